@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+
+# measures file import job throughput and how many bytes it reads per byte of file
+# run from the install dir like: python3 benchmark_import.py --num_images 10 --archive_mb 512
+# run it on two checkouts to compare them
+
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+
+import cv2
+import numpy
+
+from include import ClientConstants as CC
+from include import ClientImportFileSeeds
+from include import ClientOptions
+from include import HydrusData
+from include import HydrusGlobals as HG
+
+class BenchmarkController( object ):
+    
+    # just enough of a controller for a file import job that never touches the db
+    
+    def __init__( self ):
+        
+        self.options = {}
+        
+        self.options[ 'thumbnail_dimensions' ] = [ 150, 125 ]
+        
+        self.new_options = ClientOptions.ClientOptions()
+        
+    
+    def Read( self, action, *args, **kwargs ):
+        
+        return ( CC.STATUS_UNKNOWN, None, '' )
+        
+    
+def GenerateArchive( path, num_bytes ):
+    
+    with open( path, 'wb' ) as f:
+        
+        f.write( b'PK\x03\x04' )
+        
+        num_written = 4
+        
+        while num_written < num_bytes:
+            
+            block = os.urandom( min( 16 * 1048576, num_bytes - num_written ) )
+            
+            f.write( block )
+            
+            num_written += len( block )
+            
+        
+    
+def GenerateImage( path, resolution ):
+    
+    ( width, height ) = resolution
+    
+    gradient = numpy.linspace( random.randint( 0, 128 ), random.randint( 128, 255 ), width, dtype = numpy.float32 )
+    
+    numpy_image = numpy.dstack( [ numpy.tile( gradient * random.uniform( 0.5, 1.0 ), ( height, 1 ) ) for channel in range( 3 ) ] ).astype( numpy.uint8 )
+    
+    for j in range( 30 ):
+        
+        centre = ( random.randint( 0, width ), random.randint( 0, height ) )
+        radius = random.randint( width // 40, width // 6 )
+        colour = tuple( random.randint( 0, 255 ) for channel in range( 3 ) )
+        
+        cv2.circle( numpy_image, centre, radius, colour, -1 )
+        
+    
+    numpy_image = cv2.add( numpy_image, numpy.random.randint( 0, 12, size = numpy_image.shape, dtype = numpy.uint8 ) )
+    
+    cv2.imwrite( path, numpy_image, [ cv2.IMWRITE_JPEG_QUALITY, 92 ] )
+    
+def GetBytesRead():
+    
+    # rchar counts everything that came through read syscalls, cached or not, which is what a network drive has to serve
+    
+    with open( '/proc/self/io', 'r' ) as f:
+        
+        for line in f:
+            
+            if line.startswith( 'rchar:' ):
+                
+                return int( line.split()[1] )
+                
+            
+        
+    
+    return 0
+    
+def RunImportJob( path ):
+    
+    file_import_job = ClientImportFileSeeds.FileImportJob( path, file_import_options = HG.client_controller.new_options.GetDefaultFileImportOptions( 'loud' ) )
+    
+    file_import_job.GenerateHashAndStatus()
+    
+    file_import_job.GenerateInfo()
+    
+def TimeRun( run_callable, paths ):
+    
+    bytes_read_before = GetBytesRead()
+    time_started = time.perf_counter()
+    
+    for path in paths:
+        
+        run_callable( path )
+        
+    
+    time_taken = time.perf_counter() - time_started
+    bytes_read = GetBytesRead() - bytes_read_before
+    
+    return ( time_taken, bytes_read )
+    
+def Main():
+    
+    argparser = argparse.ArgumentParser( description = 'hydrus file import benchmark' )
+    
+    argparser.add_argument( '--num_images', type = int, default = 10, help = 'number of synthetic jpegs' )
+    argparser.add_argument( '--resolution', default = '6000,4000', help = 'resolution of the synthetic jpegs' )
+    argparser.add_argument( '--archive_mb', type = int, default = 512, help = 'size of the synthetic zip' )
+    argparser.add_argument( '--seed', type = int, default = 0 )
+    
+    result = argparser.parse_args()
+    
+    random.seed( result.seed )
+    numpy.random.seed( result.seed )
+    
+    resolution = tuple( int( dimension ) for dimension in result.resolution.split( ',' ) )
+    
+    HG.client_controller = BenchmarkController()
+    
+    test_dir = tempfile.mkdtemp( prefix = 'hydrus_benchmark_' )
+    
+    try:
+        
+        print( 'generating ' + HydrusData.ToHumanInt( result.num_images ) + ' jpegs at ' + HydrusData.ConvertResolutionToPrettyString( resolution ) + ' and a ' + HydrusData.ToHumanBytes( result.archive_mb * 1048576 ) + ' zip' )
+        
+        image_paths = []
+        
+        for i in range( result.num_images ):
+            
+            path = os.path.join( test_dir, '{}.jpg'.format( i ) )
+            
+            GenerateImage( path, resolution )
+            
+            image_paths.append( path )
+            
+        
+        archive_path = os.path.join( test_dir, 'big.zip' )
+        
+        GenerateArchive( archive_path, result.archive_mb * 1048576 )
+        
+        print( '' )
+        print( 'files      MB/s      MB read per MB of file' )
+        
+        for ( name, paths ) in ( ( 'jpegs', image_paths ), ( 'zip', [ archive_path ] ) ):
+            
+            total_size = sum( os.path.getsize( path ) for path in paths )
+            
+            # one run to get everything into the disk cache first
+            
+            RunImportJob( paths[0] )
+            
+            ( time_taken, bytes_read ) = TimeRun( RunImportJob, paths )
+            
+            print( '{:<11}{:<10.1f}{:.2f}'.format( name, total_size / 1048576 / time_taken, bytes_read / total_size ) )
+            
+        
+    finally:
+        
+        shutil.rmtree( test_dir )
+        
+    
+if __name__ == '__main__':
+    
+    Main()
+    
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+
+# measures how much memory a big page of media results costs
+# run from the install dir like: python3 benchmark_media_results.py --num_results 100000
+
+import argparse
+import collections
+import gc
+import os
+import random
+import time
+import tracemalloc
+
+from include import ClientConstants as CC
+from include import ClientMedia
+from include import ClientRatings
+from include import HydrusConstants as HC
+from include import HydrusData
+
+def GenerateMediaResults( num_results, num_tags_per_file, tag_pool_size ):
+    
+    # the db shares tag strings and service keys across a batch, so we do the same
+    
+    tag_pool = [ 'series:series {}'.format( i ) if i % 10 == 0 else 'tag {}'.format( i ) for i in range( tag_pool_size ) ]
+    
+    tag_service_keys = [ CC.DEFAULT_LOCAL_TAG_SERVICE_KEY, HydrusData.GenerateKey() ]
+    file_repo_service_key = HydrusData.GenerateKey()
+    rating_service_key = HydrusData.GenerateKey()
+    
+    now = HydrusData.GetNow()
+    
+    media_results = []
+    
+    for hash_id in range( 1, num_results + 1 ):
+        
+        hash = os.urandom( 32 )
+        
+        file_info_manager = ClientMedia.FileInfoManager( hash_id, hash, random.randint( 10000, 5000000 ), HC.IMAGE_JPEG, random.randint( 200, 4000 ), random.randint( 200, 4000 ), None, None, False, None )
+        
+        # like the db, we hand over the sibling-collapsed tags as well, which for most files are the same as storage
+        
+        service_keys_to_statuses_to_tags = collections.defaultdict( HydrusData.default_dict_set )
+        service_keys_to_statuses_to_sibling_tags = collections.defaultdict( HydrusData.default_dict_set )
+        
+        for tag_service_key in tag_service_keys:
+            
+            tags = random.sample( tag_pool, num_tags_per_file )
+            
+            service_keys_to_statuses_to_tags[ tag_service_key ][ HC.CONTENT_STATUS_CURRENT ] = set( tags )
+            service_keys_to_statuses_to_sibling_tags[ tag_service_key ][ HC.CONTENT_STATUS_CURRENT ] = set( tags )
+            
+        
+        tags_manager = ClientMedia.TagsManager( service_keys_to_statuses_to_tags, service_keys_to_statuses_to_sibling_tags )
+        
+        current = { CC.LOCAL_FILE_SERVICE_KEY, CC.COMBINED_LOCAL_FILE_SERVICE_KEY }
+        
+        if hash_id % 3 == 0:
+            
+            current.add( file_repo_service_key )
+            
+        
+        current_to_timestamps = { service_key : now for service_key in current }
+        
+        urls = { 'https://example.com/post/{}'.format( hash_id ) } if hash_id % 2 == 0 else set()
+        
+        locations_manager = ClientMedia.LocationsManager( current, set(), set(), set(), hash_id % 5 == 0, urls, {}, current_to_timestamps = current_to_timestamps )
+        
+        local_ratings = { rating_service_key : 0.5 } if hash_id % 7 == 0 else {}
+        
+        ratings_manager = ClientRatings.RatingsManager( local_ratings )
+        
+        file_viewing_stats_manager = ClientMedia.FileViewingStatsManager( 1, 5, 2, 30 )
+        
+        media_results.append( ClientMedia.MediaResult( file_info_manager, tags_manager, locations_manager, ratings_manager, file_viewing_stats_manager ) )
+        
+    
+    return media_results
+
+def Main():
+    
+    argparser = argparse.ArgumentParser( description = 'hydrus media result memory benchmark' )
+    
+    argparser.add_argument( '--num_results', type = int, default = 100000, help = 'number of synthetic media results' )
+    argparser.add_argument( '--num_tags', type = int, default = 10, help = 'tags per file per tag service' )
+    argparser.add_argument( '--tag_pool_size', type = int, default = 5000, help = 'number of distinct tags' )
+    argparser.add_argument( '--seed', type = int, default = 0 )
+    
+    result = argparser.parse_args()
+    
+    random.seed( result.seed )
+    
+    gc.collect()
+    
+    tracemalloc.start()
+    
+    time_started = time.perf_counter()
+    
+    media_results = GenerateMediaResults( result.num_results, result.num_tags, result.tag_pool_size )
+    
+    time_taken = time.perf_counter() - time_started
+    
+    gc.collect()
+    
+    ( current_size, peak_size ) = tracemalloc.get_traced_memory()
+    
+    tracemalloc.stop()
+    
+    print( 'built ' + HydrusData.ToHumanInt( len( media_results ) ) + ' media results in ' + HydrusData.TimeDeltaToPrettyTimeDelta( time_taken ) )
+    print( 'memory held: ' + HydrusData.ToHumanBytes( current_size ) + ', ' + HydrusData.ToHumanBytes( current_size // len( media_results ) ) + ' per result' )
+    print( 'peak memory: ' + HydrusData.ToHumanBytes( peak_size ) )
+
+if __name__ == '__main__':
+    
+    Main()
+    
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+
+# compares full and reduced-size jpeg decoding for thumbnail and phash generation
+# run from the install dir like: python3 benchmark_reduced_decode.py --num_images 20
+
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+
+import cv2
+import numpy
+
+from include import ClientImageHandling
+from include import ClientOptions
+from include import HydrusConstants as HC
+from include import HydrusData
+from include import HydrusGlobals as HG
+from include import HydrusImageHandling
+
+class BenchmarkController( object ):
+    
+    # just enough of a controller for the image loading options
+    
+    def __init__( self ):
+        
+        self.new_options = ClientOptions.ClientOptions()
+        
+    
+def GenerateImages( image_dir, num_images, resolution ):
+    
+    # blurry shapes on a gradient with a little grain, so the jpegs compress and hash like photos rather than noise
+    
+    ( width, height ) = resolution
+    
+    paths = []
+    
+    for i in range( num_images ):
+        
+        gradient = numpy.linspace( random.randint( 0, 128 ), random.randint( 128, 255 ), width, dtype = numpy.float32 )
+        
+        numpy_image = numpy.dstack( [ numpy.tile( gradient * random.uniform( 0.5, 1.0 ), ( height, 1 ) ) for channel in range( 3 ) ] ).astype( numpy.uint8 )
+        
+        for j in range( 30 ):
+            
+            centre = ( random.randint( 0, width ), random.randint( 0, height ) )
+            radius = random.randint( width // 40, width // 6 )
+            colour = tuple( random.randint( 0, 255 ) for channel in range( 3 ) )
+            
+            cv2.circle( numpy_image, centre, radius, colour, -1 )
+            
+        
+        numpy_image = cv2.GaussianBlur( numpy_image, ( 0, 0 ), 4 )
+        
+        numpy_image = cv2.add( numpy_image, numpy.random.randint( 0, 12, size = numpy_image.shape, dtype = numpy.uint8 ) )
+        
+        path = os.path.join( image_dir, '{}.jpg'.format( i ) )
+        
+        cv2.imwrite( path, numpy_image, [ cv2.IMWRITE_JPEG_QUALITY, 92 ] )
+        
+        paths.append( path )
+        
+    
+    return paths
+    
+def TimeThumbnails( paths, target_resolution, minimum_resolution ):
+    
+    time_started = time.perf_counter()
+    
+    for path in paths:
+        
+        numpy_image = HydrusImageHandling.GenerateNumPyImage( path, HC.IMAGE_JPEG, minimum_resolution = minimum_resolution )
+        
+        numpy_image = HydrusImageHandling.ResizeNumPyImage( numpy_image, target_resolution )
+        
+        HydrusImageHandling.GenerateThumbnailBytesNumPy( numpy_image, HC.IMAGE_JPEG )
+        
+    
+    return time.perf_counter() - time_started
+    
+def TimePHashes( paths, minimum_decode_resolution ):
+    
+    ClientImageHandling.PHASH_MINIMUM_DECODE_RESOLUTION = minimum_decode_resolution
+    
+    all_phashes = []
+    
+    time_started = time.perf_counter()
+    
+    for path in paths:
+        
+        all_phashes.append( ClientImageHandling.GenerateShapePerceptualHashes( path, HC.IMAGE_JPEG ) )
+        
+    
+    return ( time.perf_counter() - time_started, all_phashes )
+    
+def Main():
+    
+    argparser = argparse.ArgumentParser( description = 'hydrus reduced jpeg decode benchmark' )
+    
+    argparser.add_argument( '--num_images', type = int, default = 20, help = 'number of synthetic jpegs' )
+    argparser.add_argument( '--resolution', default = '6000,4000', help = 'resolution of the synthetic jpegs' )
+    argparser.add_argument( '--thumbnail_dimensions', default = '150,125', help = 'thumbnail bounding box' )
+    argparser.add_argument( '--seed', type = int, default = 0 )
+    
+    result = argparser.parse_args()
+    
+    random.seed( result.seed )
+    numpy.random.seed( result.seed )
+    
+    resolution = tuple( int( dimension ) for dimension in result.resolution.split( ',' ) )
+    thumbnail_dimensions = tuple( int( dimension ) for dimension in result.thumbnail_dimensions.split( ',' ) )
+    
+    target_resolution = HydrusImageHandling.GetThumbnailResolution( resolution, thumbnail_dimensions )
+    
+    HG.client_controller = BenchmarkController()
+    
+    image_dir = tempfile.mkdtemp( prefix = 'hydrus_benchmark_' )
+    
+    try:
+        
+        print( 'generating ' + HydrusData.ToHumanInt( result.num_images ) + ' jpegs at ' + HydrusData.ConvertResolutionToPrettyString( resolution ) )
+        
+        paths = GenerateImages( image_dir, result.num_images, resolution )
+        
+        original_phash_minimum_decode_resolution = ClientImageHandling.PHASH_MINIMUM_DECODE_RESOLUTION
+        
+        full_thumbnail_time = TimeThumbnails( paths, target_resolution, None )
+        reduced_thumbnail_time = TimeThumbnails( paths, target_resolution, target_resolution )
+        
+        ( full_phash_time, full_phashes ) = TimePHashes( paths, None )
+        ( reduced_phash_time, reduced_phashes ) = TimePHashes( paths, original_phash_minimum_decode_resolution )
+        
+        ClientImageHandling.PHASH_MINIMUM_DECODE_RESOLUTION = original_phash_minimum_decode_resolution
+        
+        print( '' )
+        print( 'job           full ms/image    reduced ms/image    speedup' )
+        
+        for ( name, full_time, reduced_time ) in ( ( 'thumbnail', full_thumbnail_time, reduced_thumbnail_time ), ( 'phash', full_phash_time, reduced_phash_time ) ):
+            
+            print( '{:<14}{:>13.1f}{:>20.1f}{:>10.1f}x'.format( name, 1000 * full_time / len( paths ), 1000 * reduced_time / len( paths ), full_time / reduced_time ) )
+            
+        
+        # a reduced decode must not move phashes far, or similar files searches will stop matching old imports
+        
+        distances = [ HydrusData.Get64BitHammingDistance( list( full )[0], list( reduced )[0] ) for ( full, reduced ) in zip( full_phashes, reduced_phashes ) if len( full ) > 0 and len( reduced ) > 0 ]
+        
+        print( '' )
+        print( 'phash hamming distance from full decode: mean {:.2f}, max {}'.format( sum( distances ) / max( len( distances ), 1 ), max( distances, default = 0 ) ) )
+        
+    finally:
+        
+        shutil.rmtree( image_dir )
+        
+    
+if __name__ == '__main__':
+    
+    Main()
+    
@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+
+# measures catching up on a big tag repository, row by row as normal processing does it, and staged then built in bulk
+# the tables have the same shapes as the client's mappings tables and caches, but live in a scratch sqlite file
+# each update also carries a few parents and siblings. the staged method builds the tags they do not touch in one go, and plays the rest back in order around them
+# run from the install dir like: python3 benchmark_repository_processing.py --num_rows 50000000
+
+import argparse
+import collections
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import time
+
+from include import HydrusData
+
+UPDATE_NUM_ROWS = 100000
+UPDATE_NUM_PAIRS = 50
+CHUNK_NUM_ROWS = 1000
+REPLAY_CHUNK_NUM_ROWS = 100000
+
+def AddMappings( c, tag_id, hash_ids ):
+    
+    c.executemany( 'INSERT OR IGNORE INTO current_mappings VALUES ( ?, ? );', ( ( tag_id, hash_id ) for hash_id in hash_ids ) )
+    
+    num_added = c.rowcount
+    
+    if num_added > 0:
+        
+        c.execute( 'INSERT OR IGNORE INTO combined_files_ac_cache ( tag_id, current_count, pending_count ) VALUES ( ?, ?, ? );', ( tag_id, 0, 0 ) )
+        c.execute( 'UPDATE combined_files_ac_cache SET current_count = current_count + ? WHERE tag_id = ?;', ( num_added, tag_id ) )
+        
+    
+    local_hash_ids = [ hash_id for ( hash_id, ) in c.execute( 'SELECT hash_id FROM specific_files_cache WHERE hash_id IN ' + HydrusData.SplayListForDB( hash_ids ) + ';' ) ]
+    
+    c.executemany( 'INSERT OR IGNORE INTO specific_current_mappings_cache ( hash_id, tag_id ) VALUES ( ?, ? );', ( ( hash_id, tag_id ) for hash_id in local_hash_ids ) )
+    
+    num_added = c.rowcount
+    
+    if num_added > 0:
+        
+        c.execute( 'INSERT OR IGNORE INTO specific_ac_cache ( tag_id, current_count, pending_count ) VALUES ( ?, ?, ? );', ( tag_id, 0, 0 ) )
+        c.execute( 'UPDATE specific_ac_cache SET current_count = current_count + ? WHERE tag_id = ?;', ( num_added, tag_id ) )
+        
+    
+def AddPairs( c, parents, siblings ):
+    
+    # like the client, a new parent is filled in on every file that has the child right now
+    
+    c.executemany( 'INSERT OR IGNORE INTO tag_parents ( child_tag_id, parent_tag_id ) VALUES ( ?, ? );', parents )
+    c.executemany( 'INSERT OR REPLACE INTO tag_siblings ( bad_tag_id, good_tag_id ) VALUES ( ?, ? );', siblings )
+    
+    for ( child_tag_id, parent_tag_id ) in parents:
+        
+        FillInParent( c, child_tag_id, parent_tag_id )
+        
+    
+def FillInParent( c, child_tag_id, parent_tag_id ):
+    
+    hash_ids = [ hash_id for ( hash_id, ) in c.execute( 'SELECT hash_id FROM current_mappings WHERE tag_id = ?;', ( child_tag_id, ) ) ]
+    
+    for block_of_hash_ids in HydrusData.SplitListIntoChunks( hash_ids, CHUNK_NUM_ROWS ):
+        
+        AddMappings( c, parent_tag_id, block_of_hash_ids )
+        
+    
+
+def BuildMappings( c ):
+    
+    c.execute( 'DROP INDEX current_mappings_hash_id_tag_id_index;' )
+    c.execute( 'DROP INDEX specific_current_mappings_cache_tag_id_hash_id_index;' )
+    
+    c.execute( 'INSERT INTO current_mappings ( tag_id, hash_id ) SELECT tag_id, hash_id FROM ( SELECT tag_id, hash_id, action, MAX( rowid ) FROM staging WHERE tag_id NOT IN ( SELECT tag_id FROM linked_tags ) GROUP BY tag_id, hash_id ) WHERE action = ?;', ( 0, ) )
+    
+    c.execute( 'CREATE UNIQUE INDEX current_mappings_hash_id_tag_id_index ON current_mappings ( hash_id, tag_id );' )
+    
+    c.execute( 'INSERT INTO combined_files_ac_cache ( tag_id, current_count, pending_count ) SELECT tag_id, COUNT( * ), 0 FROM current_mappings GROUP BY tag_id;' )
+    
+    c.execute( 'INSERT INTO specific_current_mappings_cache ( hash_id, tag_id ) SELECT hash_id, tag_id FROM specific_files_cache CROSS JOIN current_mappings USING ( hash_id );' )
+    c.execute( 'INSERT INTO specific_ac_cache ( tag_id, current_count, pending_count ) SELECT tag_id, COUNT( * ), 0 FROM specific_current_mappings_cache GROUP BY tag_id;' )
+    
+    c.execute( 'CREATE UNIQUE INDEX specific_current_mappings_cache_tag_id_hash_id_index ON specific_current_mappings_cache ( tag_id, hash_id );' )
+    
+def CreateTables( c, local_hash_ids ):
+    
+    c.execute( 'CREATE TABLE current_mappings ( tag_id INTEGER, hash_id INTEGER, PRIMARY KEY ( tag_id, hash_id ) ) WITHOUT ROWID;' )
+    c.execute( 'CREATE UNIQUE INDEX current_mappings_hash_id_tag_id_index ON current_mappings ( hash_id, tag_id );' )
+    
+    c.execute( 'CREATE TABLE combined_files_ac_cache ( tag_id INTEGER PRIMARY KEY, current_count INTEGER, pending_count INTEGER );' )
+    
+    c.execute( 'CREATE TABLE specific_files_cache ( hash_id INTEGER PRIMARY KEY );' )
+    c.execute( 'CREATE TABLE specific_current_mappings_cache ( hash_id INTEGER, tag_id INTEGER, PRIMARY KEY ( hash_id, tag_id ) ) WITHOUT ROWID;' )
+    c.execute( 'CREATE UNIQUE INDEX specific_current_mappings_cache_tag_id_hash_id_index ON specific_current_mappings_cache ( tag_id, hash_id );' )
+    c.execute( 'CREATE TABLE specific_ac_cache ( tag_id INTEGER PRIMARY KEY, current_count INTEGER, pending_count INTEGER );' )
+    
+    c.execute( 'CREATE TABLE tag_parents ( child_tag_id INTEGER, parent_tag_id INTEGER, PRIMARY KEY ( child_tag_id, parent_tag_id ) );' )
+    c.execute( 'CREATE TABLE tag_siblings ( bad_tag_id INTEGER PRIMARY KEY, good_tag_id INTEGER );' )
+    
+    c.executemany( 'INSERT INTO specific_files_cache ( hash_id ) VALUES ( ? );', ( ( hash_id, ) for hash_id in local_hash_ids ) )
+    
+def GetLinkedTagIds( c ):
+    
+    # like the client, a pair can only touch the mappings of tags it is linked to through parents and siblings
+    
+    tag_ids_to_linked_tag_ids = collections.defaultdict( set )
+    
+    for ( tag_id_a, tag_id_b ) in c.execute( 'SELECT tag_id_a, tag_id_b FROM pairs_staging;' ).fetchall():
+        
+        tag_ids_to_linked_tag_ids[ tag_id_a ].add( tag_id_b )
+        tag_ids_to_linked_tag_ids[ tag_id_b ].add( tag_id_a )
+        
+    
+    linked_tag_ids = set()
+    
+    search_tag_ids = list( tag_ids_to_linked_tag_ids.keys() )
+    
+    while len( search_tag_ids ) > 0:
+        
+        tag_id = search_tag_ids.pop()
+        
+        if tag_id in linked_tag_ids:
+            
+            continue
+            
+        
+        linked_tag_ids.add( tag_id )
+        
+        search_tag_ids.extend( tag_ids_to_linked_tag_ids[ tag_id ] )
+        
+    
+    return linked_tag_ids
+    
+def GenerateUpdates( num_rows, num_tags, num_files ):
+    
+    # a few tags are on a great many files and most are on a handful, like the real thing
+    # parents point up into their own range of tag ids, so they never chain and the two methods can be checked against each other
+    
+    num_rows_done = 0
+    
+    while num_rows_done < num_rows:
+        
+        update = []
+        num_update_rows = 0
+        
+        while num_update_rows < UPDATE_NUM_ROWS and num_rows_done + num_update_rows < num_rows:
+            
+            tag_id = int( num_tags ** random.random() )
+            
+            num_hashes = min( random.randint( 1, 200 ), num_rows - num_rows_done - num_update_rows )
+            
+            hash_ids = random.sample( range( 1, num_files + 1 ), num_hashes )
+            
+            update.append( ( tag_id, hash_ids ) )
+            
+            num_update_rows += num_hashes
+            
+        
+        parents = [ ( int( num_tags ** random.random() ), num_tags + random.randint( 1, 1000 ) ) for i in range( UPDATE_NUM_PAIRS ) ]
+        siblings = [ ( int( num_tags ** random.random() ), int( num_tags ** random.random() ) ) for i in range( UPDATE_NUM_PAIRS ) ]
+        
+        yield ( update, parents, siblings )
+        
+        num_rows_done += num_update_rows
+        
+    
+def GetCounts( c ):
+    
+    results = []
+    
+    for table_name in ( 'current_mappings', 'combined_files_ac_cache', 'specific_current_mappings_cache', 'specific_ac_cache', 'tag_parents', 'tag_siblings' ):
+        
+        ( count, ) = c.execute( 'SELECT COUNT( * ) FROM ' + table_name + ';' ).fetchone()
+        
+        results.append( count )
+        
+    
+    ( total, ) = c.execute( 'SELECT SUM( current_count ) FROM combined_files_ac_cache;' ).fetchone()
+    
+    results.append( total )
+    
+    return tuple( results )
+    
+def ProcessBulk( c, updates ):
+    
+    c.execute( 'CREATE TABLE staging ( tag_id INTEGER, hash_id INTEGER, action INTEGER );' )
+    c.execute( 'CREATE TABLE pairs_staging ( content_type INTEGER, tag_id_a INTEGER, tag_id_b INTEGER, mappings_rowid INTEGER );' )
+    
+    for ( update, parents, siblings ) in updates:
+        
+        c.execute( 'BEGIN IMMEDIATE;' )
+        
+        c.executemany( 'INSERT INTO staging ( tag_id, hash_id, action ) VALUES ( ?, ?, ? );', ( ( tag_id, hash_id, 0 ) for ( tag_id, hash_ids ) in update for hash_id in hash_ids ) )
+        
+        ( mappings_rowid, ) = c.execute( 'SELECT IFNULL( MAX( rowid ), 0 ) FROM staging;' ).fetchone()
+        
+        c.executemany( 'INSERT INTO pairs_staging ( content_type, tag_id_a, tag_id_b, mappings_rowid ) VALUES ( ?, ?, ?, ? );', [ ( 0, child_tag_id, parent_tag_id, mappings_rowid ) for ( child_tag_id, parent_tag_id ) in parents ] + [ ( 1, bad_tag_id, good_tag_id, mappings_rowid ) for ( bad_tag_id, good_tag_id ) in siblings ] )
+        
+        c.execute( 'COMMIT;' )
+        
+    
+    time_staged = time.perf_counter()
+    
+    c.execute( 'BEGIN IMMEDIATE;' )
+    
+    c.execute( 'CREATE TEMPORARY TABLE linked_tags ( tag_id INTEGER PRIMARY KEY );' )
+    
+    c.executemany( 'INSERT INTO linked_tags ( tag_id ) VALUES ( ? );', ( ( tag_id, ) for tag_id in GetLinkedTagIds( c ) ) )
+    
+    BuildMappings( c )
+    
+    # each pair goes in right after the linked mappings that were staged ahead of it
+    
+    mappings_rowids = [ mappings_rowid for ( mappings_rowid, ) in c.execute( 'SELECT DISTINCT mappings_rowid FROM pairs_staging ORDER BY mappings_rowid;' ) ]
+    
+    ( max_rowid, ) = c.execute( 'SELECT IFNULL( MAX( rowid ), 0 ) FROM staging;' ).fetchone()
+    
+    last_rowid = 0
+    
+    for mappings_rowid in mappings_rowids:
+        
+        ReplayMappings( c, last_rowid, mappings_rowid )
+        
+        parents = []
+        siblings = []
+        
+        for ( content_type, tag_id_a, tag_id_b ) in c.execute( 'SELECT content_type, tag_id_a, tag_id_b FROM pairs_staging WHERE mappings_rowid = ? ORDER BY rowid;', ( mappings_rowid, ) ).fetchall():
+            
+            ( parents if content_type == 0 else siblings ).append( ( tag_id_a, tag_id_b ) )
+            
+        
+        AddPairs( c, parents, siblings )
+        
+        last_rowid = mappings_rowid
+        
+    
+    ReplayMappings( c, last_rowid, max_rowid )
+    
+    c.execute( 'DROP TABLE staging;' )
+    c.execute( 'DROP TABLE pairs_staging;' )
+    c.execute( 'DROP TABLE linked_tags;' )
+    
+    c.execute( 'COMMIT;' )
+    
+    return time_staged
+    
+def ProcessNormal( c, updates ):
+    
+    for ( update, parents, siblings ) in updates:
+        
+        c.execute( 'BEGIN IMMEDIATE;' )
+        
+        for chunk in HydrusData.SplitIteratorIntoChunks( HydrusData.SmoothOutMappingIterator( update, 50 ), CHUNK_NUM_ROWS // 50 ):
+            
+            for ( tag_id, hash_ids ) in chunk:
+                
+                AddMappings( c, tag_id, hash_ids )
+                
+            
+        
+        AddPairs( c, parents, siblings )
+        
+        c.execute( 'COMMIT;' )
+        
+    
+def ReplayMappings( c, from_rowid, to_rowid ):
+    
+    last_rowid = from_rowid
+    
+    while True:
+        
+        rows = c.execute( 'SELECT rowid, tag_id, hash_id FROM staging WHERE rowid > ? AND rowid <= ? AND tag_id IN ( SELECT tag_id FROM linked_tags ) ORDER BY rowid LIMIT ?;', ( last_rowid, to_rowid, REPLAY_CHUNK_NUM_ROWS ) ).fetchall()
+        
+        if len( rows ) == 0:
+            
+            break
+            
+        
+        last_rowid = rows[-1][0]
+        
+        tag_ids_to_hash_ids = collections.defaultdict( list )
+        
+        for ( rowid, tag_id, hash_id ) in rows:
+            
+            tag_ids_to_hash_ids[ tag_id ].append( hash_id )
+            
+        
+        for ( tag_id, hash_ids ) in tag_ids_to_hash_ids.items():
+            
+            AddMappings( c, tag_id, hash_ids )
+            
+        
+    
+def Main():
+    
+    argparser = argparse.ArgumentParser( description = 'hydrus tag repository processing benchmark' )
+    
+    argparser.add_argument( '--num_rows', type = int, default = 50000000, help = 'number of mappings in the synthetic update stream' )
+    argparser.add_argument( '--num_tags', type = int, default = 1000000 )
+    argparser.add_argument( '--num_files', type = int, default = 10000000 )
+    argparser.add_argument( '--num_local_files', type = int, default = 100000, help = 'number of files the specific cache covers' )
+    argparser.add_argument( '--seed', type = int, default = 0 )
+    
+    result = argparser.parse_args()
+    
+    test_dir = tempfile.mkdtemp( prefix = 'hydrus_benchmark_' )
+    
+    try:
+        
+        print( 'processing ' + HydrusData.ToHumanInt( result.num_rows ) + ' mappings over ' + HydrusData.ToHumanInt( result.num_tags ) + ' tags and ' + HydrusData.ToHumanInt( result.num_files ) + ' files' )
+        print( '' )
+        print( 'method                   staging s   total s     rows/second' )
+        
+        all_counts = []
+        
+        for ( name, process_func ) in ( ( 'row by row', ProcessNormal ), ( 'staged and built', ProcessBulk ) ):
+            
+            # both methods get the same stream
+            
+            random.seed( result.seed )
+            
+            local_hash_ids = random.sample( range( 1, result.num_files + 1 ), result.num_local_files )
+            
+            path = os.path.join( test_dir, name.replace( ' ', '_' ) + '.db' )
+            
+            db = sqlite3.connect( path, isolation_level = None )
+            
+            c = db.cursor()
+            
+            c.execute( 'PRAGMA journal_mode = WAL;' )
+            c.execute( 'PRAGMA synchronous = NORMAL;' )
+            c.execute( 'PRAGMA cache_size = -262144;' )
+            
+            CreateTables( c, local_hash_ids )
+            
+            updates = GenerateUpdates( result.num_rows, result.num_tags, result.num_files )
+            
+            time_started = time.perf_counter()
+            
+            time_staged = process_func( c, updates )
+            
+            time_finished = time.perf_counter()
+            
+            staging_time = '' if time_staged is None else '{:.1f}'.format( time_staged - time_started )
+            
+            print( '{:<25}{:<12}{:<12.1f}{}'.format( name, staging_time, time_finished - time_started, HydrusData.ToHumanInt( int( result.num_rows / ( time_finished - time_started ) ) ) ) )
+            
+            all_counts.append( GetCounts( c ) )
+            
+            db.close()
+            
+            os.remove( path )
+            
+        
+        if len( set( all_counts ) ) != 1:
+            
+            raise Exception( 'The methods did not agree! ' + repr( all_counts ) )
+            
+        
+    finally:
+        
+        shutil.rmtree( test_dir )
+        
+    
+if __name__ == '__main__':
+    
+    Main()
+    
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+
+# measures save and load of a big file import cache under the json and binary serialisation formats
+# run from the install dir like: python3 benchmark_serialisation.py --num_seeds 1000000
+
+import argparse
+import gc
+import random
+import time
+
+from include import ClientConstants as CC
+from include import ClientImportFileSeeds
+from include import HydrusData
+from include import HydrusSerialisable
+
+def GenerateSessionLikeContainer( num_seeds ):
+    
+    file_seeds = HydrusSerialisable.SerialisableList()
+    
+    statuses = ( CC.STATUS_SUCCESSFUL_AND_NEW, CC.STATUS_SUCCESSFUL_BUT_REDUNDANT, CC.STATUS_DELETED, CC.STATUS_ERROR, CC.STATUS_UNKNOWN )
+    
+    for i in range( num_seeds ):
+        
+        file_seed = ClientImportFileSeeds.FileSeed( ClientImportFileSeeds.FILE_SEED_TYPE_URL, 'https://example.com/post/{}'.format( random.randint( 0, 2 ** 40 ) ) )
+        
+        file_seed.status = random.choice( statuses )
+        file_seed.source_time = file_seed.created - random.randint( 0, 86400 * 365 )
+        
+        file_seeds.append( file_seed )
+        
+    
+    file_seed_cache = HydrusSerialisable.CreateFromSerialisableTuple( ( HydrusSerialisable.SERIALISABLE_TYPE_FILE_SEED_CACHE, ClientImportFileSeeds.FileSeedCache.SERIALISABLE_VERSION, file_seeds.GetSerialisableTuple() ) )
+    
+    # the cache sits inside a session, which is what gets saved and loaded
+    
+    return HydrusSerialisable.SerialisableList( [ file_seed_cache ] )
+    
+def TimeCall( func, *args ):
+    
+    time_started = time.perf_counter()
+    
+    result = func( *args )
+    
+    return ( result, time.perf_counter() - time_started )
+    
+def Main():
+    
+    argparser = argparse.ArgumentParser( description = 'hydrus serialisation benchmark' )
+    
+    argparser.add_argument( '--num_seeds', type = int, default = 1000000, help = 'number of file seeds in the cache' )
+    argparser.add_argument( '--seed', type = int, default = 0 )
+    
+    result = argparser.parse_args()
+    
+    random.seed( result.seed )
+    
+    print( 'generating ' + HydrusData.ToHumanInt( result.num_seeds ) + ' file seeds' )
+    
+    container = GenerateSessionLikeContainer( result.num_seeds )
+    
+    print( 'binary dumps are ' + ( 'lz4' if HydrusSerialisable.LZ4_OK else 'zlib' ) + ' compressed' )
+    print( '' )
+    print( 'format                   save s      load s      first access s   resave s    size' )
+    
+    formats = []
+    
+    formats.append( ( 'json', lambda obj: obj.DumpToString(), HydrusSerialisable.CreateFromString ) )
+    formats.append( ( 'json + zlib', lambda obj: obj.DumpToNetworkBytes(), HydrusSerialisable.CreateFromNetworkBytes ) )
+    formats.append( ( 'binary', lambda obj: obj.DumpToBinary(), HydrusSerialisable.CreateFromBinary ) )
+    
+    for ( name, dump_func, load_func ) in formats:
+        
+        # a million leftover seeds from the previous format make the garbage collector slow everything down
+        
+        loaded_container = None
+        loaded_file_seeds = None
+        reloaded_container = None
+        
+        gc.collect()
+        
+        ( dump, save_time ) = TimeCall( dump_func, container )
+        
+        ( loaded_container, load_time ) = TimeCall( load_func, dump )
+        
+        # the lazy format only pays for the seeds when something looks at them
+        
+        ( loaded_file_seeds, first_access_time ) = TimeCall( loaded_container[0].GetFileSeeds )
+        
+        if len( loaded_file_seeds ) != result.num_seeds:
+            
+            raise Exception( 'The ' + name + ' format lost some seeds!' )
+            
+        
+        # and a session that was loaded but never looked at is saved without parsing the seeds
+        
+        reloaded_container = load_func( dump )
+        
+        resave_time = TimeCall( dump_func, reloaded_container )[1]
+        
+        print( '{:<25}{:<12.2f}{:<12.2f}{:<17.2f}{:<12.2f}{}'.format( name, save_time, load_time, first_access_time, resave_time, HydrusData.ToHumanBytes( len( dump ) ) ) )
+        
+    
+if __name__ == '__main__':
+    
+    Main()
+    
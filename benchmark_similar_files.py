@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+
+# compares the similar files search backends on a synthetic phash corpus
+# run from the install dir like: python3 benchmark_similar_files.py --num_phashes 1000000
+
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import struct
+import tempfile
+import time
+
+from include import ClientDB
+from include import ClientDuplicates
+from include import ClientThreading
+from include import HydrusData
+
+class BenchmarkDB( ClientDB.DB ):
+    
+    # just enough of a db to hold the similar files search tables, without any of the boot stuff
+    
+    def __init__( self, db_dir ):
+        
+        self._db = sqlite3.connect( os.path.join( db_dir, 'client.db' ), isolation_level = None )
+        
+        self._write_c = self._db.cursor()
+        self._thread_ids_to_read_cursors = {}
+        self._write_caches = {}
+        self._phash_index = None
+        
+        self._c.execute( 'ATTACH ? AS external_caches;', ( os.path.join( db_dir, 'client.caches.db' ), ) )
+        
+        self._c.execute( 'PRAGMA journal_mode = OFF;' )
+        self._c.execute( 'PRAGMA external_caches.journal_mode = OFF;' )
+        self._c.execute( 'PRAGMA synchronous = OFF;' )
+        
+        self._CreateDBCaches()
+        
+    
+    def Close( self ):
+        
+        self._c.close()
+        self._db.close()
+        
+    
+    def Populate( self, phashes ):
+        
+        self._c.execute( 'BEGIN IMMEDIATE;' )
+        
+        self._c.executemany( 'INSERT INTO shape_perceptual_hashes ( phash_id, phash ) VALUES ( ?, ? );', enumerate( phashes, start = 1 ) )
+        
+        all_nodes = self._c.execute( 'SELECT phash_id, phash FROM shape_perceptual_hashes;' ).fetchall()
+        
+        self._PHashesAddMultiIndexHashes( all_nodes )
+        
+        ( root_id, root_phash ) = self._PHashesPopBestRootNode( all_nodes )
+        
+        self._PHashesGenerateBranch( ClientThreading.JobKey(), None, root_id, root_phash, all_nodes )
+        
+        self._c.execute( 'COMMIT;' )
+        
+        self._c.execute( 'ANALYZE;' )
+        
+    
+def GenerateCorpus( num_phashes, cluster_size, max_cluster_distance ):
+    
+    # real phashes clump together--lots of files have a few near-duplicates--so we make clusters of variants around random centres
+    
+    phashes = set()
+    
+    while len( phashes ) < num_phashes:
+        
+        centre = random.getrandbits( 64 )
+        
+        for i in range( cluster_size ):
+            
+            variant = centre
+            
+            for bit in random.sample( range( 64 ), random.randint( 0, max_cluster_distance ) ):
+                
+                variant ^= 1 << bit
+                
+            
+            phashes.add( struct.pack( '!Q', variant ) )
+            
+        
+    
+    phashes = list( phashes )[ : num_phashes ]
+    
+    random.shuffle( phashes )
+    
+    return phashes
+    
+def Main():
+    
+    argparser = argparse.ArgumentParser( description = 'hydrus similar files search benchmark' )
+    
+    argparser.add_argument( '--num_phashes', type = int, default = 1000000, help = 'size of the synthetic corpus' )
+    argparser.add_argument( '--num_searches', type = int, default = 200, help = 'number of searches per distance' )
+    argparser.add_argument( '--distances', default = '0,2,4,8', help = 'comma-separated search distances' )
+    argparser.add_argument( '--seed', type = int, default = 0 )
+    
+    result = argparser.parse_args()
+    
+    random.seed( result.seed )
+    
+    distances = [ int( distance ) for distance in result.distances.split( ',' ) ]
+    
+    db_dir = tempfile.mkdtemp( prefix = 'hydrus_benchmark_' )
+    
+    try:
+        
+        print( 'generating ' + HydrusData.ToHumanInt( result.num_phashes ) + ' phashes' )
+        
+        phashes = GenerateCorpus( result.num_phashes, 10, 12 )
+        
+        db = BenchmarkDB( db_dir )
+        
+        time_started = time.perf_counter()
+        
+        db.Populate( phashes )
+        
+        print( 'built tree and multi-index in ' + HydrusData.TimeDeltaToPrettyTimeDelta( time.perf_counter() - time_started ) )
+        
+        phash_index = ClientDuplicates.PerceptualHashIndex( list( enumerate( phashes, start = 1 ) ) )
+        
+        search_phashes = random.sample( phashes, min( result.num_searches, len( phashes ) ) )
+        
+        # every candidate gets a full distance check, so we count those
+        
+        num_distance_checks = [ 0 ]
+        
+        original_get_distance = HydrusData.Get64BitHammingDistance
+        
+        def counting_get_distance( phash1, phash2 ):
+            
+            num_distance_checks[0] += 1
+            
+            return original_get_distance( phash1, phash2 )
+            
+        
+        HydrusData.Get64BitHammingDistance = counting_get_distance
+        
+        backends = []
+        
+        backends.append( ( 'vp-tree', lambda search_phash, distance: db._PHashesSearchTree( [ search_phash ], distance ) ) )
+        backends.append( ( 'multi-index', lambda search_phash, distance: db._PHashesSearchMultiIndex( [ search_phash ], distance ) ) )
+        backends.append( ( 'in-memory', lambda search_phash, distance: phash_index.Search( [ search_phash ], distance )[0] ) )
+        
+        print( '' )
+        print( 'distance    backend        candidates/search    ms/search    matches/search' )
+        
+        for distance in distances:
+            
+            all_results = []
+            
+            for ( name, search_call ) in backends:
+                
+                num_distance_checks[0] = 0
+                
+                results = []
+                
+                time_started = time.perf_counter()
+                
+                for search_phash in search_phashes:
+                    
+                    results.append( search_call( search_phash, distance ) )
+                    
+                
+                time_taken = time.perf_counter() - time_started
+                
+                all_results.append( results )
+                
+                if name == 'in-memory':
+                    
+                    candidates = len( phashes )
+                    
+                else:
+                    
+                    candidates = num_distance_checks[0] / len( search_phashes )
+                    
+                
+                num_matches = sum( ( len( r ) for r in results ) ) / len( search_phashes )
+                
+                print( '{:<12}{:<15}{:>17.1f}{:>13.2f}{:>18.1f}'.format( distance, name, candidates, 1000 * time_taken / len( search_phashes ), num_matches ) )
+                
+            
+            if not all( ( results == all_results[0] for results in all_results ) ):
+                
+                print( 'WARNING: the backends disagreed at distance ' + str( distance ) + '!' )
+                
+            
+        
+        HydrusData.Get64BitHammingDistance = original_get_distance
+        
+        db.Close()
+        
+    finally:
+        
+        shutil.rmtree( db_dir )
+        
+    
+if __name__ == '__main__':
+    
+    Main()
+    
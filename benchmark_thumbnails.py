@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+
+# measures how fast the thumbnail waterfall fills a fresh page with different numbers of workers
+# run from the install dir like: python3 benchmark_thumbnails.py --num_thumbnails 5000 --workers 1,4,16
+
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+
+import numpy
+from PIL import Image as PILImage
+
+from include import ClientCaches
+from include import ClientOptions
+from include import HydrusConstants as HC
+from include import HydrusData
+from include import HydrusGlobals as HG
+from include import HydrusImageHandling
+from include import HydrusThreading
+
+class BenchmarkClientFilesManager( object ):
+    
+    def __init__( self, hashes_to_paths ):
+        
+        self._hashes_to_paths = hashes_to_paths
+        
+    
+    def GetThumbnailPath( self, media ):
+        
+        return self._hashes_to_paths[ media.GetHash() ]
+        
+    
+class BenchmarkController( object ):
+    
+    # just enough of a controller to run a thumbnail cache, without any of the boot stuff
+    
+    def __init__( self, db_dir, hashes_to_paths, thumbnail_dimensions, num_workers ):
+        
+        self.db_dir = db_dir
+        
+        self.options = {}
+        
+        self.options[ 'thumbnail_cache_size' ] = 4096 * 1048576
+        self.options[ 'thumbnail_dimensions' ] = thumbnail_dimensions
+        
+        self.new_options = ClientOptions.ClientOptions()
+        
+        self.new_options.SetBoolean( 'keep_decoded_thumbnail_store', False )
+        self.new_options.SetInteger( 'thumbnail_waterfall_workers', num_workers )
+        
+        self.client_files_manager = BenchmarkClientFilesManager( hashes_to_paths )
+        
+        self.threads = []
+        
+        self._num_rendered = 0
+        self._num_expected = 0
+        
+        self._done_event = threading.Event()
+        self._lock = threading.Lock()
+        
+    
+    def CallToThreadLongRunning( self, callable, *args, **kwargs ):
+        
+        thread = threading.Thread( target = callable, args = args, kwargs = kwargs, daemon = True )
+        
+        self.threads.append( thread )
+        
+        thread.start()
+        
+    
+    def CurrentlyPubSubbing( self ):
+        
+        return False
+        
+    
+    def pub( self, topic, *args, **kwargs ):
+        
+        if topic == 'waterfall_thumbnails':
+            
+            ( page_key, rendered_medias ) = args
+            
+            with self._lock:
+                
+                self._num_rendered += len( rendered_medias )
+                
+                if self._num_rendered >= self._num_expected:
+                    
+                    self._done_event.set()
+                    
+                
+            
+        
+    
+    def sub( self, *args, **kwargs ):
+        
+        pass
+        
+    
+    def SetExpected( self, num_expected ):
+        
+        with self._lock:
+            
+            self._num_rendered = 0
+            self._num_expected = num_expected
+            
+            self._done_event.clear()
+            
+        
+    
+    def WaitUntilDone( self ):
+        
+        self._done_event.wait()
+        
+    
+class BenchmarkLocationsManager( object ):
+    
+    def IsLocal( self ):
+        
+        return True
+        
+    
+    def ShouldIdeallyHaveThumbnail( self ):
+        
+        return True
+        
+    
+class BenchmarkMedia( object ):
+    
+    def __init__( self, hash, resolution ):
+        
+        self._hash = hash
+        self._resolution = resolution
+        
+        self._locations_manager = BenchmarkLocationsManager()
+        
+    
+    def GetDisplayMedia( self ):
+        
+        return self
+        
+    
+    def GetHash( self ):
+        
+        return self._hash
+        
+    
+    def GetLocationsManager( self ):
+        
+        return self._locations_manager
+        
+    
+    def GetMediaResult( self ):
+        
+        return self
+        
+    
+    def GetMime( self ):
+        
+        return HC.IMAGE_JPEG
+        
+    
+    def GetResolution( self ):
+        
+        return self._resolution
+        
+    
+def GenerateThumbnails( thumbnail_dir, num_thumbnails, thumbnail_dimensions ):
+    
+    # smooth gradients with some noise, so the jpegs are about as big as real thumbnails
+    
+    hashes_to_paths = {}
+    medias = []
+    
+    for i in range( num_thumbnails ):
+        
+        hash = HydrusData.GenerateKey()
+        
+        resolution = ( random.randint( 300, 4000 ), random.randint( 300, 4000 ) )
+        
+        ( width, height ) = HydrusImageHandling.GetThumbnailResolution( resolution, thumbnail_dimensions )
+        
+        gradient = numpy.linspace( 0, 255, width * height * 3 ).reshape( ( height, width, 3 ) )
+        noise = numpy.random.randint( 0, 64, size = ( height, width, 3 ) )
+        
+        numpy_image = ( ( gradient + noise ) % 256 ).astype( numpy.uint8 )
+        
+        path = os.path.join( thumbnail_dir, hash.hex() + '.thumbnail' )
+        
+        PILImage.fromarray( numpy_image ).save( path, 'JPEG', quality = 90 )
+        
+        hashes_to_paths[ hash ] = path
+        medias.append( BenchmarkMedia( hash, resolution ) )
+        
+    
+    return ( hashes_to_paths, medias )
+    
+def RunWaterfall( db_dir, hashes_to_paths, medias, thumbnail_dimensions, num_workers ):
+    
+    controller = BenchmarkController( db_dir, hashes_to_paths, thumbnail_dimensions, num_workers )
+    
+    HG.client_controller = controller
+    
+    thumbnail_cache = ClientCaches.ThumbnailCache( controller )
+    
+    controller.SetExpected( len( medias ) )
+    
+    time_started = time.perf_counter()
+    
+    thumbnail_cache.Waterfall( HydrusData.GenerateKey(), medias )
+    
+    controller.WaitUntilDone()
+    
+    time_taken = time.perf_counter() - time_started
+    
+    for thread in controller.threads:
+        
+        HydrusThreading.ShutdownThread( thread )
+        
+    
+    for thread in controller.threads:
+        
+        thread.join()
+        
+    
+    return time_taken
+    
+def Main():
+    
+    argparser = argparse.ArgumentParser( description = 'hydrus thumbnail waterfall benchmark' )
+    
+    argparser.add_argument( '--num_thumbnails', type = int, default = 5000, help = 'number of synthetic thumbnails' )
+    argparser.add_argument( '--workers', default = '1,4,16', help = 'comma-separated worker counts' )
+    argparser.add_argument( '--thumbnail_dimensions', default = '150,125', help = 'thumbnail bounding box' )
+    argparser.add_argument( '--seed', type = int, default = 0 )
+    
+    result = argparser.parse_args()
+    
+    random.seed( result.seed )
+    numpy.random.seed( result.seed )
+    
+    worker_counts = [ int( num_workers ) for num_workers in result.workers.split( ',' ) ]
+    thumbnail_dimensions = [ int( dimension ) for dimension in result.thumbnail_dimensions.split( ',' ) ]
+    
+    db_dir = tempfile.mkdtemp( prefix = 'hydrus_benchmark_' )
+    
+    try:
+        
+        print( 'generating ' + HydrusData.ToHumanInt( result.num_thumbnails ) + ' thumbnails' )
+        
+        ( hashes_to_paths, medias ) = GenerateThumbnails( db_dir, result.num_thumbnails, thumbnail_dimensions )
+        
+        # read everything once so every run sees the same warm disk cache
+        
+        for path in hashes_to_paths.values():
+            
+            with open( path, 'rb' ) as f:
+                
+                f.read()
+                
+            
+        
+        print( '' )
+        print( 'workers    seconds    thumbnails/second' )
+        
+        for num_workers in worker_counts:
+            
+            time_taken = RunWaterfall( db_dir, hashes_to_paths, medias, thumbnail_dimensions, num_workers )
+            
+            print( '{:<11}{:<11.2f}{:.0f}'.format( num_workers, time_taken, len( medias ) / time_taken ) )
+            
+        
+    finally:
+        
+        shutil.rmtree( db_dir )
+        
+    
+if __name__ == '__main__':
+    
+    Main()
+    
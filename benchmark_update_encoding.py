@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+
+# measures repository update files on the wire and how long a client takes to decode them, as json and as columnar updates
+# the updates are full-sized, like the server makes for a busy tag repository
+# run from the install dir like: python3 benchmark_update_encoding.py --num_files 10000000
+
+import argparse
+import os
+import random
+import time
+
+from include import HydrusConstants as HC
+from include import HydrusData
+from include import HydrusNetwork
+from include import HydrusSerialisable
+
+MAX_DEFINITIONS_ROWS = 50000
+MAX_CONTENT_ROWS = 250000
+
+def GenerateContentUpdate( num_tags, num_files ):
+    
+    # a few tags are on a great many files and most are on a handful, like the real thing
+    
+    content_update = HydrusNetwork.ContentUpdate()
+    
+    num_rows = 0
+    
+    for service_tag_id in sorted( random.sample( range( 1, num_tags + 1 ), MAX_CONTENT_ROWS // 20 ) ):
+        
+        num_hashes = min( int( 2000 ** random.random() ), MAX_CONTENT_ROWS - num_rows )
+        
+        if num_hashes == 0:
+            
+            break
+            
+        
+        service_hash_ids = sorted( random.sample( range( 1, num_files + 1 ), num_hashes ) )
+        
+        content_update.AddRow( ( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_ADD, ( service_tag_id, service_hash_ids ) ) )
+        
+        num_rows += num_hashes
+        
+    
+    return content_update
+    
+def GenerateDefinitionsUpdate( num_tags, num_files ):
+    
+    definitions_update = HydrusNetwork.DefinitionsUpdate()
+    
+    for service_hash_id in sorted( random.sample( range( 1, num_files + 1 ), MAX_DEFINITIONS_ROWS // 2 ) ):
+        
+        definitions_update.AddRow( ( HC.DEFINITIONS_TYPE_HASHES, service_hash_id, os.urandom( 32 ) ) )
+        
+    
+    namespaces = ( '', 'character:', 'creator:', 'series:' )
+    
+    for service_tag_id in sorted( random.sample( range( 1, num_tags + 1 ), MAX_DEFINITIONS_ROWS // 2 ) ):
+        
+        tag = random.choice( namespaces ) + ' '.join( ( '{:x}'.format( random.randint( 0, 2 ** 20 ) ) for i in range( random.randint( 1, 3 ) ) ) )
+        
+        definitions_update.AddRow( ( HC.DEFINITIONS_TYPE_TAGS, service_tag_id, tag ) )
+        
+    
+    return definitions_update
+    
+def IterateRows( update ):
+    
+    # what processing does with an update once it is loaded. a catching-up client stages the flat mappings rows
+    
+    num_rows = 0
+    
+    if isinstance( update, HydrusNetwork.ContentUpdate ):
+        
+        for ( service_tag_id, service_hash_id ) in update.GetNewMappingsRows():
+            
+            num_rows += 1
+            
+        
+    else:
+        
+        for ( service_hash_id, hash ) in update.GetHashIdsToHashes().items():
+            
+            num_rows += 1
+            
+        
+        for ( service_tag_id, tag ) in update.GetTagIdsToTags().items():
+            
+            num_rows += 1
+            
+        
+    
+    return num_rows
+    
+def TimeCall( func, *args ):
+    
+    time_started = time.perf_counter()
+    
+    result = func( *args )
+    
+    return ( result, time.perf_counter() - time_started )
+    
+def Main():
+    
+    argparser = argparse.ArgumentParser( description = 'hydrus repository update encoding benchmark' )
+    
+    argparser.add_argument( '--num_tags', type = int, default = 1000000 )
+    argparser.add_argument( '--num_files', type = int, default = 10000000 )
+    argparser.add_argument( '--seed', type = int, default = 0 )
+    
+    result = argparser.parse_args()
+    
+    random.seed( result.seed )
+    
+    updates = []
+    
+    updates.append( ( 'content', GenerateContentUpdate( result.num_tags, result.num_files ) ) )
+    updates.append( ( 'definitions', GenerateDefinitionsUpdate( result.num_tags, result.num_files ) ) )
+    
+    formats = []
+    
+    formats.append( ( 'json + zlib', lambda update: update.DumpToNetworkBytes() ) )
+    formats.append( ( 'columnar', lambda update: update.DumpToBinary( compression = HydrusSerialisable.BINARY_COMPRESSION_ZLIB ) ) )
+    
+    print( 'update                        format         size        encode s    decode s    decode + rows s' )
+    
+    for ( update_name, update ) in updates:
+        
+        num_rows = IterateRows( update )
+        
+        for ( format_name, dump_func ) in formats:
+            
+            ( network_bytes, encode_time ) = TimeCall( dump_func, update )
+            
+            # clients load both through the same call, which tells them apart
+            
+            ( loaded_update, decode_time ) = TimeCall( HydrusSerialisable.CreateFromNetworkBytes, network_bytes )
+            
+            ( loaded_num_rows, iterate_time ) = TimeCall( IterateRows, loaded_update )
+            
+            if loaded_num_rows != num_rows:
+                
+                raise Exception( 'The ' + format_name + ' ' + update_name + ' update lost some rows!' )
+                
+            
+            print( '{:<30}{:<15}{:<12}{:<12.2f}{:<12.3f}{:.3f}'.format( update_name + ' (' + HydrusData.ToHumanInt( num_rows ) + ' rows)', format_name, HydrusData.ToHumanBytes( len( network_bytes ) ), encode_time, decode_time, decode_time + iterate_time ) )
+            
+        
+    
+if __name__ == '__main__':
+    
+    Main()
+    
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+
+# measures how fast the ffmpeg video renderer hands over frames, and how long seeks take
+# run from the install dir like: python3 benchmark_video.py --resolution 3840,2160 --num_frames 300
+
+import argparse
+import os
+import random
+import shutil
+import subprocess
+import tempfile
+import time
+
+from include import HydrusConstants as HC
+from include import HydrusData
+from include import HydrusVideoHandling
+
+def GenerateVideo( path, resolution, num_frames, fps, keyframe_interval ):
+    
+    ( width, height ) = resolution
+    
+    cmd = [ HydrusVideoHandling.FFMPEG_PATH, '-y', '-loglevel', 'quiet', '-f', 'lavfi', '-i', 'testsrc2=size={}x{}:rate={}'.format( width, height, fps ), '-frames:v', str( num_frames ), '-g', str( keyframe_interval ), '-c:v', 'libx264', '-preset', 'ultrafast', '-pix_fmt', 'yuv420p', path ]
+    
+    subprocess.run( cmd, check = True )
+    
+def TimePlayback( path, resolution, num_frames, fps, reuse_buffers ):
+    
+    renderer = HydrusVideoHandling.VideoRendererFFMPEG( path, HC.VIDEO_MP4, int( 1000 * num_frames / fps ), num_frames, resolution )
+    
+    # like the video buffer, we hang on to a few seconds of frames
+    
+    held_frames = []
+    spare_numpy_images = []
+    
+    time_started = time.perf_counter()
+    
+    for i in range( num_frames ):
+        
+        if reuse_buffers:
+            
+            spare_numpy_image = spare_numpy_images.pop() if len( spare_numpy_images ) > 0 else None
+            
+            numpy_image = renderer.read_frame( spare_numpy_image )
+            
+        else:
+            
+            numpy_image = renderer.read_frame()
+            
+        
+        held_frames.append( numpy_image )
+        
+        if len( held_frames ) > 3 * fps:
+            
+            spare_numpy_images.append( held_frames.pop( 0 ) )
+            
+        
+    
+    time_taken = time.perf_counter() - time_started
+    
+    renderer.Stop()
+    
+    return time_taken
+    
+def TimeSeeks( path, resolution, num_frames, fps, seek_indices, use_frame_index ):
+    
+    renderer = HydrusVideoHandling.VideoRendererFFMPEG( path, HC.VIDEO_MP4, int( 1000 * num_frames / fps ), num_frames, resolution )
+    
+    if use_frame_index:
+        
+        renderer.SetFrameIndex( *HydrusVideoHandling.GetVideoFrameIndex( path ) )
+        
+    
+    time_started = time.perf_counter()
+    
+    for index in seek_indices:
+        
+        renderer.set_position( index )
+        
+        renderer.read_frame()
+        
+    
+    time_taken = time.perf_counter() - time_started
+    
+    renderer.Stop()
+    
+    return time_taken
+    
+def Main():
+    
+    argparser = argparse.ArgumentParser( description = 'hydrus video renderer benchmark' )
+    
+    argparser.add_argument( '--resolution', default = '3840,2160', help = 'resolution of the synthetic video' )
+    argparser.add_argument( '--num_frames', type = int, default = 300, help = 'length of the synthetic video in frames' )
+    argparser.add_argument( '--fps', type = int, default = 60 )
+    argparser.add_argument( '--keyframe_interval', type = int, default = 30 )
+    argparser.add_argument( '--num_seeks', type = int, default = 20 )
+    argparser.add_argument( '--seed', type = int, default = 0 )
+    
+    result = argparser.parse_args()
+    
+    random.seed( result.seed )
+    
+    resolution = tuple( int( dimension ) for dimension in result.resolution.split( ',' ) )
+    
+    # short forward hops, like scrubbing, are where the keyframes matter
+    
+    seek_indices = sorted( random.sample( range( result.num_frames ), result.num_seeks ) )
+    
+    test_dir = tempfile.mkdtemp( prefix = 'hydrus_benchmark_' )
+    
+    try:
+        
+        path = os.path.join( test_dir, 'video.mp4' )
+        
+        print( 'generating ' + HydrusData.ToHumanInt( result.num_frames ) + ' frames at ' + HydrusData.ConvertResolutionToPrettyString( resolution ) )
+        
+        GenerateVideo( path, resolution, result.num_frames, result.fps, result.keyframe_interval )
+        
+        print( '' )
+        print( 'playback                 frames/second' )
+        
+        for ( name, reuse_buffers ) in ( ( 'new buffer per frame', False ), ( 'reused buffers', True ) ):
+            
+            time_taken = TimePlayback( path, resolution, result.num_frames, result.fps, reuse_buffers )
+            
+            print( '{:<25}{:.1f}'.format( name, result.num_frames / time_taken ) )
+            
+        
+        print( '' )
+        print( 'seeking                  ms/seek' )
+        
+        for ( name, use_frame_index ) in ( ( 'frame rate estimate', False ), ( 'frame index', True ) ):
+            
+            time_taken = TimeSeeks( path, resolution, result.num_frames, result.fps, seek_indices, use_frame_index )
+            
+            print( '{:<25}{:.1f}'.format( name, 1000 * time_taken / len( seek_indices ) ) )
+            
+        
+    finally:
+        
+        shutil.rmtree( test_dir )
+        
+    
+if __name__ == '__main__':
+    
+    Main()
+    
@@ -31,6 +31,7 @@ try:
     argparser.add_argument( '--db_memory_journaling', action='store_true', help = 'run db journaling entirely in memory (DANGEROUS)' )
     argparser.add_argument( '--db_synchronous_override', help = 'override SQLite Synchronous PRAGMA (range 0-3, default=2)' )
     argparser.add_argument( '--no_db_temp_files', action='store_true', help = 'run db temp operations entirely in memory' )
+    argparser.add_argument( '--db_read_connections', help = 'number of extra read-only db connections that serve searches in parallel with writes (default=2, 0 to disable)' )
     
     result = argparser.parse_args()
     
@@ -92,6 +93,18 @@ try:
     
     HG.no_db_temp_files = result.no_db_temp_files
     
+    if result.db_read_connections is not None:
+        
+        try:
+            
+            HG.db_read_connections = int( result.db_read_connections )
+            
+        except ValueError:
+            
+            raise Exception( 'db_read_connections must be an integer' )
+            
+        
+    
     if result.temp_dir is not None:
         
         HydrusPaths.SetEnvTempDir( result.temp_dir )
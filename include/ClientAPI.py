@@ -3,6 +3,7 @@ from . import HydrusData
 from . import HydrusExceptions
 from . import HydrusGlobals as HG
 from . import HydrusSerialisable
+import numpy
 import os
 import threading
 
@@ -12,8 +13,9 @@ CLIENT_API_PERMISSION_ADD_TAGS = 2
 CLIENT_API_PERMISSION_SEARCH_FILES = 3
 CLIENT_API_PERMISSION_MANAGE_PAGES = 4
 CLIENT_API_PERMISSION_MANAGE_COOKIES = 5
+CLIENT_API_PERMISSION_MANAGE_DATABASE = 6
 
-ALLOWED_PERMISSIONS = ( CLIENT_API_PERMISSION_ADD_FILES, CLIENT_API_PERMISSION_ADD_TAGS, CLIENT_API_PERMISSION_ADD_URLS, CLIENT_API_PERMISSION_SEARCH_FILES, CLIENT_API_PERMISSION_MANAGE_PAGES, CLIENT_API_PERMISSION_MANAGE_COOKIES )
+ALLOWED_PERMISSIONS = ( CLIENT_API_PERMISSION_ADD_FILES, CLIENT_API_PERMISSION_ADD_TAGS, CLIENT_API_PERMISSION_ADD_URLS, CLIENT_API_PERMISSION_SEARCH_FILES, CLIENT_API_PERMISSION_MANAGE_PAGES, CLIENT_API_PERMISSION_MANAGE_COOKIES, CLIENT_API_PERMISSION_MANAGE_DATABASE )
 
 basic_permission_to_str_lookup = {}
 
@@ -23,9 +25,12 @@ basic_permission_to_str_lookup[ CLIENT_API_PERMISSION_ADD_TAGS ] = 'add tags to
 basic_permission_to_str_lookup[ CLIENT_API_PERMISSION_SEARCH_FILES ] = 'search for files'
 basic_permission_to_str_lookup[ CLIENT_API_PERMISSION_MANAGE_PAGES ] = 'manage pages'
 basic_permission_to_str_lookup[ CLIENT_API_PERMISSION_MANAGE_COOKIES ] = 'manage cookies'
+basic_permission_to_str_lookup[ CLIENT_API_PERMISSION_MANAGE_DATABASE ] = 'manage database'
 
 SEARCH_RESULTS_CACHE_TIMEOUT = 4 * 3600
 
+MAX_SEARCH_CURSORS = 10
+
 SESSION_EXPIRY = 86400
 
 api_request_dialog_open = False
@@ -230,6 +235,8 @@ class APIPermissions( HydrusSerialisable.SerialisableBaseNamed ):
         self._last_search_results = None
         self._search_results_timeout = 0
         
+        self._search_keys_to_cursor_results = {}
+        
         self._lock = threading.Lock()
         
     
@@ -381,6 +388,63 @@ class APIPermissions( HydrusSerialisable.SerialisableBaseNamed ):
             
         
     
+    def GetSearchCursorPage( self, cursor, limit = None ):
+        
+        with self._lock:
+            
+            try:
+                
+                ( search_key_hex, offset ) = cursor.split( '_' )
+                
+                search_key = bytes.fromhex( search_key_hex )
+                offset = int( offset )
+                
+            except:
+                
+                raise HydrusExceptions.BadRequestException( 'Could not understand that cursor!' )
+                
+            
+            if offset < 0:
+                
+                raise HydrusExceptions.BadRequestException( 'The cursor offset cannot be negative!' )
+                
+            
+            if search_key not in self._search_keys_to_cursor_results:
+                
+                raise HydrusExceptions.BadRequestException( 'It looks like those search results are no longer available--please run the search again!' )
+                
+            
+            ( hash_ids, page_size, timeout ) = self._search_keys_to_cursor_results[ search_key ]
+            
+            if limit is not None:
+                
+                if limit < 1:
+                    
+                    raise HydrusExceptions.BadRequestException( 'The limit has to be at least 1!' )
+                    
+                
+                page_size = limit
+                
+            
+            self._search_keys_to_cursor_results[ search_key ] = ( hash_ids, page_size, HydrusData.GetNow() + SEARCH_RESULTS_CACHE_TIMEOUT )
+            
+            next_offset = offset + page_size
+            
+            page_hash_ids = hash_ids[ offset : next_offset ].tolist()
+            
+            if next_offset < len( hash_ids ):
+                
+                next_cursor = '{}_{}'.format( search_key_hex, next_offset )
+                
+            else:
+                
+                next_cursor = None
+                
+            
+            return ( page_hash_ids, next_cursor )
+            
+        
+    
     def GetSearchTagFilter( self ):
         
         with self._lock:
@@ -406,6 +470,15 @@ class APIPermissions( HydrusSerialisable.SerialisableBaseNamed ):
                 self._last_search_results = None
                 
             
+            for ( search_key, ( hash_ids, page_size, timeout ) ) in list( self._search_keys_to_cursor_results.items() ):
+                
+                if HydrusData.TimeHasPassed( timeout ):
+                    
+                    del self._search_keys_to_cursor_results[ search_key ]
+                    
+                
+            
+            
         
     
     def SetLastSearchResults( self, hash_ids ):
@@ -431,6 +504,32 @@ class APIPermissions( HydrusSerialisable.SerialisableBaseNamed ):
             
         
     
+    def StartSearchCursor( self, hash_ids, page_size ):
+        
+        if page_size < 1:
+            
+            raise HydrusExceptions.BadRequestException( 'The limit has to be at least 1!' )
+            
+        
+        with self._lock:
+            
+            # we hold the ids compactly so a client can page through a huge search at its leisure
+            
+            if len( self._search_keys_to_cursor_results ) >= MAX_SEARCH_CURSORS:
+                
+                oldest_search_key = min( self._search_keys_to_cursor_results.keys(), key = lambda search_key: self._search_keys_to_cursor_results[ search_key ][2] )
+                
+                del self._search_keys_to_cursor_results[ oldest_search_key ]
+                
+            
+            search_key = HydrusData.GenerateKey()
+            
+            self._search_keys_to_cursor_results[ search_key ] = ( numpy.fromiter( hash_ids, dtype = numpy.int64, count = len( hash_ids ) ), page_size, HydrusData.GetNow() + SEARCH_RESULTS_CACHE_TIMEOUT )
+            
+            return '{}_{}'.format( search_key.hex(), 0 )
+            
+        
+    
     def ToHumanString( self ):
         
         s = 'API Permissions ({}): '.format( self._name )
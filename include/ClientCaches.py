@@ -5,9 +5,12 @@ from . import ClientRendering
 from . import HydrusConstants as HC
 from . import HydrusExceptions
 from . import HydrusImageHandling
+from . import HydrusPaths
 from . import HydrusThreading
 import json
 import os
+import pathlib
+import sqlite3
 import threading
 import time
 from . import HydrusData
@@ -17,21 +20,110 @@ import collections
 import traceback
 import weakref
 
+class CacheMemoryBudget( object ):
+    
+    def __init__( self ):
+        
+        self._data_caches = []
+        self._budgeted_data_caches = []
+        self._size = 0
+        
+        self._lock = threading.Lock()
+        
+    
+    def AddDataCache( self, data_cache, shares_budget = True ):
+        
+        # a cache that does not share the budget keeps to its own size, and is only here so its stats show up
+        
+        with self._lock:
+            
+            self._data_caches.append( data_cache )
+            
+            if shares_budget:
+                
+                self._budgeted_data_caches.append( data_cache )
+                
+                self._size += data_cache.GetCacheSize()
+                
+            
+        
+    
+    def GetDataCaches( self ):
+        
+        with self._lock:
+            
+            return list( self._data_caches )
+            
+        
+    
+    def GetSize( self ):
+        
+        with self._lock:
+            
+            return self._size
+            
+        
+    
+    def ShrinkToFit( self ):
+        
+        # the caches share one allowance, so whoever has the stalest data gives it up, probationary data first
+        
+        with self._lock:
+            
+            while sum( ( data_cache.GetEstimatedMemoryFootprint() for data_cache in self._budgeted_data_caches ) ) > self._size:
+                
+                candidates = [ ( data_cache.GetEvictionCandidatePriority(), data_cache ) for data_cache in self._budgeted_data_caches ]
+                
+                candidates = [ ( priority, data_cache ) for ( priority, data_cache ) in candidates if priority is not None ]
+                
+                if len( candidates ) == 0:
+                    
+                    break
+                    
+                
+                ( priority, data_cache ) = min( candidates, key = lambda candidate: candidate[0] )
+                
+                data_cache.EvictOne()
+                
+            
+        
+    
 class DataCache( object ):
     
-    def __init__( self, controller, cache_size, timeout = 1200 ):
+    # a segmented lru. new data goes on probation, and only data that is asked for again later is protected
+    # so a big one-off scroll through thumbnails will not flush out what we were looking at a moment ago
+    
+    PROTECTED_FRACTION = 0.8
+    PROMOTION_DELAY = 1.0
+    
+    def __init__( self, controller, name, cache_size, timeout = 1200, memory_budget = None ):
         
         self._controller = controller
+        self._name = name
         self._cache_size = cache_size
         self._timeout = timeout
+        self._memory_budget = memory_budget
         
         self._keys_to_data = {}
-        self._keys_fifo = collections.OrderedDict()
+        self._keys_to_memory_footprints = {}
+        
+        self._probationary_keys = collections.OrderedDict()
+        self._protected_keys = collections.OrderedDict()
         
         self._total_estimated_memory_footprint = 0
+        self._protected_estimated_memory_footprint = 0
+        
+        self._num_hits = 0
+        self._num_misses = 0
+        self._num_evictions = 0
         
         self._lock = threading.Lock()
         
+        if self._memory_budget is not None:
+            
+            self._memory_budget.AddDataCache( self )
+            
+        
         self._controller.sub( self, 'MaintainCache', 'memory_maintenance_pulse' )
         
     
@@ -42,34 +134,116 @@ class DataCache( object ):
             return
             
         
-        deletee_data = self._keys_to_data[ key ]
-        
         del self._keys_to_data[ key ]
         
-        self._RecalcMemoryUsage()
+        memory_footprint = self._keys_to_memory_footprints.pop( key )
+        
+        self._total_estimated_memory_footprint -= memory_footprint
+        
+        if key in self._protected_keys:
+            
+            del self._protected_keys[ key ]
+            
+            self._protected_estimated_memory_footprint -= memory_footprint
+            
+        else:
+            
+            del self._probationary_keys[ key ]
+            
         
     
     def _DeleteItem( self ):
         
-        ( deletee_key, last_access_time ) = self._keys_fifo.popitem( last = False )
+        if len( self._probationary_keys ) > 0:
+            
+            deletee_key = next( iter( self._probationary_keys ) )
+            
+        else:
+            
+            deletee_key = next( iter( self._protected_keys ) )
+            
         
         self._Delete( deletee_key )
         
+        self._num_evictions += 1
+        
+    
+    def _RefreshMemoryFootprint( self, key ):
+        
+        # some data, like an image renderer, gets bigger once it is done loading
+        
+        old_memory_footprint = self._keys_to_memory_footprints[ key ]
+        new_memory_footprint = self._keys_to_data[ key ].GetEstimatedMemoryFootprint()
+        
+        if new_memory_footprint != old_memory_footprint:
+            
+            self._keys_to_memory_footprints[ key ] = new_memory_footprint
+            
+            self._total_estimated_memory_footprint += new_memory_footprint - old_memory_footprint
+            
+            if key in self._protected_keys:
+                
+                self._protected_estimated_memory_footprint += new_memory_footprint - old_memory_footprint
+                
+            
+        
+        return new_memory_footprint > old_memory_footprint
+        
     
-    def _RecalcMemoryUsage( self ):
+    def _ShrinkToOwnSize( self ):
         
-        self._total_estimated_memory_footprint = sum( ( data.GetEstimatedMemoryFootprint() for data in self._keys_to_data.values() ) )
+        while self._total_estimated_memory_footprint > self._cache_size and len( self._keys_to_data ) > 1:
+            
+            self._DeleteItem()
+            
         
     
     def _TouchKey( self, key ):
         
-        # have to delete first, rather than overwriting, so the ordereddict updates its internal order
-        if key in self._keys_fifo:
+        now = HydrusData.GetNowFloat()
+        
+        if key in self._protected_keys:
+            
+            self._protected_keys.move_to_end( key )
+            
+            self._protected_keys[ key ] = now
+            
+        else:
+            
+            last_access_time = self._probationary_keys[ key ]
             
-            del self._keys_fifo[ key ]
+            # a thumbnail is often fetched twice in a row as it loads and draws, which is not a real second use
+            
+            if now - last_access_time > self.PROMOTION_DELAY:
+                
+                del self._probationary_keys[ key ]
+                
+                self._protected_keys[ key ] = now
+                
+                self._protected_estimated_memory_footprint += self._keys_to_memory_footprints[ key ]
+                
+                protected_size = self._cache_size * self.PROTECTED_FRACTION
+                
+                while self._protected_estimated_memory_footprint > protected_size and len( self._protected_keys ) > 1:
+                    
+                    ( demotee_key, demotee_last_access_time ) = self._protected_keys.popitem( last = False )
+                    
+                    self._protected_estimated_memory_footprint -= self._keys_to_memory_footprints[ demotee_key ]
+                    
+                    # it goes to the young end of probation, so it has to look young too, or the oldest-first expiry and eviction checks see it out of order
+                    
+                    self._probationary_keys[ demotee_key ] = now
+                    
+                
+            else:
+                
+                self._probationary_keys.move_to_end( key )
+                
+                self._probationary_keys[ key ] = now
+                
             
         
-        self._keys_fifo[ key ] = HydrusData.GetNow()
+        return self._RefreshMemoryFootprint( key )
         
     
     def Clear( self ):
@@ -77,9 +251,13 @@ class DataCache( object ):
         with self._lock:
             
             self._keys_to_data = {}
-            self._keys_fifo = collections.OrderedDict()
+            self._keys_to_memory_footprints = {}
+            
+            self._probationary_keys = collections.OrderedDict()
+            self._protected_keys = collections.OrderedDict()
             
             self._total_estimated_memory_footprint = 0
+            self._protected_estimated_memory_footprint = 0
             
         
     
@@ -87,19 +265,32 @@ class DataCache( object ):
         
         with self._lock:
             
-            if key not in self._keys_to_data:
+            if key in self._keys_to_data:
+                
+                return
+                
+            
+            if self._memory_budget is None:
                 
                 while self._total_estimated_memory_footprint > self._cache_size:
                     
                     self._DeleteItem()
                     
                 
-                self._keys_to_data[ key ] = data
-                
-                self._TouchKey( key )
-                
-                self._RecalcMemoryUsage()
-                
+            
+            memory_footprint = data.GetEstimatedMemoryFootprint()
+            
+            self._keys_to_data[ key ] = data
+            self._keys_to_memory_footprints[ key ] = memory_footprint
+            
+            self._probationary_keys[ key ] = HydrusData.GetNowFloat()
+            
+            self._total_estimated_memory_footprint += memory_footprint
+            
+        
+        if self._memory_budget is not None:
+            
+            self._memory_budget.ShrinkToFit()
             
         
     
@@ -111,30 +302,72 @@ class DataCache( object ):
             
         
     
+    def EvictOne( self ):
+        
+        with self._lock:
+            
+            if len( self._keys_to_data ) > 0:
+                
+                self._DeleteItem()
+                
+            
+        
+    
+    def GetCacheSize( self ):
+        
+        return self._cache_size
+        
+    
     def GetData( self, key ):
         
         with self._lock:
             
             if key not in self._keys_to_data:
                 
+                self._num_misses += 1
+                
                 raise Exception( 'Cache error! Looking for ' + str( key ) + ', but it was missing.' )
                 
             
-            self._TouchKey( key )
+            self._num_hits += 1
+            
+            data = self._keys_to_data[ key ]
+            
+            size_increased = self._TouchKey( key )
+            
+            if size_increased and self._memory_budget is None:
+                
+                self._ShrinkToOwnSize()
+                
+            
+        
+        if size_increased and self._memory_budget is not None:
             
-            return self._keys_to_data[ key ]
+            self._memory_budget.ShrinkToFit()
             
         
+        return data
+        
     
-    def GetIfHasData( self, key ):
+    def GetEstimatedMemoryFootprint( self ):
         
         with self._lock:
             
-            if key in self._keys_to_data:
+            return self._total_estimated_memory_footprint
+            
+        
+    
+    def GetEvictionCandidatePriority( self ):
+        
+        with self._lock:
+            
+            if len( self._probationary_keys ) > 0:
+                
+                return ( 0, next( iter( self._probationary_keys.values() ) ) )
                 
-                self._TouchKey( key )
+            elif len( self._protected_keys ) > 0:
                 
-                return self._keys_to_data[ key ]
+                return ( 1, next( iter( self._protected_keys.values() ) ) )
                 
             else:
                 
@@ -143,6 +376,50 @@ class DataCache( object ):
             
         
     
+    def GetIfHasData( self, key ):
+        
+        with self._lock:
+            
+            if key not in self._keys_to_data:
+                
+                self._num_misses += 1
+                
+                return None
+                
+            
+            self._num_hits += 1
+            
+            data = self._keys_to_data[ key ]
+            
+            size_increased = self._TouchKey( key )
+            
+            if size_increased and self._memory_budget is None:
+                
+                self._ShrinkToOwnSize()
+                
+            
+        
+        if size_increased and self._memory_budget is not None:
+            
+            self._memory_budget.ShrinkToFit()
+            
+        
+        return data
+        
+    
+    def GetName( self ):
+        
+        return self._name
+        
+    
+    def GetStats( self ):
+        
+        with self._lock:
+            
+            return ( len( self._keys_to_data ), self._total_estimated_memory_footprint, self._num_hits, self._num_misses, self._num_evictions )
+            
+        
+    
     def HasData( self, key ):
         
         with self._lock:
@@ -155,19 +432,15 @@ class DataCache( object ):
         
         with self._lock:
             
-            while True:
+            for keys_to_last_access_times in ( self._probationary_keys, self._protected_keys ):
                 
-                if len( self._keys_fifo ) == 0:
-                    
-                    break
-                    
-                else:
-                    
-                    ( key, last_access_time ) = next( iter( self._keys_fifo.items() ) )
+                expired_keys = []
+                
+                for ( key, last_access_time ) in keys_to_last_access_times.items():
                     
-                    if HydrusData.TimeHasPassed( last_access_time + self._timeout ):
+                    if HydrusData.TimeHasPassedFloat( last_access_time + self._timeout ):
                         
-                        self._DeleteItem()
+                        expired_keys.append( key )
                         
                     else:
                         
@@ -175,6 +448,11 @@ class DataCache( object ):
                         
                     
                 
+                for key in expired_keys:
+                    
+                    self._Delete( key )
+                    
+                
             
         
     
@@ -511,120 +789,81 @@ class MediaResultCache( object ):
         
     
     
-class ParsingCache( object ):
+class ParsedObject( object ):
     
-    def __init__( self ):
+    def __init__( self, parsed_object, estimated_memory_footprint ):
         
-        self._next_clean_cache_time = HydrusData.GetNow()
+        self._parsed_object = parsed_object
+        self._estimated_memory_footprint = estimated_memory_footprint
         
-        self._html_to_soups = {}
-        self._json_to_jsons = {}
+    
+    def GetEstimatedMemoryFootprint( self ):
         
-        self._lock = threading.Lock()
+        return self._estimated_memory_footprint
         
     
-    def _CleanCache( self ):
+    def GetParsedObject( self ):
         
-        if HydrusData.TimeHasPassed( self._next_clean_cache_time ):
-            
-            for cache in ( self._html_to_soups, self._json_to_jsons ):
-                
-                dead_datas = set()
-                
-                for ( data, ( last_accessed, parsed_object ) ) in cache.items():
-                    
-                    if HydrusData.TimeHasPassed( last_accessed + 10 ):
-                        
-                        dead_datas.add( data )
-                        
-                    
-                
-                for dead_data in dead_datas:
-                    
-                    del cache[ dead_data ]
-                    
-                
-            
-            self._next_clean_cache_time = HydrusData.GetNow() + 5
-            
+        return self._parsed_object
         
     
-    def CleanCache( self ):
+class ParsingCache( object ):
+    
+    # parsed objects are much bigger than the text they came from, so we guess generously
+    
+    CACHE_SIZE = 32 * 1048576
+    PARSED_OBJECT_SIZE_MULTIPLIER = 8
+    
+    def __init__( self, controller, memory_budget = None ):
         
-        with self._lock:
-            
-            self._CleanCache()
-            
+        self._data_cache = DataCache( controller, 'parsing', self.CACHE_SIZE, timeout = 10, memory_budget = memory_budget )
         
     
-    def GetJSON( self, json_text ):
+    def _GetParsedObject( self, parse_type, text, parse_callable ):
         
-        with self._lock:
-            
-            now = HydrusData.GetNow()
-            
-            if json_text not in self._json_to_jsons:
-                
-                json_object = json.loads( json_text )
-                
-                self._json_to_jsons[ json_text ] = ( now, json_object )
-                
+        key = ( parse_type, text )
+        
+        result = self._data_cache.GetIfHasData( key )
+        
+        if result is None:
             
-            ( last_accessed, json_object ) = self._json_to_jsons[ json_text ]
+            parsed_object = parse_callable( text )
             
-            if last_accessed != now:
-                
-                self._json_to_jsons[ json_text ] = ( now, json_object )
-                
+            self._data_cache.AddData( key, ParsedObject( parsed_object, len( text ) * self.PARSED_OBJECT_SIZE_MULTIPLIER ) )
             
-            if len( self._json_to_jsons ) > 10:
-                
-                self._CleanCache()
-                
+        else:
             
-            return json_object
+            parsed_object = result.GetParsedObject()
             
         
+        return parsed_object
+        
+    
+    def CleanCache( self ):
+        
+        self._data_cache.MaintainCache()
+        
+    
+    def GetJSON( self, json_text ):
+        
+        return self._GetParsedObject( 'json', json_text, json.loads )
+        
     
     def GetSoup( self, html ):
         
-        with self._lock:
-            
-            now = HydrusData.GetNow()
-            
-            if html not in self._html_to_soups:
-                
-                soup = ClientParsing.GetSoup( html )
-                
-                self._html_to_soups[ html ] = ( now, soup )
-                
-            
-            ( last_accessed, soup ) = self._html_to_soups[ html ]
-            
-            if last_accessed != now:
-                
-                self._html_to_soups[ html ] = ( now, soup )
-                
-            
-            if len( self._html_to_soups ) > 10:
-                
-                self._CleanCache()
-                
-            
-            return soup
-            
+        return self._GetParsedObject( 'html', html, ClientParsing.GetSoup )
         
     
 class RenderedImageCache( object ):
     
-    def __init__( self, controller ):
+    def __init__( self, controller, memory_budget = None ):
         
         self._controller = controller
         
         cache_size = self._controller.options[ 'fullscreen_cache_size' ]
         cache_timeout = self._controller.new_options.GetInteger( 'image_cache_timeout' )
         
-        self._data_cache = DataCache( self._controller, cache_size, timeout = cache_timeout )
+        self._data_cache = DataCache( self._controller, 'rendered images', cache_size, timeout = cache_timeout, memory_budget = memory_budget )
         
     
     def Clear( self ):
@@ -654,6 +893,37 @@ class RenderedImageCache( object ):
         return image_renderer
         
     
+    def GetImageTile( self, image_renderer, target_resolution, clip_rect ):
+        
+        hash = image_renderer.GetHash()
+        
+        key = ( hash, target_resolution.width(), target_resolution.height(), clip_rect.x(), clip_rect.y(), clip_rect.width(), clip_rect.height() )
+        
+        result = self._data_cache.GetIfHasData( key )
+        
+        if result is None:
+            
+            # rendering a tile is a use of its renderer, so we keep that fresh too
+            
+            if self._data_cache.GetIfHasData( hash ) is None:
+                
+                self._data_cache.AddData( hash, image_renderer )
+                
+            
+            qt_image = image_renderer.GetQtImage( target_resolution = target_resolution, clip_rect = clip_rect )
+            
+            image_tile = ClientRendering.ImageTile( qt_image )
+            
+            self._data_cache.AddData( key, image_tile )
+            
+        else:
+            
+            image_tile = result
+            
+        
+        return image_tile
+        
+    
     def HasImageRenderer( self, hash ):
         
         key = hash
@@ -663,14 +933,28 @@ class RenderedImageCache( object ):
     
 class ThumbnailCache( object ):
     
-    def __init__( self, controller ):
+    # a few screenfuls of thumbnails on a 4k monitor
+    
+    DECOMPRESSED_CACHE_SIZE = 64 * 1048576
+    DECOMPRESSED_CACHE_TIMEOUT = 300
+    
+    def __init__( self, controller, memory_budget = None ):
         
         self._controller = controller
         
         cache_size = self._controller.options[ 'thumbnail_cache_size' ]
         cache_timeout = self._controller.new_options.GetInteger( 'thumbnail_cache_timeout' )
         
-        self._data_cache = DataCache( self._controller, cache_size, timeout = cache_timeout )
+        self._data_cache = DataCache( self._controller, 'thumbnails', cache_size, timeout = cache_timeout, memory_budget = memory_budget )
+        
+        # the thumbnails are stored compressed, so the ones we painted recently are also kept ready to draw
+        
+        self._decompressed_data_cache = DataCache( self._controller, 'decompressed thumbnails', self.DECOMPRESSED_CACHE_SIZE, timeout = self.DECOMPRESSED_CACHE_TIMEOUT )
+        
+        if memory_budget is not None:
+            
+            memory_budget.AddDataCache( self._decompressed_data_cache, shares_budget = False )
+            
         
         self._magic_mime_thumbnail_ease_score_lookup = {}
         
@@ -690,16 +974,109 @@ class ThumbnailCache( object ):
         
         self._waterfall_event = threading.Event()
         
+        self._page_keys_to_rendered_medias = collections.defaultdict( list )
+        self._last_waterfall_pub_time = 0.0
+        
         self._special_thumbs = {}
         
+        if self._controller.new_options.GetBoolean( 'keep_decoded_thumbnail_store' ):
+            
+            self._thumbnail_pixel_store = ThumbnailPixelStore( os.path.join( self._controller.db_dir, 'client.thumbnails.db' ) )
+            
+        else:
+            
+            self._thumbnail_pixel_store = None
+            
+        
         self.Clear()
         
         self._controller.CallToThreadLongRunning( self.MainLoop )
         
+        # the main loop does waterfall work too, so we only need the extra workers here
+        
+        num_workers = self._controller.new_options.GetInteger( 'thumbnail_waterfall_workers' )
+        
+        for i in range( num_workers - 1 ):
+            
+            self._controller.CallToThreadLongRunning( self.WaterfallLoop )
+            
+        
         self._controller.sub( self, 'Clear', 'reset_thumbnail_cache' )
         self._controller.sub( self, 'ClearThumbnails', 'clear_thumbnails' )
         
     
+    def _DoWaterfallWork( self ):
+        
+        start_time = HydrusData.GetNowPrecise()
+        stop_time = start_time + 0.005 # a bit of a typical frame
+        
+        rendered_results = []
+        
+        num_done = 0
+        max_at_once = 16
+        
+        while not HydrusData.TimeHasPassedPrecise( stop_time ) and num_done <= max_at_once:
+            
+            with self._lock:
+                
+                if len( self._waterfall_queue ) == 0:
+                    
+                    break
+                    
+                
+                result = self._waterfall_queue.pop()
+                
+                if len( self._waterfall_queue ) == 0:
+                    
+                    self._waterfall_queue_empty_event.set()
+                    
+                
+                self._waterfall_queue_quick.discard( result )
+                
+            
+            ( page_key, media ) = result
+            
+            if media.GetDisplayMedia() is not None:
+                
+                self.GetThumbnail( media )
+                
+                rendered_results.append( result )
+                
+            
+            num_done += 1
+            
+        
+        # all the workers share one batch, so the gui gets a few big updates rather than many small ones
+        
+        with self._lock:
+            
+            for ( page_key, media ) in rendered_results:
+                
+                self._page_keys_to_rendered_medias[ page_key ].append( media )
+                
+            
+            if len( self._page_keys_to_rendered_medias ) > 0 and ( len( self._waterfall_queue ) == 0 or HydrusData.TimeHasPassedPrecise( self._last_waterfall_pub_time + 0.005 ) ):
+                
+                page_keys_to_rendered_medias = self._page_keys_to_rendered_medias
+                
+                self._page_keys_to_rendered_medias = collections.defaultdict( list )
+                
+                self._last_waterfall_pub_time = HydrusData.GetNowPrecise()
+                
+            else:
+                
+                page_keys_to_rendered_medias = {}
+                
+            
+        
+        for ( page_key, rendered_medias ) in page_keys_to_rendered_medias.items():
+            
+            self._controller.pub( 'waterfall_thumbnails', page_key, rendered_medias )
+            
+        
+        return len( page_keys_to_rendered_medias ) > 0
+        
+    
     def _GetThumbnailHydrusBitmap( self, display_media ):
         
         bounding_dimensions = self._controller.options[ 'thumbnail_dimensions' ]
@@ -725,6 +1102,21 @@ class ThumbnailCache( object ):
             return self._special_thumbs[ 'hydrus' ]
             
         
+        if self._thumbnail_pixel_store is not None:
+            
+            thumbnail_stat = self._GetThumbnailStat( path )
+            
+            if thumbnail_stat is not None:
+                
+                hydrus_bitmap = self._thumbnail_pixel_store.GetHydrusBitmap( hash, bounding_dimensions, thumbnail_stat )
+                
+                if hydrus_bitmap is not None:
+                    
+                    return hydrus_bitmap
+                    
+                
+            
+        
         try:
             
             numpy_image = ClientImageHandling.GenerateNumPyImage( path, mime )
@@ -759,6 +1151,8 @@ class ThumbnailCache( object ):
                 
             
         
+        can_store = True
+        
         ( current_width, current_height ) = HydrusImageHandling.GetResolutionNumPy( numpy_image )
         
         ( media_width, media_height ) = display_media.GetResolution()
@@ -863,6 +1257,10 @@ class ThumbnailCache( object ):
                             HydrusData.ShowText( 'Thumbnail {} too small, scheduling regeneration from source.'.format( hash.hex() ) )
                             
                         
+                        # this thumb is going to be replaced soon, so no point storing it
+                        
+                        can_store = False
+                        
                         delayed_item = display_media.GetMediaResult()
                         
                         with self._lock:
@@ -890,9 +1288,35 @@ class ThumbnailCache( object ):
         
         hydrus_bitmap = ClientRendering.GenerateHydrusBitmapFromNumPyImage( numpy_image )
         
+        if self._thumbnail_pixel_store is not None and can_store:
+            
+            # we may have just saved a shrunk thumb back, so check the file again
+            
+            thumbnail_stat = self._GetThumbnailStat( path )
+            
+            if thumbnail_stat is not None:
+                
+                self._thumbnail_pixel_store.StoreHydrusBitmap( hash, bounding_dimensions, thumbnail_stat, hydrus_bitmap )
+                
+            
+        
         return hydrus_bitmap
         
     
+    def _GetThumbnailStat( self, path ):
+        
+        try:
+            
+            stat_result = os.stat( path )
+            
+        except OSError:
+            
+            return None
+            
+        
+        return ( stat_result.st_mtime, stat_result.st_size )
+        
+    
     def _HandleThumbnailException( self, e, summary ):
         
         if self._thumbnail_error_occurred:
@@ -1035,6 +1459,22 @@ class ThumbnailCache( object ):
             
             self._delayed_regeneration_queue_quick.difference_update( cancelled_media_results )
             
+            if page_key in self._page_keys_to_rendered_medias:
+                
+                cancelled_medias = set( medias )
+                
+                rendered_medias = [ media for media in self._page_keys_to_rendered_medias[ page_key ] if media not in cancelled_medias ]
+                
+                if len( rendered_medias ) == 0:
+                    
+                    del self._page_keys_to_rendered_medias[ page_key ]
+                    
+                else:
+                    
+                    self._page_keys_to_rendered_medias[ page_key ] = rendered_medias
+                    
+                
+            
             self._RecalcQueues()
             
         
@@ -1044,6 +1484,7 @@ class ThumbnailCache( object ):
         with self._lock:
             
             self._data_cache.Clear()
+            self._decompressed_data_cache.Clear()
             
             self._special_thumbs = {}
             
@@ -1065,9 +1506,16 @@ class ThumbnailCache( object ):
                 
                 hydrus_bitmap = ClientRendering.GenerateHydrusBitmapFromNumPyImage( numpy_image )
                 
+                hydrus_bitmap.SetDecompressedDataCache( self._decompressed_data_cache )
+                
                 self._special_thumbs[ name ] = hydrus_bitmap
                 
             
+            if self._thumbnail_pixel_store is not None:
+                
+                self._thumbnail_pixel_store.Clear( bounding_dimensions )
+                
+            
             self._controller.pub( 'notify_complete_thumbnail_reset' )
             
             self._waterfall_queue_quick = set()
@@ -1086,6 +1534,11 @@ class ThumbnailCache( object ):
                 self._data_cache.DeleteData( hash )
                 
             
+            if self._thumbnail_pixel_store is not None:
+                
+                self._thumbnail_pixel_store.DeleteThumbnails( hashes )
+                
+            
         
     
     def WaitUntilFree( self ):
@@ -1138,6 +1591,8 @@ class ThumbnailCache( object ):
                         
                         hydrus_bitmap = self._GetThumbnailHydrusBitmap( display_media )
                         
+                        hydrus_bitmap.SetDecompressedDataCache( self._decompressed_data_cache )
+                        
                     except:
                         
                         hydrus_bitmap = self._special_thumbs[ 'hydrus' ]
@@ -1195,17 +1650,13 @@ class ThumbnailCache( object ):
         self._waterfall_event.set()
         
     
-    def MainLoop( self ):
-        
-        last_paused = HydrusData.GetNowPrecise()
+    def WaterfallLoop( self ):
         
         while not HydrusThreading.IsThreadShuttingDown():
             
-            time.sleep( 0.00001 )
-            
             with self._lock:
                 
-                do_wait = len( self._waterfall_queue ) == 0 and len( self._delayed_regeneration_queue ) == 0
+                do_wait = len( self._waterfall_queue ) == 0
                 
             
             if do_wait:
@@ -1214,54 +1665,46 @@ class ThumbnailCache( object ):
                 
                 self._waterfall_event.clear()
                 
-                last_paused = HydrusData.GetNowPrecise()
+            
+            did_pub = self._DoWaterfallWork()
+            
+            if did_pub:
+                
+                time.sleep( 0.00001 )
                 
             
-            start_time = HydrusData.GetNowPrecise()
-            stop_time = start_time + 0.005 # a bit of a typical frame
+        
+    
+    def MainLoop( self ):
+        
+        last_paused = HydrusData.GetNowPrecise()
+        
+        while not HydrusThreading.IsThreadShuttingDown():
             
-            page_keys_to_rendered_medias = collections.defaultdict( list )
+            time.sleep( 0.00001 )
             
-            num_done = 0
-            max_at_once = 16
+            with self._lock:
+                
+                do_wait = len( self._waterfall_queue ) == 0 and len( self._delayed_regeneration_queue ) == 0
+                
             
-            while not HydrusData.TimeHasPassedPrecise( stop_time ) and num_done <= max_at_once:
+            if do_wait:
                 
-                with self._lock:
-                    
-                    if len( self._waterfall_queue ) == 0:
-                        
-                        break
-                        
-                    
-                    result = self._waterfall_queue.pop()
-                    
-                    if len( self._waterfall_queue ) == 0:
-                        
-                        self._waterfall_queue_empty_event.set()
-                        
+                if self._thumbnail_pixel_store is not None:
                     
-                    self._waterfall_queue_quick.discard( result )
+                    self._thumbnail_pixel_store.Flush()
                     
                 
-                ( page_key, media ) = result
+                self._waterfall_event.wait( 1 )
                 
-                if media.GetDisplayMedia() is not None:
-                    
-                    self.GetThumbnail( media )
-                    
-                    page_keys_to_rendered_medias[ page_key ].append( media )
-                    
+                self._waterfall_event.clear()
                 
-                num_done += 1
+                last_paused = HydrusData.GetNowPrecise()
                 
             
-            if len( page_keys_to_rendered_medias ) > 0:
-                
-                for ( page_key, rendered_medias ) in page_keys_to_rendered_medias.items():
-                    
-                    self._controller.pub( 'waterfall_thumbnails', page_key, rendered_medias )
-                    
+            did_pub = self._DoWaterfallWork()
+            
+            if did_pub:
                 
                 time.sleep( 0.00001 )
                 
@@ -1306,4 +1749,348 @@ class ThumbnailCache( object ):
                 
             
         
+        if self._thumbnail_pixel_store is not None:
+            
+            self._thumbnail_pixel_store.Close()
+            
+        
+    
+class ThumbnailPixelStore( object ):
+    
+    # decoded thumbnails, ready to go straight to screen, so a page we have seen before does not have to decode every jpeg again
+    # this is only a cache, so if the file is ever damaged we just throw it away and start again
+    
+    MAX_PENDING_ROWS = 64
+    MMAP_SIZE = 1024 * 1048576
+    
+    def __init__( self, path ):
+        
+        self._path = path
+        
+        self._db = None
+        self._c = None
+        
+        self._pending_keys_to_rows = {}
+        
+        # the waterfall has several threads reading at once, so each gets its own read connection and only the write connection is shared
+        
+        self._read_generation = 0
+        self._read_dbs = []
+        self._thread_local = threading.local()
+        
+        self._lock = threading.Lock()
+        
+        self._InitDB()
+        
+    
+    def _CloseDB( self ):
+        
+        for read_db in self._read_dbs:
+            
+            read_db.close()
+            
+        
+        self._read_dbs = []
+        self._read_generation += 1
+        
+        if self._db is not None:
+            
+            self._c.close()
+            self._db.close()
+            
+            self._db = None
+            self._c = None
+            
+        
+    
+    def _DeleteDBFiles( self ):
+        
+        for path in ( self._path, self._path + '-wal', self._path + '-shm' ):
+            
+            HydrusPaths.DeletePath( path )
+            
+        
+    
+    def _FlushPendingRows( self ):
+        
+        if self._db is None or len( self._pending_keys_to_rows ) == 0:
+            
+            return
+            
+        
+        rows = list( self._pending_keys_to_rows.values() )
+        
+        self._pending_keys_to_rows = {}
+        
+        try:
+            
+            self._c.execute( 'BEGIN IMMEDIATE;' )
+            
+            self._c.executemany( 'REPLACE INTO thumbnail_pixels ( hash, bounding_width, bounding_height, thumbnail_modified_time, thumbnail_size, width, height, depth, compressed, data ) VALUES ( ?, ?, ?, ?, ?, ?, ?, ?, ?, ? );', rows )
+            
+            self._c.execute( 'COMMIT;' )
+            
+        except Exception as e:
+            
+            self._HandleDBError( e )
+            
+        
+    
+    def _GetReadCursor( self ):
+        
+        if getattr( self._thread_local, 'read_generation', None ) != self._read_generation:
+            
+            read_db = sqlite3.connect( pathlib.Path( self._path ).absolute().as_uri() + '?mode=ro', uri = True, isolation_level = None, check_same_thread = False )
+            
+            read_c = read_db.cursor()
+            
+            read_c.execute( 'PRAGMA mmap_size = {};'.format( self.MMAP_SIZE ) )
+            
+            self._read_dbs.append( read_db )
+            
+            self._thread_local.read_generation = self._read_generation
+            self._thread_local.read_c = read_c
+            
+        
+        return self._thread_local.read_c
+        
+    
+    def _HandleDBError( self, e ):
+        
+        HydrusData.Print( 'The decoded thumbnail store at {} had a problem, so it is being reset. The error follows:'.format( self._path ) )
+        
+        HydrusData.PrintException( e, do_wait = False )
+        
+        self._CloseDB()
+        
+        self._DeleteDBFiles()
+        
+        self._InitDB()
+        
+    
+    def _InitDB( self ):
+        
+        try:
+            
+            self._OpenDB()
+            
+        except Exception as e:
+            
+            HydrusData.Print( 'The decoded thumbnail store at {} could not be opened, so it is being recreated. The error follows:'.format( self._path ) )
+            
+            HydrusData.PrintException( e, do_wait = False )
+            
+            self._CloseDB()
+            
+            self._DeleteDBFiles()
+            
+            try:
+                
+                self._OpenDB()
+                
+            except Exception as e:
+                
+                HydrusData.Print( 'The decoded thumbnail store at {} could not be created, so thumbnails will be decoded from disk every time. The error follows:'.format( self._path ) )
+                
+                HydrusData.PrintException( e, do_wait = False )
+                
+                self._CloseDB()
+                
+            
+        
+    
+    def _OpenDB( self ):
+        
+        self._db = sqlite3.connect( self._path, isolation_level = None, check_same_thread = False )
+        
+        self._c = self._db.cursor()
+        
+        self._c.execute( 'PRAGMA journal_mode = WAL;' )
+        self._c.execute( 'PRAGMA synchronous = OFF;' )
+        self._c.execute( 'PRAGMA mmap_size = {};'.format( self.MMAP_SIZE ) )
+        
+        self._c.execute( 'CREATE TABLE IF NOT EXISTS thumbnail_pixels ( hash BLOB_BYTES, bounding_width INTEGER, bounding_height INTEGER, thumbnail_modified_time REAL, thumbnail_size INTEGER, width INTEGER, height INTEGER, depth INTEGER, compressed INTEGER_BOOLEAN, data BLOB_BYTES, PRIMARY KEY ( hash, bounding_width, bounding_height ) );' )
+        
+    
+    def Clear( self, bounding_dimensions ):
+        
+        # the thumbnail size may have changed, in which case the old pixels are never coming back
+        
+        ( bounding_width, bounding_height ) = bounding_dimensions
+        
+        with self._lock:
+            
+            self._FlushPendingRows()
+            
+            if self._db is None:
+                
+                return
+                
+            
+            try:
+                
+                self._c.execute( 'DELETE FROM thumbnail_pixels WHERE bounding_width != ? OR bounding_height != ?;', ( bounding_width, bounding_height ) )
+                
+            except Exception as e:
+                
+                self._HandleDBError( e )
+                
+            
+        
+    
+    def Close( self ):
+        
+        with self._lock:
+            
+            self._FlushPendingRows()
+            
+            self._CloseDB()
+            
+        
+    
+    def DeleteThumbnails( self, hashes ):
+        
+        with self._lock:
+            
+            hashes = set( hashes )
+            
+            self._pending_keys_to_rows = { key : row for ( key, row ) in self._pending_keys_to_rows.items() if key[0] not in hashes }
+            
+            if self._db is None:
+                
+                return
+                
+            
+            try:
+                
+                self._c.executemany( 'DELETE FROM thumbnail_pixels WHERE hash = ?;', ( ( sqlite3.Binary( hash ), ) for hash in hashes ) )
+                
+            except Exception as e:
+                
+                self._HandleDBError( e )
+                
+            
+        
+    
+    def Flush( self ):
+        
+        with self._lock:
+            
+            self._FlushPendingRows()
+            
+        
+    
+    def GetHydrusBitmap( self, hash, bounding_dimensions, thumbnail_stat ):
+        
+        ( bounding_width, bounding_height ) = bounding_dimensions
+        
+        key = ( hash, bounding_width, bounding_height )
+        
+        with self._lock:
+            
+            if key in self._pending_keys_to_rows:
+                
+                row = self._pending_keys_to_rows[ key ]
+                
+                result = row[ 3 : ]
+                
+                read_c = None
+                
+            else:
+                
+                if self._db is None:
+                    
+                    return None
+                    
+                
+                read_generation = self._read_generation
+                
+                try:
+                    
+                    read_c = self._GetReadCursor()
+                    
+                except Exception as e:
+                    
+                    self._HandleDBError( e )
+                    
+                    return None
+                    
+                
+            
+        
+        if read_c is not None:
+            
+            # the select happens outside the lock, so the other waterfall threads can read at the same time
+            
+            try:
+                
+                result = read_c.execute( 'SELECT thumbnail_modified_time, thumbnail_size, width, height, depth, compressed, data FROM thumbnail_pixels WHERE hash = ? AND bounding_width = ? AND bounding_height = ?;', ( sqlite3.Binary( hash ), bounding_width, bounding_height ) ).fetchone()
+                
+            except Exception as e:
+                
+                with self._lock:
+                    
+                    # if another thread already reset the store, our connection was just closed under us
+                    
+                    if read_generation == self._read_generation:
+                        
+                        self._HandleDBError( e )
+                        
+                    
+                
+                return None
+                
+            
+            if result is None:
+                
+                return None
+                
+            
+        
+        ( thumbnail_modified_time, thumbnail_size, width, height, depth, compressed, data ) = result
+        
+        # if the thumbnail file has been replaced behind our back, what we have is stale
+        
+        if ( thumbnail_modified_time, thumbnail_size ) != thumbnail_stat:
+            
+            return None
+            
+        
+        if compressed and not ClientRendering.LZ4_OK:
+            
+            return None
+            
+        
+        return ClientRendering.HydrusBitmap( data, ( width, height ), depth, compressed = compressed, data_is_already_compressed = compressed )
+        
+    
+    def StoreHydrusBitmap( self, hash, bounding_dimensions, thumbnail_stat, hydrus_bitmap ):
+        
+        ( bounding_width, bounding_height ) = bounding_dimensions
+        ( thumbnail_modified_time, thumbnail_size ) = thumbnail_stat
+        
+        ( width, height ) = hydrus_bitmap.GetSize()
+        depth = hydrus_bitmap.GetDepth()
+        
+        ( data, compressed ) = hydrus_bitmap.GetStorageData()
+        
+        key = ( hash, bounding_width, bounding_height )
+        
+        row = ( sqlite3.Binary( hash ), bounding_width, bounding_height, thumbnail_modified_time, thumbnail_size, width, height, depth, compressed, sqlite3.Binary( data ) )
+        
+        with self._lock:
+            
+            if self._db is None:
+                
+                return
+                
+            
+            self._pending_keys_to_rows[ key ] = row
+            
+            if len( self._pending_keys_to_rows ) >= self.MAX_PENDING_ROWS:
+                
+                self._FlushPendingRows()
+                
+            
+        
     
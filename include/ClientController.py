@@ -804,7 +804,9 @@ class Controller( HydrusController.HydrusController ):
         
         self.pub( 'splash_set_status_subtext', 'network' )
         
-        self.parsing_cache = ClientCaches.ParsingCache()
+        self.cache_memory_budget = ClientCaches.CacheMemoryBudget()
+        
+        self.parsing_cache = ClientCaches.ParsingCache( self, memory_budget = self.cache_memory_budget )
         
         client_api_manager = self.Read( 'serialisable', HydrusSerialisable.SERIALISABLE_TYPE_CLIENT_API_MANAGER )
         
@@ -917,8 +919,8 @@ class Controller( HydrusController.HydrusController ):
         
         def qt_code():
             
-            self._caches[ 'images' ] = ClientCaches.RenderedImageCache( self )
-            self._caches[ 'thumbnail' ] = ClientCaches.ThumbnailCache( self )
+            self._caches[ 'images' ] = ClientCaches.RenderedImageCache( self, memory_budget = self.cache_memory_budget )
+            self._caches[ 'thumbnail' ] = ClientCaches.ThumbnailCache( self, memory_budget = self.cache_memory_budget )
             
             self.bitmap_manager = ClientManagers.BitmapManager( self )
             
@@ -1447,7 +1449,9 @@ class Controller( HydrusController.HydrusController ):
         
         if name == 'last session':
             
-            session_hash = hashlib.sha256( bytes( session.DumpToString(), 'utf-8' ) ).digest()
+            # the binary dump reuses the blobs of any seed caches nobody has opened, so an untouched session is cheap to check
+            
+            session_hash = hashlib.sha256( session.DumpToBinary( compression = HydrusSerialisable.BINARY_COMPRESSION_NONE ) ).digest()
             
             if session_hash == self._last_last_session_hash:
                 
@@ -2,9 +2,11 @@ from . import ClientAPI
 from . import ClientCaches
 from . import ClientData
 from . import ClientDefaults
+from . import ClientDuplicates
 from . import ClientFiles
 from . import ClientGUIShortcuts
 from . import ClientImageHandling
+from . import ClientManagers
 from . import ClientMedia
 from . import ClientNetworkingBandwidth
 from . import ClientNetworkingContexts
@@ -42,6 +44,8 @@ import random
 import re
 import sqlite3
 import stat
+import struct
+import threading
 import time
 import traceback
 from qtpy import QtWidgets as QW
@@ -145,6 +149,14 @@ YAML_DUMP_ID_LOCAL_BOORU = 8
 MIN_CACHED_INTEGER = -99999999
 MAX_CACHED_INTEGER = 99999999
 
+# below this, the multi-index only has to check a handful of buckets and beats brute-forcing the in-memory phash index
+MIN_PHASH_INDEX_SEARCH_DISTANCE = 8
+
+BACKUP_PAGES_PER_STEP = 1024
+
+# a tag repository this many update files behind stages its mappings and builds the mappings tables in one go
+REPOSITORY_BULK_MAPPINGS_MIN_UNPROCESSED_UPDATES = 200
+
 def CanCacheInteger( num ):
     
     return MIN_CACHED_INTEGER <= num and num <= MAX_CACHED_INTEGER
@@ -204,6 +216,15 @@ def GenerateMappingsTableNames( service_id ):
     
     return ( current_mappings_table_name, deleted_mappings_table_name, pending_mappings_table_name, petitioned_mappings_table_name )
     
+def GenerateRepositoryBulkMappingsStagingTableNames( service_id ):
+    
+    suffix = str( service_id )
+    
+    mappings_staging_table_name = 'external_mappings.repository_bulk_mappings_staging_' + suffix
+    pairs_staging_table_name = 'external_mappings.repository_bulk_pairs_staging_' + suffix
+    
+    return ( mappings_staging_table_name, pairs_staging_table_name )
+    
 def GenerateRepositoryMasterCacheTableNames( service_id ):
     
     suffix = str( service_id )
@@ -219,6 +240,18 @@ def GenerateRepositoryRepositoryUpdatesTableName( service_id ):
     
     return repository_updates_table_name
     
+def GenerateTagDisplayCacheTableNames( service_id ):
+    
+    suffix = str( service_id )
+    
+    tag_siblings_lookup_table_name = 'external_caches.tag_siblings_lookup_cache_' + suffix
+    
+    display_current_mappings_table_name = 'external_caches.display_current_mappings_cache_' + suffix
+    
+    display_pending_mappings_table_name = 'external_caches.display_pending_mappings_cache_' + suffix
+    
+    return ( tag_siblings_lookup_table_name, display_current_mappings_table_name, display_pending_mappings_table_name )
+    
 def GenerateSpecificMappingsCacheTableNames( file_service_id, tag_service_id ):
     
     suffix = str( file_service_id ) + '_' + str( tag_service_id )
@@ -275,11 +308,17 @@ def report_speed_to_log( precise_timestamp, num_rows, row_name ):
 class DB( HydrusDB.HydrusDB ):
     
     READ_WRITE_ACTIONS = [ 'service_info', 'system_predicates', 'missing_thumbnail_hashes' ]
+    PARALLEL_READ_ACTIONS = [ 'autocomplete_predicates', 'file_hashes', 'file_query_ids', 'hash_status', 'related_tags', 'url_statuses' ]
     
     def __init__( self, controller, db_dir, db_name ):
         
         self._initial_messages = []
         
+        self._backup_job_key = None
+        self._phash_index = None
+        self._subtag_trigrams_available = False
+        self._tag_display_dirty_tag_service_ids = set()
+        
         HydrusDB.HydrusDB.__init__( self, controller, db_dir, db_name )
         
     
@@ -423,6 +462,8 @@ class DB( HydrusDB.HydrusDB ):
                 self._CacheSpecificMappingsGenerate( file_service_id, service_id )
                 
             
+            self._CacheTagDisplayGenerate( service_id )
+            
         
         if service_type in HC.AUTOCOMPLETE_CACHE_SPECIFIC_FILE_SERVICES:
             
@@ -462,6 +503,8 @@ class DB( HydrusDB.HydrusDB ):
         
         self._c.executemany( 'INSERT OR IGNORE INTO tag_siblings ( service_id, bad_tag_id, good_tag_id, status ) VALUES ( ?, ?, ?, ? );', ( ( service_id, bad_tag_id, good_tag_id, HC.CONTENT_STATUS_CURRENT ) for ( bad_tag_id, good_tag_id ) in pairs ) )
         
+        self._CacheTagDisplayNotifySiblingsChanged( service_id )
+        
         tag_ids = set()
         
         for ( bad_tag_id, good_tag_id ) in pairs:
@@ -611,13 +654,44 @@ class DB( HydrusDB.HydrusDB ):
     
     def _Backup( self, path ):
         
-        self._CloseDBCursor()
+        if self._backup_job_key is not None and not self._backup_job_key.IsDone():
+            
+            HydrusData.ShowText( 'A database backup is already running!' )
+            
+            return self._backup_job_key
+            
         
-        try:
+        job_key = ClientThreading.JobKey( cancellable = True )
+        
+        job_key.SetVariable( 'popup_title', 'backing up db' )
+        
+        self._backup_job_key = job_key
+        
+        if HG.no_wal or HG.db_memory_journaling:
             
-            job_key = ClientThreading.JobKey( cancellable = True )
+            self._BackupOffline( path, job_key )
+            
+        else:
+            
+            # the backup reads from its own connection, which only sees what we have committed
+            
+            self._Commit()
             
-            job_key.SetVariable( 'popup_title', 'backing up db' )
+            self._BeginImmediate()
+            
+            self._controller.pub( 'message', job_key )
+            
+            self._controller.CallToThreadLongRunning( self._BackupOnline, path, job_key )
+            
+        
+        return job_key
+        
+    
+    def _BackupOffline( self, path, job_key ):
+        
+        self._CloseDBCursor()
+        
+        try:
             
             self._controller.pub( 'modal_message', job_key )
             
@@ -667,6 +741,242 @@ class DB( HydrusDB.HydrusDB ):
             
         
     
+    def _BackupOnline( self, path, job_key ):
+        
+        # this runs in its own thread with its own read-only connection, copying a consistent snapshot of every db file with the sqlite online backup api while the write connection carries on
+        # a manifest in the backup dir remembers what each file looked like when it was last copied, so an update only copies the files that have changed since
+        
+        with self._read_connections_condition:
+            
+            if not self._read_connections_allowed:
+                
+                job_key.SetVariable( 'popup_text_1', 'the db is not available right now, please try again later' )
+                
+                job_key.Finish()
+                
+                return
+                
+            
+            # the db waits on this before it disconnects, just like a read connection
+            self._num_read_connections_open += 1
+            
+        
+        manifest_path = os.path.join( path, self._db_name + '.backup_manifest.json' )
+        
+        db = None
+        connection_registered = True
+        
+        def unregister_connection():
+            
+            with self._read_connections_condition:
+                
+                self._num_read_connections_open -= 1
+                
+                self._read_connections_condition.notify_all()
+                
+            
+        
+        def get_fingerprint( db_path ):
+            
+            fingerprint = []
+            
+            for p in ( db_path, db_path + '-wal' ):
+                
+                if os.path.exists( p ):
+                    
+                    stat_result = os.stat( p )
+                    
+                    fingerprint.append( [ stat_result.st_size, stat_result.st_mtime_ns ] )
+                    
+                else:
+                    
+                    fingerprint.append( None )
+                    
+                
+            
+            return fingerprint
+            
+        
+        def write_manifest( manifest ):
+            
+            with open( manifest_path, 'w', encoding = 'utf-8' ) as f:
+                
+                json.dump( manifest, f )
+                
+            
+        
+        try:
+            
+            HydrusPaths.MakeSureDirectoryExists( path )
+            
+            manifest = {}
+            
+            if os.path.exists( manifest_path ):
+                
+                try:
+                    
+                    with open( manifest_path, 'r', encoding = 'utf-8' ) as f:
+                        
+                        manifest = json.load( f )
+                        
+                    
+                except:
+                    
+                    manifest = {}
+                    
+                
+            
+            # fingerprint before we take the snapshot, so a change that lands in between just gets copied again next time
+            
+            filenames_to_fingerprints = { filename : get_fingerprint( os.path.join( self._db_dir, filename ) ) for filename in self._db_filenames.values() }
+            
+            db_path = os.path.join( self._db_dir, self._db_filenames[ 'main' ] )
+            
+            db = sqlite3.connect( self._GetReadOnlyURI( db_path ), uri = True, isolation_level = None )
+            
+            c = db.cursor()
+            
+            self._AttachExternalDatabasesReadOnly( c )
+            
+            # holding one read transaction across every file means the writes that come in meanwhile do not restart the copy or tear it
+            
+            c.execute( 'BEGIN DEFERRED;' )
+            
+            for name in self._db_filenames.keys():
+                
+                c.execute( 'SELECT 1 FROM {}.sqlite_master;'.format( name ) ).fetchone()
+                
+            
+            for ( name, filename ) in self._db_filenames.items():
+                
+                dest = os.path.join( path, filename )
+                
+                if filename in manifest and os.path.exists( dest ):
+                    
+                    ( source_fingerprint, dest_fingerprint ) = manifest[ filename ]
+                    
+                    if source_fingerprint == filenames_to_fingerprints[ filename ] and dest_fingerprint == get_fingerprint( dest ):
+                        
+                        continue
+                        
+                    
+                
+                def progress_hook( status, remaining, total ):
+                    
+                    if job_key.IsCancelled() or not self._read_connections_allowed or HG.model_shutdown:
+                        
+                        raise HydrusExceptions.CancelledException( 'Backup cancelled!' )
+                        
+                    
+                    job_key.SetVariable( 'popup_text_1', 'copying ' + filename + ': ' + HydrusData.ConvertValueRangeToPrettyString( total - remaining, total ) + ' pages' )
+                    job_key.SetVariable( 'popup_gauge_1', ( total - remaining, total ) )
+                    
+                    # leave the disk to the user while they are about
+                    
+                    if not self._controller.CurrentlyIdle():
+                        
+                        time.sleep( 0.05 )
+                        
+                    
+                
+                temp_dest = dest + '.temp'
+                
+                dest_db = sqlite3.connect( temp_dest )
+                
+                try:
+                    
+                    db.backup( dest_db, pages = BACKUP_PAGES_PER_STEP, progress = progress_hook, name = name )
+                    
+                except:
+                    
+                    dest_db.close()
+                    
+                    HydrusPaths.DeletePath( temp_dest )
+                    
+                    raise
+                    
+                
+                dest_db.close()
+                
+                if os.path.exists( dest ):
+                    
+                    HydrusPaths.MakeFileWritable( dest )
+                    
+                
+                os.replace( temp_dest, dest )
+                
+                manifest[ filename ] = ( filenames_to_fingerprints[ filename ], get_fingerprint( dest ) )
+                
+                write_manifest( manifest )
+                
+            
+            c.execute( 'COMMIT;' )
+            
+            c.close()
+            db.close()
+            
+            db = None
+            
+            unregister_connection()
+            
+            connection_registered = False
+            
+            job_key.DeleteVariable( 'popup_gauge_1' )
+            
+            def is_cancelled_hook():
+                
+                return job_key.IsCancelled() or HG.model_shutdown
+                
+            
+            def text_update_hook( text ):
+                
+                job_key.SetVariable( 'popup_text_1', text )
+                
+            
+            client_files_default = os.path.join( self._db_dir, 'client_files' )
+            
+            if os.path.exists( client_files_default ):
+                
+                HydrusPaths.MirrorTree( client_files_default, os.path.join( path, 'client_files' ), text_update_hook = text_update_hook, is_cancelled_hook = is_cancelled_hook )
+                
+            
+            if job_key.IsCancelled():
+                
+                job_key.SetVariable( 'popup_text_1', 'backup cancelled!' )
+                
+            else:
+                
+                job_key.SetVariable( 'popup_text_1', 'backup complete!' )
+                
+            
+        except HydrusExceptions.CancelledException:
+            
+            job_key.SetVariable( 'popup_text_1', 'backup cancelled!' )
+            
+        except Exception as e:
+            
+            job_key.SetVariable( 'popup_text_1', 'backup failed!' )
+            
+            HydrusData.ShowException( e )
+            
+        finally:
+            
+            if db is not None:
+                
+                db.close()
+                
+            
+            if connection_registered:
+                
+                unregister_connection()
+                
+            
+            job_key.DeleteVariable( 'popup_gauge_1' )
+            
+            job_key.Finish()
+            
+        
+    
     def _CacheCombinedFilesMappingsDrop( self, service_id ):
         
         ac_cache_table_name = GenerateCombinedFilesMappingsCacheTableName( service_id )
@@ -1233,63 +1543,374 @@ class DB( HydrusDB.HydrusDB ):
             
         
     
-    def _CheckDBIntegrity( self ):
+    def _CacheSubtagTrigramsCanSearch( self, wildcard ):
         
-        prefix_string = 'checking db integrity: '
+        # the index can only narrow things down if there is a run of at least three real characters to look up
         
-        job_key = ClientThreading.JobKey( cancellable = True )
+        return self._subtag_trigrams_available and max( ( len( part ) for part in wildcard.split( '*' ) ) ) >= 3
+        
+    
+    def _CacheSubtagTrigramsDrop( self ):
+        
+        self._c.execute( 'DROP TABLE IF EXISTS external_master.subtags_trigrams;' )
+        
+        self._subtag_trigrams_available = False
+        
+    
+    def _CacheSubtagTrigramsGenerate( self ):
+        
+        # the trigram tokenizer needs fts5 and sqlite 3.34+. if we do not have it, complex wildcard searches just scan the subtags table as before
         
         try:
             
-            job_key.SetVariable( 'popup_title', prefix_string + 'preparing' )
+            self._c.execute( 'CREATE VIRTUAL TABLE IF NOT EXISTS external_master.subtags_trigrams USING fts5( subtag, content = \'subtags\', content_rowid = \'subtag_id\', tokenize = \'trigram\' );' )
             
-            self._controller.pub( 'modal_message', job_key )
+        except sqlite3.OperationalError:
             
-            num_errors = 0
+            self._subtag_trigrams_available = False
             
-            job_key.SetVariable( 'popup_title', prefix_string + 'running' )
-            job_key.SetVariable( 'popup_text_1', 'errors found so far: ' + HydrusData.ToHumanInt( num_errors ) )
+            return
             
-            db_names = [ name for ( index, name, path ) in self._c.execute( 'PRAGMA database_list;' ) if name not in ( 'mem', 'temp', 'durable_temp' ) ]
+        
+        self._c.execute( 'INSERT INTO subtags_trigrams ( subtags_trigrams ) VALUES ( ? );', ( 'rebuild', ) )
+        
+        self._subtag_trigrams_available = True
+        
+    
+    def _CacheTagDisplayAddMappings( self, tag_service_id, status, mappings_ids ):
+        
+        ( tag_siblings_lookup_table_name, display_current_mappings_table_name, display_pending_mappings_table_name ) = GenerateTagDisplayCacheTableNames( tag_service_id )
+        
+        if status == HC.CONTENT_STATUS_CURRENT:
             
-            for db_name in db_names:
-                
-                for ( text, ) in self._c.execute( 'PRAGMA ' + db_name + '.integrity_check;' ):
-                    
-                    ( i_paused, should_quit ) = job_key.WaitIfNeeded()
-                    
-                    if should_quit:
-                        
-                        job_key.SetVariable( 'popup_title', prefix_string + 'cancelled' )
-                        job_key.SetVariable( 'popup_text_1', 'errors found: ' + HydrusData.ToHumanInt( num_errors ) )
-                        
-                        return
-                        
-                    
-                    if text != 'ok':
-                        
-                        if num_errors == 0:
-                            
-                            HydrusData.Print( 'During a db integrity check, these errors were discovered:' )
-                            
-                        
-                        HydrusData.Print( text )
-                        
-                        num_errors += 1
-                        
-                    
-                    job_key.SetVariable( 'popup_text_1', 'errors found so far: ' + HydrusData.ToHumanInt( num_errors ) )
-                    
-                
+            display_mappings_table_name = display_current_mappings_table_name
             
-        finally:
+        else:
             
-            job_key.SetVariable( 'popup_title', prefix_string + 'completed' )
-            job_key.SetVariable( 'popup_text_1', 'errors found: ' + HydrusData.ToHumanInt( num_errors ) )
+            display_mappings_table_name = display_pending_mappings_table_name
             
-            HydrusData.Print( job_key.ToString() )
+        
+        for ( tag_id, hash_ids ) in mappings_ids:
             
-            job_key.Finish()
+            ideal_tag_id = self._CacheTagDisplayGetIdealTagId( tag_service_id, tag_id )
+            
+            self._c.executemany( 'INSERT OR IGNORE INTO ' + display_mappings_table_name + ' ( hash_id, tag_id ) VALUES ( ?, ? );', ( ( hash_id, ideal_tag_id ) for hash_id in hash_ids ) )
+            
+        
+    
+    def _CacheTagDisplayDeleteMappings( self, tag_service_id, status, mappings_ids ):
+        
+        # the ideal tag stays as long as the file still has any tag in its sibling chain
+        
+        ( current_mappings_table_name, deleted_mappings_table_name, pending_mappings_table_name, petitioned_mappings_table_name ) = GenerateMappingsTableNames( tag_service_id )
+        ( tag_siblings_lookup_table_name, display_current_mappings_table_name, display_pending_mappings_table_name ) = GenerateTagDisplayCacheTableNames( tag_service_id )
+        
+        if status == HC.CONTENT_STATUS_CURRENT:
+            
+            ( mappings_table_name, display_mappings_table_name ) = ( current_mappings_table_name, display_current_mappings_table_name )
+            
+        else:
+            
+            ( mappings_table_name, display_mappings_table_name ) = ( pending_mappings_table_name, display_pending_mappings_table_name )
+            
+        
+        for ( tag_id, hash_ids ) in mappings_ids:
+            
+            ideal_tag_id = self._CacheTagDisplayGetIdealTagId( tag_service_id, tag_id )
+            
+            chain_tag_ids = self._CacheTagDisplayGetChainTagIds( tag_service_id, ideal_tag_id )
+            
+            delete_statement = 'DELETE FROM ' + display_mappings_table_name + ' WHERE hash_id = ? AND tag_id = ? AND NOT EXISTS ( SELECT 1 FROM ' + mappings_table_name + ' WHERE hash_id = ? AND tag_id IN ' + HydrusData.SplayListForDB( chain_tag_ids ) + ' );'
+            
+            self._c.executemany( delete_statement, ( ( hash_id, ideal_tag_id, hash_id ) for hash_id in hash_ids ) )
+            
+        
+    
+    def _CacheTagDisplayDrop( self, tag_service_id ):
+        
+        ( tag_siblings_lookup_table_name, display_current_mappings_table_name, display_pending_mappings_table_name ) = GenerateTagDisplayCacheTableNames( tag_service_id )
+        
+        self._c.execute( 'DROP TABLE IF EXISTS ' + tag_siblings_lookup_table_name + ';' )
+        self._c.execute( 'DROP TABLE IF EXISTS ' + display_current_mappings_table_name + ';' )
+        self._c.execute( 'DROP TABLE IF EXISTS ' + display_pending_mappings_table_name + ';' )
+        
+    
+    def _CacheTagDisplayGenerate( self, tag_service_id ):
+        
+        ( current_mappings_table_name, deleted_mappings_table_name, pending_mappings_table_name, petitioned_mappings_table_name ) = GenerateMappingsTableNames( tag_service_id )
+        ( tag_siblings_lookup_table_name, display_current_mappings_table_name, display_pending_mappings_table_name ) = GenerateTagDisplayCacheTableNames( tag_service_id )
+        
+        self._c.execute( 'CREATE TABLE ' + tag_siblings_lookup_table_name + ' ( bad_tag_id INTEGER PRIMARY KEY, ideal_tag_id INTEGER );' )
+        
+        self._c.execute( 'CREATE TABLE ' + display_current_mappings_table_name + ' ( hash_id INTEGER, tag_id INTEGER, PRIMARY KEY ( hash_id, tag_id ) ) WITHOUT ROWID;' )
+        
+        self._c.execute( 'CREATE TABLE ' + display_pending_mappings_table_name + ' ( hash_id INTEGER, tag_id INTEGER, PRIMARY KEY ( hash_id, tag_id ) ) WITHOUT ROWID;' )
+        
+        #
+        
+        service_ids_to_siblings_lookups = self._CacheTagDisplayGetSiblingsLookups( ( tag_service_id, ) )
+        
+        self._c.executemany( 'INSERT INTO ' + tag_siblings_lookup_table_name + ' ( bad_tag_id, ideal_tag_id ) VALUES ( ?, ? );', service_ids_to_siblings_lookups[ tag_service_id ].items() )
+        
+        for ( mappings_table_name, display_mappings_table_name ) in ( ( current_mappings_table_name, display_current_mappings_table_name ), ( pending_mappings_table_name, display_pending_mappings_table_name ) ):
+            
+            self._c.execute( 'INSERT OR IGNORE INTO ' + display_mappings_table_name + ' ( hash_id, tag_id ) SELECT hash_id, IFNULL( ideal_tag_id, tag_id ) FROM ' + mappings_table_name + ' LEFT JOIN ' + tag_siblings_lookup_table_name + ' ON ( tag_id = bad_tag_id );' )
+            
+        
+        self._CreateIndex( tag_siblings_lookup_table_name, [ 'ideal_tag_id' ] )
+        self._CreateIndex( display_current_mappings_table_name, [ 'tag_id', 'hash_id' ], unique = True )
+        self._CreateIndex( display_pending_mappings_table_name, [ 'tag_id', 'hash_id' ], unique = True )
+        
+    
+    def _CacheTagDisplayGetApplyAllSiblings( self ):
+        
+        # the value the caches were last built with, which can lag the live option by a job
+        
+        return self._GetJSONSimple( 'tag_display_cache_apply_all_siblings' ) is True
+        
+    
+    def _CacheTagDisplayGetChainTagIds( self, tag_service_id, ideal_tag_id ):
+        
+        ( tag_siblings_lookup_table_name, display_current_mappings_table_name, display_pending_mappings_table_name ) = GenerateTagDisplayCacheTableNames( tag_service_id )
+        
+        chain_tag_ids = self._STL( self._c.execute( 'SELECT bad_tag_id FROM ' + tag_siblings_lookup_table_name + ' WHERE ideal_tag_id = ?;', ( ideal_tag_id, ) ) )
+        
+        chain_tag_ids.append( ideal_tag_id )
+        
+        return chain_tag_ids
+        
+    
+    def _CacheTagDisplayGetIdealTagId( self, tag_service_id, tag_id ):
+        
+        ( tag_siblings_lookup_table_name, display_current_mappings_table_name, display_pending_mappings_table_name ) = GenerateTagDisplayCacheTableNames( tag_service_id )
+        
+        result = self._c.execute( 'SELECT ideal_tag_id FROM ' + tag_siblings_lookup_table_name + ' WHERE bad_tag_id = ?;', ( tag_id, ) ).fetchone()
+        
+        if result is None:
+            
+            return tag_id
+            
+        
+        ( ideal_tag_id, ) = result
+        
+        return ideal_tag_id
+        
+    
+    def _CacheTagDisplayGetSiblingsLookups( self, tag_service_ids ):
+        
+        # this is the same collapse the siblings manager does, done on the tag text so conflicts resolve the same way
+        
+        apply_all_siblings = self._CacheTagDisplayGetApplyAllSiblings()
+        
+        if apply_all_siblings:
+            
+            source_tag_service_ids = self._GetServiceIds( HC.TAG_SERVICES )
+            
+        else:
+            
+            source_tag_service_ids = tag_service_ids
+            
+        
+        service_ids_to_pair_ids = {}
+        
+        for service_id in source_tag_service_ids:
+            
+            service_ids_to_pair_ids[ service_id ] = self._c.execute( 'SELECT bad_tag_id, good_tag_id FROM tag_siblings WHERE service_id = ? AND status = ? UNION SELECT bad_tag_id, good_tag_id FROM tag_sibling_petitions WHERE service_id = ? AND status = ?;', ( service_id, HC.CONTENT_STATUS_CURRENT, service_id, HC.CONTENT_STATUS_PENDING ) ).fetchall()
+            
+        
+        all_tag_ids = set( itertools.chain.from_iterable( itertools.chain.from_iterable( service_ids_to_pair_ids.values() ) ) )
+        
+        self._PopulateTagIdsToTagsCache( all_tag_ids )
+        
+        tags_to_tag_ids = { self._tag_ids_to_tags_cache[ tag_id ] : tag_id for tag_id in all_tag_ids }
+        
+        def collapse_pair_ids( groups_of_pair_ids ):
+            
+            groups_of_pairs = [ [ ( self._tag_ids_to_tags_cache[ bad_tag_id ], self._tag_ids_to_tags_cache[ good_tag_id ] ) for ( bad_tag_id, good_tag_id ) in pair_ids ] for pair_ids in groups_of_pair_ids ]
+            
+            siblings = ClientManagers.CollapseTagSiblingPairs( groups_of_pairs )
+            
+            return { tags_to_tag_ids[ bad ] : tags_to_tag_ids[ good ] for ( bad, good ) in siblings.items() }
+            
+        
+        if apply_all_siblings:
+            
+            local_tag_service_ids = set( self._GetServiceIds( ( HC.LOCAL_TAG, ) ) )
+            
+            local_pair_ids = set()
+            tag_repo_pair_ids = set()
+            
+            for ( service_id, pair_ids ) in service_ids_to_pair_ids.items():
+                
+                if service_id in local_tag_service_ids:
+                    
+                    local_pair_ids.update( pair_ids )
+                    
+                else:
+                    
+                    tag_repo_pair_ids.update( pair_ids )
+                    
+                
+            
+            combined_siblings_lookup = collapse_pair_ids( [ local_pair_ids, tag_repo_pair_ids ] )
+            
+            return { tag_service_id : combined_siblings_lookup for tag_service_id in tag_service_ids }
+            
+        else:
+            
+            return { tag_service_id : collapse_pair_ids( [ service_ids_to_pair_ids[ tag_service_id ] ] ) for tag_service_id in tag_service_ids }
+            
+        
+    
+    def _CacheTagDisplayNotifySiblingsChanged( self, tag_service_id ):
+        
+        if self._CacheTagDisplayGetApplyAllSiblings():
+            
+            self._tag_display_dirty_tag_service_ids.update( self._GetServiceIds( HC.TAG_SERVICES ) )
+            
+        else:
+            
+            self._tag_display_dirty_tag_service_ids.add( tag_service_id )
+            
+        
+    
+    def _CacheTagDisplaySetApplyAllSiblings( self, apply_all_siblings ):
+        
+        if apply_all_siblings != self._CacheTagDisplayGetApplyAllSiblings():
+            
+            self._SetJSONSimple( 'tag_display_cache_apply_all_siblings', apply_all_siblings )
+            
+            self._tag_display_dirty_tag_service_ids.update( self._GetServiceIds( HC.TAG_SERVICES ) )
+            
+        
+    
+    def _CacheTagDisplaySyncSiblings( self ):
+        
+        # siblings have changed, so we diff the old and new lookups and rebuild just the chains that moved
+        
+        tag_service_ids = set( self._GetServiceIds( HC.TAG_SERVICES ) ).intersection( self._tag_display_dirty_tag_service_ids )
+        
+        self._tag_display_dirty_tag_service_ids = set()
+        
+        if len( tag_service_ids ) == 0:
+            
+            return
+            
+        
+        service_ids_to_siblings_lookups = self._CacheTagDisplayGetSiblingsLookups( tag_service_ids )
+        
+        display_changed = False
+        
+        for tag_service_id in tag_service_ids:
+            
+            ( current_mappings_table_name, deleted_mappings_table_name, pending_mappings_table_name, petitioned_mappings_table_name ) = GenerateMappingsTableNames( tag_service_id )
+            ( tag_siblings_lookup_table_name, display_current_mappings_table_name, display_pending_mappings_table_name ) = GenerateTagDisplayCacheTableNames( tag_service_id )
+            
+            old_siblings_lookup = dict( self._c.execute( 'SELECT bad_tag_id, ideal_tag_id FROM ' + tag_siblings_lookup_table_name + ';' ) )
+            new_siblings_lookup = service_ids_to_siblings_lookups[ tag_service_id ]
+            
+            changed_tag_ids = { tag_id for tag_id in set( old_siblings_lookup.keys() ).union( new_siblings_lookup.keys() ) if old_siblings_lookup.get( tag_id ) != new_siblings_lookup.get( tag_id ) }
+            
+            if len( changed_tag_ids ) == 0:
+                
+                continue
+                
+            
+            self._c.executemany( 'DELETE FROM ' + tag_siblings_lookup_table_name + ' WHERE bad_tag_id = ?;', ( ( tag_id, ) for tag_id in changed_tag_ids ) )
+            self._c.executemany( 'INSERT INTO ' + tag_siblings_lookup_table_name + ' ( bad_tag_id, ideal_tag_id ) VALUES ( ?, ? );', ( ( tag_id, new_siblings_lookup[ tag_id ] ) for tag_id in changed_tag_ids if tag_id in new_siblings_lookup ) )
+            
+            # every chain that lost or gained a member gets wiped and refilled from the storage mappings
+            
+            affected_ideal_tag_ids = set( changed_tag_ids )
+            
+            affected_ideal_tag_ids.update( ( old_siblings_lookup[ tag_id ] for tag_id in changed_tag_ids if tag_id in old_siblings_lookup ) )
+            affected_ideal_tag_ids.update( ( new_siblings_lookup[ tag_id ] for tag_id in changed_tag_ids if tag_id in new_siblings_lookup ) )
+            
+            for ( mappings_table_name, display_mappings_table_name ) in ( ( current_mappings_table_name, display_current_mappings_table_name ), ( pending_mappings_table_name, display_pending_mappings_table_name ) ):
+                
+                self._c.executemany( 'DELETE FROM ' + display_mappings_table_name + ' WHERE tag_id = ?;', ( ( ideal_tag_id, ) for ideal_tag_id in affected_ideal_tag_ids ) )
+                
+                for ideal_tag_id in affected_ideal_tag_ids:
+                    
+                    if ideal_tag_id in new_siblings_lookup:
+                        
+                        # no longer an ideal, so nothing collapses to it
+                        
+                        continue
+                        
+                    
+                    chain_tag_ids = self._CacheTagDisplayGetChainTagIds( tag_service_id, ideal_tag_id )
+                    
+                    self._c.executemany( 'INSERT OR IGNORE INTO ' + display_mappings_table_name + ' ( hash_id, tag_id ) SELECT hash_id, ? FROM ' + mappings_table_name + ' WHERE tag_id = ?;', ( ( ideal_tag_id, chain_tag_id ) for chain_tag_id in chain_tag_ids ) )
+                    
+                
+            
+            display_changed = True
+            
+        
+        if display_changed:
+            
+            self.pub_after_job( 'notify_new_force_refresh_tags_data' )
+            
+        
+    
+    def _CheckDBIntegrity( self ):
+        
+        prefix_string = 'checking db integrity: '
+        
+        job_key = ClientThreading.JobKey( cancellable = True )
+        
+        try:
+            
+            job_key.SetVariable( 'popup_title', prefix_string + 'preparing' )
+            
+            self._controller.pub( 'modal_message', job_key )
+            
+            num_errors = 0
+            
+            job_key.SetVariable( 'popup_title', prefix_string + 'running' )
+            job_key.SetVariable( 'popup_text_1', 'errors found so far: ' + HydrusData.ToHumanInt( num_errors ) )
+            
+            db_names = [ name for ( index, name, path ) in self._c.execute( 'PRAGMA database_list;' ) if name not in ( 'mem', 'temp', 'durable_temp' ) ]
+            
+            for db_name in db_names:
+                
+                for ( text, ) in self._c.execute( 'PRAGMA ' + db_name + '.integrity_check;' ):
+                    
+                    ( i_paused, should_quit ) = job_key.WaitIfNeeded()
+                    
+                    if should_quit:
+                        
+                        job_key.SetVariable( 'popup_title', prefix_string + 'cancelled' )
+                        job_key.SetVariable( 'popup_text_1', 'errors found: ' + HydrusData.ToHumanInt( num_errors ) )
+                        
+                        return
+                        
+                    
+                    if text != 'ok':
+                        
+                        if num_errors == 0:
+                            
+                            HydrusData.Print( 'During a db integrity check, these errors were discovered:' )
+                            
+                        
+                        HydrusData.Print( text )
+                        
+                        num_errors += 1
+                        
+                    
+                    job_key.SetVariable( 'popup_text_1', 'errors found so far: ' + HydrusData.ToHumanInt( num_errors ) )
+                    
+                
+            
+        finally:
+            
+            job_key.SetVariable( 'popup_title', prefix_string + 'completed' )
+            job_key.SetVariable( 'popup_text_1', 'errors found: ' + HydrusData.ToHumanInt( num_errors ) )
+            
+            HydrusData.Print( job_key.ToString() )
+            
+            job_key.Finish()
             
         
     
@@ -1555,6 +2176,8 @@ class DB( HydrusDB.HydrusDB ):
         
         self._c.execute( 'CREATE VIRTUAL TABLE IF NOT EXISTS external_master.subtags_fts4 USING fts4( subtag );' )
         
+        self._CacheSubtagTrigramsGenerate()
+        
         self._c.execute( 'CREATE TABLE IF NOT EXISTS external_master.tags ( tag_id INTEGER PRIMARY KEY, namespace_id INTEGER, subtag_id INTEGER );' )
         self._CreateIndex( 'external_master.tags', [ 'subtag_id', 'namespace_id' ] )
         
@@ -1694,6 +2317,15 @@ class DB( HydrusDB.HydrusDB ):
         self._c.executemany( 'INSERT INTO json_dumps_named VALUES ( ?, ?, ?, ?, ? );', ClientDefaults.GetDefaultScriptRows() )
         
     
+    def _CreateDBCachesMultiIndexHashes( self ):
+        
+        self._c.execute( 'CREATE TABLE IF NOT EXISTS external_caches.shape_multi_index_hashes ( phash_id INTEGER PRIMARY KEY, block_0 INTEGER, block_1 INTEGER, block_2 INTEGER, block_3 INTEGER );' )
+        self._CreateIndex( 'external_caches.shape_multi_index_hashes', [ 'block_0' ] )
+        self._CreateIndex( 'external_caches.shape_multi_index_hashes', [ 'block_1' ] )
+        self._CreateIndex( 'external_caches.shape_multi_index_hashes', [ 'block_2' ] )
+        self._CreateIndex( 'external_caches.shape_multi_index_hashes', [ 'block_3' ] )
+        
+    
     def _CreateDBCaches( self ):
         
         self._c.execute( 'CREATE TABLE IF NOT EXISTS external_caches.file_maintenance_jobs ( hash_id INTEGER, job_type INTEGER, time_can_start INTEGER, PRIMARY KEY ( hash_id, job_type ) );' )
@@ -1706,6 +2338,8 @@ class DB( HydrusDB.HydrusDB ):
         self._c.execute( 'CREATE TABLE IF NOT EXISTS external_caches.shape_vptree ( phash_id INTEGER PRIMARY KEY, parent_id INTEGER, radius INTEGER, inner_id INTEGER, inner_population INTEGER, outer_id INTEGER, outer_population INTEGER );' )
         self._CreateIndex( 'external_caches.shape_vptree', [ 'parent_id' ] )
         
+        self._CreateDBCachesMultiIndexHashes()
+        
         self._c.execute( 'CREATE TABLE IF NOT EXISTS external_caches.shape_maintenance_branch_regen ( phash_id INTEGER PRIMARY KEY );' )
         
         self._c.execute( 'CREATE TABLE IF NOT EXISTS external_caches.shape_search_cache ( hash_id INTEGER PRIMARY KEY, searched_distance INTEGER );' )
@@ -1909,6 +2543,8 @@ class DB( HydrusDB.HydrusDB ):
             self._c.execute( 'DELETE FROM tag_sibling_petitions WHERE service_id = ?;', ( service_id, ) )
             self._c.execute( 'DELETE FROM tag_parent_petitions WHERE service_id = ?;', ( service_id, ) )
             
+            self._CacheTagDisplayNotifySiblingsChanged( service_id )
+            
         elif service.GetServiceType() in ( HC.FILE_REPOSITORY, HC.IPFS ):
             
             self._c.execute( 'DELETE FROM file_transfers WHERE service_id = ?;', ( service_id, ) )
@@ -2003,6 +2639,17 @@ class DB( HydrusDB.HydrusDB ):
                 self._CacheSpecificMappingsDrop( file_service_id, service_id )
                 
             
+            self._CacheTagDisplayDrop( service_id )
+            
+            for staging_table_name in GenerateRepositoryBulkMappingsStagingTableNames( service_id ):
+                
+                self._c.execute( 'DROP TABLE IF EXISTS ' + staging_table_name + ';' )
+                
+            
+            # with 'apply all siblings', the other services may have been using this one's siblings
+            
+            self._CacheTagDisplayNotifySiblingsChanged( service_id )
+            
         
         if service_type in HC.AUTOCOMPLETE_CACHE_SPECIFIC_FILE_SERVICES:
             
@@ -2056,6 +2703,8 @@ class DB( HydrusDB.HydrusDB ):
         
         self._c.executemany( 'INSERT OR IGNORE INTO tag_siblings ( service_id, bad_tag_id, good_tag_id, status ) VALUES ( ?, ?, ?, ? );', ( ( service_id, bad_tag_id, good_tag_id, HC.CONTENT_STATUS_DELETED ) for ( bad_tag_id, good_tag_id ) in pairs ) )
         
+        self._CacheTagDisplayNotifySiblingsChanged( service_id )
+        
     
     def _DeleteYAMLDump( self, dump_type, dump_name = None ):
         
@@ -2354,7 +3003,7 @@ class DB( HydrusDB.HydrusDB ):
         
         # can't just pull explicit king_hash_ids, since files not in the system are considered king of their group
         
-        if not isinstance( allowed_hash_ids, set ):
+        if not isinstance( allowed_hash_ids, ( set, HydrusDB.HashIdSet ) ):
             
             allowed_hash_ids = set( allowed_hash_ids )
             
@@ -4129,8 +4778,17 @@ class DB( HydrusDB.HydrusDB ):
                     
                     like_param = ConvertWildcardToSQLiteLikeParameter( half_complete_subtag )
                     
-                    t_j = ' NATURAL JOIN subtags'
-                    pred = 'subtag LIKE ?'
+                    if self._CacheSubtagTrigramsCanSearch( half_complete_subtag ):
+                        
+                        t_j = ''
+                        pred = 'subtag_id IN ( SELECT rowid FROM subtags_trigrams WHERE subtag LIKE ? )'
+                        
+                    else:
+                        
+                        t_j = ' NATURAL JOIN subtags'
+                        pred = 'subtag LIKE ?'
+                        
+                    
                     param = like_param
                     
                 else:
@@ -4718,6 +5376,7 @@ class DB( HydrusDB.HydrusDB ):
         #
         
         tag_data = []
+        display_tag_data = []
         
         tag_service_ids = self._GetServiceIds( HC.TAG_SERVICES )
         
@@ -4742,10 +5401,26 @@ class DB( HydrusDB.HydrusDB ):
             
             tag_data.extend( ( hash_id, ( tag_service_id, HC.CONTENT_STATUS_PETITIONED, tag_id ) ) for ( hash_id, tag_id ) in self._ExecuteManySelectSingleParam( 'SELECT hash_id, tag_id FROM ' + petitioned_mappings_table_name + ' WHERE hash_id = ?;', hash_ids ) )
             
+            # and the sibling-collapsed tags. current and pending are materialised, the rarer deleted and petitioned go through the siblings lookup
+            
+            ( tag_siblings_lookup_table_name, display_current_mappings_table_name, display_pending_mappings_table_name ) = GenerateTagDisplayCacheTableNames( tag_service_id )
+            
+            display_tag_data.extend( ( hash_id, ( tag_service_id, HC.CONTENT_STATUS_CURRENT, tag_id ) ) for ( hash_id, tag_id ) in self._ExecuteManySelectSingleParam( 'SELECT hash_id, tag_id FROM ' + display_current_mappings_table_name + ' WHERE hash_id = ?;', hash_ids ) )
+            display_tag_data.extend( ( hash_id, ( tag_service_id, HC.CONTENT_STATUS_PENDING, tag_id ) ) for ( hash_id, tag_id ) in self._ExecuteManySelectSingleParam( 'SELECT hash_id, tag_id FROM ' + display_pending_mappings_table_name + ' WHERE hash_id = ?;', hash_ids ) )
+            
+            for ( status, mappings_table_name ) in ( ( HC.CONTENT_STATUS_DELETED, deleted_mappings_table_name ), ( HC.CONTENT_STATUS_PETITIONED, petitioned_mappings_table_name ) ):
+                
+                select_statement = 'SELECT hash_id, IFNULL( ideal_tag_id, tag_id ) FROM ' + mappings_table_name + ' LEFT JOIN ' + tag_siblings_lookup_table_name + ' ON ( tag_id = bad_tag_id ) WHERE hash_id = ?;'
+                
+                display_tag_data.extend( ( hash_id, ( tag_service_id, status, tag_id ) ) for ( hash_id, tag_id ) in self._ExecuteManySelectSingleParam( select_statement, hash_ids ) )
+                
+            
         
         seen_tag_ids = { tag_id for ( hash_id, ( tag_service_id, status, tag_id ) ) in tag_data }
+        seen_tag_ids.update( ( tag_id for ( hash_id, ( tag_service_id, status, tag_id ) ) in display_tag_data ) )
         
         hash_ids_to_raw_tag_data = HydrusData.BuildKeyToListDict( tag_data )
+        hash_ids_to_raw_display_tag_data = HydrusData.BuildKeyToListDict( display_tag_data )
         
         self._PopulateTagIdsToTagsCache( seen_tag_ids )
         
@@ -4765,7 +5440,15 @@ class DB( HydrusDB.HydrusDB ):
             
             service_keys_to_statuses_to_tags.update( { service_ids_to_service_keys[ service_id ] : HydrusData.BuildKeyToSetDict( tag_data ) for ( service_id, tag_data ) in list(service_ids_to_tag_data.items()) } )
             
-            tags_manager = ClientMedia.TagsManager( service_keys_to_statuses_to_tags )
+            raw_display_tag_data = hash_ids_to_raw_display_tag_data[ hash_id ]
+            
+            service_ids_to_display_tag_data = HydrusData.BuildKeyToListDict( ( ( tag_service_id, ( status, self._tag_ids_to_tags_cache[ tag_id ] ) ) for ( tag_service_id, status, tag_id ) in raw_display_tag_data ) )
+            
+            service_keys_to_statuses_to_display_tags = collections.defaultdict( HydrusData.default_dict_set )
+            
+            service_keys_to_statuses_to_display_tags.update( { service_ids_to_service_keys[ service_id ] : HydrusData.BuildKeyToSetDict( display_tag_data ) for ( service_id, display_tag_data ) in service_ids_to_display_tag_data.items() } )
+            
+            tags_manager = ClientMedia.TagsManager( service_keys_to_statuses_to_tags, service_keys_to_statuses_to_display_tags )
             
             hash_ids_to_tag_managers[ hash_id ] = tags_manager
             
@@ -5013,7 +5696,7 @@ class DB( HydrusDB.HydrusDB ):
         
         if query_hash_ids is not None:
             
-            query_hash_ids = set( query_hash_ids )
+            query_hash_ids = HydrusDB.HashIdSet( query_hash_ids )
             
         
         self._controller.ResetIdleTimer()
@@ -5162,16 +5845,11 @@ class DB( HydrusDB.HydrusDB ):
         
         # start with some quick ways to populate query_hash_ids
         
-        def intersection_update_qhi( query_hash_ids, some_hash_ids, force_create_new_set = False ):
+        def intersection_update_qhi( query_hash_ids, some_hash_ids ):
             
             if query_hash_ids is None:
                 
-                if not isinstance( some_hash_ids, set ) or force_create_new_set:
-                    
-                    some_hash_ids = set( some_hash_ids )
-                    
-                
-                return some_hash_ids
+                return HydrusDB.HashIdSet( some_hash_ids )
                 
             else:
                 
@@ -5204,7 +5882,7 @@ class DB( HydrusDB.HydrusDB ):
                 
                 # blue eyes OR green eyes
                 
-                or_query_hash_ids = set()
+                or_query_hash_ids = HydrusDB.HashIdSet()
                 
                 for or_subpredicate in or_predicate.GetValue():
                     
@@ -5370,7 +6048,7 @@ class DB( HydrusDB.HydrusDB ):
         
         if is_inbox:
             
-            query_hash_ids = intersection_update_qhi( query_hash_ids, self._inbox_hash_ids, force_create_new_set = True )
+            query_hash_ids = intersection_update_qhi( query_hash_ids, self._inbox_hash_ids )
             
         
         for ( operator, num_relationships, dupe_type ) in system_predicates.GetDuplicateRelationshipCountPredicates():
@@ -5450,7 +6128,7 @@ class DB( HydrusDB.HydrusDB ):
                 
                 query_hash_ids = intersection_update_qhi( query_hash_ids, tag_query_hash_ids )
                 
-                if query_hash_ids == set():
+                if len( query_hash_ids ) == 0:
                     
                     return query_hash_ids
                     
@@ -5478,7 +6156,7 @@ class DB( HydrusDB.HydrusDB ):
                 
                 query_hash_ids = intersection_update_qhi( query_hash_ids, namespace_query_hash_ids )
                 
-                if query_hash_ids == set():
+                if len( query_hash_ids ) == 0:
                     
                     return query_hash_ids
                     
@@ -5506,7 +6184,7 @@ class DB( HydrusDB.HydrusDB ):
                 
                 query_hash_ids = intersection_update_qhi( query_hash_ids, wildcard_query_hash_ids )
                 
-                if query_hash_ids == set():
+                if len( query_hash_ids ) == 0:
                     
                     return query_hash_ids
                     
@@ -5537,7 +6215,7 @@ class DB( HydrusDB.HydrusDB ):
                 
                 files_info_predicates.insert( 0, 'service_id = ' + str( file_service_id ) )
                 
-                query_hash_ids = intersection_update_qhi( query_hash_ids, self._STS( self._c.execute( 'SELECT hash_id FROM current_files NATURAL JOIN files_info WHERE ' + ' AND '.join( files_info_predicates ) + ';' ) ) )
+                query_hash_ids = intersection_update_qhi( query_hash_ids, self._STI( self._c.execute( 'SELECT hash_id FROM current_files NATURAL JOIN files_info WHERE ' + ' AND '.join( files_info_predicates ) + ';' ) ) )
                 
                 done_files_info_predicates = True
                 
@@ -5792,7 +6470,7 @@ class DB( HydrusDB.HydrusDB ):
             
             if must_not_be_local:
                 
-                query_hash_ids = set()
+                query_hash_ids = HydrusDB.HashIdSet()
                 
             
         elif must_be_local or must_not_be_local:
@@ -6259,6 +6937,11 @@ class DB( HydrusDB.HydrusDB ):
                 
                 like_param = ConvertWildcardToSQLiteLikeParameter( w )
                 
+                if self._CacheSubtagTrigramsCanSearch( w ):
+                    
+                    return self._STL( self._c.execute( 'SELECT rowid FROM subtags_trigrams WHERE subtag LIKE ?;', ( like_param, ) ) )
+                    
+                
                 return self._STL( self._c.execute( 'SELECT subtag_id FROM subtags WHERE subtag LIKE ?;', ( like_param, ) ) )
                 
             else:
@@ -6347,7 +7030,7 @@ class DB( HydrusDB.HydrusDB ):
             search_tag_service_ids = [ self._GetServiceId( tag_service_key ) ]
             
         
-        nonzero_tag_hash_ids = set()
+        nonzero_tag_hash_ids = HydrusDB.HashIdSet()
         
         if hash_ids is None or len( hash_ids ) > 20000:
             
@@ -6659,18 +7342,28 @@ class DB( HydrusDB.HydrusDB ):
             
             try:
                 
-                if isinstance( dump, bytes ):
+                if HydrusSerialisable.IsBinary( dump ):
                     
-                    dump = str( dump, 'utf-8' )
+                    ( obj_tuple, blobs ) = HydrusSerialisable.UnpackBinary( dump )
                     
-                
-                serialisable_info = json.loads( dump )
-                
-            except:
-                
-                self._c.execute( 'DELETE FROM json_dumps WHERE dump_type = ?;', ( dump_type, ) )
-                
-                if self._in_transaction:
+                else:
+                    
+                    if isinstance( dump, bytes ):
+                        
+                        dump = str( dump, 'utf-8' )
+                        
+                    
+                    serialisable_info = json.loads( dump )
+                    
+                    obj_tuple = ( dump_type, version, serialisable_info )
+                    blobs = None
+                    
+                
+            except:
+                
+                self._c.execute( 'DELETE FROM json_dumps WHERE dump_type = ?;', ( dump_type, ) )
+                
+                if self._in_transaction:
                     
                     self._Commit()
                     
@@ -6680,7 +7373,7 @@ class DB( HydrusDB.HydrusDB ):
                 DealWithBrokenJSONDump( self._db_dir, dump, 'dump_type {}'.format( dump_type ) )
                 
             
-            return HydrusSerialisable.CreateFromSerialisableTuple( ( dump_type, version, serialisable_info ) )
+            return HydrusSerialisable.CreateFromSerialisableTuple( obj_tuple, blobs = blobs )
             
         
     
@@ -6696,14 +7389,24 @@ class DB( HydrusDB.HydrusDB ):
                 
                 try:
                     
-                    if isinstance( dump, bytes ):
+                    if HydrusSerialisable.IsBinary( dump ):
                         
-                        dump = str( dump, 'utf-8' )
+                        ( obj_tuple, blobs ) = HydrusSerialisable.UnpackBinary( dump )
+                        
+                    else:
+                        
+                        if isinstance( dump, bytes ):
+                            
+                            dump = str( dump, 'utf-8' )
+                            
+                        
+                        serialisable_info = json.loads( dump )
+                        
+                        obj_tuple = ( dump_type, dump_name, version, serialisable_info )
+                        blobs = None
                         
                     
-                    serialisable_info = json.loads( dump )
-                    
-                    objs.append( HydrusSerialisable.CreateFromSerialisableTuple( ( dump_type, dump_name, version, serialisable_info ) ) )
+                    objs.append( HydrusSerialisable.CreateFromSerialisableTuple( obj_tuple, blobs = blobs ) )
                     
                 except:
                     
@@ -6735,12 +7438,22 @@ class DB( HydrusDB.HydrusDB ):
             
             try:
                 
-                if isinstance( dump, bytes ):
+                if HydrusSerialisable.IsBinary( dump ):
                     
-                    dump = str( dump, 'utf-8' )
+                    ( obj_tuple, blobs ) = HydrusSerialisable.UnpackBinary( dump )
+                    
+                else:
+                    
+                    if isinstance( dump, bytes ):
+                        
+                        dump = str( dump, 'utf-8' )
+                        
+                    
+                    serialisable_info = json.loads( dump )
+                    
+                    obj_tuple = ( dump_type, dump_name, version, serialisable_info )
+                    blobs = None
                     
-                
-                serialisable_info = json.loads( dump )
                 
             except:
                 
@@ -6756,7 +7469,7 @@ class DB( HydrusDB.HydrusDB ):
                 DealWithBrokenJSONDump( self._db_dir, dump, 'dump_type {} dump_name {} timestamp {}'.format( dump_type, dump_name[:10], object_timestamp ) )
                 
             
-            return HydrusSerialisable.CreateFromSerialisableTuple( ( dump_type, dump_name, version, serialisable_info ) )
+            return HydrusSerialisable.CreateFromSerialisableTuple( obj_tuple, blobs = blobs )
             
         
     
@@ -7536,11 +8249,9 @@ class DB( HydrusDB.HydrusDB ):
     
     def _GetService( self, service_id ):
         
-        if service_id in self._service_cache:
-            
-            service = self._service_cache[ service_id ]
-            
-        else:
+        service = self._service_cache.get( service_id, None ) # the write thread may reset the cache while a read connection is looking
+        
+        if service is None:
             
             result = self._c.execute( 'SELECT service_key, service_type, name, dictionary_string FROM services WHERE service_id = ?;', ( service_id, ) ).fetchone()
             
@@ -7826,6 +8537,11 @@ class DB( HydrusDB.HydrusDB ):
             
             self._c.execute( 'REPLACE INTO subtags_fts4 ( docid, subtag ) VALUES ( ?, ? );', ( subtag_id, subtag_searchable ) )
             
+            if self._subtag_trigrams_available:
+                
+                self._c.execute( 'INSERT INTO subtags_trigrams ( rowid, subtag ) VALUES ( ?, ? );', ( subtag_id, subtag ) )
+                
+            
             try:
                 
                 integer_subtag = int( subtag )
@@ -8452,8 +9168,12 @@ class DB( HydrusDB.HydrusDB ):
         self._service_cache = {}
         
         self._weakref_media_result_cache = ClientCaches.MediaResultCache()
-        self._hash_ids_to_hashes_cache = {}
-        self._tag_ids_to_tags_cache = {}
+        self._hash_ids_to_hashes_cache.clear()
+        self._tag_ids_to_tags_cache.clear()
+        
+        self._phash_index = None
+        
+        self._subtag_trigrams_available = self._c.execute( 'SELECT 1 FROM external_master.sqlite_master WHERE name = ?;', ( 'subtags_trigrams', ) ).fetchone() is not None
         
         ( self._null_namespace_id, ) = self._c.execute( 'SELECT namespace_id FROM namespaces WHERE namespace = ?;', ( '', ) ).fetchone()
         
@@ -8562,6 +9282,13 @@ class DB( HydrusDB.HydrusDB ):
             
         
     
+    def _IsKnownFileSize( self, size ):
+        
+        result = self._c.execute( 'SELECT 1 FROM files_info WHERE size = ?;', ( size, ) ).fetchone()
+        
+        return result is not None
+        
+    
     def _LoadIntoDiskCache( self, stop_time = None, caller_limit = None, for_processing = False ):
         
         self._CloseDBCursor()
@@ -9080,6 +9807,11 @@ class DB( HydrusDB.HydrusDB ):
         self._c.execute( 'INSERT OR REPLACE INTO shape_vptree ( phash_id, parent_id, radius, inner_id, inner_population, outer_id, outer_population ) VALUES ( ?, ?, ?, ?, ?, ?, ? );', ( phash_id, parent_id, radius, inner_id, inner_population, outer_id, outer_population ) )
         
     
+    def _PHashesAddMultiIndexHashes( self, phash_ids_and_phashes ):
+        
+        self._c.executemany( 'INSERT OR REPLACE INTO shape_multi_index_hashes ( phash_id, block_0, block_1, block_2, block_3 ) VALUES ( ?, ?, ?, ?, ? );', ( ( phash_id, ) + self._PHashesGetMultiIndexBlocks( phash ) for ( phash_id, phash ) in phash_ids_and_phashes ) )
+        
+    
     def _PHashesAssociatePHashes( self, hash_id, phashes ):
         
         phash_ids = set()
@@ -9233,6 +9965,27 @@ class DB( HydrusDB.HydrusDB ):
         self._c.executemany( 'INSERT OR REPLACE INTO shape_vptree ( phash_id, parent_id, radius, inner_id, inner_population, outer_id, outer_population ) VALUES ( ?, ?, ?, ?, ?, ?, ? );', insert_rows )
         
     
+    def _PHashesGetIndex( self ):
+        
+        if not self._controller.new_options.GetBoolean( 'use_in_memory_similar_files_index' ):
+            
+            self._phash_index = None
+            
+            return None
+            
+        
+        # only the main db thread builds the index, so it cannot miss a phash that is added while it loads
+        
+        if self._phash_index is None and threading.get_ident() not in self._thread_ids_to_read_cursors:
+            
+            phash_ids_and_phashes = self._c.execute( 'SELECT phash_id, phash FROM shape_perceptual_hashes;' ).fetchall()
+            
+            self._phash_index = ClientDuplicates.PerceptualHashIndex( phash_ids_and_phashes )
+            
+        
+        return self._phash_index
+        
+    
     def _PHashesGetMaintenanceStatus( self ):
         
         searched_distances_to_count = collections.Counter( dict( self._c.execute( 'SELECT searched_distance, COUNT( * ) FROM shape_search_cache GROUP BY searched_distance;' ) ) )
@@ -9240,6 +9993,11 @@ class DB( HydrusDB.HydrusDB ):
         return searched_distances_to_count
         
     
+    def _PHashesGetMultiIndexBlocks( self, phash ):
+        
+        return struct.unpack( '>4H', phash )
+        
+    
     def _PHashesGetPHashId( self, phash ):
         
         result = self._c.execute( 'SELECT phash_id FROM shape_perceptual_hashes WHERE phash = ?;', ( sqlite3.Binary( phash ), ) ).fetchone()
@@ -9252,6 +10010,13 @@ class DB( HydrusDB.HydrusDB ):
             
             self._PHashesAddLeaf( phash_id, phash )
             
+            self._PHashesAddMultiIndexHashes( ( ( phash_id, phash ), ) )
+            
+            if self._phash_index is not None:
+                
+                self._phash_index.Add( ( ( phash_id, phash ), ) )
+                
+            
         else:
             
             ( phash_id, ) = result
@@ -9473,6 +10238,12 @@ class DB( HydrusDB.HydrusDB ):
         orphan_phash_ids = unbalanced_phash_ids.difference( useful_phash_ids )
         
         self._c.executemany( 'DELETE FROM shape_perceptual_hashes WHERE phash_id = ?;', ( ( p_id, ) for p_id in orphan_phash_ids ) )
+        self._c.executemany( 'DELETE FROM shape_multi_index_hashes WHERE phash_id = ?;', ( ( p_id, ) for p_id in orphan_phash_ids ) )
+        
+        if self._phash_index is not None:
+            
+            self._phash_index.Remove( orphan_phash_ids )
+            
         
         useful_nodes = [ row for row in unbalanced_nodes if row[0] in useful_phash_ids ]
         
@@ -9531,6 +10302,10 @@ class DB( HydrusDB.HydrusDB ):
             
             all_nodes = self._c.execute( 'SELECT phash_id, phash FROM shape_perceptual_hashes;' ).fetchall()
             
+            self._c.execute( 'DELETE FROM shape_multi_index_hashes;' )
+            
+            self._PHashesAddMultiIndexHashes( all_nodes )
+            
             job_key.SetVariable( 'popup_text_1', HydrusData.ToHumanInt( len( all_nodes ) ) + ' leaves found, now regenerating' )
             
             ( root_id, root_phash ) = self._PHashesPopBestRootNode( all_nodes ) #HydrusData.RandomPop( all_nodes )
@@ -9581,7 +10356,23 @@ class DB( HydrusDB.HydrusDB ):
             
             total_done_previously = total_num_hash_ids_in_cache - len( hash_ids )
             
-            for ( i, hash_id ) in enumerate( hash_ids ):
+            phash_index = self._PHashesGetIndex()
+            
+            if phash_index is None or search_distance < MIN_PHASH_INDEX_SEARCH_DISTANCE:
+                
+                phash_index = None
+                
+                num_to_search_at_once = 1
+                
+            else:
+                
+                num_to_search_at_once = 256
+                
+            
+            num_done = 0
+            num_done_at_last_status = None
+            
+            for group_of_hash_ids in HydrusData.SplitListIntoChunks( hash_ids, num_to_search_at_once ):
                 
                 job_key.SetVariable( 'popup_title', 'similar files duplicate pair discovery' )
                 
@@ -9601,23 +10392,39 @@ class DB( HydrusDB.HydrusDB ):
                     return
                     
                 
-                if i % 25 == 0:
+                if num_done_at_last_status is None or num_done - num_done_at_last_status >= 25:
                     
-                    text = 'searched ' + HydrusData.ConvertValueRangeToPrettyString( total_done_previously + i, total_num_hash_ids_in_cache ) + ' files'
+                    text = 'searched ' + HydrusData.ConvertValueRangeToPrettyString( total_done_previously + num_done, total_num_hash_ids_in_cache ) + ' files'
                     
                     job_key.SetVariable( 'popup_text_1', text )
-                    job_key.SetVariable( 'popup_gauge_1', ( total_done_previously + i, total_num_hash_ids_in_cache ) )
+                    job_key.SetVariable( 'popup_gauge_1', ( total_done_previously + num_done, total_num_hash_ids_in_cache ) )
                     
                     HG.client_controller.pub( 'splash_set_status_subtext', text )
                     
+                    num_done_at_last_status = num_done
+                    
                 
-                media_id = self._DuplicatesGetMediaId( hash_id )
+                if phash_index is None:
+                    
+                    hash_ids_to_similar_hash_ids_and_distances = { hash_id : self._PHashesSearch( hash_id, search_distance ) for hash_id in group_of_hash_ids }
+                    
+                else:
+                    
+                    hash_ids_to_similar_hash_ids_and_distances = self._PHashesSearchIndex( phash_index, group_of_hash_ids, search_distance )
+                    
                 
-                potential_duplicate_media_ids_and_distances = [ ( self._DuplicatesGetMediaId( duplicate_hash_id ), distance ) for ( duplicate_hash_id, distance ) in self._PHashesSearch( hash_id, search_distance ) if duplicate_hash_id != hash_id ]
+                for hash_id in group_of_hash_ids:
+                    
+                    media_id = self._DuplicatesGetMediaId( hash_id )
+                    
+                    potential_duplicate_media_ids_and_distances = [ ( self._DuplicatesGetMediaId( duplicate_hash_id ), distance ) for ( duplicate_hash_id, distance ) in hash_ids_to_similar_hash_ids_and_distances[ hash_id ] if duplicate_hash_id != hash_id ]
+                    
+                    self._DuplicatesAddPotentialDuplicates( media_id, potential_duplicate_media_ids_and_distances )
+                    
                 
-                self._DuplicatesAddPotentialDuplicates( media_id, potential_duplicate_media_ids_and_distances )
+                self._c.executemany( 'UPDATE shape_search_cache SET searched_distance = ? WHERE hash_id = ?;', ( ( search_distance, hash_id ) for hash_id in group_of_hash_ids ) )
                 
-                self._c.execute( 'UPDATE shape_search_cache SET searched_distance = ? WHERE hash_id = ?;', ( search_distance, hash_id ) )
+                num_done += len( group_of_hash_ids )
                 
             
         finally:
@@ -9641,17 +10448,13 @@ class DB( HydrusDB.HydrusDB ):
             
         else:
             
-            search_radius = max_hamming_distance
+            phash_index = self._PHashesGetIndex()
             
-            top_node_result = self._c.execute( 'SELECT phash_id FROM shape_vptree WHERE parent_id IS NULL;' ).fetchone()
-            
-            if top_node_result is None:
+            if phash_index is not None and max_hamming_distance >= MIN_PHASH_INDEX_SEARCH_DISTANCE:
                 
-                return []
+                return self._PHashesSearchIndex( phash_index, ( hash_id, ), max_hamming_distance )[ hash_id ]
                 
             
-            ( root_node_phash_id, ) = top_node_result
-            
             search_phashes = self._STL( self._c.execute( 'SELECT phash FROM shape_perceptual_hashes NATURAL JOIN shape_perceptual_hash_map WHERE hash_id = ?;', ( hash_id, ) ) )
             
             if len( search_phashes ) == 0:
@@ -9659,84 +10462,15 @@ class DB( HydrusDB.HydrusDB ):
                 return []
                 
             
-            similar_phash_ids_to_distances = {}
-            
-            num_cycles = 0
+            # the multi-index lookups are quick while each block only has to allow two bits of difference, past that the tree is better
             
-            for search_phash in search_phashes:
+            if max_hamming_distance // 4 <= 2:
                 
-                next_potentials = [ root_node_phash_id ]
-                
-                while len( next_potentials ) > 0:
-                    
-                    current_potentials = next_potentials
-                    next_potentials = []
-                    
-                    num_cycles += 1
-                    
-                    for group_of_current_potentials in HydrusData.SplitListIntoChunks( current_potentials, 1024 ):
-                        
-                        # this is split into fixed lists of results of subgroups because as an iterable it was causing crashes on linux!!
-                        # after investigation, it seemed to be SQLite having a problem with part of Get64BitHammingDistance touching phashes it presumably was still hanging on to
-                        # the crash was in sqlite code, again presumably on subsequent fetch
-                        # adding a delay in seemed to fix it as well. guess it was some memory maintenance buffer/bytes thing
-                        # anyway, we now just get the whole lot of results first and then work on the whole lot
-                        
-                        select_statement = 'SELECT phash_id, phash, radius, inner_id, outer_id FROM shape_perceptual_hashes NATURAL JOIN shape_vptree WHERE phash_id = ?;'
-                        
-                        results = list( self._ExecuteManySelectSingleParam( select_statement, group_of_current_potentials ) )
-                        
-                        for ( node_phash_id, node_phash, node_radius, inner_phash_id, outer_phash_id ) in results:
-                            
-                            # first check the node itself--is it similar?
-                            
-                            node_hamming_distance = HydrusData.Get64BitHammingDistance( search_phash, node_phash )
-                            
-                            if node_hamming_distance <= search_radius:
-                                
-                                similar_phash_ids_to_distances[ node_phash_id ] = node_hamming_distance
-                                
-                            
-                            # now how about its children?
-                            
-                            if node_radius is not None:
-                                
-                                # we have two spheres--node and search--their centers separated by node_hamming_distance
-                                # we want to search inside/outside the node_sphere if the search_sphere intersects with those spaces
-                                # there are four possibles:
-                                # (----N----)-(--S--)    intersects with outer only - distance between N and S > their radii
-                                # (----N---(-)-S--)      intersects with both
-                                # (----N-(--S-)-)        intersects with both
-                                # (---(-N-S--)-)         intersects with inner only - distance between N and S + radius_S does not exceed radius_N
-                                
-                                if inner_phash_id is not None:
-                                    
-                                    spheres_disjoint = node_hamming_distance > ( node_radius + search_radius )
-                                    
-                                    if not spheres_disjoint: # i.e. they intersect at some point
-                                        
-                                        next_potentials.append( inner_phash_id )
-                                        
-                                    
-                                
-                                if outer_phash_id is not None:
-                                    
-                                    search_sphere_subset_of_node_sphere = ( node_hamming_distance + search_radius ) <= node_radius
-                                    
-                                    if not search_sphere_subset_of_node_sphere: # i.e. search sphere intersects with non-node sphere space at some point
-                                        
-                                        next_potentials.append( outer_phash_id )
-                                        
-                                    
-                                
-                            
-                        
-                    
+                similar_phash_ids_to_distances = self._PHashesSearchMultiIndex( search_phashes, max_hamming_distance )
                 
-            
-            if HG.db_report_mode:
+            else:
                 
-                HydrusData.ShowText( 'Similar file search completed in ' + HydrusData.ToHumanInt( num_cycles ) + ' cycles.' )
+                similar_phash_ids_to_distances = self._PHashesSearchTree( search_phashes, max_hamming_distance )
                 
             
             # so, so now we have phash_ids and distances. let's map that to actual files.
@@ -9776,6 +10510,186 @@ class DB( HydrusDB.HydrusDB ):
         return similar_hash_ids_and_distances
         
     
+    def _PHashesSearchIndex( self, phash_index, hash_ids, max_hamming_distance ):
+        
+        hash_ids_and_phashes = list( self._ExecuteManySelectSingleParam( 'SELECT hash_id, phash FROM shape_perceptual_hash_map NATURAL JOIN shape_perceptual_hashes WHERE hash_id = ?;', hash_ids ) )
+        
+        results = phash_index.Search( [ phash for ( hash_id, phash ) in hash_ids_and_phashes ], max_hamming_distance )
+        
+        similar_phash_ids = set()
+        
+        for similar_phash_ids_to_distances in results:
+            
+            similar_phash_ids.update( similar_phash_ids_to_distances.keys() )
+            
+        
+        similar_phash_ids_to_hash_ids = HydrusData.BuildKeyToListDict( self._ExecuteManySelectSingleParam( 'SELECT phash_id, hash_id FROM shape_perceptual_hash_map WHERE phash_id = ?;', similar_phash_ids ) )
+        
+        # files can have multiple phashes, and phashes can refer to multiple files, so we keep the smallest distance we found
+        
+        hash_ids_to_similar_hash_ids_to_distances = { hash_id : {} for hash_id in hash_ids }
+        
+        for ( ( hash_id, phash ), similar_phash_ids_to_distances ) in zip( hash_ids_and_phashes, results ):
+            
+            similar_hash_ids_to_distances = hash_ids_to_similar_hash_ids_to_distances[ hash_id ]
+            
+            for ( similar_phash_id, distance ) in similar_phash_ids_to_distances.items():
+                
+                for similar_hash_id in similar_phash_ids_to_hash_ids[ similar_phash_id ]:
+                    
+                    if similar_hash_id not in similar_hash_ids_to_distances or distance < similar_hash_ids_to_distances[ similar_hash_id ]:
+                        
+                        similar_hash_ids_to_distances[ similar_hash_id ] = distance
+                        
+                    
+                
+            
+        
+        return { hash_id : list( similar_hash_ids_to_distances.items() ) for ( hash_id, similar_hash_ids_to_distances ) in hash_ids_to_similar_hash_ids_to_distances.items() }
+        
+    
+    def _PHashesSearchMultiIndex( self, search_phashes, max_hamming_distance ):
+        
+        # if two phashes are within d of each other, then at least one of their four 16-bit blocks must be within d // 4
+        # so we fetch everything that is close enough on any block and then check the full distance
+        
+        block_radius = max_hamming_distance // 4
+        
+        masks = [ sum( ( 1 << bit for bit in bits ) ) for num_bits in range( block_radius + 1 ) for bits in itertools.combinations( range( 16 ), num_bits ) ]
+        
+        similar_phash_ids_to_distances = {}
+        
+        num_candidates = 0
+        
+        for search_phash in search_phashes:
+            
+            candidate_phash_ids_to_phashes = {}
+            
+            for ( i, search_block ) in enumerate( self._PHashesGetMultiIndexBlocks( search_phash ) ):
+                
+                select_statement = 'SELECT phash_id, phash FROM shape_multi_index_hashes NATURAL JOIN shape_perceptual_hashes WHERE block_' + str( i ) + ' = ?;'
+                
+                candidate_phash_ids_to_phashes.update( self._ExecuteManySelectSingleParam( select_statement, ( search_block ^ mask for mask in masks ) ) )
+                
+            
+            num_candidates += len( candidate_phash_ids_to_phashes )
+            
+            for ( phash_id, phash ) in candidate_phash_ids_to_phashes.items():
+                
+                distance = HydrusData.Get64BitHammingDistance( search_phash, phash )
+                
+                if distance <= max_hamming_distance:
+                    
+                    if phash_id not in similar_phash_ids_to_distances or distance < similar_phash_ids_to_distances[ phash_id ]:
+                        
+                        similar_phash_ids_to_distances[ phash_id ] = distance
+                        
+                    
+                
+            
+        
+        if HG.db_report_mode:
+            
+            HydrusData.ShowText( 'Similar file search checked ' + HydrusData.ToHumanInt( num_candidates ) + ' candidates.' )
+            
+        
+        return similar_phash_ids_to_distances
+        
+    
+    def _PHashesSearchTree( self, search_phashes, search_radius ):
+        
+        top_node_result = self._c.execute( 'SELECT phash_id FROM shape_vptree WHERE parent_id IS NULL;' ).fetchone()
+        
+        if top_node_result is None:
+            
+            return {}
+            
+        
+        ( root_node_phash_id, ) = top_node_result
+        
+        similar_phash_ids_to_distances = {}
+        
+        num_cycles = 0
+        
+        for search_phash in search_phashes:
+            
+            next_potentials = [ root_node_phash_id ]
+            
+            while len( next_potentials ) > 0:
+                
+                current_potentials = next_potentials
+                next_potentials = []
+                
+                num_cycles += 1
+                
+                for group_of_current_potentials in HydrusData.SplitListIntoChunks( current_potentials, 1024 ):
+                    
+                    # this is split into fixed lists of results of subgroups because as an iterable it was causing crashes on linux!!
+                    # after investigation, it seemed to be SQLite having a problem with part of Get64BitHammingDistance touching phashes it presumably was still hanging on to
+                    # the crash was in sqlite code, again presumably on subsequent fetch
+                    # adding a delay in seemed to fix it as well. guess it was some memory maintenance buffer/bytes thing
+                    # anyway, we now just get the whole lot of results first and then work on the whole lot
+                    
+                    select_statement = 'SELECT phash_id, phash, radius, inner_id, outer_id FROM shape_perceptual_hashes NATURAL JOIN shape_vptree WHERE phash_id = ?;'
+                    
+                    results = list( self._ExecuteManySelectSingleParam( select_statement, group_of_current_potentials ) )
+                    
+                    for ( node_phash_id, node_phash, node_radius, inner_phash_id, outer_phash_id ) in results:
+                        
+                        # first check the node itself--is it similar?
+                        
+                        node_hamming_distance = HydrusData.Get64BitHammingDistance( search_phash, node_phash )
+                        
+                        if node_hamming_distance <= search_radius:
+                            
+                            similar_phash_ids_to_distances[ node_phash_id ] = node_hamming_distance
+                            
+                        
+                        # now how about its children?
+                        
+                        if node_radius is not None:
+                            
+                            # we have two spheres--node and search--their centers separated by node_hamming_distance
+                            # we want to search inside/outside the node_sphere if the search_sphere intersects with those spaces
+                            # there are four possibles:
+                            # (----N----)-(--S--)    intersects with outer only - distance between N and S > their radii
+                            # (----N---(-)-S--)      intersects with both
+                            # (----N-(--S-)-)        intersects with both
+                            # (---(-N-S--)-)         intersects with inner only - distance between N and S + radius_S does not exceed radius_N
+                            
+                            if inner_phash_id is not None:
+                                
+                                spheres_disjoint = node_hamming_distance > ( node_radius + search_radius )
+                                
+                                if not spheres_disjoint: # i.e. they intersect at some point
+                                    
+                                    next_potentials.append( inner_phash_id )
+                                    
+                                
+                            
+                            if outer_phash_id is not None:
+                                
+                                search_sphere_subset_of_node_sphere = ( node_hamming_distance + search_radius ) <= node_radius
+                                
+                                if not search_sphere_subset_of_node_sphere: # i.e. search sphere intersects with non-node sphere space at some point
+                                    
+                                    next_potentials.append( outer_phash_id )
+                                    
+                                
+                            
+                        
+                    
+                
+            
+        
+        if HG.db_report_mode:
+            
+            HydrusData.ShowText( 'Similar file search completed in ' + HydrusData.ToHumanInt( num_cycles ) + ' cycles.' )
+            
+        
+        return similar_phash_ids_to_distances
+        
+    
     def _PHashesSetFileMetadata( self, hash_id, phashes ):
         
         current_phash_ids = self._STS( self._c.execute( 'SELECT phash_id FROM shape_perceptual_hash_map WHERE hash_id = ?;', ( hash_id, ) ) )
@@ -9795,7 +10709,7 @@ class DB( HydrusDB.HydrusDB ):
         
         if len( self._hash_ids_to_hashes_cache ) > 25000:
             
-            self._hash_ids_to_hashes_cache = {}
+            self._hash_ids_to_hashes_cache.clear()
             
         
         uncached_hash_ids = [ hash_id for hash_id in hash_ids if hash_id not in self._hash_ids_to_hashes_cache ]
@@ -9841,7 +10755,7 @@ class DB( HydrusDB.HydrusDB ):
         
         if len( self._tag_ids_to_tags_cache ) > 25000:
             
-            self._tag_ids_to_tags_cache = {}
+            self._tag_ids_to_tags_cache.clear()
             
         
         uncached_tag_ids = [ tag_id for tag_id in tag_ids if tag_id not in self._tag_ids_to_tags_cache ]
@@ -10377,6 +11291,8 @@ class DB( HydrusDB.HydrusDB ):
                             notify_new_pending = True
                             
                         
+                        self._CacheTagDisplayNotifySiblingsChanged( service_id )
+                        
                         notify_new_siblings = True
                         
                     
@@ -10502,6 +11418,8 @@ class DB( HydrusDB.HydrusDB ):
         
         num_rows_processed = 0
         
+        bulk_mappings = self._RepositoryBulkMappingsShouldStage( service_id )
+        
         if 'new_files' in content_iterator_dict:
             
             has_audio = None # hack until we figure this out better
@@ -10564,6 +11482,33 @@ class DB( HydrusDB.HydrusDB ):
         
         #
         
+        if 'new_mappings_rows' in content_iterator_dict:
+            
+            # the same mappings also come as flat rows. when staging, those go in with one executemany that looks the ids up in sqlite
+            # either way, we drop the other form as soon as we start on one
+            
+            if bulk_mappings:
+                
+                content_iterator_dict.pop( 'new_mappings', None )
+                
+                i = content_iterator_dict[ 'new_mappings_rows' ]
+                
+                for chunk in HydrusData.SplitIteratorIntoAutothrottledChunks( i, MAPPINGS_INITIAL_CHUNK_SIZE, precise_time_to_stop ):
+                    
+                    self._RepositoryBulkMappingsStageServiceRows( service_id, HC.CONTENT_UPDATE_ADD, chunk )
+                    
+                    num_rows_processed += len( chunk )
+                    
+                    if HydrusData.TimeHasPassedPrecise( precise_time_to_stop ) or job_key.IsCancelled():
+                        
+                        return num_rows_processed
+                        
+                    
+                
+            
+            del content_iterator_dict[ 'new_mappings_rows' ]
+            
+        
         if 'new_mappings' in content_iterator_dict:
             
             i = content_iterator_dict[ 'new_mappings' ]
@@ -10584,9 +11529,16 @@ class DB( HydrusDB.HydrusDB ):
                     num_rows += len( service_hash_ids )
                     
                 
-                self._UpdateMappings( service_id, mappings_ids = mappings_ids )
-                
-                num_rows_processed += num_rows
+                if bulk_mappings:
+                    
+                    self._RepositoryBulkMappingsStage( service_id, HC.CONTENT_UPDATE_ADD, mappings_ids )
+                    
+                else:
+                    
+                    self._UpdateMappings( service_id, mappings_ids = mappings_ids )
+                    
+                
+                num_rows_processed += num_rows
                 
                 if HydrusData.TimeHasPassedPrecise( precise_time_to_stop ) or job_key.IsCancelled():
                     
@@ -10599,6 +11551,30 @@ class DB( HydrusDB.HydrusDB ):
         
         #
         
+        if 'deleted_mappings_rows' in content_iterator_dict:
+            
+            if bulk_mappings:
+                
+                content_iterator_dict.pop( 'deleted_mappings', None )
+                
+                i = content_iterator_dict[ 'deleted_mappings_rows' ]
+                
+                for chunk in HydrusData.SplitIteratorIntoAutothrottledChunks( i, MAPPINGS_INITIAL_CHUNK_SIZE, precise_time_to_stop ):
+                    
+                    self._RepositoryBulkMappingsStageServiceRows( service_id, HC.CONTENT_UPDATE_DELETE, chunk )
+                    
+                    num_rows_processed += len( chunk )
+                    
+                    if HydrusData.TimeHasPassedPrecise( precise_time_to_stop ) or job_key.IsCancelled():
+                        
+                        return num_rows_processed
+                        
+                    
+                
+            
+            del content_iterator_dict[ 'deleted_mappings_rows' ]
+            
+        
         if 'deleted_mappings' in content_iterator_dict:
             
             i = content_iterator_dict[ 'deleted_mappings' ]
@@ -10619,7 +11595,14 @@ class DB( HydrusDB.HydrusDB ):
                     num_rows += len( service_hash_ids )
                     
                 
-                self._UpdateMappings( service_id, deleted_mappings_ids = deleted_mappings_ids )
+                if bulk_mappings:
+                    
+                    self._RepositoryBulkMappingsStage( service_id, HC.CONTENT_UPDATE_DELETE, deleted_mappings_ids )
+                    
+                else:
+                    
+                    self._UpdateMappings( service_id, deleted_mappings_ids = deleted_mappings_ids )
+                    
                 
                 num_rows_processed += num_rows
                 
@@ -10650,7 +11633,14 @@ class DB( HydrusDB.HydrusDB ):
                     parent_ids.append( ( child_tag_id, parent_tag_id ) )
                     
                 
-                self._AddTagParents( service_id, parent_ids )
+                if bulk_mappings:
+                    
+                    self._RepositoryBulkPairsStage( service_id, HC.CONTENT_TYPE_TAG_PARENTS, HC.CONTENT_UPDATE_ADD, parent_ids )
+                    
+                else:
+                    
+                    self._AddTagParents( service_id, parent_ids )
+                    
                 
                 num_rows_processed += len( parent_ids )
                 
@@ -10681,7 +11671,14 @@ class DB( HydrusDB.HydrusDB ):
                     parent_ids.append( ( child_tag_id, parent_tag_id ) )
                     
                 
-                self._DeleteTagParents( service_id, parent_ids )
+                if bulk_mappings:
+                    
+                    self._RepositoryBulkPairsStage( service_id, HC.CONTENT_TYPE_TAG_PARENTS, HC.CONTENT_UPDATE_DELETE, parent_ids )
+                    
+                else:
+                    
+                    self._DeleteTagParents( service_id, parent_ids )
+                    
                 
                 num_rows = len( parent_ids )
                 
@@ -10714,7 +11711,14 @@ class DB( HydrusDB.HydrusDB ):
                     sibling_ids.append( ( bad_tag_id, good_tag_id ) )
                     
                 
-                self._AddTagSiblings( service_id, sibling_ids )
+                if bulk_mappings:
+                    
+                    self._RepositoryBulkPairsStage( service_id, HC.CONTENT_TYPE_TAG_SIBLINGS, HC.CONTENT_UPDATE_ADD, sibling_ids )
+                    
+                else:
+                    
+                    self._AddTagSiblings( service_id, sibling_ids )
+                    
                 
                 num_rows = len( sibling_ids )
                 
@@ -10747,7 +11751,14 @@ class DB( HydrusDB.HydrusDB ):
                     sibling_ids.append( ( bad_tag_id, good_tag_id ) )
                     
                 
-                self._DeleteTagSiblings( service_id, sibling_ids )
+                if bulk_mappings:
+                    
+                    self._RepositoryBulkPairsStage( service_id, HC.CONTENT_TYPE_TAG_SIBLINGS, HC.CONTENT_UPDATE_DELETE, sibling_ids )
+                    
+                else:
+                    
+                    self._DeleteTagSiblings( service_id, sibling_ids )
+                    
                 
                 num_rows_processed += len( sibling_ids )
                 
@@ -10766,6 +11777,23 @@ class DB( HydrusDB.HydrusDB ):
         
         self._c.execute( 'UPDATE {} SET processed = ? WHERE hash_id = ?;'.format( repository_updates_table_name ), ( True, update_hash_id ) )
         
+        if bulk_mappings:
+            
+            ( num_unprocessed, ) = self._c.execute( 'SELECT COUNT( * ) FROM {} NATURAL JOIN files_info WHERE mime = ? AND processed = ?;'.format( repository_updates_table_name ), ( HC.APPLICATION_HYDRUS_UPDATE_CONTENT, False ) ).fetchone()
+            
+            if num_unprocessed == 0:
+                
+                # we have caught up with everything we have, so make it visible
+                
+                self._RepositoryBulkMappingsFlush( service_id, job_key )
+                
+                for staging_table_name in GenerateRepositoryBulkMappingsStagingTableNames( service_id ):
+                    
+                    self._c.execute( 'DROP TABLE ' + staging_table_name + ';' )
+                    
+                
+            
+        
         return num_rows_processed
         
     
@@ -10885,6 +11913,7 @@ class DB( HydrusDB.HydrusDB ):
         elif action == 'imageboards': result = self._GetYAMLDump( YAML_DUMP_ID_IMAGEBOARD, *args, **kwargs )
         elif action == 'in_inbox': result = self._InInbox( *args, **kwargs )
         elif action == 'is_an_orphan': result = self._IsAnOrphan( *args, **kwargs )
+        elif action == 'is_known_file_size': result = self._IsKnownFileSize( *args, **kwargs )
         elif action == 'last_shutdown_work_time': result = self._GetLastShutdownWorkTime( *args, **kwargs )
         elif action == 'load_into_disk_cache': result = self._LoadIntoDiskCache( *args, **kwargs )
         elif action == 'local_booru_share_keys': result = self._GetYAMLDumpNames( YAML_DUMP_ID_LOCAL_BOORU )
@@ -10997,6 +12026,87 @@ class DB( HydrusDB.HydrusDB ):
             
         
     
+    def _RegenerateSubtagTrigrams( self ):
+        
+        job_key = ClientThreading.JobKey()
+        
+        try:
+            
+            job_key.SetVariable( 'popup_title', 'regenerating wildcard tag search index' )
+            
+            self._controller.pub( 'modal_message', job_key )
+            
+            job_key.SetVariable( 'popup_text_1', 'generating' )
+            
+            self._CacheSubtagTrigramsDrop()
+            
+            self._CacheSubtagTrigramsGenerate()
+            
+            if self._subtag_trigrams_available:
+                
+                job_key.SetVariable( 'popup_text_1', 'done!' )
+                
+            else:
+                
+                job_key.SetVariable( 'popup_text_1', 'Your SQLite does not support trigram indices, so complex wildcard searches will continue to scan every tag.' )
+                
+            
+        finally:
+            
+            job_key.Finish()
+            
+            if self._subtag_trigrams_available:
+                
+                job_key.Delete( 5 )
+                
+            
+        
+    
+    def _RegenerateTagDisplayCache( self ):
+        
+        job_key = ClientThreading.JobKey( cancellable = True )
+        
+        try:
+            
+            job_key.SetVariable( 'popup_title', 'regenerating tag display cache' )
+            
+            self._controller.pub( 'modal_message', job_key )
+            
+            self._SetJSONSimple( 'tag_display_cache_apply_all_siblings', self._controller.new_options.GetBoolean( 'apply_all_siblings_to_all_services' ) )
+            
+            tag_service_ids = self._GetServiceIds( HC.TAG_SERVICES )
+            
+            for tag_service_id in tag_service_ids:
+                
+                if job_key.IsCancelled():
+                    
+                    break
+                    
+                
+                message = 'generating tag display cache {}'.format( tag_service_id )
+                
+                job_key.SetVariable( 'popup_text_1', message )
+                self._controller.pub( 'splash_set_status_subtext', message )
+                
+                time.sleep( 0.01 )
+                
+                self._CacheTagDisplayDrop( tag_service_id )
+                
+                self._CacheTagDisplayGenerate( tag_service_id )
+                
+            
+            self.pub_after_job( 'notify_new_force_refresh_tags_data' )
+            
+        finally:
+            
+            job_key.SetVariable( 'popup_text_1', 'done!' )
+            
+            job_key.Finish()
+            
+            job_key.Delete( 5 )
+            
+        
+    
     def _RelocateClientFiles( self, prefix, source, dest ):
         
         full_source = os.path.join( source, prefix )
@@ -11055,8 +12165,12 @@ class DB( HydrusDB.HydrusDB ):
         self._service_cache = {}
         
         self._weakref_media_result_cache = ClientCaches.MediaResultCache()
-        self._hash_ids_to_hashes_cache = {}
-        self._tag_ids_to_tags_cache = {}
+        self._hash_ids_to_hashes_cache.clear()
+        self._tag_ids_to_tags_cache.clear()
+        
+        self._phash_index = None
+        
+        self._subtag_trigrams_available = self._c.execute( 'SELECT 1 FROM external_master.sqlite_master WHERE name = ?;', ( 'subtags_trigrams', ) ).fetchone() is not None
         
         ( self._null_namespace_id, ) = self._c.execute( 'SELECT namespace_id FROM namespaces WHERE namespace = ?;', ( '', ) ).fetchone()
         
@@ -11102,156 +12216,525 @@ class DB( HydrusDB.HydrusDB ):
             
             self._controller.CallBlockingToQt( self._controller.app, QW.QMessageBox.warning, None, 'Warning', message )
             
-            self._c.execute( 'CREATE TABLE external_master.local_hashes ( hash_id INTEGER PRIMARY KEY, md5 BLOB_BYTES, sha1 BLOB_BYTES, sha512 BLOB_BYTES );' )
-            self._CreateIndex( 'external_master.local_hashes', [ 'md5' ] )
-            self._CreateIndex( 'external_master.local_hashes', [ 'sha1' ] )
-            self._CreateIndex( 'external_master.local_hashes', [ 'sha512' ] )
+            self._c.execute( 'CREATE TABLE external_master.local_hashes ( hash_id INTEGER PRIMARY KEY, md5 BLOB_BYTES, sha1 BLOB_BYTES, sha512 BLOB_BYTES );' )
+            self._CreateIndex( 'external_master.local_hashes', [ 'md5' ] )
+            self._CreateIndex( 'external_master.local_hashes', [ 'sha1' ] )
+            self._CreateIndex( 'external_master.local_hashes', [ 'sha512' ] )
+            
+        
+        # mappings
+        
+        existing_mapping_tables = self._STS( self._c.execute( 'SELECT name FROM external_mappings.sqlite_master WHERE type = ?;', ( 'table', ) ) )
+        
+        main_mappings_tables = set()
+        
+        for service_id in tag_service_ids:
+            
+            main_mappings_tables.update( ( name.split( '.' )[1] for name in GenerateMappingsTableNames( service_id ) ) )
+            
+        
+        missing_main_tables = main_mappings_tables.difference( existing_mapping_tables )
+        
+        if len( missing_main_tables ) > 0:
+            
+            missing_main_tables = list( missing_main_tables )
+            
+            missing_main_tables.sort()
+            
+            message = 'On boot, some important mappings tables were missing! This could be due to the entire \'mappings\' database file being missing or some other problem. The tags in these tables are lost. The exact missing tables were:'
+            message += os.linesep * 2
+            message += os.linesep.join( missing_main_tables )
+            message += os.linesep * 2
+            message += 'If you wish, click ok on this message and the client will recreate these tables--empty, without data--which should at least let the client boot. If the affected tag service(s) are tag repositories, you will want to reset the processing cache so the client can repopulate the tables from your cached update files. But if you want to solve this problem otherwise, kill the hydrus process now.'
+            message += os.linesep * 2
+            message += 'If you do not already know what caused this, it was likely a hard drive fault--either due to a recent abrupt power cut or actual hardware failure. Check \'help my db is broke.txt\' in the install_dir/db directory as soon as you can.'
+            
+            self._controller.CallBlockingToQt( self._controller.app, QW.QMessageBox.warning, None, 'Warning', message )
+            
+            for service_id in tag_service_ids:
+                
+                self._GenerateMappingsTables( service_id )
+                
+            
+        
+        # caches
+        
+        existing_cache_tables = self._STS( self._c.execute( 'SELECT name FROM external_caches.sqlite_master WHERE type = ?;', ( 'table', ) ) )
+        
+        main_cache_tables = set()
+        
+        main_cache_tables.add( 'shape_perceptual_hashes' )
+        main_cache_tables.add( 'shape_perceptual_hash_map' )
+        main_cache_tables.add( 'shape_vptree' )
+        main_cache_tables.add( 'shape_multi_index_hashes' )
+        main_cache_tables.add( 'shape_maintenance_branch_regen' )
+        main_cache_tables.add( 'shape_search_cache' )
+        main_cache_tables.add( 'integer_subtags' )
+        
+        missing_main_tables = main_cache_tables.difference( existing_cache_tables )
+        
+        if len( missing_main_tables ) > 0:
+            
+            missing_main_tables = list( missing_main_tables )
+            
+            missing_main_tables.sort()
+            
+            message = 'On boot, some important caches tables were missing! This could be due to the entire \'caches\' database file being missing or some other problem. Data related to duplicate file search may have been lost. The exact missing tables were:'
+            message += os.linesep * 2
+            message += os.linesep.join( missing_main_tables )
+            message += os.linesep * 2
+            message += 'If you wish, click ok on this message and the client will recreate these tables--empty, without data--which should at least let the client boot. But if you want to solve this problem otherwise, kill the hydrus process now.'
+            message += os.linesep * 2
+            message += 'If you do not already know what caused this, it was likely a hard drive fault--either due to a recent abrupt power cut or actual hardware failure. Check \'help my db is broke.txt\' in the install_dir/db directory as soon as you can.'
+            
+            self._controller.CallBlockingToQt( self._controller.app, QW.QMessageBox.warning, None, 'Warning', message )
+            
+            self._CreateDBCaches()
+            
+            if 'shape_multi_index_hashes' in missing_main_tables:
+                
+                # the multi-index is derived from the phashes, so we can fill it back in from whatever survived
+                
+                all_nodes = self._c.execute( 'SELECT phash_id, phash FROM shape_perceptual_hashes;' ).fetchall()
+                
+                self._PHashesAddMultiIndexHashes( all_nodes )
+                
+            
+        
+        mappings_cache_tables = set()
+        
+        for ( file_service_id, tag_service_id ) in itertools.product( file_service_ids, tag_service_ids ):
+            
+            mappings_cache_tables.update( ( name.split( '.' )[1] for name in GenerateSpecificMappingsCacheTableNames( file_service_id, tag_service_id ) ) )
+            
+        
+        for tag_service_id in tag_service_ids:
+            
+            mappings_cache_tables.add( GenerateCombinedFilesMappingsCacheTableName( tag_service_id ).split( '.' )[1] )
+            
+        
+        mappings_cache_tables.add( 'local_tags_cache' )
+        
+        missing_main_tables = mappings_cache_tables.difference( existing_cache_tables )
+        
+        if len( missing_main_tables ) > 0:
+            
+            missing_main_tables = list( missing_main_tables )
+            
+            missing_main_tables.sort()
+            
+            message = 'On boot, some mapping caches tables were missing! This could be due to the entire \'caches\' database file being missing or due to some other problem. All of this data can be regenerated. The exact missing tables were:'
+            message += os.linesep * 2
+            message += os.linesep.join( missing_main_tables )
+            message += os.linesep * 2
+            message += 'If you wish, click ok on this message and the client will recreate and repopulate these tables with the correct data. This may take a few minutes. But if you want to solve this problem otherwise, kill the hydrus process now.'
+            message += os.linesep * 2
+            message += 'If you do not already know what caused this, it was likely a hard drive fault--either due to a recent abrupt power cut or actual hardware failure. Check \'help my db is broke.txt\' in the install_dir/db directory as soon as you can.'
+            
+            self._controller.CallBlockingToQt( self._controller.app, QW.QMessageBox.warning, None, 'Warning', message )
+            
+            self._RegenerateACCache()
+            
+        
+        #
+        
+        new_options = self._GetJSONDump( HydrusSerialisable.SERIALISABLE_TYPE_CLIENT_OPTIONS )
+        
+        if new_options is None:
+            
+            message = 'On boot, your main options object was missing!'
+            message += os.linesep * 2
+            message += 'If you wish, click ok on this message and the client will re-add fresh options with default values. But if you want to solve this problem otherwise, kill the hydrus process now.'
+            message += os.linesep * 2
+            message += 'If you do not already know what caused this, it was likely a hard drive fault--either due to a recent abrupt power cut or actual hardware failure. Check \'help my db is broke.txt\' in the install_dir/db directory as soon as you can.'
+            
+            self._controller.CallBlockingToQt( self._controller.app, QW.QMessageBox.warning, None, 'Warning', message )
+            
+            new_options = ClientOptions.ClientOptions()
+            
+            new_options.SetSimpleDownloaderFormulae( ClientDefaults.GetDefaultSimpleDownloaderFormulae() )
+            
+            self._SetJSONDump( new_options )
+            
+        
+    
+    def _ReportOverupdatedDB( self, version ):
+        
+        def qt_code():
+            
+            QW.QMessageBox.warning( None, 'Warning', 'This client\'s database is version '+HydrusData.ToHumanInt(version)+', but the software is version '+HydrusData.ToHumanInt(HC.SOFTWARE_VERSION)+'! This situation only sometimes works, and when it does not, it can break things! If you are not sure what is going on, or if you accidentally installed an older version of the software to a newer database, force-kill this client in Task Manager right now. Otherwise, ok this dialog box to continue.' )
+            
+        
+        self._controller.CallBlockingToQt(None, qt_code)
+        
+    
+    def _ReportUnderupdatedDB( self, version ):
+        
+        def qt_code():
+            
+            QW.QMessageBox.warning( None, 'Warning', 'This client\'s database is version '+HydrusData.ToHumanInt(version)+', but the software is significantly later, '+HydrusData.ToHumanInt(HC.SOFTWARE_VERSION)+'! Trying to update many versions in one go can be dangerous due to bitrot. I suggest you try at most to only do 10 versions at once. If you want to try a big jump anyway, you should make sure you have a backup beforehand so you can roll back to it in case the update makes your db unbootable. If you would rather try smaller updates, or you do not have a backup, force-kill this client in Task Manager right now. Otherwise, ok this dialog box to continue.' )
+            
+        
+        self._controller.CallBlockingToQt(None, qt_code)
+        
+    
+    def _RepositoryBulkMappingsBuild( self, service_id, excluded_tag_ids_table_name ):
+        
+        # the mappings tables are empty, so we can skip all the row by row bookkeeping and build everything from the staged rows in a few big passes
+        
+        ( staging_table_name, pairs_staging_table_name ) = GenerateRepositoryBulkMappingsStagingTableNames( service_id )
+        
+        ( current_mappings_table_name, deleted_mappings_table_name, pending_mappings_table_name, petitioned_mappings_table_name ) = GenerateMappingsTableNames( service_id )
+        ( tag_siblings_lookup_table_name, display_current_mappings_table_name, display_pending_mappings_table_name ) = GenerateTagDisplayCacheTableNames( service_id )
+        
+        file_service_ids = self._GetServiceIds( HC.AUTOCOMPLETE_CACHE_SPECIFIC_FILE_SERVICES )
+        
+        mappings_indices = [ ( current_mappings_table_name, [ 'hash_id', 'tag_id' ] ), ( deleted_mappings_table_name, [ 'hash_id', 'tag_id' ] ) ]
+        cache_indices = [ ( display_current_mappings_table_name, [ 'tag_id', 'hash_id' ] ) ]
+        
+        for file_service_id in file_service_ids:
+            
+            ( cache_files_table_name, cache_current_mappings_table_name, cache_deleted_mappings_table_name, cache_pending_mappings_table_name, ac_cache_table_name ) = GenerateSpecificMappingsCacheTableNames( file_service_id, service_id )
+            
+            cache_indices.append( ( cache_current_mappings_table_name, [ 'tag_id', 'hash_id' ] ) )
+            cache_indices.append( ( cache_deleted_mappings_table_name, [ 'tag_id', 'hash_id' ] ) )
+            
+        
+        for ( table_name, columns ) in mappings_indices + cache_indices:
+            
+            self._c.execute( 'DROP INDEX IF EXISTS ' + table_name + '_' + '_'.join( columns ) + '_index;' )
+            
+        
+        # the last thing the repository said about a mapping wins, and the grouping hands the rows over in primary key order
+        
+        for ( mappings_table_name, action ) in ( ( current_mappings_table_name, HC.CONTENT_UPDATE_ADD ), ( deleted_mappings_table_name, HC.CONTENT_UPDATE_DELETE ) ):
+            
+            self._c.execute( 'INSERT INTO ' + mappings_table_name + ' ( tag_id, hash_id ) SELECT tag_id, hash_id FROM ( SELECT tag_id, hash_id, action, MAX( rowid ) FROM ' + staging_table_name + ' WHERE tag_id NOT IN ( SELECT tag_id FROM ' + excluded_tag_ids_table_name + ' ) GROUP BY tag_id, hash_id ) WHERE action = ?;', ( action, ) )
+            
+        
+        # the caches are keyed on hash_id, so they want these back before they are filled
+        
+        for ( table_name, columns ) in mappings_indices:
+            
+            self._CreateIndex( table_name, columns, unique = True )
+            
+        
+        self._c.execute( 'INSERT OR IGNORE INTO ' + display_current_mappings_table_name + ' ( hash_id, tag_id ) SELECT hash_id, IFNULL( ideal_tag_id, tag_id ) FROM ' + current_mappings_table_name + ' LEFT JOIN ' + tag_siblings_lookup_table_name + ' ON ( tag_id = bad_tag_id ) ORDER BY hash_id;' )
+        
+        ac_cache_table_name = GenerateCombinedFilesMappingsCacheTableName( service_id )
+        
+        self._c.execute( 'INSERT INTO ' + ac_cache_table_name + ' ( tag_id, current_count, pending_count ) SELECT tag_id, COUNT( * ), 0 FROM ' + current_mappings_table_name + ' GROUP BY tag_id;' )
+        
+        for file_service_id in file_service_ids:
+            
+            ( cache_files_table_name, cache_current_mappings_table_name, cache_deleted_mappings_table_name, cache_pending_mappings_table_name, ac_cache_table_name ) = GenerateSpecificMappingsCacheTableNames( file_service_id, service_id )
+            
+            for ( mappings_table_name, cache_mappings_table_name ) in ( ( current_mappings_table_name, cache_current_mappings_table_name ), ( deleted_mappings_table_name, cache_deleted_mappings_table_name ) ):
+                
+                self._c.execute( 'INSERT INTO ' + cache_mappings_table_name + ' ( hash_id, tag_id ) SELECT hash_id, tag_id FROM ' + cache_files_table_name + ' CROSS JOIN ' + mappings_table_name + ' USING ( hash_id );' )
+                
+            
+            self._c.execute( 'INSERT INTO ' + ac_cache_table_name + ' ( tag_id, current_count, pending_count ) SELECT tag_id, COUNT( * ), 0 FROM ' + cache_current_mappings_table_name + ' GROUP BY tag_id;' )
+            
+            if file_service_id == self._combined_local_file_service_id:
+                
+                for group_of_tag_ids in HydrusDB.ReadLargeIdQueryInSeparateChunks( self._c, 'SELECT tag_id FROM ' + ac_cache_table_name + ';', 10000 ):
+                    
+                    self._CacheLocalTagIdsPotentialAdd( group_of_tag_ids )
+                    
+                
+            
+        
+        for ( table_name, columns ) in cache_indices:
+            
+            self._CreateIndex( table_name, columns, unique = True )
+            
+        
+        self._c.executemany( 'DELETE FROM service_info WHERE service_id = ? AND info_type = ?;', ( ( service_id, info_type ) for info_type in ( HC.SERVICE_INFO_NUM_FILES, HC.SERVICE_INFO_NUM_TAGS, HC.SERVICE_INFO_NUM_MAPPINGS, HC.SERVICE_INFO_NUM_DELETED_MAPPINGS ) ) )
+        
+        for name in ( current_mappings_table_name, deleted_mappings_table_name ):
+            
+            self._AnalyzeTable( name )
+            
+        
+    
+    def _RepositoryBulkMappingsFlush( self, service_id, job_key ):
+        
+        ( staging_table_name, pairs_staging_table_name ) = GenerateRepositoryBulkMappingsStagingTableNames( service_id )
+        
+        mappings_staged = self._c.execute( 'SELECT 1 FROM ' + staging_table_name + ' LIMIT 1;' ).fetchone() is not None
+        pairs_staged = self._c.execute( 'SELECT 1 FROM ' + pairs_staging_table_name + ' LIMIT 1;' ).fetchone() is not None
+        
+        if not ( mappings_staged or pairs_staged ):
+            
+            return
+            
+        
+        job_key.SetVariable( 'popup_text_2', 'committing staged mappings' )
+        
+        mappings_table_names = GenerateMappingsTableNames( service_id )
+        
+        mappings_exist = True in ( self._c.execute( 'SELECT 1 FROM ' + mappings_table_name + ' LIMIT 1;' ).fetchone() is not None for mappings_table_name in mappings_table_names )
+        
+        if mappings_staged and not mappings_exist:
+            
+            # a pair only reads and fills in mappings for tags it is linked to, so everything else can be built in one go, and only the linked tags wait to be played back around the pairs
+            
+            linked_tag_ids = self._RepositoryBulkPairsGetLinkedTagIds( service_id )
+            
+            with HydrusDB.TemporaryIntegerTable( self._c, linked_tag_ids, 'tag_id' ) as linked_tag_ids_table_name:
+                
+                self._RepositoryBulkMappingsBuild( service_id, linked_tag_ids_table_name )
+                
+                self._RepositoryBulkMappingsReplayAroundPairs( service_id, linked_tag_ids_table_name )
+                
+            
+        else:
+            
+            self._RepositoryBulkMappingsReplayAroundPairs( service_id )
             
         
-        # mappings
+        self._c.execute( 'DELETE FROM ' + staging_table_name + ';' )
+        self._c.execute( 'DELETE FROM ' + pairs_staging_table_name + ';' )
         
-        existing_mapping_tables = self._STS( self._c.execute( 'SELECT name FROM external_mappings.sqlite_master WHERE type = ?;', ( 'table', ) ) )
+        job_key.DeleteVariable( 'popup_text_2' )
         
-        main_mappings_tables = set()
+    
+    def _RepositoryBulkMappingsReplay( self, service_id, from_rowid, to_rowid, tag_ids_table_name = None ):
         
-        for service_id in tag_service_ids:
+        # when there is already data in the way, or pairs need to see the mappings as they were, we play the staged rows back in order, but in much bigger gulps than normal processing gets
+        
+        REPLAY_CHUNK_SIZE = 100000
+        
+        ( staging_table_name, pairs_staging_table_name ) = GenerateRepositoryBulkMappingsStagingTableNames( service_id )
+        
+        select_statement = 'SELECT rowid, tag_id, hash_id, action FROM ' + staging_table_name + ' WHERE rowid > ? AND rowid <= ?'
+        
+        if tag_ids_table_name is not None:
             
-            main_mappings_tables.update( ( name.split( '.' )[1] for name in GenerateMappingsTableNames( service_id ) ) )
+            select_statement += ' AND tag_id IN ( SELECT tag_id FROM ' + tag_ids_table_name + ' )'
             
         
-        missing_main_tables = main_mappings_tables.difference( existing_mapping_tables )
+        select_statement += ' ORDER BY rowid LIMIT ?;'
         
-        if len( missing_main_tables ) > 0:
+        last_rowid = from_rowid
+        
+        while True:
             
-            missing_main_tables = list( missing_main_tables )
+            rows = self._c.execute( select_statement, ( last_rowid, to_rowid, REPLAY_CHUNK_SIZE ) ).fetchall()
             
-            missing_main_tables.sort()
+            if len( rows ) == 0:
+                
+                break
+                
             
-            message = 'On boot, some important mappings tables were missing! This could be due to the entire \'mappings\' database file being missing or some other problem. The tags in these tables are lost. The exact missing tables were:'
-            message += os.linesep * 2
-            message += os.linesep.join( missing_main_tables )
-            message += os.linesep * 2
-            message += 'If you wish, click ok on this message and the client will recreate these tables--empty, without data--which should at least let the client boot. If the affected tag service(s) are tag repositories, you will want to reset the processing cache so the client can repopulate the tables from your cached update files. But if you want to solve this problem otherwise, kill the hydrus process now.'
-            message += os.linesep * 2
-            message += 'If you do not already know what caused this, it was likely a hard drive fault--either due to a recent abrupt power cut or actual hardware failure. Check \'help my db is broke.txt\' in the install_dir/db directory as soon as you can.'
+            last_rowid = rows[-1][0]
             
-            self._controller.CallBlockingToQt( self._controller.app, QW.QMessageBox.warning, None, 'Warning', message )
+            runs = []
             
-            for service_id in tag_service_ids:
+            for ( rowid, tag_id, hash_id, action ) in rows:
                 
-                self._GenerateMappingsTables( service_id )
+                if len( runs ) == 0 or runs[-1][0] != action:
+                    
+                    runs.append( ( action, collections.defaultdict( set ) ) )
+                    
+                
+                runs[-1][1][ tag_id ].add( hash_id )
+                
+            
+            for ( action, tag_ids_to_hash_ids ) in runs:
+                
+                mappings_ids = [ ( tag_id, list( hash_ids ) ) for ( tag_id, hash_ids ) in tag_ids_to_hash_ids.items() ]
+                
+                if action == HC.CONTENT_UPDATE_ADD:
+                    
+                    self._UpdateMappings( service_id, mappings_ids = mappings_ids )
+                    
+                else:
+                    
+                    self._UpdateMappings( service_id, deleted_mappings_ids = mappings_ids )
+                    
                 
             
         
-        # caches
+    
+    def _RepositoryBulkMappingsReplayAroundPairs( self, service_id, tag_ids_table_name = None ):
         
-        existing_cache_tables = self._STS( self._c.execute( 'SELECT name FROM external_caches.sqlite_master WHERE type = ?;', ( 'table', ) ) )
+        # parents are filled in from the current mappings, so each staged pair goes in right after the mappings that were staged before it, as normal processing would have done
         
-        main_cache_tables = set()
+        ( staging_table_name, pairs_staging_table_name ) = GenerateRepositoryBulkMappingsStagingTableNames( service_id )
         
-        main_cache_tables.add( 'shape_perceptual_hashes' )
-        main_cache_tables.add( 'shape_perceptual_hash_map' )
-        main_cache_tables.add( 'shape_vptree' )
-        main_cache_tables.add( 'shape_maintenance_branch_regen' )
-        main_cache_tables.add( 'shape_search_cache' )
-        main_cache_tables.add( 'integer_subtags' )
+        mappings_rowids = self._STL( self._c.execute( 'SELECT DISTINCT mappings_rowid FROM ' + pairs_staging_table_name + ' ORDER BY mappings_rowid;' ) )
         
-        missing_main_tables = main_cache_tables.difference( existing_cache_tables )
+        ( max_rowid, ) = self._c.execute( 'SELECT IFNULL( MAX( rowid ), 0 ) FROM ' + staging_table_name + ';' ).fetchone()
         
-        if len( missing_main_tables ) > 0:
-            
-            missing_main_tables = list( missing_main_tables )
-            
-            missing_main_tables.sort()
+        last_rowid = 0
+        
+        for mappings_rowid in mappings_rowids:
             
-            message = 'On boot, some important caches tables were missing! This could be due to the entire \'caches\' database file being missing or some other problem. Data related to duplicate file search may have been lost. The exact missing tables were:'
-            message += os.linesep * 2
-            message += os.linesep.join( missing_main_tables )
-            message += os.linesep * 2
-            message += 'If you wish, click ok on this message and the client will recreate these tables--empty, without data--which should at least let the client boot. But if you want to solve this problem otherwise, kill the hydrus process now.'
-            message += os.linesep * 2
-            message += 'If you do not already know what caused this, it was likely a hard drive fault--either due to a recent abrupt power cut or actual hardware failure. Check \'help my db is broke.txt\' in the install_dir/db directory as soon as you can.'
+            self._RepositoryBulkMappingsReplay( service_id, last_rowid, mappings_rowid, tag_ids_table_name = tag_ids_table_name )
             
-            self._controller.CallBlockingToQt( self._controller.app, QW.QMessageBox.warning, None, 'Warning', message )
+            self._RepositoryBulkPairsReplay( service_id, mappings_rowid )
             
-            self._CreateDBCaches()
+            last_rowid = mappings_rowid
             
         
-        mappings_cache_tables = set()
+        self._RepositoryBulkMappingsReplay( service_id, last_rowid, max_rowid, tag_ids_table_name = tag_ids_table_name )
         
-        for ( file_service_id, tag_service_id ) in itertools.product( file_service_ids, tag_service_ids ):
+    
+    def _RepositoryBulkMappingsShouldStage( self, service_id ):
+        
+        service = self._GetService( service_id )
+        
+        if service.GetServiceType() != HC.TAG_REPOSITORY:
             
-            mappings_cache_tables.update( ( name.split( '.' )[1] for name in GenerateSpecificMappingsCacheTableNames( file_service_id, tag_service_id ) ) )
+            return False
             
         
-        for tag_service_id in tag_service_ids:
+        ( staging_table_name, pairs_staging_table_name ) = GenerateRepositoryBulkMappingsStagingTableNames( service_id )
+        
+        ( database_name, table_name ) = staging_table_name.split( '.' )
+        
+        if self._c.execute( 'SELECT 1 FROM ' + database_name + '.sqlite_master WHERE name = ?;', ( table_name, ) ).fetchone() is not None:
             
-            mappings_cache_tables.add( GenerateCombinedFilesMappingsCacheTableName( tag_service_id ).split( '.' )[1] )
+            self._c.execute( 'CREATE TABLE IF NOT EXISTS ' + pairs_staging_table_name + ' ( content_type INTEGER, action INTEGER, tag_id_a INTEGER, tag_id_b INTEGER, mappings_rowid INTEGER );' )
+            
+            return True
             
         
-        mappings_cache_tables.add( 'local_tags_cache' )
+        repository_updates_table_name = GenerateRepositoryRepositoryUpdatesTableName( service_id )
         
-        missing_main_tables = mappings_cache_tables.difference( existing_cache_tables )
+        ( num_unprocessed, ) = self._c.execute( 'SELECT COUNT( * ) FROM {} WHERE processed = ?;'.format( repository_updates_table_name ), ( False, ) ).fetchone()
         
-        if len( missing_main_tables ) > 0:
+        if num_unprocessed >= REPOSITORY_BULK_MAPPINGS_MIN_UNPROCESSED_UPDATES:
             
-            missing_main_tables = list( missing_main_tables )
+            # no indices, so appending is as cheap as it gets
             
-            missing_main_tables.sort()
+            self._c.execute( 'CREATE TABLE ' + staging_table_name + ' ( tag_id INTEGER, hash_id INTEGER, action INTEGER );' )
+            self._c.execute( 'CREATE TABLE ' + pairs_staging_table_name + ' ( content_type INTEGER, action INTEGER, tag_id_a INTEGER, tag_id_b INTEGER, mappings_rowid INTEGER );' )
             
-            message = 'On boot, some mapping caches tables were missing! This could be due to the entire \'caches\' database file being missing or due to some other problem. All of this data can be regenerated. The exact missing tables were:'
-            message += os.linesep * 2
-            message += os.linesep.join( missing_main_tables )
-            message += os.linesep * 2
-            message += 'If you wish, click ok on this message and the client will recreate and repopulate these tables with the correct data. This may take a few minutes. But if you want to solve this problem otherwise, kill the hydrus process now.'
-            message += os.linesep * 2
-            message += 'If you do not already know what caused this, it was likely a hard drive fault--either due to a recent abrupt power cut or actual hardware failure. Check \'help my db is broke.txt\' in the install_dir/db directory as soon as you can.'
+            return True
             
-            self._controller.CallBlockingToQt( self._controller.app, QW.QMessageBox.warning, None, 'Warning', message )
+        
+        return False
+        
+    
+    def _RepositoryBulkMappingsStage( self, service_id, action, mappings_ids ):
+        
+        ( staging_table_name, pairs_staging_table_name ) = GenerateRepositoryBulkMappingsStagingTableNames( service_id )
+        
+        self._c.executemany( 'INSERT INTO ' + staging_table_name + ' ( tag_id, hash_id, action ) VALUES ( ?, ?, ? );', ( ( tag_id, hash_id, action ) for ( tag_id, hash_ids ) in mappings_ids for hash_id in hash_ids ) )
+        
+    
+    def _RepositoryBulkMappingsStageServiceRows( self, service_id, action, rows ):
+        
+        ( staging_table_name, pairs_staging_table_name ) = GenerateRepositoryBulkMappingsStagingTableNames( service_id )
+        ( hash_id_map_table_name, tag_id_map_table_name ) = GenerateRepositoryMasterCacheTableNames( service_id )
+        
+        # the action is baked into the statement so the rows can go in exactly as they come
+        
+        insert_statement = 'INSERT INTO {} ( tag_id, hash_id, action ) SELECT tag_id, hash_id, {} FROM {} CROSS JOIN {} WHERE service_tag_id = ? AND service_hash_id = ?;'.format( staging_table_name, int( action ), tag_id_map_table_name, hash_id_map_table_name )
+        
+        self._c.executemany( insert_statement, rows )
+        
+        if self._c.rowcount != len( rows ):
             
-            self._RegenerateACCache()
+            self._HandleCriticalRepositoryDefinitionError( service_id )
             
         
-        #
+    
+    def _RepositoryBulkPairsGetLinkedTagIds( self, service_id ):
         
-        new_options = self._GetJSONDump( HydrusSerialisable.SERIALISABLE_TYPE_CLIENT_OPTIONS )
+        # only added pairs fill parents in, which reads the child's siblings and writes all its parents across every service's pairs, so we take everything they can reach
         
-        if new_options is None:
+        ( staging_table_name, pairs_staging_table_name ) = GenerateRepositoryBulkMappingsStagingTableNames( service_id )
+        
+        staged_pairs = self._c.execute( 'SELECT tag_id_a, tag_id_b FROM ' + pairs_staging_table_name + ';' ).fetchall()
+        added_pairs = self._c.execute( 'SELECT tag_id_a, tag_id_b FROM ' + pairs_staging_table_name + ' WHERE action = ?;', ( HC.CONTENT_UPDATE_ADD, ) ).fetchall()
+        
+        tag_ids_to_linked_tag_ids = collections.defaultdict( set )
+        
+        for ( tag_id_a, tag_id_b ) in itertools.chain( staged_pairs, self._c.execute( 'SELECT child_tag_id, parent_tag_id FROM tag_parents;' ).fetchall(), self._c.execute( 'SELECT bad_tag_id, good_tag_id FROM tag_siblings;' ).fetchall() ):
             
-            message = 'On boot, your main options object was missing!'
-            message += os.linesep * 2
-            message += 'If you wish, click ok on this message and the client will re-add fresh options with default values. But if you want to solve this problem otherwise, kill the hydrus process now.'
-            message += os.linesep * 2
-            message += 'If you do not already know what caused this, it was likely a hard drive fault--either due to a recent abrupt power cut or actual hardware failure. Check \'help my db is broke.txt\' in the install_dir/db directory as soon as you can.'
+            tag_ids_to_linked_tag_ids[ tag_id_a ].add( tag_id_b )
+            tag_ids_to_linked_tag_ids[ tag_id_b ].add( tag_id_a )
             
-            self._controller.CallBlockingToQt( self._controller.app, QW.QMessageBox.warning, None, 'Warning', message )
+        
+        linked_tag_ids = set()
+        
+        search_tag_ids = [ tag_id for pair in added_pairs for tag_id in pair ]
+        
+        while len( search_tag_ids ) > 0:
             
-            new_options = ClientOptions.ClientOptions()
+            tag_id = search_tag_ids.pop()
             
-            new_options.SetSimpleDownloaderFormulae( ClientDefaults.GetDefaultSimpleDownloaderFormulae() )
+            if tag_id in linked_tag_ids:
+                
+                continue
+                
             
-            self._SetJSONDump( new_options )
+            linked_tag_ids.add( tag_id )
+            
+            search_tag_ids.extend( tag_ids_to_linked_tag_ids[ tag_id ] )
             
         
+        return linked_tag_ids
+        
     
-    def _ReportOverupdatedDB( self, version ):
+    def _RepositoryBulkPairsReplay( self, service_id, mappings_rowid ):
         
-        def qt_code():
+        # these are few next to the mappings, so they go back through the normal calls, in order, in runs of the same kind
+        
+        ( staging_table_name, pairs_staging_table_name ) = GenerateRepositoryBulkMappingsStagingTableNames( service_id )
+        
+        runs = []
+        
+        for ( content_type, action, tag_id_a, tag_id_b ) in self._c.execute( 'SELECT content_type, action, tag_id_a, tag_id_b FROM ' + pairs_staging_table_name + ' WHERE mappings_rowid = ? ORDER BY rowid;', ( mappings_rowid, ) ).fetchall():
             
-            QW.QMessageBox.warning( None, 'Warning', 'This client\'s database is version '+HydrusData.ToHumanInt(version)+', but the software is version '+HydrusData.ToHumanInt(HC.SOFTWARE_VERSION)+'! This situation only sometimes works, and when it does not, it can break things! If you are not sure what is going on, or if you accidentally installed an older version of the software to a newer database, force-kill this client in Task Manager right now. Otherwise, ok this dialog box to continue.' )
+            if len( runs ) == 0 or runs[-1][0] != ( content_type, action ):
+                
+                runs.append( ( ( content_type, action ), [] ) )
+                
+            
+            runs[-1][1].append( ( tag_id_a, tag_id_b ) )
             
         
-        self._controller.CallBlockingToQt(None, qt_code)
+        for ( ( content_type, action ), pairs ) in runs:
+            
+            if content_type == HC.CONTENT_TYPE_TAG_PARENTS:
+                
+                if action == HC.CONTENT_UPDATE_ADD:
+                    
+                    self._AddTagParents( service_id, pairs )
+                    
+                else:
+                    
+                    self._DeleteTagParents( service_id, pairs )
+                    
+                
+            else:
+                
+                if action == HC.CONTENT_UPDATE_ADD:
+                    
+                    self._AddTagSiblings( service_id, pairs )
+                    
+                else:
+                    
+                    self._DeleteTagSiblings( service_id, pairs )
+                    
+                
+            
         
     
-    def _ReportUnderupdatedDB( self, version ):
+    def _RepositoryBulkPairsStage( self, service_id, content_type, action, pairs ):
         
-        def qt_code():
-            
-            QW.QMessageBox.warning( None, 'Warning', 'This client\'s database is version '+HydrusData.ToHumanInt(version)+', but the software is significantly later, '+HydrusData.ToHumanInt(HC.SOFTWARE_VERSION)+'! Trying to update many versions in one go can be dangerous due to bitrot. I suggest you try at most to only do 10 versions at once. If you want to try a big jump anyway, you should make sure you have a backup beforehand so you can roll back to it in case the update makes your db unbootable. If you would rather try smaller updates, or you do not have a backup, force-kill this client in Task Manager right now. Otherwise, ok this dialog box to continue.' )
-            
+        ( staging_table_name, pairs_staging_table_name ) = GenerateRepositoryBulkMappingsStagingTableNames( service_id )
         
-        self._controller.CallBlockingToQt(None, qt_code)
+        # we remember how many mappings were staged ahead of the pair, so the flush can put it back in the same place
+        
+        ( mappings_rowid, ) = self._c.execute( 'SELECT IFNULL( MAX( rowid ), 0 ) FROM ' + staging_table_name + ';' ).fetchone()
+        
+        self._c.executemany( 'INSERT INTO ' + pairs_staging_table_name + ' ( content_type, action, tag_id_a, tag_id_b, mappings_rowid ) VALUES ( ?, ?, ?, ?, ? );', ( ( content_type, action, tag_id_a, tag_id_b, mappings_rowid ) for ( tag_id_a, tag_id_b ) in pairs ) )
         
     
     def _ReprocessRepository( self, service_key, update_mime_types ):
@@ -11322,6 +12805,15 @@ class DB( HydrusDB.HydrusDB ):
             
         
     
+    def _Rollback( self ):
+        
+        HydrusDB.HydrusDB._Rollback( self )
+        
+        # the phash index may have been told about rows that no longer exist
+        
+        self._phash_index = None
+        
+    
     def _SaveDirtyServices( self, dirty_services ):
         
         # if allowed to save objects
@@ -11407,19 +12899,28 @@ class DB( HydrusDB.HydrusDB ):
         
         if isinstance( obj, HydrusSerialisable.SerialisableBaseNamed ):
             
-            ( dump_type, dump_name, version, serialisable_info ) = obj.GetSerialisableTuple()
-            
-            try:
+            if obj.SERIALISABLE_BINARY_DUMP:
                 
-                dump = json.dumps( serialisable_info )
+                ( dump_type, dump_name, version ) = ( obj.SERIALISABLE_TYPE, obj.GetName(), obj.SERIALISABLE_VERSION )
                 
-            except Exception as e:
+                dump = obj.DumpToBinary()
                 
-                HydrusData.ShowException( e )
-                HydrusData.Print( obj )
-                HydrusData.Print( serialisable_info )
+            else:
+                
+                ( dump_type, dump_name, version, serialisable_info ) = obj.GetSerialisableTuple()
                 
-                raise Exception( 'Trying to json dump the object ' + str( obj ) + ' with name ' + dump_name + ' caused an error. Its serialisable info has been dumped to the log.' )
+                try:
+                    
+                    dump = json.dumps( serialisable_info )
+                    
+                except Exception as e:
+                    
+                    HydrusData.ShowException( e )
+                    HydrusData.Print( obj )
+                    HydrusData.Print( serialisable_info )
+                    
+                    raise Exception( 'Trying to json dump the object ' + str( obj ) + ' with name ' + dump_name + ' caused an error. Its serialisable info has been dumped to the log.' )
+                    
                 
             
             store_backups = False
@@ -11461,7 +12962,15 @@ class DB( HydrusDB.HydrusDB ):
                 self._c.execute( 'DELETE FROM json_dumps_named WHERE dump_type = ? AND dump_name = ?;', ( dump_type, dump_name ) )
                 
             
-            dump_buffer = sqlite3.Binary( bytes( dump, 'utf-8' ) )
+            if isinstance( dump, bytes ):
+                
+                dump_buffer = sqlite3.Binary( dump )
+                
+            else:
+                
+                dump_buffer = sqlite3.Binary( bytes( dump, 'utf-8' ) )
+                
+            
             
             try:
                 
@@ -11477,24 +12986,46 @@ class DB( HydrusDB.HydrusDB ):
             
         else:
             
-            ( dump_type, version, serialisable_info ) = obj.GetSerialisableTuple()
-            
-            try:
+            if obj.SERIALISABLE_BINARY_DUMP:
                 
-                dump = json.dumps( serialisable_info )
+                ( dump_type, version ) = ( obj.SERIALISABLE_TYPE, obj.SERIALISABLE_VERSION )
                 
-            except Exception as e:
+                dump = obj.DumpToBinary()
+                
+            else:
                 
-                HydrusData.ShowException( e )
-                HydrusData.Print( obj )
-                HydrusData.Print( serialisable_info )
+                ( dump_type, version, serialisable_info ) = obj.GetSerialisableTuple()
                 
-                raise Exception( 'Trying to json dump the object ' + str( obj ) + ' caused an error. Its serialisable info has been dumped to the log.' )
+                try:
+                    
+                    dump = json.dumps( serialisable_info )
+                    
+                except Exception as e:
+                    
+                    HydrusData.ShowException( e )
+                    HydrusData.Print( obj )
+                    HydrusData.Print( serialisable_info )
+                    
+                    raise Exception( 'Trying to json dump the object ' + str( obj ) + ' caused an error. Its serialisable info has been dumped to the log.' )
+                    
                 
             
             self._c.execute( 'DELETE FROM json_dumps WHERE dump_type = ?;', ( dump_type, ) )
             
-            dump_buffer = sqlite3.Binary( bytes( dump, 'utf-8' ) )
+            if dump_type == HydrusSerialisable.SERIALISABLE_TYPE_CLIENT_OPTIONS:
+                
+                self._CacheTagDisplaySetApplyAllSiblings( obj.GetBoolean( 'apply_all_siblings_to_all_services' ) )
+                
+            
+            if isinstance( dump, bytes ):
+                
+                dump_buffer = sqlite3.Binary( dump )
+                
+            else:
+                
+                dump_buffer = sqlite3.Binary( bytes( dump, 'utf-8' ) )
+                
+            
             
             try:
                 
@@ -12358,7 +13889,7 @@ class DB( HydrusDB.HydrusDB ):
                 
                 i = 0
                 
-                self._tag_ids_to_tags_cache = {}
+                self._tag_ids_to_tags_cache.clear()
                 
                 for block_of_tag_ids in HydrusData.SplitListIntoChunks( tag_ids, 1000 ):
                     
@@ -13523,6 +15054,32 @@ class DB( HydrusDB.HydrusDB ):
                 
             
         
+        if version == 384:
+            
+            self._controller.pub( 'splash_set_status_subtext', 'generating similar files multi-index' )
+            
+            self._CreateDBCachesMultiIndexHashes()
+            
+            all_nodes = self._c.execute( 'SELECT phash_id, phash FROM shape_perceptual_hashes;' ).fetchall()
+            
+            self._PHashesAddMultiIndexHashes( all_nodes )
+            
+            self._controller.pub( 'splash_set_status_subtext', 'generating wildcard tag search index' )
+            
+            self._CacheSubtagTrigramsGenerate()
+            
+            new_options = self._GetJSONDump( HydrusSerialisable.SERIALISABLE_TYPE_CLIENT_OPTIONS )
+            
+            self._SetJSONSimple( 'tag_display_cache_apply_all_siblings', new_options.GetBoolean( 'apply_all_siblings_to_all_services' ) )
+            
+            for tag_service_id in self._GetServiceIds( HC.TAG_SERVICES ):
+                
+                self._controller.pub( 'splash_set_status_subtext', 'generating tag display cache {}'.format( tag_service_id ) )
+                
+                self._CacheTagDisplayGenerate( tag_service_id )
+                
+            
+        
         self._controller.pub( 'splash_set_title_text', 'updated db to v' + str( version + 1 ) )
         
         self._c.execute( 'UPDATE version SET version = ?;', ( version + 1, ) )
@@ -13585,6 +15142,8 @@ class DB( HydrusDB.HydrusDB ):
         
         if len( mappings_ids ) > 0:
             
+            pending_deleted_mappings_ids = []
+            
             for ( tag_id, hash_ids ) in mappings_ids:
                 
                 self._c.executemany( 'DELETE FROM ' + deleted_mappings_table_name + ' WHERE tag_id = ? AND hash_id = ?;', ( ( tag_id, hash_id ) for hash_id in hash_ids ) )
@@ -13606,12 +15165,20 @@ class DB( HydrusDB.HydrusDB ):
                 combined_files_pending_counter[ tag_id ] -= num_pending_deleted
                 combined_files_current_counter[ tag_id ] += num_current_inserted
                 
+                if num_pending_deleted > 0:
+                    
+                    pending_deleted_mappings_ids.append( ( tag_id, hash_ids ) )
+                    
+                
             
             for file_service_id in file_service_ids:
                 
                 self._CacheSpecificMappingsAddMappings( file_service_id, tag_service_id, mappings_ids )
                 
             
+            self._CacheTagDisplayAddMappings( tag_service_id, HC.CONTENT_STATUS_CURRENT, mappings_ids )
+            self._CacheTagDisplayDeleteMappings( tag_service_id, HC.CONTENT_STATUS_PENDING, pending_deleted_mappings_ids )
+            
         
         if len( deleted_mappings_ids ) > 0:
             
@@ -13641,6 +15208,8 @@ class DB( HydrusDB.HydrusDB ):
                 self._CacheSpecificMappingsDeleteMappings( file_service_id, tag_service_id, deleted_mappings_ids )
                 
             
+            self._CacheTagDisplayDeleteMappings( tag_service_id, HC.CONTENT_STATUS_CURRENT, deleted_mappings_ids )
+            
         
         if len( pending_mappings_ids ) > 0:
             
@@ -13676,6 +15245,8 @@ class DB( HydrusDB.HydrusDB ):
                 self._CacheSpecificMappingsPendMappings( file_service_id, tag_service_id, pending_mappings_ids )
                 
             
+            self._CacheTagDisplayAddMappings( tag_service_id, HC.CONTENT_STATUS_PENDING, pending_mappings_ids )
+            
         
         if len( pending_rescinded_mappings_ids ) > 0:
             
@@ -13695,6 +15266,8 @@ class DB( HydrusDB.HydrusDB ):
                 self._CacheSpecificMappingsRescindPendingMappings( file_service_id, tag_service_id, pending_rescinded_mappings_ids )
                 
             
+            self._CacheTagDisplayDeleteMappings( tag_service_id, HC.CONTENT_STATUS_PENDING, pending_rescinded_mappings_ids )
+            
         
         combined_files_seen_ids = set( ( key for ( key, value ) in list( combined_files_current_counter.items() ) if value != 0 ) )
         combined_files_seen_ids.update( ( key for ( key, value ) in list( combined_files_pending_counter.items() ) if value != 0 ) )
@@ -14049,7 +15622,7 @@ class DB( HydrusDB.HydrusDB ):
         
         if action == 'analyze': self._AnalyzeDueTables( *args, **kwargs )
         elif action == 'associate_repository_update_hashes': self._AssociateRepositoryUpdateHashes( *args, **kwargs )
-        elif action == 'backup': self._Backup( *args, **kwargs )
+        elif action == 'backup': result = self._Backup( *args, **kwargs )
         elif action == 'clear_false_positive_relations': self._DuplicatesClearAllFalsePositiveRelationsFromHashes( *args, **kwargs )
         elif action == 'clear_false_positive_relations_between_groups': self._DuplicatesClearFalsePositiveRelationsBetweenGroupsFromHashes( *args, **kwargs )
         elif action == 'clear_orphan_file_records': self._ClearOrphanFileRecords( *args, **kwargs )
@@ -14088,6 +15661,8 @@ class DB( HydrusDB.HydrusDB ):
         elif action == 'push_recent_tags': self._PushRecentTags( *args, **kwargs )
         elif action == 'regenerate_ac_cache': self._RegenerateACCache( *args, **kwargs )
         elif action == 'regenerate_similar_files': self._PHashesRegenerateTree( *args, **kwargs )
+        elif action == 'regenerate_subtag_trigrams': self._RegenerateSubtagTrigrams( *args, **kwargs )
+        elif action == 'regenerate_tag_display_cache': self._RegenerateTagDisplayCache( *args, **kwargs )
         elif action == 'relocate_client_files': self._RelocateClientFiles( *args, **kwargs )
         elif action == 'remove_alternates_member': self._DuplicatesRemoveAlternateMemberFromHashes( *args, **kwargs )
         elif action == 'remove_duplicates_member': self._DuplicatesRemoveMediaIdMemberFromHashes( *args, **kwargs )
@@ -14107,9 +15682,27 @@ class DB( HydrusDB.HydrusDB ):
         elif action == 'vacuum': self._Vacuum( *args, **kwargs )
         else: raise Exception( 'db received an unknown write command: ' + action )
         
+        if len( self._tag_display_dirty_tag_service_ids ) > 0:
+            
+            self._CacheTagDisplaySyncSiblings()
+            
+        
         return result
         
     
+    def _GetHashIdsToHashesCache( self ):
+        
+        return self._GetThreadCache( 'hash_ids_to_hashes' )
+        
+    
+    def _GetTagIdsToTagsCache( self ):
+        
+        return self._GetThreadCache( 'tag_ids_to_tags' )
+        
+    
+    _hash_ids_to_hashes_cache = property( _GetHashIdsToHashesCache )
+    _tag_ids_to_tags_cache = property( _GetTagIdsToTagsCache )
+    
     def pub_content_updates_after_commit( self, service_keys_to_content_updates ):
         
         self.pub_after_job( 'content_updates_data', service_keys_to_content_updates )
@@ -6,6 +6,8 @@ from . import HydrusData
 from . import HydrusExceptions
 from . import HydrusGlobals as HG
 from . import HydrusSerialisable
+import numpy
+import threading
 
 class DuplicateActionOptions( HydrusSerialisable.SerialisableBase ):
     
@@ -372,3 +374,166 @@ class DuplicateActionOptions( HydrusSerialisable.SerialisableBase ):
         
     
 HydrusSerialisable.SERIALISABLE_TYPES_TO_OBJECT_TYPES[ HydrusSerialisable.SERIALISABLE_TYPE_DUPLICATE_ACTION_OPTIONS ] = DuplicateActionOptions
+
+class PerceptualHashIndex( object ):
+    
+    MAX_BLOCK_CELLS = 1048576
+    
+    def __init__( self, phash_ids_and_phashes = None ):
+        
+        self._lock = threading.Lock()
+        
+        self._phash_ids = numpy.zeros( 0, dtype = numpy.int64 )
+        self._phashes = numpy.zeros( 0, dtype = numpy.uint64 )
+        
+        self._pending_phash_ids_and_phashes = []
+        
+        if phash_ids_and_phashes is not None:
+            
+            self.Add( phash_ids_and_phashes )
+            
+        
+    
+    def _ConsolidatePending( self ):
+        
+        if len( self._pending_phash_ids_and_phashes ) > 0:
+            
+            ( phash_ids, phashes ) = list( zip( *self._pending_phash_ids_and_phashes ) )
+            
+            # we never edit the arrays in place, so a search that grabbed the old ones can carry on safely
+            
+            self._phash_ids = numpy.concatenate( ( self._phash_ids, numpy.array( phash_ids, dtype = numpy.int64 ) ) )
+            self._phashes = numpy.concatenate( ( self._phashes, self._ConvertPHashesToArray( phashes ) ) )
+            
+            self._pending_phash_ids_and_phashes = []
+            
+        
+    
+    def _ConvertPHashesToArray( self, phashes ):
+        
+        return numpy.frombuffer( b''.join( phashes ), dtype = '>u8' ).astype( numpy.uint64 )
+        
+    
+    def _GetHammingDistances( self, xors ):
+        
+        if hasattr( numpy, 'bitwise_count' ):
+            
+            return numpy.bitwise_count( xors )
+            
+        
+        # same popcount magic as HydrusData.Get64BitHammingDistance, but over the whole array at once
+        
+        # it is all done in place with one scratch array, since these blocks are big
+        
+        n = xors
+        t = numpy.empty_like( n )
+        
+        numpy.right_shift( n, numpy.uint64( 1 ), out = t )
+        t &= numpy.uint64( 0x5555555555555555 )
+        n -= t
+        
+        numpy.right_shift( n, numpy.uint64( 2 ), out = t )
+        t &= numpy.uint64( 0x3333333333333333 )
+        n &= numpy.uint64( 0x3333333333333333 )
+        n += t
+        
+        numpy.right_shift( n, numpy.uint64( 4 ), out = t )
+        n += t
+        n &= numpy.uint64( 0x0F0F0F0F0F0F0F0F )
+        
+        n *= numpy.uint64( 0x0101010101010101 )
+        n >>= numpy.uint64( 56 )
+        
+        return n
+        
+    
+    def Add( self, phash_ids_and_phashes ):
+        
+        with self._lock:
+            
+            self._pending_phash_ids_and_phashes.extend( phash_ids_and_phashes )
+            
+        
+    
+    def GetNumPHashes( self ):
+        
+        with self._lock:
+            
+            return len( self._phash_ids ) + len( self._pending_phash_ids_and_phashes )
+            
+        
+    
+    def Remove( self, phash_ids ):
+        
+        if len( phash_ids ) == 0:
+            
+            return
+            
+        
+        with self._lock:
+            
+            self._ConsolidatePending()
+            
+            keep = numpy.isin( self._phash_ids, numpy.array( list( phash_ids ), dtype = numpy.int64 ), invert = True )
+            
+            self._phash_ids = self._phash_ids[ keep ]
+            self._phashes = self._phashes[ keep ]
+            
+        
+    
+    def Search( self, search_phashes, max_hamming_distance ):
+        
+        with self._lock:
+            
+            self._ConsolidatePending()
+            
+            phash_ids = self._phash_ids
+            phashes = self._phashes
+            
+        
+        search_phashes = list( search_phashes )
+        
+        results = [ {} for search_phash in search_phashes ]
+        
+        if len( search_phashes ) == 0 or len( phashes ) == 0:
+            
+            return results
+            
+        
+        search_array = self._ConvertPHashesToArray( search_phashes )
+        
+        # compare a block of search phashes against a block of the index at a time, so the xor matrix stays a sensible size
+        
+        search_block_size = min( len( search_array ), 256 )
+        index_block_size = max( 1, self.MAX_BLOCK_CELLS // search_block_size )
+        
+        for search_start in range( 0, len( search_array ), search_block_size ):
+            
+            search_block = search_array[ search_start : search_start + search_block_size ]
+            
+            for index_start in range( 0, len( phashes ), index_block_size ):
+                
+                index_block = phashes[ index_start : index_start + index_block_size ]
+                
+                distances = self._GetHammingDistances( numpy.bitwise_xor.outer( search_block, index_block ) )
+                
+                ( search_indices, index_indices ) = numpy.nonzero( distances <= max_hamming_distance )
+                
+                if len( search_indices ) == 0:
+                    
+                    continue
+                    
+                
+                matching_phash_ids = phash_ids[ index_start + index_indices ].tolist()
+                matching_distances = distances[ search_indices, index_indices ].tolist()
+                
+                for ( search_index, phash_id, distance ) in zip( search_indices.tolist(), matching_phash_ids, matching_distances ):
+                    
+                    results[ search_start + search_index ][ phash_id ] = distance
+                    
+                
+            
+        
+        return results
+        
+    
@@ -2,6 +2,7 @@ from . import ClientConstants as CC
 from . import ClientImageHandling
 from . import ClientPaths
 from . import ClientThreading
+from . import ClientVideoHandling
 import collections
 import gc
 from . import HydrusConstants as HC
@@ -14,6 +15,7 @@ from . import HydrusNetworking
 from . import HydrusPaths
 from . import HydrusThreading
 import os
+import queue
 import random
 import threading
 import time
@@ -107,6 +109,9 @@ regen_file_enum_to_overruled_jobs[ REGENERATE_FILE_DATA_JOB_FILE_MODIFIED_TIMEST
 
 ALL_REGEN_JOBS_IN_PREFERRED_ORDER = [ REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_PRESENCE_URL, REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_DATA_URL, REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_PRESENCE, REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_DATA, REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_DATA_SILENT_DELETE, REGENERATE_FILE_DATA_JOB_FILE_METADATA, REGENERATE_FILE_DATA_JOB_REFIT_THUMBNAIL, REGENERATE_FILE_DATA_JOB_FORCE_THUMBNAIL, REGENERATE_FILE_DATA_JOB_SIMILAR_FILES_METADATA, REGENERATE_FILE_DATA_JOB_CHECK_SIMILAR_FILES_MEMBERSHIP, REGENERATE_FILE_DATA_JOB_FIX_PERMISSIONS, REGENERATE_FILE_DATA_JOB_FILE_MODIFIED_TIMESTAMP, REGENERATE_FILE_DATA_JOB_OTHER_HASHES, REGENERATE_FILE_DATA_JOB_DELETE_NEIGHBOUR_DUPES ]
 
+# these spend most of their time in decoders, hashlib and ffmpeg, which all let go of the GIL, so several files can be done at once
+PARALLEL_REGEN_JOBS = { REGENERATE_FILE_DATA_JOB_FILE_METADATA, REGENERATE_FILE_DATA_JOB_FORCE_THUMBNAIL, REGENERATE_FILE_DATA_JOB_REFIT_THUMBNAIL, REGENERATE_FILE_DATA_JOB_OTHER_HASHES, REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_DATA, REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_DATA_URL, REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_DATA_SILENT_DELETE, REGENERATE_FILE_DATA_JOB_SIMILAR_FILES_METADATA }
+
 def GetAllFilePaths( raw_paths, do_human_sort = True ):
     
     file_paths = []
@@ -988,6 +993,11 @@ class ClientFilesManager( object ):
                     
                     ClientPaths.DeletePath( path )
                     
+                    if mime in HC.VIDEO:
+                        
+                        ClientVideoHandling.DeleteVideoFrameIndices( ( hash, ) )
+                        
+                    
                 
             
             big_pauser.Pause()
@@ -1017,6 +1027,8 @@ class ClientFilesManager( object ):
                     
                 
             
+            self._controller.pub( 'clear_thumbnails', set( hashes_chunk ) )
+            
             big_pauser.Pause()
             
         
@@ -1334,7 +1346,9 @@ class FilesMaintenanceManager( object ):
         self._ReInitialiseWorkRules()
         
         self._maintenance_lock = threading.Lock()
+        self._job_lock = threading.Lock()
         self._lock = threading.Lock()
+        self._bad_file_lock = threading.Lock()
         
         self._wake_background_event = threading.Event()
         self._reset_background_event = threading.Event()
@@ -1358,7 +1372,10 @@ class FilesMaintenanceManager( object ):
                 return False
                 
             
-            return self._idle_work_rules.CanStartRequest( self._work_tracker )
+            with self._lock:
+                
+                return self._idle_work_rules.CanStartRequest( self._work_tracker )
+                
             
         else:
             
@@ -1367,7 +1384,10 @@ class FilesMaintenanceManager( object ):
                 return False
                 
             
-            return self._active_work_rules.CanStartRequest( self._work_tracker )
+            with self._lock:
+                
+                return self._active_work_rules.CanStartRequest( self._work_tracker )
+                
             
         
     
@@ -1408,117 +1428,122 @@ class FilesMaintenanceManager( object ):
         
         if file_was_bad:
             
-            urls = media_result.GetLocationsManager().GetURLs()
+            # several files can be checked at once, so we do the exports and messages one at a time
             
-            if len( urls ) > 0:
+            with self._bad_file_lock:
                 
-                HydrusPaths.MakeSureDirectoryExists( error_dir )
+                urls = media_result.GetLocationsManager().GetURLs()
                 
-                with open( os.path.join( error_dir, hash.hex() + '.urls.txt' ), 'w', encoding = 'utf-8' ) as f:
+                if len( urls ) > 0:
+                    
+                    HydrusPaths.MakeSureDirectoryExists( error_dir )
                     
-                    for url in urls:
+                    with open( os.path.join( error_dir, hash.hex() + '.urls.txt' ), 'w', encoding = 'utf-8' ) as f:
                         
-                        f.write( url )
-                        f.write( os.linesep )
+                        for url in urls:
+                            
+                            f.write( url )
+                            f.write( os.linesep )
+                            
                         
                     
-                
-                with open( os.path.join( error_dir, 'all_urls.txt' ), 'a', encoding = 'utf-8' ) as f:
-                    
-                    for url in urls:
+                    with open( os.path.join( error_dir, 'all_urls.txt' ), 'a', encoding = 'utf-8' ) as f:
                         
-                        f.write( url )
-                        f.write( os.linesep )
+                        for url in urls:
+                            
+                            f.write( url )
+                            f.write( os.linesep )
+                            
                         
                     
                 
-            
-            useful_urls = []
-            
-            for url in urls:
-                
-                add_it = False
-                
-                url_class = HG.client_controller.network_engine.domain_manager.GetURLClass( url )
+                useful_urls = []
                 
-                if url_class is None:
+                for url in urls:
                     
-                    add_it = True
+                    add_it = False
                     
-                else:
+                    url_class = HG.client_controller.network_engine.domain_manager.GetURLClass( url )
                     
-                    if url_class.GetURLType() in ( HC.URL_TYPE_FILE, HC.URL_TYPE_POST ):
+                    if url_class is None:
                         
                         add_it = True
                         
+                    else:
+                        
+                        if url_class.GetURLType() in ( HC.URL_TYPE_FILE, HC.URL_TYPE_POST ):
+                            
+                            add_it = True
+                            
+                        
                     
-                
-                if add_it:
-                    
-                    useful_urls.append( url )
+                    if add_it:
+                        
+                        useful_urls.append( url )
+                        
                     
                 
-            
-            delete_record = job_type in ( REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_PRESENCE, REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_DATA )
-            try_redownload = job_type in ( REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_PRESENCE_URL, REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_DATA_URL ) and len( useful_urls ) > 0
-            do_export = file_is_invalid and ( job_type in ( REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_DATA, REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_DATA_SILENT_DELETE ) or ( job_type == REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_DATA_URL and try_redownload ) )
-            
-            if do_export:
-                
-                HydrusPaths.MakeSureDirectoryExists( error_dir )
-                
-                dest_path = os.path.join( error_dir, os.path.basename( path ) )
+                delete_record = job_type in ( REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_PRESENCE, REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_DATA )
+                try_redownload = job_type in ( REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_PRESENCE_URL, REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_DATA_URL ) and len( useful_urls ) > 0
+                do_export = file_is_invalid and ( job_type in ( REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_DATA, REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_DATA_SILENT_DELETE ) or ( job_type == REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_DATA_URL and try_redownload ) )
                 
-                HydrusPaths.MergeFile( path, dest_path )
-                
-                if not self._pubbed_message_about_invalid_file_export:
-                    
-                    self._pubbed_message_about_invalid_file_export = True
+                if do_export:
                     
-                    message = 'During file maintenance, a file was found to be invalid. It and any known URLs have been moved to "{}".'.format( error_dir )
-                    message += os.linesep * 2
-                    message += 'More files may be invalid, but this message will not appear again during this boot.'
+                    HydrusPaths.MakeSureDirectoryExists( error_dir )
                     
-                    HydrusData.ShowText( message )
+                    dest_path = os.path.join( error_dir, os.path.basename( path ) )
                     
-                
-            
-            if delete_record:
-                
-                content_update = HydrusData.ContentUpdate( HC.CONTENT_TYPE_FILES, HC.CONTENT_UPDATE_DELETE, ( hash, ), reason = 'Record deleted during File Integrity check.' )
-                
-                for service_key in [ CC.LOCAL_FILE_SERVICE_KEY, CC.LOCAL_UPDATE_SERVICE_KEY, CC.TRASH_SERVICE_KEY, CC.COMBINED_LOCAL_FILE_SERVICE_KEY ]:
+                    HydrusPaths.MergeFile( path, dest_path )
                     
-                    service_keys_to_content_updates = { CC.TRASH_SERVICE_KEY : [ content_update ] }
-                    
-                    self._controller.WriteSynchronous( 'content_updates', service_keys_to_content_updates )
+                    if not self._pubbed_message_about_invalid_file_export:
+                        
+                        self._pubbed_message_about_invalid_file_export = True
+                        
+                        message = 'During file maintenance, a file was found to be invalid. It and any known URLs have been moved to "{}".'.format( error_dir )
+                        message += os.linesep * 2
+                        message += 'More files may be invalid, but this message will not appear again during this boot.'
+                        
+                        HydrusData.ShowText( message )
+                        
                     
                 
-                if not self._pubbed_message_about_bad_file_record_delete:
+                if delete_record:
                     
-                    self._pubbed_message_about_bad_file_record_delete = True
+                    content_update = HydrusData.ContentUpdate( HC.CONTENT_TYPE_FILES, HC.CONTENT_UPDATE_DELETE, ( hash, ), reason = 'Record deleted during File Integrity check.' )
                     
-                    message = 'During file maintenance, a file was found to be missing or invalid. Its record has been removed from the database. Any known URLs for the file have been written to "{}".'.format( error_dir )
-                    message += os.linesep * 2
-                    message += 'More file records may have been removed, but this message will not appear again during this boot.'
+                    for service_key in [ CC.LOCAL_FILE_SERVICE_KEY, CC.LOCAL_UPDATE_SERVICE_KEY, CC.TRASH_SERVICE_KEY, CC.COMBINED_LOCAL_FILE_SERVICE_KEY ]:
+                        
+                        service_keys_to_content_updates = { CC.TRASH_SERVICE_KEY : [ content_update ] }
+                        
+                        self._controller.WriteSynchronous( 'content_updates', service_keys_to_content_updates )
+                        
                     
-                    HydrusData.ShowText( message )
+                    if not self._pubbed_message_about_bad_file_record_delete:
+                        
+                        self._pubbed_message_about_bad_file_record_delete = True
+                        
+                        message = 'During file maintenance, a file was found to be missing or invalid. Its record has been removed from the database. Any known URLs for the file have been written to "{}".'.format( error_dir )
+                        message += os.linesep * 2
+                        message += 'More file records may have been removed, but this message will not appear again during this boot.'
+                        
+                        HydrusData.ShowText( message )
+                        
                     
                 
-            
-            if try_redownload:
-                
-                def qt_add_url( url ):
+                if try_redownload:
                     
-                    if QP.isValid( HG.client_controller.gui ):
+                    def qt_add_url( url ):
                         
-                        HG.client_controller.gui.ImportURL( url, 'missing files redownloader' )
+                        if QP.isValid( HG.client_controller.gui ):
+                            
+                            HG.client_controller.gui.ImportURL( url, 'missing files redownloader' )
+                            
                         
                     
-                
-                for url in useful_urls:
-                    
-                    QP.CallAfter( qt_add_url, url )
+                    for url in useful_urls:
+                        
+                        QP.CallAfter( qt_add_url, url )
+                        
                     
                 
             
@@ -1740,114 +1765,121 @@ class FilesMaintenanceManager( object ):
         self._active_work_rules.AddRule( HC.BANDWIDTH_TYPE_REQUESTS, file_maintenance_active_throttle_time_delta, file_maintenance_active_throttle_files * NORMALISED_BIG_JOB_WEIGHT )
         
     
-    def _RunJob( self, media_results, job_type, job_key ):
+    def _RunJob( self, media_results, job_type, job_key, can_start_callable = None ):
         
         num_bad_files = 0
         num_thumb_refits = 0
         
-        next_gc_collect = HydrusData.GetNow() + 10
+        if job_type in PARALLEL_REGEN_JOBS:
+            
+            num_workers = self._controller.new_options.GetInteger( 'file_maintenance_workers' )
+            
+        else:
+            
+            num_workers = 1
+            
+        
+        results = queue.Queue()
         
-        try:
+        def do_it( media_result ):
             
-            cleared_jobs = []
+            results.put( self._RunMediaResultJob( media_result, job_type ) )
             
-            num_to_do = len( media_results )
+        
+        cleared_jobs = []
+        
+        num_to_do = len( media_results )
+        num_started = 0
+        num_done = 0
+        
+        stop_starting = False
+        
+        try:
             
             if HG.file_report_mode:
                 
                 HydrusData.ShowText( 'file maintenance: {} for {} files'.format( regen_file_enum_to_str_lookup[ job_type ], HydrusData.ToHumanInt( num_to_do ) ) )
                 
             
-            for ( i, media_result ) in enumerate( media_results ):
-                
-                hash = media_result.GetHash()
-                
-                if job_key.IsCancelled():
-                    
-                    return
-                    
-                
-                status_text = '{}: {}'.format( regen_file_enum_to_str_lookup[ job_type ], HydrusData.ConvertValueRangeToPrettyString( i + 1, num_to_do ) )
-                
-                job_key.SetVariable( 'popup_text_1', status_text )
-                job_key.SetVariable( 'popup_gauge_1', ( i + 1, num_to_do ) )
-                
-                additional_data = None
+            while True:
                 
-                try:
+                if not stop_starting and num_started < num_to_do and num_started - num_done < num_workers:
                     
-                    if job_type == REGENERATE_FILE_DATA_JOB_FILE_METADATA:
-                        
-                        additional_data = self._RegenFileMetadata( media_result )
-                        
-                    elif job_type == REGENERATE_FILE_DATA_JOB_FILE_MODIFIED_TIMESTAMP:
-                        
-                        additional_data = self._RegenFileModifiedTimestamp( media_result )
-                        
-                    elif job_type == REGENERATE_FILE_DATA_JOB_OTHER_HASHES:
-                        
-                        additional_data = self._RegenFileOtherHashes( media_result )
-                        
-                    elif job_type == REGENERATE_FILE_DATA_JOB_FORCE_THUMBNAIL:
-                        
-                        self._RegenFileThumbnailForce( media_result )
-                        
-                    elif job_type == REGENERATE_FILE_DATA_JOB_REFIT_THUMBNAIL:
+                    if job_key.IsCancelled() or ( can_start_callable is not None and not can_start_callable() ):
                         
-                        was_regenerated = self._RegenFileThumbnailRefit( media_result )
+                        stop_starting = True
                         
-                        if was_regenerated:
-                            
-                            num_thumb_refits += 1
-                            
-                        
-                        job_key.SetVariable( 'popup_text_2', 'thumbs needing regen: {}'.format( HydrusData.ToHumanInt( num_thumb_refits ) ) )
-                        
-                    elif job_type == REGENERATE_FILE_DATA_JOB_DELETE_NEIGHBOUR_DUPES:
-                        
-                        self._DeleteNeighbourDupes( media_result )
-                        
-                    elif job_type == REGENERATE_FILE_DATA_JOB_CHECK_SIMILAR_FILES_MEMBERSHIP:
-                        
-                        additional_data = self._CheckSimilarFilesMembership( media_result )
-                        
-                    elif job_type == REGENERATE_FILE_DATA_JOB_SIMILAR_FILES_METADATA:
-                        
-                        additional_data = self._RegenSimilarFilesMetadata( media_result )
+                        continue
                         
-                    elif job_type == REGENERATE_FILE_DATA_JOB_FIX_PERMISSIONS:
+                    
+                    media_result = media_results[ num_started ]
+                    
+                    num_started += 1
+                    
+                    # charge the work up front, so a full set of workers cannot run past the throttle
+                    self._work_tracker.ReportRequestUsed( num_requests = regen_file_enum_to_job_weight_lookup[ job_type ] )
+                    
+                    if num_workers == 1:
                         
-                        self._FixFilePermissions( media_result )
+                        do_it( media_result )
                         
-                    elif job_type in ( REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_PRESENCE, REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_PRESENCE_URL, REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_DATA, REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_DATA_URL, REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_DATA_SILENT_DELETE ):
+                    else:
                         
-                        file_was_bad = self._CheckFileIntegrity( media_result, job_type )
+                        self._controller.CallToThread( do_it, media_result )
                         
-                        if file_was_bad:
-                            
-                            num_bad_files += 1
-                            
+                    
+                    continue
+                    
+                
+                if num_done == num_started:
+                    
+                    break
+                    
+                
+                try:
+                    
+                    ( hash, additional_data, file_was_flagged ) = results.get( timeout = 1.0 )
+                    
+                except queue.Empty:
+                    
+                    # a worker queued as we shut down may never run, so we cannot wait on it forever. on cancel we have stopped starting new files, but we still wait on what is running so its results are recorded
+                    
+                    if HG.model_shutdown:
                         
-                        job_key.SetVariable( 'popup_text_2', 'missing or invalid files: {}'.format( HydrusData.ToHumanInt( num_bad_files ) ) )
+                        break
                         
                     
-                except Exception as e:
+                    continue
                     
-                    HydrusData.PrintException( e )
+                
+                num_done += 1
+                
+                status_text = '{}: {}'.format( regen_file_enum_to_str_lookup[ job_type ], HydrusData.ConvertValueRangeToPrettyString( num_done, num_to_do ) )
+                
+                job_key.SetVariable( 'popup_text_1', status_text )
+                job_key.SetVariable( 'popup_gauge_1', ( num_done, num_to_do ) )
+                
+                if job_type == REGENERATE_FILE_DATA_JOB_REFIT_THUMBNAIL:
                     
-                    message = 'There was a problem performing maintenance task {} on file {}! The job will not be reattempted. A full traceback of this error should be written to the log.'.format( regen_file_enum_to_str_lookup[ job_type ], hash.hex() )
-                    message += os.linesep * 2
-                    message += str( e )
+                    if file_was_flagged:
+                        
+                        num_thumb_refits += 1
+                        
                     
-                    HydrusData.ShowText( message )
+                    job_key.SetVariable( 'popup_text_2', 'thumbs needing regen: {}'.format( HydrusData.ToHumanInt( num_thumb_refits ) ) )
                     
-                finally:
+                elif job_type in ( REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_PRESENCE, REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_PRESENCE_URL, REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_DATA, REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_DATA_URL, REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_DATA_SILENT_DELETE ):
                     
-                    self._work_tracker.ReportRequestUsed( num_requests = regen_file_enum_to_job_weight_lookup[ job_type ] )
+                    if file_was_flagged:
+                        
+                        num_bad_files += 1
+                        
                     
-                    cleared_jobs.append( ( hash, job_type, additional_data ) )
+                    job_key.SetVariable( 'popup_text_2', 'missing or invalid files: {}'.format( HydrusData.ToHumanInt( num_bad_files ) ) )
                     
                 
+                cleared_jobs.append( ( hash, job_type, additional_data ) )
+                
                 self._jobs_since_last_gc_collect += 1
                 
                 if self._jobs_since_last_gc_collect > 100:
@@ -1863,6 +1895,8 @@ class FilesMaintenanceManager( object ):
                     
                     cleared_jobs = []
                     
+                    self._controller.pub( 'notify_files_maintenance_done' )
+                    
                 
             
         finally:
@@ -1874,24 +1908,84 @@ class FilesMaintenanceManager( object ):
             
         
     
-    def CancelJobs( self, job_type ):
+    def _RunMediaResultJob( self, media_result, job_type ):
         
-        with self._lock:
+        hash = media_result.GetHash()
+        
+        additional_data = None
+        file_was_flagged = False
+        
+        try:
+            
+            if job_type == REGENERATE_FILE_DATA_JOB_FILE_METADATA:
+                
+                additional_data = self._RegenFileMetadata( media_result )
+                
+            elif job_type == REGENERATE_FILE_DATA_JOB_FILE_MODIFIED_TIMESTAMP:
+                
+                additional_data = self._RegenFileModifiedTimestamp( media_result )
+                
+            elif job_type == REGENERATE_FILE_DATA_JOB_OTHER_HASHES:
+                
+                additional_data = self._RegenFileOtherHashes( media_result )
+                
+            elif job_type == REGENERATE_FILE_DATA_JOB_FORCE_THUMBNAIL:
+                
+                self._RegenFileThumbnailForce( media_result )
+                
+            elif job_type == REGENERATE_FILE_DATA_JOB_REFIT_THUMBNAIL:
+                
+                file_was_flagged = self._RegenFileThumbnailRefit( media_result )
+                
+            elif job_type == REGENERATE_FILE_DATA_JOB_DELETE_NEIGHBOUR_DUPES:
+                
+                self._DeleteNeighbourDupes( media_result )
+                
+            elif job_type == REGENERATE_FILE_DATA_JOB_CHECK_SIMILAR_FILES_MEMBERSHIP:
+                
+                additional_data = self._CheckSimilarFilesMembership( media_result )
+                
+            elif job_type == REGENERATE_FILE_DATA_JOB_SIMILAR_FILES_METADATA:
+                
+                additional_data = self._RegenSimilarFilesMetadata( media_result )
+                
+            elif job_type == REGENERATE_FILE_DATA_JOB_FIX_PERMISSIONS:
+                
+                self._FixFilePermissions( media_result )
+                
+            elif job_type in ( REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_PRESENCE, REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_PRESENCE_URL, REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_DATA, REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_DATA_URL, REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_DATA_SILENT_DELETE ):
+                
+                file_was_flagged = self._CheckFileIntegrity( media_result, job_type )
+                
+            
+        except Exception as e:
             
-            self._controller.WriteSynchronous( 'file_maintenance_cancel_jobs', job_type )
+            HydrusData.PrintException( e )
             
-            self._reset_background_event.set()
+            message = 'There was a problem performing maintenance task {} on file {}! The job will not be reattempted. A full traceback of this error should be written to the log.'.format( regen_file_enum_to_str_lookup[ job_type ], hash.hex() )
+            message += os.linesep * 2
+            message += str( e )
             
+            HydrusData.ShowText( message )
+            
+        
+        return ( hash, additional_data, file_was_flagged )
+        
+    
+    def CancelJobs( self, job_type ):
+        
+        # the job queue lives in the db, so these need no lock, and they must not wait on a running batch
+        
+        self._controller.WriteSynchronous( 'file_maintenance_cancel_jobs', job_type )
+        
+        self._reset_background_event.set()
         
     
     def ClearJobs( self, hashes, job_type ):
         
-        with self._lock:
-            
-            self._ClearJobs( hashes, job_type )
-            
-            self._reset_background_event.set()
-            
+        self._ClearJobs( hashes, job_type )
+        
+        self._reset_background_event.set()
         
     
     def ForceMaintenance( self, mandated_job_types = None ):
@@ -1942,7 +2036,7 @@ class FilesMaintenanceManager( object ):
                     
                     self._ClearJobs( missing_hashes, job_type )
                     
-                    with self._lock:
+                    with self._job_lock:
                         
                         self._RunJob( media_results, job_type, job_key )
                         
@@ -2009,6 +2103,15 @@ class FilesMaintenanceManager( object ):
                 
             
         
+        def can_start_job():
+            
+            # we hold the job lock while a batch runs, so we stop the batch rather than wait in here for the rules to allow more work
+            
+            check_shutdown()
+            
+            return self._AbleToDoBackgroundMaintenance() and not should_reset()
+            
+        
         try:
             
             time_to_start = HydrusData.GetNow() + 15
@@ -2024,6 +2127,8 @@ class FilesMaintenanceManager( object ):
                 
                 check_shutdown()
                 
+                wait_on_maintenance()
+                
                 did_work = False
                 
                 with self._maintenance_lock:
@@ -2036,8 +2141,6 @@ class FilesMaintenanceManager( object ):
                         
                         job_key = ClientThreading.JobKey()
                         
-                        i = 0
-                        
                         try:
                             
                             ( hashes, job_type ) = job
@@ -2050,28 +2153,9 @@ class FilesMaintenanceManager( object ):
                             
                             self._ClearJobs( missing_hashes, job_type )
                             
-                            for media_result in media_results:
-                                
-                                wait_on_maintenance()
+                            with self._job_lock:
                                 
-                                if should_reset():
-                                    
-                                    break
-                                    
-                                
-                                with self._lock:
-                                    
-                                    self._RunJob( ( media_result, ), job_type, job_key )
-                                    
-                                
-                                time.sleep( 0.0001 )
-                                
-                                i += 1
-                                
-                                if i % 100 == 0:
-                                    
-                                    self._controller.pub( 'notify_files_maintenance_done' )
-                                    
+                                self._RunJob( media_results, job_type, job_key, can_start_callable = can_start_job )
                                 
                             
                         finally:
@@ -2116,9 +2200,11 @@ class FilesMaintenanceManager( object ):
             self._controller.pub( 'message', job_key )
             
         
+        # the reset stops any background batch at its next file, so we only wait on what it has in flight
+        
         self._reset_background_event.set()
         
-        with self._lock:
+        with self._job_lock:
             
             try:
                 
@@ -2141,22 +2227,16 @@ class FilesMaintenanceManager( object ):
     
     def ScheduleJob( self, hashes, job_type, time_can_start = 0 ):
         
-        with self._lock:
-            
-            self._controller.Write( 'file_maintenance_add_jobs_hashes', hashes, job_type, time_can_start )
-            
-            self._wake_background_event.set()
-            
+        self._controller.Write( 'file_maintenance_add_jobs_hashes', hashes, job_type, time_can_start )
+        
+        self._wake_background_event.set()
         
     
     def ScheduleJobHashIds( self, hash_ids, job_type, time_can_start = 0 ):
         
-        with self._lock:
-            
-            self._controller.Write( 'file_maintenance_add_jobs', hash_ids, job_type, time_can_start )
-            
-            self._wake_background_event.set()
-            
+        self._controller.Write( 'file_maintenance_add_jobs', hash_ids, job_type, time_can_start )
+        
+        self._wake_background_event.set()
         
     
     def Shutdown( self ):
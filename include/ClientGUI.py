@@ -893,7 +893,15 @@ class FrameGUI( ClientGUITopLevelWindows.MainFrameThatResizes ):
         
         text = action + ' backup at "' + path + '"?'
         text += os.linesep * 2
-        text += 'The database will be locked while the backup occurs, which may lock up your gui as well.'
+        
+        if HG.no_wal or HG.db_memory_journaling:
+            
+            text += 'The database will be locked while the backup occurs, which may lock up your gui as well.'
+            
+        else:
+            
+            text += 'The backup will run in the background, and you can keep using the client while it works. Only the database files that have changed since the last backup will be copied.'
+            
         
         result = ClientGUIDialogsQuick.GetYesNo( self, text )
         
@@ -2920,6 +2928,38 @@ class FrameGUI( ClientGUITopLevelWindows.MainFrameThatResizes ):
             
         
     
+    def _RegenerateSubtagTrigrams( self ):
+        
+        message = 'This will delete and then recreate the index that speeds up complex wildcard tag searches like \'*gun*\'. This is useful if those searches have started missing tags.'
+        message += os.linesep * 2
+        message += 'If you have a lot of tags, it can take a long time, during which the gui may hang.'
+        message += os.linesep * 2
+        message += 'If you do not have a specific reason to run this, it is pointless.'
+        
+        result = ClientGUIDialogsQuick.GetYesNo( self, message, yes_label = 'do it', no_label = 'forget it' )
+        
+        if result == QW.QDialog.Accepted:
+            
+            self._controller.Write( 'regenerate_subtag_trigrams' )
+            
+        
+    
+    def _RegenerateTagDisplayCache( self ):
+        
+        message = 'This will delete and then recreate the cache of sibling-collapsed tags that thumbnails and the media viewer show. This is useful if tags are showing without their siblings applied.'
+        message += os.linesep * 2
+        message += 'If you have a lot of tags, it can take a long time, during which the gui may hang.'
+        message += os.linesep * 2
+        message += 'If you do not have a specific reason to run this, it is pointless.'
+        
+        result = ClientGUIDialogsQuick.GetYesNo( self, message, yes_label = 'do it', no_label = 'forget it' )
+        
+        if result == QW.QDialog.Accepted:
+            
+            self._controller.Write( 'regenerate_tag_display_cache' )
+            
+        
+    
     def _RestoreSplitterPositions( self ):
         
         self._controller.pub( 'set_splitter_positions', HC.options[ 'hpos' ], HC.options[ 'vpos' ] )
@@ -2934,6 +2974,24 @@ class FrameGUI( ClientGUITopLevelWindows.MainFrameThatResizes ):
         frame.SetPanel( panel )
         
     
+    def _ReviewCacheStatistics( self ):
+        
+        frame = ClientGUITopLevelWindows.FrameThatTakesScrollablePanel( self, 'review cache statistics' )
+        
+        panel = ClientGUIScrolledPanelsReview.ReviewCacheStatistics( frame, self._controller )
+        
+        frame.SetPanel( panel )
+        
+    
+    def _ReviewDBJobStatistics( self ):
+        
+        frame = ClientGUITopLevelWindows.FrameThatTakesScrollablePanel( self, 'review db job statistics' )
+        
+        panel = ClientGUIScrolledPanelsReview.ReviewDBJobStatistics( frame, self._controller )
+        
+        frame.SetPanel( panel )
+        
+    
     def _ReviewFileMaintenance( self ):
         
         frame = ClientGUITopLevelWindows.FrameThatTakesScrollablePanel( self, 'file maintenance' )
@@ -4115,6 +4173,8 @@ The password is cleartext here but obscured in the entry dialog. Enter a blank p
             
             ClientGUIMenus.AppendMenuItem( submenu, 'autocomplete cache', 'Delete and recreate the tag autocomplete cache, fixing any miscounts.', self._RegenerateACCache )
             ClientGUIMenus.AppendMenuItem( submenu, 'similar files search tree', 'Delete and recreate the similar files search tree.', self._RegenerateSimilarFilesTree )
+            ClientGUIMenus.AppendMenuItem( submenu, 'tag display cache', 'Delete and recreate the cache of sibling-collapsed tags.', self._RegenerateTagDisplayCache )
+            ClientGUIMenus.AppendMenuItem( submenu, 'wildcard tag search index', 'Delete and recreate the index that speeds up complex wildcard tag searches like \'*gun*\'.', self._RegenerateSubtagTrigrams )
             
             ClientGUIMenus.AppendMenu( menu, submenu, 'regenerate' )
             
@@ -4474,6 +4534,8 @@ The password is cleartext here but obscured in the entry dialog. Enter a blank p
             ClientGUIMenus.AppendMenuItem( data_actions, 'run fast memory maintenance', 'Tell all the fast caches to maintain themselves.', self._controller.MaintainMemoryFast )
             ClientGUIMenus.AppendMenuItem( data_actions, 'run slow memory maintenance', 'Tell all the slow caches to maintain themselves.', self._controller.MaintainMemorySlow )
             ClientGUIMenus.AppendMenuItem( data_actions, 'review threads', 'Show current threads and what they are doing.', self._ReviewThreads )
+            ClientGUIMenus.AppendMenuItem( data_actions, 'review cache statistics', 'Show how full the thumbnail, image and parsing caches are, and how often they hit.', self._ReviewCacheStatistics )
+            ClientGUIMenus.AppendMenuItem( data_actions, 'review db job statistics', 'Show how long each kind of database job has been taking, and the slowest recent jobs.', self._ReviewDBJobStatistics )
             ClientGUIMenus.AppendMenuItem( data_actions, 'show scheduled jobs', 'Print some information about the currently scheduled jobs log.', self._DebugShowScheduledJobs )
             ClientGUIMenus.AppendMenuItem( data_actions, 'subscription manager snapshot', 'Have the subscription system show what it is doing.', self._controller.subscriptions_manager.ShowSnapshot )
             ClientGUIMenus.AppendMenuItem( data_actions, 'flush log', 'Command the log to write any buffered contents to hard drive.', HydrusData.DebugPrint, 'Flushing log' )
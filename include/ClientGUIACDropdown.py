@@ -239,7 +239,7 @@ def ReadFetch( win, job_key, results_callable, parsed_search_text, qt_media_call
                 
                 if small_exact_match_search:
                     
-                    predicates = HG.client_controller.Read( 'autocomplete_predicates', file_service_key = file_service_key, tag_service_key = tag_service_key, search_text = cache_text, exact_match = True, inclusive = inclusive, include_current = include_current, include_pending = include_pending, add_namespaceless = add_namespaceless, job_key = job_key, collapse_siblings = True )
+                    predicates = HG.client_controller.ReadSnapshot( 'autocomplete_predicates', file_service_key = file_service_key, tag_service_key = tag_service_key, search_text = cache_text, exact_match = True, inclusive = inclusive, include_current = include_current, include_pending = include_pending, add_namespaceless = add_namespaceless, job_key = job_key, collapse_siblings = True )
                     
                 else:
                     
@@ -249,7 +249,7 @@ def ReadFetch( win, job_key, results_callable, parsed_search_text, qt_media_call
                         
                         new_search_text_for_current_cache = cache_text
                         
-                        cached_results = HG.client_controller.Read( 'autocomplete_predicates', file_service_key = file_service_key, tag_service_key = tag_service_key, search_text = search_text, inclusive = inclusive, include_current = include_current, include_pending = include_pending, add_namespaceless = add_namespaceless, job_key = job_key, collapse_siblings = True )
+                        cached_results = HG.client_controller.ReadSnapshot( 'autocomplete_predicates', file_service_key = file_service_key, tag_service_key = tag_service_key, search_text = search_text, inclusive = inclusive, include_current = include_current, include_pending = include_pending, add_namespaceless = add_namespaceless, job_key = job_key, collapse_siblings = True )
                         
                     
                     predicates = cached_results
@@ -431,7 +431,7 @@ def WriteFetch( win, job_key, results_callable, parsed_search_text, file_service
             
             if small_exact_match_search:
                 
-                predicates = HG.client_controller.Read( 'autocomplete_predicates', file_service_key = file_service_key, tag_service_key = tag_service_key, search_text = cache_text, exact_match = True, add_namespaceless = False, job_key = job_key, collapse_siblings = False )
+                predicates = HG.client_controller.ReadSnapshot( 'autocomplete_predicates', file_service_key = file_service_key, tag_service_key = tag_service_key, search_text = cache_text, exact_match = True, add_namespaceless = False, job_key = job_key, collapse_siblings = False )
                 
             else:
                 
@@ -441,7 +441,7 @@ def WriteFetch( win, job_key, results_callable, parsed_search_text, file_service
                     
                     search_text_for_current_cache = cache_text
                     
-                    cached_results = HG.client_controller.Read( 'autocomplete_predicates', file_service_key = file_service_key, tag_service_key = tag_service_key, search_text = search_text, add_namespaceless = False, job_key = job_key, collapse_siblings = False )
+                    cached_results = HG.client_controller.ReadSnapshot( 'autocomplete_predicates', file_service_key = file_service_key, tag_service_key = tag_service_key, search_text = search_text, add_namespaceless = False, job_key = job_key, collapse_siblings = False )
                     
                 
                 predicates = cached_results
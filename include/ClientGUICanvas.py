@@ -6037,6 +6037,8 @@ class OpenExternallyPanel( QW.QWidget ):
     
 class StaticImage( QW.QWidget ):
     
+    TILE_SIZE = 512
+    
     def __init__( self, parent, canvas_type ):
         
         QW.QWidget.__init__( self, parent )
@@ -6049,14 +6051,10 @@ class StaticImage( QW.QWidget ):
         
         self._media = None
         
-        self._first_background_drawn = False
-        
         self._image_renderer = None
         
         self._is_rendered = False
         
-        self._canvas_qt_pixmap = None
-        
         if self._canvas_type == ClientGUICommon.CANVAS_MEDIA_VIEWER:
             
             shortcut_set = 'media_viewer_media_window'
@@ -6069,71 +6067,65 @@ class StaticImage( QW.QWidget ):
         self._my_shortcut_handler = ClientGUIShortcuts.ShortcutsHandler( self, [ shortcut_set ], catch_mouse = True )
         
     
-    def _ClearCanvasBitmap( self ):
+    def _DrawBackground( self, painter ):
         
-        self._canvas_qt_pixmap = None
+        new_options = HG.client_controller.new_options
         
-        self._is_rendered = False
+        painter.setBackground( QG.QBrush( new_options.GetColour( CC.COLOUR_MEDIA_BACKGROUND ) ) )
         
-        self._first_background_drawn = False
+        painter.eraseRect( painter.viewport() )
         
     
-    def _DrawBackground( self, painter ):
+    def _DrawTiles( self, painter, rect ):
         
-        new_options = HG.client_controller.new_options
+        # we are often much bigger than the screen when zoomed in, so we only render the tiles that are actually being painted
         
-        painter.setBackground( QG.QBrush( new_options.GetColour( CC.COLOUR_MEDIA_BACKGROUND ) ) )
+        image_cache = HG.client_controller.GetCache( 'images' )
         
-        painter.eraseRect( painter.viewport() )
+        target_resolution = self.size()
         
-        self._first_background_drawn = True
+        my_rect = self.rect()
         
-    
-    def _TryToDrawCanvasBitmap( self ):
+        left_tile_x = max( rect.left(), 0 ) // self.TILE_SIZE
+        right_tile_x = min( rect.right(), my_rect.right() ) // self.TILE_SIZE
+        top_tile_y = max( rect.top(), 0 ) // self.TILE_SIZE
+        bottom_tile_y = min( rect.bottom(), my_rect.bottom() ) // self.TILE_SIZE
         
-        if self._image_renderer is not None and self._image_renderer.IsReady():
-            
-            my_size = self.size()
-            
-            width = my_size.width()
-            height = my_size.height()
+        for tile_y in range( top_tile_y, bottom_tile_y + 1 ):
             
-            self._canvas_qt_pixmap = HG.client_controller.bitmap_manager.GetQtPixmap( width, height )
-            
-            painter = QG.QPainter( self._canvas_qt_pixmap )
-            
-            self._DrawBackground( painter )
-            
-            qt_bitmap = self._image_renderer.GetQtImage( self.size() )
-            
-            painter.drawImage( 0, 0, qt_bitmap )
-            
-            self._is_rendered = True
+            for tile_x in range( left_tile_x, right_tile_x + 1 ):
+                
+                tile_rect = QC.QRect( tile_x * self.TILE_SIZE, tile_y * self.TILE_SIZE, self.TILE_SIZE, self.TILE_SIZE ).intersected( my_rect )
+                
+                if tile_rect.isEmpty():
+                    
+                    continue
+                    
+                
+                image_tile = image_cache.GetImageTile( self._image_renderer, target_resolution, tile_rect )
+                
+                painter.drawImage( tile_rect.topLeft(), image_tile.GetQtImage() )
+                
             
         
     
-    def paintEvent( self, event ):           
-        
-        if self._canvas_qt_pixmap is None:
-            
-            self._TryToDrawCanvasBitmap()
-            
+    def paintEvent( self, event ):
         
         painter = QG.QPainter( self )
         
-        if self._canvas_qt_pixmap is None:
+        self._DrawBackground( painter )
+        
+        if self._image_renderer is not None and self._image_renderer.IsReady():
             
-            self._DrawBackground( painter )
+            self._DrawTiles( painter, event.rect() )
             
-        else:
-            
-            painter.drawPixmap( 0, 0, self._canvas_qt_pixmap )
+            self._is_rendered = True
             
         
     
     def resizeEvent( self, event ):
         
-        self._ClearCanvasBitmap()
+        self._is_rendered = False
         
     
     def IsRendered( self ):
@@ -6188,7 +6180,7 @@ class StaticImage( QW.QWidget ):
         
         self._image_renderer = image_cache.GetImageRenderer( self._media )
         
-        self._ClearCanvasBitmap()
+        self._is_rendered = False
         
         if not self._image_renderer.IsReady():
             
@@ -6203,7 +6195,7 @@ class StaticImage( QW.QWidget ):
         self._media = None
         self._image_renderer = None
         
-        self._ClearCanvasBitmap()
+        self._is_rendered = False
         
         self.update()
         
@@ -842,6 +842,10 @@ class ManagementPanelDuplicateFilter( ManagementPanel ):
         
         menu_items.append( ( 'check', 'search for duplicate pairs at the current distance during normal db maintenance', 'Tell the client to find duplicate pairs in its normal db maintenance cycles, whether you have that set to idle or shutdown time.', check_manager ) )
         
+        check_manager = ClientGUICommon.CheckboxManagerOptions( 'use_in_memory_similar_files_index' )
+        
+        menu_items.append( ( 'check', 'keep all perceptual hashes in memory for faster searching', 'Tell the client to load every perceptual hash into memory and search them in big batches. This is usually much faster than walking the search tree, but it costs about 16 bytes of memory per perceptual hash.', check_manager ) )
+        
         self._cog_button = ClientGUICommon.MenuBitmapButton( self._main_left_panel, CC.GlobalPixmaps.cog, menu_items )
         
         menu_items = []
@@ -4475,6 +4479,14 @@ class ManagementPanelQuery( ManagementPanel ):
             
         
     
+    def AddQueryResults( self, query_job_key, media_results ):
+        
+        if query_job_key == self._query_job_key:
+            
+            self._page.GetMediaPanel().AddMediaResults( self._page_key, media_results )
+            
+        
+    
     def ChangeFileServicePubsub( self, page_key, service_key ):
         
         if page_key == self._page_key:
@@ -4507,6 +4519,25 @@ class ManagementPanelQuery( ManagementPanel ):
         self._query_job_key.Cancel()
         
     
+    def FinishQuery( self, query_job_key ):
+        
+        if query_job_key == self._query_job_key:
+            
+            # chunks after the first were just appended, so we now collect and sort the whole lot
+            
+            panel = self._page.GetMediaPanel()
+            
+            media_collect = self._media_collect.GetValue()
+            
+            if media_collect.DoesACollect():
+                
+                panel.Collect( self._page_key, media_collect )
+                
+            
+            panel.Sort( self._page_key, self._media_sort.GetSort() )
+            
+        
+    
     def GetPredicates( self ):
         
         if self._search_enabled:
@@ -4545,7 +4576,7 @@ class ManagementPanelQuery( ManagementPanel ):
             
         
     
-    def ShowFinishedQuery( self, query_job_key, media_results ):
+    def ShowQueryResults( self, query_job_key, media_results ):
         
         if query_job_key == self._query_job_key:
             
@@ -4575,7 +4606,27 @@ class ManagementPanelQuery( ManagementPanel ):
     
     def THREADDoQuery( self, controller, page_key, query_job_key, search_context, sort_by ):
         
-        def qt_code():
+        def qt_show( media_results ):
+            
+            if not self or not QP.isValid( self ):
+                
+                return
+                
+            
+            self.ShowQueryResults( query_job_key, media_results )
+            
+        
+        def qt_add( media_results ):
+            
+            if not self or not QP.isValid( self ):
+                
+                return
+                
+            
+            self.AddQueryResults( query_job_key, media_results )
+            
+        
+        def qt_finish():
             
             query_job_key.Finish()
             
@@ -4584,23 +4635,30 @@ class ManagementPanelQuery( ManagementPanel ):
                 return
                 
             
-            self.ShowFinishedQuery( query_job_key, media_results )
+            self.FinishQuery( query_job_key )
             
         
         QUERY_CHUNK_SIZE = 256
         
         HG.client_controller.file_viewing_stats_manager.Flush()
         
-        query_hash_ids = controller.Read( 'file_query_ids', search_context, job_key = query_job_key, limit_sort_by = sort_by )
+        # the db sorts when it can, so the first chunks we show are the top of the page
+        
+        query_hash_ids = controller.Read( 'file_query_ids', search_context, job_key = query_job_key, sort_by = sort_by )
         
         if query_job_key.IsCancelled():
             
             return
             
         
-        media_results = []
+        if len( query_hash_ids ) == 0:
+            
+            QP.CallAfter( qt_show, [] )
+            
+        
+        # the first chunk goes up straight away, the rest stream in behind it
         
-        for sub_query_hash_ids in HydrusData.SplitListIntoChunks( query_hash_ids, QUERY_CHUNK_SIZE ):
+        for ( i, sub_query_hash_ids ) in enumerate( HydrusData.SplitListIntoChunks( query_hash_ids, QUERY_CHUNK_SIZE ) ):
             
             if query_job_key.IsCancelled():
                 
@@ -4609,16 +4667,21 @@ class ManagementPanelQuery( ManagementPanel ):
             
             more_media_results = controller.Read( 'media_results_from_ids', sub_query_hash_ids )
             
-            media_results.extend( more_media_results )
-            
-            controller.pub( 'set_num_query_results', page_key, len( media_results ), len( query_hash_ids ) )
+            if i == 0:
+                
+                QP.CallAfter( qt_show, more_media_results )
+                
+            else:
+                
+                QP.CallAfter( qt_add, more_media_results )
+                
             
             controller.WaitUntilViewFree()
             
         
         search_context.SetComplete()
         
-        QP.CallAfter( qt_code )
+        QP.CallAfter( qt_finish )
         
     
     def REPEATINGPageUpdate( self ):
@@ -2838,6 +2838,8 @@ class GUISession( HydrusSerialisable.SerialisableBaseNamed ):
     SERIALISABLE_NAME = 'GUI Session'
     SERIALISABLE_VERSION = 4
     
+    SERIALISABLE_BINARY_DUMP = True
+    
     def __init__( self, name ):
         
         HydrusSerialisable.SerialisableBaseNamed.__init__( self, name )
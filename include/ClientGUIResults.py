@@ -2139,29 +2139,12 @@ class MediaPanelLoading( MediaPanel ):
     
     def __init__( self, parent, page_key, file_service_key ):
         
-        self._current = None
-        self._max = None
-        
         MediaPanel.__init__( self, parent, page_key, file_service_key, [] )
         
-        HG.client_controller.sub( self, 'SetNumQueryResults', 'set_num_query_results' )
-        
     
     def _GetPrettyStatus( self ):
         
-        s = 'Loading\u2026'
-        
-        if self._current is not None:
-            
-            s += ' ' + HydrusData.ToHumanInt( self._current )
-            
-            if self._max is not None:
-                
-                s += ' of ' + HydrusData.ToHumanInt( self._max )
-                
-            
-        
-        return s
+        return 'Loading\u2026'
         
     
     def GetSortedMedia( self ):
@@ -2169,18 +2152,6 @@ class MediaPanelLoading( MediaPanel ):
         return []
         
     
-    def SetNumQueryResults( self, page_key, num_current, num_max ):
-        
-        if page_key == self._page_key:
-            
-            self._current = num_current
-            
-            self._max = num_max
-            
-            self._PublishSelectionChange()
-            
-        
-    
 class MediaPanelThumbnails( MediaPanel ):
     
     def __init__( self, parent, page_key, file_service_key, media_results ):
@@ -3071,6 +3071,9 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             self._file_maintenance_idle_throttle_velocity.setToolTip( tt )
             self._file_maintenance_active_throttle_velocity.setToolTip( tt )
             
+            self._file_maintenance_workers = QP.MakeQSpinBox( self._file_maintenance_panel, min = 1, max = 64 )
+            self._file_maintenance_workers.setToolTip( 'How many files heavy jobs like thumbnail, metadata and similar files regeneration work on at once. If you have lots of CPU cores, more threads get through big jobs faster. The throttles above still apply.' )
+            
             #
             
             self._maintenance_vacuum_period_days = ClientGUICommon.NoneableSpinCtrl( self._vacuum_panel, '', min = 28, max = 1000, none_phrase = 'do not automatically vacuum' )
@@ -3108,6 +3111,8 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             
             self._file_maintenance_active_throttle_velocity.SetValue( file_maintenance_active_throttle_velocity )
             
+            self._file_maintenance_workers.setValue( self._new_options.GetInteger( 'file_maintenance_workers' ) )
+            
             self._maintenance_vacuum_period_days.SetValue( self._new_options.GetNoneableInteger( 'maintenance_vacuum_period_days' ) )
             
             #
@@ -3170,6 +3175,7 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             rows.append( ( 'Idle throttle: ', self._file_maintenance_idle_throttle_velocity ) )
             rows.append( ( 'Run file maintenance during normal time: ', self._file_maintenance_during_active ) )
             rows.append( ( 'Normal throttle: ', self._file_maintenance_active_throttle_velocity ) )
+            rows.append( ( 'Files to work on at once: ', self._file_maintenance_workers ) )
             
             gridbox = ClientGUICommon.WrapInGrid( self._file_maintenance_panel, rows )
             
@@ -3261,6 +3267,8 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             self._new_options.SetInteger( 'file_maintenance_active_throttle_files', file_maintenance_active_throttle_files )
             self._new_options.SetInteger( 'file_maintenance_active_throttle_time_delta', file_maintenance_active_throttle_time_delta )
             
+            self._new_options.SetInteger( 'file_maintenance_workers', self._file_maintenance_workers.value() )
+            
             self._new_options.SetNoneableInteger( 'maintenance_vacuum_period_days', self._maintenance_vacuum_period_days.GetValue() )
             
         
@@ -3795,6 +3803,12 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             self._image_cache_timeout = ClientGUITime.TimeDeltaButton( media_panel, min = 300, days = True, hours = True, minutes = True )
             self._image_cache_timeout.setToolTip( 'The amount of time after which a rendered image in the cache will naturally be removed, if it is not shunted out due to a new member exceeding the size limit. Requires restart to kick in.' )
             
+            self._thumbnail_waterfall_workers = QP.MakeQSpinBox( media_panel, min = 1, max = 64 )
+            self._thumbnail_waterfall_workers.setToolTip( 'How many threads load thumbnails for new pages at once. If you have lots of CPU cores, more threads fill pages in faster. Requires restart to kick in.' )
+            
+            self._keep_decoded_thumbnail_store = QW.QCheckBox( media_panel )
+            self._keep_decoded_thumbnail_store.setToolTip( 'If on, thumbnails are saved to a file in your db directory after they are first decoded, so they can go straight to screen the next time you see them. This makes big pages much faster to scroll through, particularly on slow drives, but the file can grow to several times the size of your thumbnail folder. Requires restart to kick in.' )
+            
             #
             
             buffer_panel = ClientGUICommon.StaticBox( self, 'video buffer' )
@@ -3843,6 +3857,9 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             self._thumbnail_cache_timeout.SetValue( self._new_options.GetInteger( 'thumbnail_cache_timeout' ) )
             self._image_cache_timeout.SetValue( self._new_options.GetInteger( 'image_cache_timeout' ) )
             
+            self._thumbnail_waterfall_workers.setValue( self._new_options.GetInteger( 'thumbnail_waterfall_workers' ) )
+            self._keep_decoded_thumbnail_store.setChecked( self._new_options.GetBoolean( 'keep_decoded_thumbnail_store' ) )
+            
             self._video_buffer_size_mb.setValue( self._new_options.GetInteger( 'video_buffer_size_mb' ) )
             
             self._autocomplete_results_fetch_automatically.setChecked( self._new_options.GetBoolean( 'autocomplete_results_fetch_automatically' ) )
@@ -3890,6 +3907,8 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             rows.append( ( 'MB memory reserved for image cache: ', fullscreens_sizer ) )
             rows.append( ( 'Thumbnail cache timeout: ', self._thumbnail_cache_timeout ) )
             rows.append( ( 'Image cache timeout: ', self._image_cache_timeout ) )
+            rows.append( ( 'Thumbnail loading threads: ', self._thumbnail_waterfall_workers ) )
+            rows.append( ( 'Keep a disk store of decoded thumbnails: ', self._keep_decoded_thumbnail_store ) )
             
             gridbox = ClientGUICommon.WrapInGrid( media_panel, rows )
             
@@ -4030,6 +4049,9 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             self._new_options.SetInteger( 'thumbnail_cache_timeout', self._thumbnail_cache_timeout.GetValue() )
             self._new_options.SetInteger( 'image_cache_timeout', self._image_cache_timeout.GetValue() )
             
+            self._new_options.SetInteger( 'thumbnail_waterfall_workers', self._thumbnail_waterfall_workers.value() )
+            self._new_options.SetBoolean( 'keep_decoded_thumbnail_store', self._keep_decoded_thumbnail_store.isChecked() )
+            
             self._new_options.SetInteger( 'video_buffer_size_mb', self._video_buffer_size_mb.value() )
             
             self._new_options.SetNoneableInteger( 'forced_search_limit', self._forced_search_limit.GetValue() )
@@ -1949,6 +1949,231 @@ class ReviewAllBandwidthPanel( ClientGUIScrolledPanels.ReviewPanel ):
             
         
     
+class ReviewCacheStatistics( ClientGUIScrolledPanels.ReviewPanel ):
+    
+    def __init__( self, parent, controller ):
+        
+        self._controller = controller
+        
+        ClientGUIScrolledPanels.ReviewPanel.__init__( self, parent )
+        
+        self._budget_st = ClientGUICommon.BetterStaticText( self )
+        
+        self._caches_list_ctrl_panel = ClientGUIListCtrl.BetterListCtrlPanel( self )
+        
+        columns = [ ( 'cache', -1 ), ( 'items', 10 ), ( 'memory', 12 ), ( 'hits', 12 ), ( 'misses', 12 ), ( 'hit rate', 10 ), ( 'evictions', 12 ) ]
+        
+        self._caches_list_ctrl = ClientGUIListCtrl.BetterListCtrl( self._caches_list_ctrl_panel, 'cache statistics', 6, 20, columns, self._ConvertCacheRowToListCtrlTuples )
+        
+        self._caches_list_ctrl_panel.SetListCtrl( self._caches_list_ctrl )
+        
+        self._caches_list_ctrl_panel.AddButton( 'refresh', self._Refresh )
+        
+        #
+        
+        self._caches_list_ctrl.Sort( 0 )
+        
+        self._Refresh()
+        
+        #
+        
+        vbox = QP.VBoxLayout()
+        
+        QP.AddToLayout( vbox, self._budget_st, CC.FLAGS_EXPAND_PERPENDICULAR )
+        QP.AddToLayout( vbox, self._caches_list_ctrl_panel, CC.FLAGS_EXPAND_BOTH_WAYS )
+        
+        self.widget().setLayout( vbox )
+        
+    
+    def _ConvertCacheRowToListCtrlTuples( self, cache_row ):
+        
+        ( name, num_items, memory_footprint, num_hits, num_misses, num_evictions ) = cache_row
+        
+        num_lookups = num_hits + num_misses
+        
+        if num_lookups == 0:
+            
+            hit_rate = 0.0
+            pretty_hit_rate = ''
+            
+        else:
+            
+            hit_rate = num_hits / num_lookups
+            pretty_hit_rate = HydrusData.ConvertFloatToPercentage( hit_rate )
+            
+        
+        pretty_num_items = HydrusData.ToHumanInt( num_items )
+        pretty_memory_footprint = HydrusData.ToHumanBytes( memory_footprint )
+        pretty_num_hits = HydrusData.ToHumanInt( num_hits )
+        pretty_num_misses = HydrusData.ToHumanInt( num_misses )
+        pretty_num_evictions = HydrusData.ToHumanInt( num_evictions )
+        
+        display_tuple = ( name, pretty_num_items, pretty_memory_footprint, pretty_num_hits, pretty_num_misses, pretty_hit_rate, pretty_num_evictions )
+        sort_tuple = ( name, num_items, memory_footprint, num_hits, num_misses, hit_rate, num_evictions )
+        
+        return ( display_tuple, sort_tuple )
+        
+    
+    def _Refresh( self ):
+        
+        cache_memory_budget = self._controller.cache_memory_budget
+        
+        cache_rows = []
+        total_memory_footprint = 0
+        
+        for data_cache in cache_memory_budget.GetDataCaches():
+            
+            ( num_items, memory_footprint, num_hits, num_misses, num_evictions ) = data_cache.GetStats()
+            
+            total_memory_footprint += memory_footprint
+            
+            cache_rows.append( ( data_cache.GetName(), num_items, memory_footprint, num_hits, num_misses, num_evictions ) )
+            
+        
+        self._budget_st.setText( 'Using ' + HydrusData.ToHumanBytes( total_memory_footprint ) + ' of a shared ' + HydrusData.ToHumanBytes( cache_memory_budget.GetSize() ) + ' budget.' )
+        
+        self._caches_list_ctrl.SetData( cache_rows )
+        
+    
+class ReviewDBJobStatistics( ClientGUIScrolledPanels.ReviewPanel ):
+    
+    def __init__( self, parent, controller ):
+        
+        self._controller = controller
+        
+        ClientGUIScrolledPanels.ReviewPanel.__init__( self, parent )
+        
+        self._since_st = ClientGUICommon.BetterStaticText( self )
+        
+        actions_panel = ClientGUICommon.StaticBox( self, 'jobs' )
+        
+        self._actions_list_ctrl_panel = ClientGUIListCtrl.BetterListCtrlPanel( actions_panel )
+        
+        columns = [ ( 'action', -1 ), ( 'type', 10 ), ( 'count', 10 ), ( 'rows', 12 ), ( 'p50', 18 ), ( 'p95', 18 ), ( 'p99', 18 ), ( 'max', 18 ), ( 'mean queue wait', 18 ), ( 'p95 queue wait', 18 ) ]
+        
+        self._actions_list_ctrl = ClientGUIListCtrl.BetterListCtrl( self._actions_list_ctrl_panel, 'db job statistics', 20, 30, columns, self._ConvertActionRowToListCtrlTuples )
+        
+        self._actions_list_ctrl_panel.SetListCtrl( self._actions_list_ctrl )
+        
+        self._actions_list_ctrl_panel.AddButton( 'refresh', self._Refresh )
+        self._actions_list_ctrl_panel.AddButton( 'reset', self._Reset )
+        
+        slow_jobs_panel = ClientGUICommon.StaticBox( self, 'slow jobs' )
+        
+        columns = [ ( 'time', 22 ), ( 'action', 24 ), ( 'execution', 18 ), ( 'queue wait', 18 ), ( 'rows', 12 ), ( 'slowest statement time', 22 ), ( 'slowest statement', -1 ) ]
+        
+        self._slow_jobs_list_ctrl = ClientGUIListCtrl.BetterListCtrl( slow_jobs_panel, 'db slow jobs', 8, 30, columns, self._ConvertSlowJobRowToListCtrlTuples, activation_callback = self._CopySlowJobs )
+        
+        #
+        
+        self._actions_list_ctrl.Sort( 7, asc = False )
+        self._slow_jobs_list_ctrl.Sort( 0, asc = False )
+        
+        self._Refresh()
+        
+        #
+        
+        actions_panel.Add( self._actions_list_ctrl_panel, CC.FLAGS_EXPAND_BOTH_WAYS )
+        
+        slow_jobs_panel.Add( ClientGUICommon.BetterStaticText( slow_jobs_panel, 'Jobs that take more than a second are logged here. Double-click to copy them to the clipboard.' ), CC.FLAGS_EXPAND_PERPENDICULAR )
+        slow_jobs_panel.Add( self._slow_jobs_list_ctrl, CC.FLAGS_EXPAND_BOTH_WAYS )
+        
+        vbox = QP.VBoxLayout()
+        
+        QP.AddToLayout( vbox, self._since_st, CC.FLAGS_EXPAND_PERPENDICULAR )
+        QP.AddToLayout( vbox, actions_panel, CC.FLAGS_EXPAND_BOTH_WAYS )
+        QP.AddToLayout( vbox, slow_jobs_panel, CC.FLAGS_EXPAND_BOTH_WAYS )
+        
+        self.widget().setLayout( vbox )
+        
+    
+    def _ConvertActionRowToListCtrlTuples( self, action_row ):
+        
+        ( action, job_type, count, rows, p50, p95, p99, max_time, mean_queue, p95_queue ) = action_row
+        
+        pretty_count = HydrusData.ToHumanInt( count )
+        pretty_rows = HydrusData.ToHumanInt( rows )
+        ( pretty_p50, pretty_p95, pretty_p99, pretty_max_time, pretty_mean_queue, pretty_p95_queue ) = [ HydrusData.TimeDeltaToPrettyTimeDelta( t ) for t in ( p50, p95, p99, max_time, mean_queue, p95_queue ) ]
+        
+        display_tuple = ( action, job_type, pretty_count, pretty_rows, pretty_p50, pretty_p95, pretty_p99, pretty_max_time, pretty_mean_queue, pretty_p95_queue )
+        sort_tuple = action_row
+        
+        return ( display_tuple, sort_tuple )
+        
+    
+    def _ConvertSlowJobRowToListCtrlTuples( self, slow_job_row ):
+        
+        ( i, timestamp, action, execution_time, queue_time, rows, slowest_statement, slowest_statement_time ) = slow_job_row
+        
+        pretty_timestamp = HydrusData.ConvertTimestampToPrettyTime( timestamp )
+        pretty_execution_time = HydrusData.TimeDeltaToPrettyTimeDelta( execution_time )
+        pretty_queue_time = HydrusData.TimeDeltaToPrettyTimeDelta( queue_time )
+        pretty_rows = HydrusData.ToHumanInt( rows )
+        
+        if slowest_statement is None:
+            
+            pretty_slowest_statement = 'not traced--this action will be next time if it is slow again'
+            pretty_slowest_statement_time = ''
+            
+            slowest_statement = ''
+            slowest_statement_time = 0.0
+            
+        else:
+            
+            pretty_slowest_statement = slowest_statement
+            pretty_slowest_statement_time = HydrusData.TimeDeltaToPrettyTimeDelta( slowest_statement_time )
+            
+        
+        display_tuple = ( pretty_timestamp, action, pretty_execution_time, pretty_queue_time, pretty_rows, pretty_slowest_statement_time, pretty_slowest_statement )
+        sort_tuple = ( i, action, execution_time, queue_time, rows, slowest_statement_time, slowest_statement )
+        
+        return ( display_tuple, sort_tuple )
+        
+    
+    def _CopySlowJobs( self ):
+        
+        slow_job_rows = self._slow_jobs_list_ctrl.GetData( only_selected = True )
+        
+        text = os.linesep.join( ( repr( slow_job_row[ 1 : ] ) for slow_job_row in slow_job_rows ) )
+        
+        HG.client_controller.pub( 'clipboard', 'text', text )
+        
+    
+    def _Refresh( self ):
+        
+        report = self._controller.db.GetJobStatistics()
+        
+        self._since_st.setText( 'Statistics since ' + HydrusData.ConvertTimestampToPrettyTime( report[ 'since' ] ) + '.' )
+        
+        action_rows = []
+        
+        for ( action, action_report ) in report[ 'actions' ].items():
+            
+            execution_time = action_report[ 'execution_time' ]
+            queue_time = action_report[ 'queue_time' ]
+            
+            action_rows.append( ( action, action_report[ 'job_type' ], action_report[ 'count' ], action_report[ 'rows' ], execution_time[ 'p50' ], execution_time[ 'p95' ], execution_time[ 'p99' ], execution_time[ 'max' ], queue_time[ 'mean' ], queue_time[ 'p95' ] ) )
+            
+        
+        self._actions_list_ctrl.SetData( action_rows )
+        
+        slow_job_rows = []
+        
+        for ( i, slow_job ) in enumerate( report[ 'slow_jobs' ] ):
+            
+            slow_job_rows.append( ( i, slow_job[ 'timestamp' ], slow_job[ 'action' ], slow_job[ 'execution_time' ], slow_job[ 'queue_time' ], slow_job[ 'rows' ], slow_job[ 'slowest_statement' ], slow_job[ 'slowest_statement_time' ] ) )
+            
+        
+        self._slow_jobs_list_ctrl.SetData( slow_job_rows )
+        
+    
+    def _Reset( self ):
+        
+        self._controller.db.ResetJobStatistics()
+        
+        self._Refresh()
+        
+    
 class ReviewDownloaderImport( ClientGUIScrolledPanels.ReviewPanel ):
     
     def __init__( self, parent, network_engine ):
@@ -246,7 +246,7 @@ class RelatedTagsPanel( QW.QWidget ):
                 self._have_fetched = True
                 
             
-            predicates = HG.client_controller.Read( 'related_tags', service_key, hash, search_tags, max_results, max_time_to_take )
+            predicates = HG.client_controller.ReadSnapshot( 'related_tags', service_key, hash, search_tags, max_results, max_time_to_take )
             
             predicates = ClientSearch.SortPredicates( predicates )
             
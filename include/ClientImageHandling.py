@@ -17,17 +17,19 @@ cv_interpolation_enum_lookup[ CC.ZOOM_AREA ] = cv2.INTER_AREA
 cv_interpolation_enum_lookup[ CC.ZOOM_CUBIC ] = cv2.INTER_CUBIC
 cv_interpolation_enum_lookup[ CC.ZOOM_LANCZOS4 ] = cv2.INTER_LANCZOS4
 
+PHASH_MINIMUM_DECODE_RESOLUTION = ( 256, 256 )
+
 def DiscardBlankPerceptualHashes( phashes ):
     
     phashes = { phash for phash in phashes if HydrusData.Get64BitHammingDistance( phash, CC.BLANK_PHASH ) > 4 }
     
     return phashes
     
-def GenerateNumPyImage( path, mime ):
+def GenerateNumPyImage( path, mime, minimum_resolution = None ):
     
     force_pil = HG.client_controller.new_options.GetBoolean( 'load_images_with_pil' )
     
-    return HydrusImageHandling.GenerateNumPyImage( path, mime, force_pil = force_pil )
+    return HydrusImageHandling.GenerateNumPyImage( path, mime, force_pil = force_pil, minimum_resolution = minimum_resolution )
     
 def GenerateShapePerceptualHashes( path, mime ):
     
@@ -36,7 +38,13 @@ def GenerateShapePerceptualHashes( path, mime ):
         HydrusData.ShowText( 'phash generation: loading image' )
         
     
-    numpy_image = GenerateNumPyImage( path, mime )
+    # we only want 32x32 in the end, so jpegs can decode at a reduced scale, which is much faster
+    # this is not identical to a full decode. it moves the hash by 0.17 bits on average and up to 2, so phashes made by older clients can need distance 2 to match exactly
+    numpy_image = GenerateNumPyImage( path, mime, minimum_resolution = PHASH_MINIMUM_DECODE_RESOLUTION )
+    
+    return GenerateShapePerceptualHashesNumPy( numpy_image )
+    
+def GenerateShapePerceptualHashesNumPy( numpy_image ):
     
     if HG.phash_generation_report_mode:
         
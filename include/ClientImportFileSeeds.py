@@ -233,7 +233,20 @@ class FileImportJob( object ):
         
         HydrusImageHandling.ConvertToPngIfBmp( self._temp_path )
         
-        self._hash = HydrusFileHandling.GetHashFromPath( self._temp_path )
+        # if nothing we know of is this size, this cannot be a file we know, so it is worth getting the other hashes in the same read
+        
+        size = os.path.getsize( self._temp_path )
+        
+        if HG.client_controller.Read( 'is_known_file_size', size ):
+            
+            self._hash = HydrusFileHandling.GetHashFromPath( self._temp_path )
+            
+        else:
+            
+            ( self._hash, md5, sha1, sha512 ) = HydrusFileHandling.GetAllHashesFromPath( self._temp_path )
+            
+            self._extra_hashes = ( md5, sha1, sha512 )
+            
         
         if HG.file_import_report_mode:
             
@@ -288,6 +301,8 @@ class FileImportJob( object ):
             HydrusData.ShowText( 'File import job file info: {}'.format( self._file_info ) )
             
         
+        numpy_image = None
+        
         if mime in HC.MIMES_WITH_THUMBNAILS:
             
             if HG.file_import_report_mode:
@@ -299,9 +314,35 @@ class FileImportJob( object ):
             
             target_resolution = HydrusImageHandling.GetThumbnailResolution( ( width, height ), bounding_dimensions )
             
-            percentage_in = HG.client_controller.new_options.GetInteger( 'video_thumbnail_percentage_in' )
+            if mime in HC.MIMES_WE_CAN_PHASH:
+                
+                # these are static images, so we decode once, big enough for both the thumbnail and the phashes
+                
+                ( target_width, target_height ) = target_resolution
+                ( phash_width, phash_height ) = ClientImageHandling.PHASH_MINIMUM_DECODE_RESOLUTION
+                
+                minimum_resolution = ( max( target_width, phash_width ), max( target_height, phash_height ) )
+                
+                numpy_image = ClientImageHandling.GenerateNumPyImage( self._temp_path, mime, minimum_resolution = minimum_resolution )
+                
+                try:
+                    
+                    thumbnail_numpy_image = HydrusImageHandling.ResizeNumPyImage( numpy_image, target_resolution )
+                    
+                    self._thumbnail_bytes = HydrusImageHandling.GenerateThumbnailBytesNumPy( thumbnail_numpy_image, mime )
+                    
+                except HydrusExceptions.CantRenderWithCVException:
+                    
+                    pass # the path version falls back to pil
+                    
+                
             
-            self._thumbnail_bytes = HydrusFileHandling.GenerateThumbnailBytes( self._temp_path, target_resolution, mime, duration, num_frames, percentage_in = percentage_in )
+            if self._thumbnail_bytes is None:
+                
+                percentage_in = HG.client_controller.new_options.GetInteger( 'video_thumbnail_percentage_in' )
+                
+                self._thumbnail_bytes = HydrusFileHandling.GenerateThumbnailBytes( self._temp_path, target_resolution, mime, duration, num_frames, percentage_in = percentage_in )
+                
             
         
         if mime in HC.MIMES_WE_CAN_PHASH:
@@ -311,7 +352,14 @@ class FileImportJob( object ):
                 HydrusData.ShowText( 'File import job generating phashes' )
                 
             
-            self._phashes = ClientImageHandling.GenerateShapePerceptualHashes( self._temp_path, mime )
+            if numpy_image is None:
+                
+                self._phashes = ClientImageHandling.GenerateShapePerceptualHashes( self._temp_path, mime )
+                
+            else:
+                
+                self._phashes = ClientImageHandling.GenerateShapePerceptualHashesNumPy( numpy_image )
+                
             
             if HG.file_import_report_mode:
                 
@@ -319,12 +367,15 @@ class FileImportJob( object ):
                 
             
         
-        if HG.file_import_report_mode:
+        if self._extra_hashes is None:
             
-            HydrusData.ShowText( 'File import job generating other hashes' )
+            if HG.file_import_report_mode:
+                
+                HydrusData.ShowText( 'File import job generating other hashes' )
+                
+            
+            self._extra_hashes = HydrusFileHandling.GetExtraHashesFromPath( self._temp_path )
             
-        
-        self._extra_hashes = HydrusFileHandling.GetExtraHashesFromPath( self._temp_path )
         
         self._file_modified_timestamp = HydrusFileHandling.GetFileModifiedTimestamp( self._temp_path )
         
@@ -1508,6 +1559,8 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
     SERIALISABLE_NAME = 'Import File Status Cache'
     SERIALISABLE_VERSION = 8
     
+    SERIALISABLE_LAZY_LOAD = True
+    
     COMPACT_NUMBER = 250
     
     def __init__( self ):
@@ -1518,6 +1571,9 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
         
         self._file_seeds_to_indices = {}
         
+        self._lazy_binary = None
+        self._lazy_statuses_to_counts = None
+        
         self._file_seed_cache_key = HydrusData.GenerateKey()
         
         self._status_cache = None
@@ -1530,6 +1586,13 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
     
     def __len__( self ):
         
+        lazy_statuses_to_counts = self._lazy_statuses_to_counts
+        
+        if lazy_statuses_to_counts is not None:
+            
+            return sum( lazy_statuses_to_counts.values() )
+            
+        
         return len( self._file_seeds )
         
     
@@ -1553,8 +1616,25 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
             
         
     
+    def _GetLazyBinary( self ):
+        
+        return self._lazy_binary
+        
+    
+    def _GetLazySummary( self ):
+        
+        return list( self._GetStatusesToCounts().items() )
+        
+    
     def _GetSerialisableInfo( self ):
         
+        if self._lazy_binary is not None:
+            
+            ( ( serialisable_type, version, serialisable_info ), blobs ) = HydrusSerialisable.UnpackBinary( self._lazy_binary )
+            
+            return serialisable_info
+            
+        
         return self._file_seeds.GetSerialisableTuple()
         
     
@@ -1575,6 +1655,11 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
     
     def _GetStatusesToCounts( self ):
         
+        if self._lazy_binary is not None:
+            
+            return collections.Counter( self._lazy_statuses_to_counts )
+            
+        
         statuses_to_counts = collections.Counter()
         
         for file_seed in self._file_seeds:
@@ -1604,6 +1689,30 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
             
         
     
+    def _InitialiseLazily( self, binary, summary ):
+        
+        with self._lock:
+            
+            self._lazy_binary = binary
+            self._lazy_statuses_to_counts = collections.Counter( { status : count for ( status, count ) in summary } )
+            
+        
+    
+    def _LoadFileSeeds( self ):
+        
+        if self._lazy_binary is not None:
+            
+            ( ( serialisable_type, version, serialisable_info ), blobs ) = HydrusSerialisable.UnpackBinary( self._lazy_binary )
+            
+            self._file_seeds = HydrusSerialisable.CreateFromSerialisableTuple( serialisable_info, blobs = blobs )
+            
+            self._file_seeds_to_indices = { file_seed : index for ( index, file_seed ) in enumerate( self._file_seeds ) }
+            
+            self._lazy_binary = None
+            self._lazy_statuses_to_counts = None
+            
+        
+    
     def _SetStatusDirty( self ):
         
         self._status_dirty = True
@@ -1826,6 +1935,8 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
         
         with self._lock:
             
+            self._LoadFileSeeds()
+            
             for file_seed in file_seeds:
                 
                 if self._HasFileSeed( file_seed ):
@@ -1863,6 +1974,8 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
         
         with self._lock:
             
+            self._LoadFileSeeds()
+            
             if file_seed in self._file_seeds_to_indices:
                 
                 index = self._file_seeds_to_indices[ file_seed ]
@@ -1885,6 +1998,8 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
         
         with self._lock:
             
+            self._LoadFileSeeds()
+            
             if len( self._file_seeds ) <= self.COMPACT_NUMBER:
                 
                 return False
@@ -1911,6 +2026,8 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
         
         with self._lock:
             
+            self._LoadFileSeeds()
+            
             if len( self._file_seeds ) <= self.COMPACT_NUMBER:
                 
                 return
@@ -1942,6 +2059,8 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
         
         with self._lock:
             
+            self._LoadFileSeeds()
+            
             if file_seed in self._file_seeds_to_indices:
                 
                 index = self._file_seeds_to_indices[ file_seed ]
@@ -1980,6 +2099,8 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
             
             if not simple:
                 
+                self._LoadFileSeeds()
+                
                 d[ 'import_items' ] = [ file_seed.GetAPIInfoDict( simple ) for file_seed in self._file_seeds ]
                 
             
@@ -1991,6 +2112,8 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
         
         with self._lock:
             
+            self._LoadFileSeeds()
+            
             if len( self._file_seeds ) == 0:
                 
                 return None
@@ -2013,7 +2136,20 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
         
         with self._lock:
             
-            if status is None:
+            if self._lazy_binary is not None:
+                
+                statuses_to_counts = self._GetStatusesToCounts()
+                
+                if status is None:
+                    
+                    result = sum( statuses_to_counts.values() )
+                    
+                else:
+                    
+                    result = statuses_to_counts[ status ]
+                    
+                
+            elif status is None:
                 
                 result = len( self._file_seeds )
                 
@@ -2036,6 +2172,8 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
         
         with self._lock:
             
+            self._LoadFileSeeds()
+            
             return self._GetFileSeeds( status )
             
         
@@ -2044,6 +2182,8 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
         
         with self._lock:
             
+            self._LoadFileSeeds()
+            
             return self._file_seeds_to_indices[ file_seed ]
             
         
@@ -2052,6 +2192,8 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
         
         with self._lock:
             
+            self._LoadFileSeeds()
+            
             hashes = [ file_seed.GetHash() for file_seed in self._file_seeds if file_seed.HasHash() ]
             
         
@@ -2062,6 +2204,8 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
         
         with self._lock:
             
+            self._LoadFileSeeds()
+            
             if len( self._file_seeds ) == 0:
                 
                 return 0
@@ -2077,6 +2221,8 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
         
         with self._lock:
             
+            self._LoadFileSeeds()
+            
             if len( self._file_seeds ) == 0:
                 
                 return 0
@@ -2092,6 +2238,15 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
         
         with self._lock:
             
+            # an importer with nothing left to do should not have to load its seeds to find that out
+            
+            if self._lazy_binary is not None and self._GetStatusesToCounts()[ status ] == 0:
+                
+                return None
+                
+            
+            self._LoadFileSeeds()
+            
             for file_seed in self._file_seeds:
                 
                 if file_seed.status == status:
@@ -2110,6 +2265,8 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
         
         with self._lock:
             
+            self._LoadFileSeeds()
+            
             for file_seed in self._file_seeds:
                 
                 source_timestamp = self._GetSourceTimestamp( file_seed )
@@ -2128,6 +2285,8 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
         
         with self._lock:
             
+            self._LoadFileSeeds()
+            
             eligible_file_seeds = [ file_seed for file_seed in self._file_seeds if file_seed.HasHash() ]
             
             file_seed_hashes = [ file_seed.GetHash() for file_seed in eligible_file_seeds ]
@@ -2212,6 +2371,8 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
         
         with self._lock:
             
+            self._LoadFileSeeds()
+            
             return self._HasFileSeed( file_seed )
             
         
@@ -2227,6 +2388,8 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
         
         with self._lock:
             
+            self._LoadFileSeeds()
+            
             index = min( index, len( self._file_seeds ) )
             
             for file_seed in file_seeds:
@@ -2269,6 +2432,8 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
         
         with self._lock:
             
+            self._LoadFileSeeds()
+            
             file_seeds_to_delete = set( file_seeds )
             
             self._file_seeds = HydrusSerialisable.SerialisableList( [ file_seed for file_seed in self._file_seeds if file_seed not in file_seeds_to_delete ] )
@@ -2285,6 +2450,8 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
         
         with self._lock:
             
+            self._LoadFileSeeds()
+            
             file_seeds_to_delete = [ file_seed for file_seed in self._file_seeds if file_seed.status in statuses_to_remove ]
             
         
@@ -2295,6 +2462,8 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
         
         with self._lock:
             
+            self._LoadFileSeeds()
+            
             file_seeds_to_delete = [ file_seed for file_seed in self._file_seeds if file_seed.status != CC.STATUS_UNKNOWN ]
             
         
@@ -2305,6 +2474,8 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
         
         with self._lock:
             
+            self._LoadFileSeeds()
+            
             failed_file_seeds = self._GetFileSeeds( CC.STATUS_ERROR )
             
             for file_seed in failed_file_seeds:
@@ -2320,6 +2491,8 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
         
         with self._lock:
             
+            self._LoadFileSeeds()
+            
             ignored_file_seeds = self._GetFileSeeds( CC.STATUS_VETOED )
             
             for file_seed in ignored_file_seeds:
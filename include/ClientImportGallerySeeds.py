@@ -512,6 +512,8 @@ class GallerySeedLog( HydrusSerialisable.SerialisableBase ):
     SERIALISABLE_NAME = 'Gallery Log'
     SERIALISABLE_VERSION = 1
     
+    SERIALISABLE_LAZY_LOAD = True
+    
     COMPACT_NUMBER = 100
     
     def __init__( self ):
@@ -522,6 +524,9 @@ class GallerySeedLog( HydrusSerialisable.SerialisableBase ):
         
         self._gallery_seeds_to_indices = {}
         
+        self._lazy_binary = None
+        self._lazy_statuses_to_counts = None
+        
         self._gallery_seed_log_key = HydrusData.GenerateKey()
         
         self._status_cache = None
@@ -534,6 +539,13 @@ class GallerySeedLog( HydrusSerialisable.SerialisableBase ):
     
     def __len__( self ):
         
+        lazy_statuses_to_counts = self._lazy_statuses_to_counts
+        
+        if lazy_statuses_to_counts is not None:
+            
+            return sum( lazy_statuses_to_counts.values() )
+            
+        
         return len( self._gallery_seeds )
         
     
@@ -549,6 +561,11 @@ class GallerySeedLog( HydrusSerialisable.SerialisableBase ):
     
     def _GetStatusesToCounts( self ):
         
+        if self._lazy_binary is not None:
+            
+            return collections.Counter( self._lazy_statuses_to_counts )
+            
+        
         statuses_to_counts = collections.Counter()
         
         for gallery_seed in self._gallery_seeds:
@@ -571,8 +588,25 @@ class GallerySeedLog( HydrusSerialisable.SerialisableBase ):
             
         
     
+    def _GetLazyBinary( self ):
+        
+        return self._lazy_binary
+        
+    
+    def _GetLazySummary( self ):
+        
+        return list( self._GetStatusesToCounts().items() )
+        
+    
     def _GetSerialisableInfo( self ):
         
+        if self._lazy_binary is not None:
+            
+            ( ( serialisable_type, version, serialisable_info ), blobs ) = HydrusSerialisable.UnpackBinary( self._lazy_binary )
+            
+            return serialisable_info
+            
+        
         return self._gallery_seeds.GetSerialisableTuple()
         
     
@@ -586,6 +620,30 @@ class GallerySeedLog( HydrusSerialisable.SerialisableBase ):
             
         
     
+    def _InitialiseLazily( self, binary, summary ):
+        
+        with self._lock:
+            
+            self._lazy_binary = binary
+            self._lazy_statuses_to_counts = collections.Counter( { status : count for ( status, count ) in summary } )
+            
+        
+    
+    def _LoadGallerySeeds( self ):
+        
+        if self._lazy_binary is not None:
+            
+            ( ( serialisable_type, version, serialisable_info ), blobs ) = HydrusSerialisable.UnpackBinary( self._lazy_binary )
+            
+            self._gallery_seeds = HydrusSerialisable.CreateFromSerialisableTuple( serialisable_info, blobs = blobs )
+            
+            self._gallery_seeds_to_indices = { gallery_seed : index for ( index, gallery_seed ) in enumerate( self._gallery_seeds ) }
+            
+            self._lazy_binary = None
+            self._lazy_statuses_to_counts = None
+            
+        
+    
     def _SetStatusDirty( self ):
         
         self._status_dirty = True
@@ -602,6 +660,8 @@ class GallerySeedLog( HydrusSerialisable.SerialisableBase ):
         
         with self._lock:
             
+            self._LoadGallerySeeds()
+            
             for gallery_seed in gallery_seeds:
                 
                 if gallery_seed in self._gallery_seeds_to_indices:
@@ -628,6 +688,8 @@ class GallerySeedLog( HydrusSerialisable.SerialisableBase ):
         
         with self._lock:
             
+            self._LoadGallerySeeds()
+            
             if gallery_seed in self._gallery_seeds_to_indices:
                 
                 index = self._gallery_seeds_to_indices[ gallery_seed ]
@@ -650,6 +712,8 @@ class GallerySeedLog( HydrusSerialisable.SerialisableBase ):
         
         with self._lock:
             
+            self._LoadGallerySeeds()
+            
             if len( self._gallery_seeds ) <= self.COMPACT_NUMBER:
                 
                 return False
@@ -676,6 +740,8 @@ class GallerySeedLog( HydrusSerialisable.SerialisableBase ):
         
         with self._lock:
             
+            self._LoadGallerySeeds()
+            
             if len( self._gallery_seeds ) == 0:
                 
                 return False
@@ -694,6 +760,8 @@ class GallerySeedLog( HydrusSerialisable.SerialisableBase ):
         
         with self._lock:
             
+            self._LoadGallerySeeds()
+            
             if len( self._gallery_seeds ) <= self.COMPACT_NUMBER:
                 
                 return
@@ -725,6 +793,8 @@ class GallerySeedLog( HydrusSerialisable.SerialisableBase ):
         
         with self._lock:
             
+            self._LoadGallerySeeds()
+            
             if gallery_seed in self._gallery_seeds_to_indices:
                 
                 index = self._gallery_seeds_to_indices[ gallery_seed ]
@@ -747,6 +817,13 @@ class GallerySeedLog( HydrusSerialisable.SerialisableBase ):
         
         with self._lock:
             
+            if self._lazy_binary is not None and self._GetStatusesToCounts()[ status ] == 0:
+                
+                return None
+                
+            
+            self._LoadGallerySeeds()
+            
             for gallery_seed in self._gallery_seeds:
                 
                 if gallery_seed.status == status:
@@ -778,6 +855,8 @@ class GallerySeedLog( HydrusSerialisable.SerialisableBase ):
             
             if not simple:
                 
+                self._LoadGallerySeeds()
+                
                 d[ 'log_items' ] = [ gallery_seed.GetAPIInfoDict( simple ) for gallery_seed in self._gallery_seeds ]
                 
             
@@ -796,7 +875,20 @@ class GallerySeedLog( HydrusSerialisable.SerialisableBase ):
         
         with self._lock:
             
-            if status is None:
+            if self._lazy_binary is not None:
+                
+                statuses_to_counts = self._GetStatusesToCounts()
+                
+                if status is None:
+                    
+                    result = sum( statuses_to_counts.values() )
+                    
+                else:
+                    
+                    result = statuses_to_counts[ status ]
+                    
+                
+            elif status is None:
                 
                 result = len( self._gallery_seeds )
                 
@@ -819,6 +911,8 @@ class GallerySeedLog( HydrusSerialisable.SerialisableBase ):
         
         with self._lock:
             
+            self._LoadGallerySeeds()
+            
             return self._GetGallerySeeds( status )
             
         
@@ -827,6 +921,8 @@ class GallerySeedLog( HydrusSerialisable.SerialisableBase ):
         
         with self._lock:
             
+            self._LoadGallerySeeds()
+            
             return self._gallery_seeds_to_indices[ gallery_seed ]
             
         
@@ -869,6 +965,8 @@ class GallerySeedLog( HydrusSerialisable.SerialisableBase ):
         
         with self._lock:
             
+            self._LoadGallerySeeds()
+            
             return gallery_seed in self._gallery_seeds_to_indices
             
         
@@ -879,7 +977,12 @@ class GallerySeedLog( HydrusSerialisable.SerialisableBase ):
         
         search_url = search_gallery_seed.url
         
-        return search_url in ( gallery_seed.url for gallery_seed in self._gallery_seeds )
+        with self._lock:
+            
+            self._LoadGallerySeeds()
+            
+            return search_url in ( gallery_seed.url for gallery_seed in self._gallery_seeds )
+            
         
     
     def NotifyGallerySeedsUpdated( self, gallery_seeds ):
@@ -896,6 +999,8 @@ class GallerySeedLog( HydrusSerialisable.SerialisableBase ):
         
         with self._lock:
             
+            self._LoadGallerySeeds()
+            
             gallery_seeds_to_delete = set( gallery_seeds )
             
             self._gallery_seeds = HydrusSerialisable.SerialisableList( [ gallery_seed for gallery_seed in self._gallery_seeds if gallery_seed not in gallery_seeds_to_delete ] )
@@ -912,6 +1017,8 @@ class GallerySeedLog( HydrusSerialisable.SerialisableBase ):
         
         with self._lock:
             
+            self._LoadGallerySeeds()
+            
             gallery_seeds_to_delete = [ gallery_seed for gallery_seed in self._gallery_seeds if gallery_seed.status in statuses_to_remove ]
             
         
@@ -922,6 +1029,8 @@ class GallerySeedLog( HydrusSerialisable.SerialisableBase ):
         
         with self._lock:
             
+            self._LoadGallerySeeds()
+            
             gallery_seeds_to_delete = [ gallery_seed for gallery_seed in self._gallery_seeds if gallery_seed.status != CC.STATUS_UNKNOWN ]
             
         
@@ -932,6 +1041,8 @@ class GallerySeedLog( HydrusSerialisable.SerialisableBase ):
         
         with self._lock:
             
+            self._LoadGallerySeeds()
+            
             if len( self._gallery_seeds ) == 0:
                 
                 return
@@ -957,6 +1068,8 @@ class GallerySeedLog( HydrusSerialisable.SerialisableBase ):
         
         with self._lock:
             
+            self._LoadGallerySeeds()
+            
             failed_gallery_seeds = self._GetGallerySeeds( CC.STATUS_ERROR )
             
             for gallery_seed in failed_gallery_seeds:
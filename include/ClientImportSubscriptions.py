@@ -26,6 +26,8 @@ class Subscription( HydrusSerialisable.SerialisableBaseNamed ):
     SERIALISABLE_NAME = 'Subscription'
     SERIALISABLE_VERSION = 10
     
+    SERIALISABLE_BINARY_DUMP = True
+    
     def __init__( self, name, gug_key_and_name = None ):
         
         HydrusSerialisable.SerialisableBaseNamed.__init__( self, name )
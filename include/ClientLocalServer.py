@@ -83,6 +83,12 @@ class HydrusServiceClientAPI( HydrusClientService ):
         manage_cookies.putChild( b'get_cookies', ClientLocalServerResources.HydrusResourceClientAPIRestrictedManageCookiesGetCookies( self._service, self._client_requests_domain ) )
         manage_cookies.putChild( b'set_cookies', ClientLocalServerResources.HydrusResourceClientAPIRestrictedManageCookiesSetCookies( self._service, self._client_requests_domain ) )
         
+        manage_database = NoResource()
+        
+        root.putChild( b'manage_database', manage_database )
+        
+        manage_database.putChild( b'get_job_statistics', ClientLocalServerResources.HydrusResourceClientAPIRestrictedManageDatabaseGetJobStatistics( self._service, self._client_requests_domain ) )
+        
         manage_pages = NoResource()
         
         root.putChild( b'manage_pages', manage_pages )
@@ -29,9 +29,9 @@ LOCAL_BOORU_STRING_PARAMS = set()
 LOCAL_BOORU_JSON_PARAMS = set()
 LOCAL_BOORU_JSON_BYTE_LIST_PARAMS = set()
 
-CLIENT_API_INT_PARAMS = { 'file_id' }
+CLIENT_API_INT_PARAMS = { 'file_id', 'limit' }
 CLIENT_API_BYTE_PARAMS = { 'hash', 'destination_page_key', 'page_key', 'Hydrus-Client-API-Access-Key', 'Hydrus-Client-API-Session-Key' }
-CLIENT_API_STRING_PARAMS = { 'name', 'url', 'domain' }
+CLIENT_API_STRING_PARAMS = { 'name', 'url', 'domain', 'cursor' }
 CLIENT_API_JSON_PARAMS = { 'basic_permissions', 'system_inbox', 'system_archive', 'tags', 'file_ids', 'only_return_identifiers', 'simple' }
 CLIENT_API_JSON_BYTE_LIST_PARAMS = { 'hashes' }
 
@@ -273,7 +273,7 @@ class HydrusResourceBooruFile( HydrusResourceBooru ):
         
         path = client_files_manager.GetFilePath( hash, mime )
         
-        response_context = HydrusServerResources.ResponseContext( 200, mime = mime, path = path )
+        response_context = HydrusServerResources.ResponseContext( 200, mime = mime, path = path, hash = hash )
         
         return response_context
         
@@ -1301,18 +1301,49 @@ class HydrusResourceClientAPIRestrictedGetFilesSearchFiles( HydrusResourceClient
     
     def _threadDoGETJob( self, request ):
         
-        predicates = ParseClientAPISearchPredicates( request )
-        
-        file_search_context = ClientSearch.FileSearchContext( file_service_key = CC.LOCAL_FILE_SERVICE_KEY, tag_service_key = CC.COMBINED_TAG_SERVICE_KEY, predicates = predicates )
-        
-        # newest first
-        sort_by = ClientMedia.MediaSort( sort_type = ( 'system', CC.SORT_FILES_BY_IMPORT_TIME ), sort_asc = CC.SORT_DESC )
-        
-        hash_ids = HG.client_controller.Read( 'file_query_ids', file_search_context, sort_by = sort_by )
-        
-        request.client_api_permissions.SetLastSearchResults( hash_ids )
+        if 'limit' in request.parsed_request_args:
+            
+            limit = request.parsed_request_args.GetValue( 'limit', int )
+            
+        else:
+            
+            limit = None
+            
         
-        body_dict = { 'file_ids' : list( hash_ids ) }
+        if 'cursor' in request.parsed_request_args:
+            
+            cursor = request.parsed_request_args.GetValue( 'cursor', str )
+            
+            ( hash_ids, next_cursor ) = request.client_api_permissions.GetSearchCursorPage( cursor, limit )
+            
+            body_dict = { 'file_ids' : hash_ids, 'next_cursor' : next_cursor }
+            
+        else:
+            
+            predicates = ParseClientAPISearchPredicates( request )
+            
+            file_search_context = ClientSearch.FileSearchContext( file_service_key = CC.LOCAL_FILE_SERVICE_KEY, tag_service_key = CC.COMBINED_TAG_SERVICE_KEY, predicates = predicates )
+            
+            # newest first
+            sort_by = ClientMedia.MediaSort( sort_type = ( 'system', CC.SORT_FILES_BY_IMPORT_TIME ), sort_asc = CC.SORT_DESC )
+            
+            hash_ids = HG.client_controller.Read( 'file_query_ids', file_search_context, sort_by = sort_by )
+            
+            request.client_api_permissions.SetLastSearchResults( hash_ids )
+            
+            if limit is None:
+                
+                body_dict = { 'file_ids' : list( hash_ids ) }
+                
+            else:
+                
+                cursor = request.client_api_permissions.StartSearchCursor( hash_ids, limit )
+                
+                ( hash_ids, next_cursor ) = request.client_api_permissions.GetSearchCursorPage( cursor )
+                
+                body_dict = { 'file_ids' : hash_ids, 'next_cursor' : next_cursor }
+                
+            
         
         body = json.dumps( body_dict )
         
@@ -1365,7 +1396,7 @@ class HydrusResourceClientAPIRestrictedGetFilesGetFile( HydrusResourceClientAPIR
             raise HydrusExceptions.NotFoundException( 'Could not find that file!' )
             
         
-        response_context = HydrusServerResources.ResponseContext( 200, mime = mime, path = path )
+        response_context = HydrusServerResources.ResponseContext( 200, mime = mime, path = path, hash = hash )
         
         return response_context
         
@@ -1376,9 +1407,37 @@ class HydrusResourceClientAPIRestrictedGetFilesFileMetadata( HydrusResourceClien
         
         only_return_identifiers = request.parsed_request_args.GetValue( 'only_return_identifiers', bool, default_value = False )
         
+        next_cursor = None
+        
         try:
             
-            if 'file_ids' in request.parsed_request_args:
+            if 'cursor' in request.parsed_request_args:
+                
+                cursor = request.parsed_request_args.GetValue( 'cursor', str )
+                
+                if 'limit' in request.parsed_request_args:
+                    
+                    limit = request.parsed_request_args.GetValue( 'limit', int )
+                    
+                else:
+                    
+                    limit = None
+                    
+                
+                # these came out of this access key's own search, so they need no further permission check
+                
+                ( file_ids, next_cursor ) = request.client_api_permissions.GetSearchCursorPage( cursor, limit )
+                
+                if only_return_identifiers:
+                    
+                    file_ids_to_hashes = HG.client_controller.Read( 'hash_ids_to_hashes', hash_ids = file_ids )
+                    
+                else:
+                    
+                    media_results = HG.client_controller.Read( 'media_results_from_ids', file_ids )
+                    
+                
+            elif 'file_ids' in request.parsed_request_args:
                 
                 file_ids = request.parsed_request_args.GetValue( 'file_ids', list )
                 
@@ -1410,7 +1469,7 @@ class HydrusResourceClientAPIRestrictedGetFilesFileMetadata( HydrusResourceClien
                 
             else:
                 
-                raise HydrusExceptions.BadRequestException( 'Please include a file_ids or hashes parameter!' )
+                raise HydrusExceptions.BadRequestException( 'Please include a file_ids, hashes, or cursor parameter!' )
                 
             
         except HydrusExceptions.DataMissing as e:
@@ -1489,6 +1548,11 @@ class HydrusResourceClientAPIRestrictedGetFilesFileMetadata( HydrusResourceClien
         
         body_dict[ 'metadata' ] = metadata
         
+        if 'cursor' in request.parsed_request_args:
+            
+            body_dict[ 'next_cursor' ] = next_cursor
+            
+        
         mime = HC.APPLICATION_JSON
         body = json.dumps( body_dict )
         
@@ -1648,6 +1712,28 @@ class HydrusResourceClientAPIRestrictedManageCookiesSetCookies( HydrusResourceCl
         return response_context
         
     
+class HydrusResourceClientAPIRestrictedManageDatabase( HydrusResourceClientAPIRestricted ):
+    
+    def _CheckAPIPermissions( self, request ):
+        
+        request.client_api_permissions.CheckPermission( ClientAPI.CLIENT_API_PERMISSION_MANAGE_DATABASE )
+        
+    
+class HydrusResourceClientAPIRestrictedManageDatabaseGetJobStatistics( HydrusResourceClientAPIRestrictedManageDatabase ):
+    
+    def _threadDoGETJob( self, request ):
+        
+        # this does not go through the db job queue, so it still answers when the db is jammed
+        
+        body_dict = HG.client_controller.db.GetJobStatistics()
+        
+        body = json.dumps( body_dict )
+        
+        response_context = HydrusServerResources.ResponseContext( 200, mime = HC.APPLICATION_JSON, body = body )
+        
+        return response_context
+        
+    
 class HydrusResourceClientAPIRestrictedManagePages( HydrusResourceClientAPIRestricted ):
     
     def _CheckAPIPermissions( self, request ):
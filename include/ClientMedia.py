@@ -22,6 +22,7 @@ import itertools
 
 hashes_to_jpeg_quality = {}
 hashes_to_pixel_hashes = {}
+interned_service_key_sets = {}
 
 def FlattenMedia( media_list ):
     
@@ -474,8 +475,18 @@ def GetMediasTagCount( pool, tag_service_key, tag_display_type ):
     
     return ( current_tags_to_count, deleted_tags_to_count, pending_tags_to_count, petitioned_tags_to_count )
     
+def InternServiceKeys( service_keys ):
+    
+    # files share a handful of location combinations, so we hand out one frozenset per combination rather than a set per file
+    
+    service_keys = frozenset( service_keys )
+    
+    return interned_service_key_sets.setdefault( service_keys, service_keys )
+    
 class MediaResult( object ):
     
+    __slots__ = ( '_file_info_manager', '_tags_manager', '_locations_manager', '_ratings_manager', '_file_viewing_stats_manager', '__weakref__' )
+    
     def __init__( self, file_info_manager, tags_manager, locations_manager, ratings_manager, file_viewing_stats_manager ):
         
         self._file_info_manager = file_info_manager
@@ -654,6 +665,8 @@ class MediaResult( object ):
     
 class DuplicatesManager( object ):
     
+    __slots__ = ( '_service_keys_to_dupe_statuses_to_counts', )
+    
     def __init__( self, service_keys_to_dupe_statuses_to_counts ):
         
         self._service_keys_to_dupe_statuses_to_counts = service_keys_to_dupe_statuses_to_counts
@@ -673,6 +686,8 @@ class DuplicatesManager( object ):
     
 class FileInfoManager( object ):
     
+    __slots__ = ( 'hash_id', 'hash', 'size', 'mime', 'width', 'height', 'duration', 'num_frames', 'has_audio', 'num_words' )
+    
     def __init__( self, hash_id, hash, size = None, mime = None, width = None, height = None, duration = None, num_frames = None, has_audio = None, num_words = None ):
         
         if mime is None:
@@ -704,6 +719,8 @@ class FileInfoManager( object ):
     
 class FileViewingStatsManager( object ):
     
+    __slots__ = ( 'preview_views', 'preview_viewtime', 'media_views', 'media_viewtime' )
+    
     def __init__( self, preview_views, preview_viewtime, media_views, media_viewtime ):
         
         self.preview_views = preview_views
@@ -755,14 +772,13 @@ class FileViewingStatsManager( object ):
     
 class LocationsManager( object ):
     
+    __slots__ = ( '_current', '_deleted', '_pending', '_petitioned', 'inbox', '_urls', '_service_keys_to_filenames', '_current_to_timestamps', '_file_modified_timestamp' )
+    
     LOCAL_LOCATIONS = { CC.LOCAL_FILE_SERVICE_KEY, CC.TRASH_SERVICE_KEY, CC.COMBINED_LOCAL_FILE_SERVICE_KEY }
     
     def __init__( self, current, deleted, pending, petitioned, inbox = False, urls = None, service_keys_to_filenames = None, current_to_timestamps = None, file_modified_timestamp = None ):
         
-        self._current = current
-        self._deleted = deleted
-        self._pending = pending
-        self._petitioned = petitioned
+        self._SetCDPP( current, deleted, pending, petitioned )
         
         self.inbox = inbox
         
@@ -790,18 +806,27 @@ class LocationsManager( object ):
         self._file_modified_timestamp = file_modified_timestamp
         
     
+    def _SetCDPP( self, current, deleted, pending, petitioned ):
+        
+        self._current = InternServiceKeys( current )
+        self._deleted = InternServiceKeys( deleted )
+        self._pending = InternServiceKeys( pending )
+        self._petitioned = InternServiceKeys( petitioned )
+        
+    
     def DeletePending( self, service_key ):
         
-        self._pending.discard( service_key )
-        self._petitioned.discard( service_key )
+        self._SetCDPP( self._current, self._deleted, self._pending.difference( ( service_key, ) ), self._petitioned.difference( ( service_key, ) ) )
         
     
     def Duplicate( self ):
         
-        current = set( self._current )
-        deleted = set( self._deleted )
-        pending = set( self._pending )
-        petitioned = set( self._petitioned )
+        # the service key sets are immutable and shared, so they need no copy
+        
+        current = self._current
+        deleted = self._deleted
+        pending = self._pending
+        petitioned = self._petitioned
         urls = set( self._urls )
         service_keys_to_filenames = dict( self._service_keys_to_filenames )
         current_to_timestamps = dict( self._current_to_timestamps )
@@ -932,6 +957,11 @@ class LocationsManager( object ):
         
         if data_type == HC.CONTENT_TYPE_FILES:
             
+            current = set( self._current )
+            deleted = set( self._deleted )
+            pending = set( self._pending )
+            petitioned = set( self._petitioned )
+            
             if action == HC.CONTENT_UPDATE_ARCHIVE:
                 
                 self.inbox = False
@@ -942,23 +972,23 @@ class LocationsManager( object ):
                 
             elif action == HC.CONTENT_UPDATE_ADD:
                 
-                self._current.add( service_key )
+                current.add( service_key )
                 
-                self._deleted.discard( service_key )
-                self._pending.discard( service_key )
+                deleted.discard( service_key )
+                pending.discard( service_key )
                 
                 if service_key == CC.LOCAL_FILE_SERVICE_KEY:
                     
-                    self._current.discard( CC.TRASH_SERVICE_KEY )
-                    self._pending.discard( CC.COMBINED_LOCAL_FILE_SERVICE_KEY )
+                    current.discard( CC.TRASH_SERVICE_KEY )
+                    pending.discard( CC.COMBINED_LOCAL_FILE_SERVICE_KEY )
                     
-                    if CC.COMBINED_LOCAL_FILE_SERVICE_KEY not in self._current:
+                    if CC.COMBINED_LOCAL_FILE_SERVICE_KEY not in current:
                         
                         self.inbox = True
                         
-                        self._current.add( CC.COMBINED_LOCAL_FILE_SERVICE_KEY )
+                        current.add( CC.COMBINED_LOCAL_FILE_SERVICE_KEY )
                         
-                        self._deleted.discard( CC.COMBINED_LOCAL_FILE_SERVICE_KEY )
+                        deleted.discard( CC.COMBINED_LOCAL_FILE_SERVICE_KEY )
                         
                         self._current_to_timestamps[ CC.COMBINED_LOCAL_FILE_SERVICE_KEY ] = HydrusData.GetNow()
                         
@@ -968,14 +998,14 @@ class LocationsManager( object ):
                 
             elif action == HC.CONTENT_UPDATE_DELETE:
                 
-                self._deleted.add( service_key )
+                deleted.add( service_key )
                 
-                self._current.discard( service_key )
-                self._petitioned.discard( service_key )
+                current.discard( service_key )
+                petitioned.discard( service_key )
                 
                 if service_key == CC.LOCAL_FILE_SERVICE_KEY:
                     
-                    self._current.add( CC.TRASH_SERVICE_KEY )
+                    current.add( CC.TRASH_SERVICE_KEY )
                     
                     self._current_to_timestamps[ CC.TRASH_SERVICE_KEY ] = HydrusData.GetNow()
                     
@@ -983,38 +1013,40 @@ class LocationsManager( object ):
                     
                     self.inbox = False
                     
-                    self._current.discard( CC.COMBINED_LOCAL_FILE_SERVICE_KEY )
-                    self._deleted.add( CC.COMBINED_LOCAL_FILE_SERVICE_KEY )
+                    current.discard( CC.COMBINED_LOCAL_FILE_SERVICE_KEY )
+                    deleted.add( CC.COMBINED_LOCAL_FILE_SERVICE_KEY )
                     
                 
             elif action == HC.CONTENT_UPDATE_UNDELETE:
                 
-                self._current.discard( CC.TRASH_SERVICE_KEY )
+                current.discard( CC.TRASH_SERVICE_KEY )
                 
-                self._deleted.discard( CC.LOCAL_FILE_SERVICE_KEY )
-                self._current.add( CC.LOCAL_FILE_SERVICE_KEY )
+                deleted.discard( CC.LOCAL_FILE_SERVICE_KEY )
+                current.add( CC.LOCAL_FILE_SERVICE_KEY )
                 
             elif action == HC.CONTENT_UPDATE_PEND:
                 
-                if service_key not in self._current: self._pending.add( service_key )
+                if service_key not in current: pending.add( service_key )
                 
             elif action == HC.CONTENT_UPDATE_PETITION:
                 
-                if service_key not in self._deleted: self._petitioned.add( service_key )
+                if service_key not in deleted: petitioned.add( service_key )
                 
             elif action == HC.CONTENT_UPDATE_RESCIND_PEND:
                 
-                self._pending.discard( service_key )
+                pending.discard( service_key )
                 
             elif action == HC.CONTENT_UPDATE_RESCIND_PETITION:
                 
-                self._petitioned.discard( service_key )
+                petitioned.discard( service_key )
                 
             elif action == HC.CONTENT_UPDATE_CLEAR_DELETE_RECORD:
                 
-                self._deleted.discard( service_key )
+                deleted.discard( service_key )
                 
             
+            self._SetCDPP( current, deleted, pending, petitioned )
+            
         elif data_type == HC.CONTENT_TYPE_URLS:
             
             if action == HC.CONTENT_UPDATE_ADD:
@@ -1035,10 +1067,9 @@ class LocationsManager( object ):
     
     def ResetService( self, service_key ):
         
-        self._current.discard( service_key )
-        self._pending.discard( service_key )
-        self._deleted.discard( service_key )
-        self._petitioned.discard( service_key )
+        removee = ( service_key, )
+        
+        self._SetCDPP( self._current.difference( removee ), self._deleted.difference( removee ), self._pending.difference( removee ), self._petitioned.difference( removee ) )
         
     
     def ShouldIdeallyHaveThumbnail( self ): # file repo or local
@@ -3414,10 +3445,48 @@ class SortedList( object ):
     
 class TagsManager( object ):
     
-    def __init__( self, service_keys_to_statuses_to_tags ):
+    __slots__ = ( '_tag_display_types_to_service_keys_to_statuses_to_tags', '_siblings_cache_is_dirty', '_siblings_cache_is_precomputed', '_cache_is_dirty' )
+    
+    def __init__( self, service_keys_to_statuses_to_tags, service_keys_to_statuses_to_sibling_tags = None ):
         
         self._tag_display_types_to_service_keys_to_statuses_to_tags = { ClientTags.TAG_DISPLAY_STORAGE : service_keys_to_statuses_to_tags }
         
+        # the db can hand us the sibling-collapsed tags straight from its display cache, in which case we only have to filter and merge
+        
+        if service_keys_to_statuses_to_sibling_tags is None:
+            
+            self._siblings_cache_is_dirty = True
+            self._siblings_cache_is_precomputed = False
+            
+        else:
+            
+            # most files have no siblings, so where a collapsed set matches its storage set we hold the one set
+            # storage edits always throw the sibling cache away, so the sharing is safe
+            
+            for ( service_key, statuses_to_sibling_tags ) in service_keys_to_statuses_to_sibling_tags.items():
+                
+                if service_key not in service_keys_to_statuses_to_tags:
+                    
+                    continue
+                    
+                
+                statuses_to_tags = service_keys_to_statuses_to_tags[ service_key ]
+                
+                for ( status, sibling_tags ) in list( statuses_to_sibling_tags.items() ):
+                    
+                    if status in statuses_to_tags and statuses_to_tags[ status ] == sibling_tags:
+                        
+                        statuses_to_sibling_tags[ status ] = statuses_to_tags[ status ]
+                        
+                    
+                
+            
+            self._tag_display_types_to_service_keys_to_statuses_to_tags[ ClientTags.TAG_DISPLAY_SIBLINGS_AND_PARENTS ] = service_keys_to_statuses_to_sibling_tags
+            
+            self._siblings_cache_is_dirty = False
+            self._siblings_cache_is_precomputed = True
+            
+        
         self._cache_is_dirty = True
         
     
@@ -3434,25 +3503,29 @@ class TagsManager( object ):
             
             # siblings (parents later)
             
-            tag_siblings_manager = HG.client_controller.tag_siblings_manager
-            
-            # ultimately, we would like to just have these values pre-computed on the db so we can just read them in, but one step at a time
-            # and ultimately, this will make parents virtual, whether that is before or after we move this calc down to db cache level
-            # we'll want to keep this live updating capability though so we can keep up with content updates without needing a db refresh
-            # main difference is cache_dirty will default to False or similar
+            # when we were loaded from the db, these come pre-computed from its display cache
+            # we keep this live updating capability so we can keep up with content updates without needing a db refresh
+            # and ultimately, this will make parents virtual
             
-            source_service_keys_to_statuses_to_tags = self._tag_display_types_to_service_keys_to_statuses_to_tags[ ClientTags.TAG_DISPLAY_STORAGE ]
-            
-            destination_service_keys_to_statuses_to_tags = collections.defaultdict( HydrusData.default_dict_set )
-            
-            for ( service_key, source_statuses_to_tags ) in source_service_keys_to_statuses_to_tags.items():
+            if self._siblings_cache_is_dirty:
                 
-                destination_statuses_to_tags = tag_siblings_manager.CollapseStatusesToTags( service_key, source_statuses_to_tags )
+                tag_siblings_manager = HG.client_controller.tag_siblings_manager
                 
-                destination_service_keys_to_statuses_to_tags[ service_key ] = destination_statuses_to_tags
+                source_service_keys_to_statuses_to_tags = self._tag_display_types_to_service_keys_to_statuses_to_tags[ ClientTags.TAG_DISPLAY_STORAGE ]
+                
+                destination_service_keys_to_statuses_to_tags = collections.defaultdict( HydrusData.default_dict_set )
+                
+                for ( service_key, source_statuses_to_tags ) in source_service_keys_to_statuses_to_tags.items():
+                    
+                    destination_statuses_to_tags = tag_siblings_manager.CollapseStatusesToTags( service_key, source_statuses_to_tags )
+                    
+                    destination_service_keys_to_statuses_to_tags[ service_key ] = destination_statuses_to_tags
+                    
+                
+                self._tag_display_types_to_service_keys_to_statuses_to_tags[ ClientTags.TAG_DISPLAY_SIBLINGS_AND_PARENTS ] = destination_service_keys_to_statuses_to_tags
+                
+                self._siblings_cache_is_dirty = False
                 
-            
-            self._tag_display_types_to_service_keys_to_statuses_to_tags[ ClientTags.TAG_DISPLAY_SIBLINGS_AND_PARENTS ] = destination_service_keys_to_statuses_to_tags
             
             # display filtering
             
@@ -3529,6 +3602,14 @@ class TagsManager( object ):
             
         
     
+    def _SetStorageDirty( self ):
+        
+        self._siblings_cache_is_dirty = True
+        self._siblings_cache_is_precomputed = False
+        
+        self._cache_is_dirty = True
+        
+    
     @staticmethod
     def MergeTagsManagers( tags_managers ):
         
@@ -3584,7 +3665,7 @@ class TagsManager( object ):
             statuses_to_tags[ HC.CONTENT_STATUS_PENDING ] = set()
             statuses_to_tags[ HC.CONTENT_STATUS_PETITIONED ] = set()
             
-            self._cache_is_dirty = True
+            self._SetStorageDirty()
             
         
     
@@ -3615,6 +3696,8 @@ class TagsManager( object ):
         
         dupe_tags_manager._tag_display_types_to_service_keys_to_statuses_to_tags = dupe_tag_display_types_to_service_keys_to_statuses_to_tags
         dupe_tags_manager._cache_is_dirty = self._cache_is_dirty
+        dupe_tags_manager._siblings_cache_is_dirty = self._siblings_cache_is_dirty
+        dupe_tags_manager._siblings_cache_is_precomputed = self._siblings_cache_is_precomputed
         
         return dupe_tags_manager
         
@@ -3748,6 +3831,13 @@ class TagsManager( object ):
     
     def NewTagDisplayRules( self ):
         
+        # pre-computed siblings are refreshed by the db when siblings change, so we only have to redo our own
+        
+        if not self._siblings_cache_is_precomputed:
+            
+            self._siblings_cache_is_dirty = True
+            
+        
         self._cache_is_dirty = True
         
     
@@ -3802,7 +3892,7 @@ class TagsManager( object ):
             statuses_to_tags[ HC.CONTENT_STATUS_DELETED ].discard( tag )
             
         
-        self._cache_is_dirty = True
+        self._SetStorageDirty()
         
     
     def ResetService( self, service_key ):
@@ -3813,7 +3903,7 @@ class TagsManager( object ):
             
             del service_keys_to_statuses_to_tags[ service_key ]
             
-            self._cache_is_dirty = True
+            self._SetStorageDirty()
             
         
     
@@ -145,6 +145,7 @@ class ClientOptions( HydrusSerialisable.SerialisableBase ):
         self._dictionary[ 'booleans' ][ 'use_system_ffmpeg' ] = False
         
         self._dictionary[ 'booleans' ][ 'maintain_similar_files_duplicate_pairs_during_idle' ] = False
+        self._dictionary[ 'booleans' ][ 'use_in_memory_similar_files_index' ] = True
         
         self._dictionary[ 'booleans' ][ 'show_namespaces' ] = True
         
@@ -156,6 +157,7 @@ class ClientOptions( HydrusSerialisable.SerialisableBase ):
         self._dictionary[ 'booleans' ][ 'touchscreen_canvas_drags_unanchor' ] = False
         
         self._dictionary[ 'booleans' ][ 'thumbnail_fill' ] = False
+        self._dictionary[ 'booleans' ][ 'keep_decoded_thumbnail_store' ] = False
         
         self._dictionary[ 'booleans' ][ 'import_page_progress_display' ] = True
         
@@ -323,6 +325,7 @@ class ClientOptions( HydrusSerialisable.SerialisableBase ):
         
         self._dictionary[ 'integers' ][ 'thumbnail_cache_timeout' ] = 86400
         self._dictionary[ 'integers' ][ 'image_cache_timeout' ] = 600
+        self._dictionary[ 'integers' ][ 'thumbnail_waterfall_workers' ] = 4
         
         self._dictionary[ 'integers' ][ 'thumbnail_border' ] = 1
         self._dictionary[ 'integers' ][ 'thumbnail_margin' ] = 2
@@ -333,6 +336,8 @@ class ClientOptions( HydrusSerialisable.SerialisableBase ):
         self._dictionary[ 'integers' ][ 'file_maintenance_active_throttle_files' ] = 1
         self._dictionary[ 'integers' ][ 'file_maintenance_active_throttle_time_delta' ] = 20
         
+        self._dictionary[ 'integers' ][ 'file_maintenance_workers' ] = 4
+        
         self._dictionary[ 'integers' ][ 'subscription_network_error_delay' ] = 12 * 3600
         self._dictionary[ 'integers' ][ 'subscription_other_error_delay' ] = 36 * 3600
         self._dictionary[ 'integers' ][ 'downloader_network_error_delay' ] = 90 * 60
@@ -304,6 +304,8 @@ def GetStars( service_key, rating_state, rating ):
     
 class RatingsManager( object ):
     
+    __slots__ = ( '_service_keys_to_ratings', )
+    
     def __init__( self, service_keys_to_ratings ):
         
         self._service_keys_to_ratings = service_keys_to_ratings
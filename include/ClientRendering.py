@@ -8,6 +8,8 @@ from . import HydrusImageHandling
 from . import HydrusGlobals as HG
 from . import HydrusThreading
 from . import HydrusVideoHandling
+import math
+import numpy
 import os
 import threading
 import time
@@ -16,6 +18,8 @@ from qtpy import QtWidgets as QW
 from qtpy import QtGui as QG
 from . import QtPorting as QP
 
+MIN_MIP_LEVEL_DIMENSION = 256
+
 LZ4_OK = False
 
 try:
@@ -84,6 +88,9 @@ class ImageRenderer( object ):
         
         self._numpy_image = None
         
+        self._mip_levels = []
+        self._mip_lock = threading.Lock()
+        
         self._hash = media.GetHash()
         self._mime = media.GetMime()
         
@@ -97,18 +104,88 @@ class ImageRenderer( object ):
         HG.client_controller.CallToThread( self._Initialise )
         
     
-    def _GetNumPyImage( self, target_resolution = None ):
+    def _GetMipLevel( self, zoom ):
+        
+        # zooming far out of a huge image, we resize from a smaller copy, halved with area interpolation each step
+        # this is faster, and smoother than resizing the original in one go
+        
+        numpy_image = self._numpy_image
+        scale = 1.0
+        
+        with self._mip_lock:
+            
+            level = 0
+            
+            while zoom <= scale * 0.5:
+                
+                ( height, width, depth ) = numpy_image.shape
+                
+                if width < MIN_MIP_LEVEL_DIMENSION * 2 or height < MIN_MIP_LEVEL_DIMENSION * 2:
+                    
+                    break
+                    
+                
+                if level == len( self._mip_levels ):
+                    
+                    self._mip_levels.append( HydrusImageHandling.ResizeNumPyImage( numpy_image, ( width // 2, height // 2 ) ) )
+                    
+                
+                numpy_image = self._mip_levels[ level ]
+                scale *= 0.5
+                
+                level += 1
+                
+            
+        
+        return numpy_image
+        
+    
+    def _GetNumPyImage( self, target_resolution = None, clip_rect = None ):
+        
+        ( image_height, image_width, depth ) = self._numpy_image.shape
         
         if target_resolution is None:
             
-            numpy_image = self._numpy_image
+            ( target_width, target_height ) = ( image_width, image_height )
             
         else:
             
-            numpy_image = ClientImageHandling.ResizeNumPyImageForMediaViewer( self._mime, self._numpy_image, target_resolution.toTuple() )
+            ( target_width, target_height ) = target_resolution.toTuple()
             
         
-        return numpy_image
+        if clip_rect is None:
+            
+            if ( target_width, target_height ) == ( image_width, image_height ):
+                
+                return self._numpy_image
+                
+            
+            return ClientImageHandling.ResizeNumPyImageForMediaViewer( self._mime, self._numpy_image, ( target_width, target_height ) )
+            
+        
+        # the clip rect is in target coordinates, so we map it back to the source and resize just that part
+        
+        zoom = min( target_width / image_width, target_height / image_height )
+        
+        numpy_image = self._GetMipLevel( zoom )
+        
+        ( source_height, source_width, depth ) = numpy_image.shape
+        
+        x_scale = source_width / target_width
+        y_scale = source_height / target_height
+        
+        source_left = min( int( clip_rect.x() * x_scale ), source_width - 1 )
+        source_top = min( int( clip_rect.y() * y_scale ), source_height - 1 )
+        source_right = max( source_left + 1, min( int( math.ceil( ( clip_rect.x() + clip_rect.width() ) * x_scale ) ), source_width ) )
+        source_bottom = max( source_top + 1, min( int( math.ceil( ( clip_rect.y() + clip_rect.height() ) * y_scale ) ), source_height ) )
+        
+        numpy_image = numpy_image[ source_top : source_bottom, source_left : source_right ]
+        
+        numpy_image = ClientImageHandling.ResizeNumPyImageForMediaViewer( self._mime, numpy_image, ( clip_rect.width(), clip_rect.height() ) )
+        
+        # a crop that needed no resize is still a view into the original
+        
+        return numpy.ascontiguousarray( numpy_image )
         
     
     def _Initialise( self ):
@@ -126,9 +203,7 @@ class ImageRenderer( object ):
             
         else:
             
-            ( height, width, depth ) = self._numpy_image.shape
-            
-            return height * width * depth
+            return self._numpy_image.nbytes + sum( ( mip_level.nbytes for mip_level in self._mip_levels ) )
             
         
     
@@ -138,11 +213,9 @@ class ImageRenderer( object ):
     
     def GetResolution( self ): return self._resolution
     
-    def GetQtImage( self, target_resolution = None ):
+    def GetQtImage( self, target_resolution = None, clip_rect = None ):
         
-        # add region param to this to allow clipping before resize
-        
-        numpy_image = self._GetNumPyImage( target_resolution = target_resolution )
+        numpy_image = self._GetNumPyImage( target_resolution = target_resolution, clip_rect = clip_rect )
         
         ( height, width, depth ) = numpy_image.shape
         
@@ -151,11 +224,9 @@ class ImageRenderer( object ):
         return HG.client_controller.bitmap_manager.GetQtImageFromBuffer( width, height, depth * 8, data )
         
     
-    def GetQtPixmap( self, target_resolution = None ):
-        
-        # add region param to this to allow clipping before resize
+    def GetQtPixmap( self, target_resolution = None, clip_rect = None ):
         
-        numpy_image = self._GetNumPyImage( target_resolution = target_resolution )
+        numpy_image = self._GetNumPyImage( target_resolution = target_resolution, clip_rect = clip_rect )
         
         ( height, width, depth ) = numpy_image.shape
         
@@ -169,6 +240,27 @@ class ImageRenderer( object ):
         return self._numpy_image is not None
         
     
+class ImageTile( object ):
+    
+    # a QImage, not a QPixmap, since the shared cache budget can evict this from any thread, and a pixmap may only die on the gui thread
+    
+    def __init__( self, qt_image ):
+        
+        self._qt_image = qt_image
+        
+        self._num_bytes = qt_image.width() * qt_image.height() * qt_image.depth() // 8
+        
+    
+    def GetEstimatedMemoryFootprint( self ):
+        
+        return self._num_bytes
+        
+    
+    def GetQtImage( self ):
+        
+        return self._qt_image
+        
+    
 class RasterContainer( object ):
     
     def __init__( self, media, target_resolution = None ):
@@ -228,6 +320,11 @@ class RasterContainerVideo( RasterContainer ):
         
         self._frames = {}
         
+        # frames we have dropped from the buffer give their pixel buffers back here, so ffmpeg can read the next frames straight into them
+        self._frame_indices_to_numpy_images = {}
+        self._spare_numpy_images = []
+        self._last_index_fetched = -1
+        
         self._buffer_start_index = -1
         self._buffer_end_index = -1
         
@@ -310,6 +407,36 @@ class RasterContainerVideo( RasterContainer ):
             
             del self._frames[ i ]
             
+            if i in self._frame_indices_to_numpy_images:
+                
+                numpy_image = self._frame_indices_to_numpy_images.pop( i )
+                
+                # the gui may be drawing the last frame it asked for right now
+                
+                if i != self._last_index_fetched:
+                    
+                    self._spare_numpy_images.append( numpy_image )
+                    
+                
+            
+        
+    
+    def THREADLoadFrameIndex( self, renderer ):
+        
+        try:
+            
+            ( frame_timestamps_ms, keyframe_indices ) = ClientVideoHandling.GetVideoFrameIndex( self._media.GetHash(), self._path )
+            
+        except Exception as e:
+            
+            HydrusData.Print( 'Could not generate a frame index for {}, so seeking will estimate frame times from the frame rate. The error follows:'.format( self._path ) )
+            
+            HydrusData.PrintException( e, do_wait = False )
+            
+            return
+            
+        
+        renderer.SetFrameIndex( frame_timestamps_ms, keyframe_indices )
         
     
     def THREADRender( self ):
@@ -333,6 +460,13 @@ class RasterContainerVideo( RasterContainer ):
             
             self._renderer = HydrusVideoHandling.VideoRendererFFMPEG( self._path, mime, duration, num_frames_in_video, self._target_resolution )
             
+            if mime in HC.VIDEO:
+                
+                HG.client_controller.CallToThread( self.THREADLoadFrameIndex, self._renderer )
+                
+            
+        
+        recycle_numpy_images = isinstance( self._renderer, HydrusVideoHandling.VideoRendererFFMPEG )
         
         # give ui a chance to draw a blank frame rather than hard-charge right into CPUland
         time.sleep( 0.00001 )
@@ -356,6 +490,9 @@ class RasterContainerVideo( RasterContainer ):
                     
                     self._frames = {}
                     
+                    self._frame_indices_to_numpy_images = {}
+                    self._spare_numpy_images = []
+                    
                 
                 return
                 
@@ -403,10 +540,26 @@ class RasterContainerVideo( RasterContainer ):
                     
                     renderer = self._renderer
                     
+                    if recycle_numpy_images and len( self._spare_numpy_images ) > 0:
+                        
+                        spare_numpy_image = self._spare_numpy_images.pop()
+                        
+                    else:
+                        
+                        spare_numpy_image = None
+                        
+                    
                 
                 try:
                     
-                    numpy_image = renderer.read_frame()
+                    if recycle_numpy_images:
+                        
+                        numpy_image = renderer.read_frame( spare_numpy_image )
+                        
+                    else:
+                        
+                        numpy_image = renderer.read_frame()
+                        
                     
                 except Exception as e:
                     
@@ -440,15 +593,29 @@ class RasterContainerVideo( RasterContainer ):
                 
                 if should_save_frame:
                     
+                    # these frames are about to be shown, so no compression, and the bitmap just wraps our numpy image
+                    
                     frame = GenerateHydrusBitmapFromNumPyImage( numpy_image, compressed = False )
                     
                     with self._lock:
                         
                         self._frames[ frame_index ] = frame
                         
+                        if recycle_numpy_images:
+                            
+                            self._frame_indices_to_numpy_images[ frame_index ] = numpy_image
+                            
+                        
                         self._MaintainBuffer()
                         
                     
+                elif recycle_numpy_images:
+                    
+                    with self._lock:
+                        
+                        self._spare_numpy_images.append( numpy_image )
+                        
+                    
                 
                 with self._lock:
                     
@@ -507,6 +674,8 @@ class RasterContainerVideo( RasterContainer ):
             
             frame = self._frames[ index ]
             
+            self._last_index_fetched = index
+            
         
         num_frames_in_video = self.GetNumFrames()
         
@@ -675,7 +844,7 @@ class RasterContainerVideo( RasterContainer ):
     
 class HydrusBitmap( object ):
     
-    def __init__( self, data, size, depth, compressed = True ):
+    def __init__( self, data, size, depth, compressed = True, data_is_already_compressed = False ):
         
         if not LZ4_OK:
             
@@ -684,7 +853,7 @@ class HydrusBitmap( object ):
         
         self._compressed = compressed
         
-        if self._compressed:
+        if self._compressed and not data_is_already_compressed:
             
             self._data = lz4.block.compress( data )
             
@@ -696,12 +865,37 @@ class HydrusBitmap( object ):
         self._size = size
         self._depth = depth
         
+        self._decompressed_data_cache = None
+        
     
     def _GetData( self ):
         
         if self._compressed:
             
-            return lz4.block.decompress( self._data )
+            # recently painted bitmaps keep an uncompressed twin in a small cache, so repaints do not decompress every time
+            
+            data_cache = self._decompressed_data_cache
+            
+            if data_cache is not None:
+                
+                decompressed_bitmap = data_cache.GetIfHasData( self )
+                
+                if decompressed_bitmap is not None:
+                    
+                    ( data, compressed ) = decompressed_bitmap.GetStorageData()
+                    
+                    return data
+                    
+                
+            
+            data = lz4.block.decompress( self._data )
+            
+            if data_cache is not None:
+                
+                data_cache.AddData( self, HydrusBitmap( data, self._size, self._depth, compressed = False ) )
+                
+            
+            return data
             
         else:
             
@@ -750,3 +944,13 @@ class HydrusBitmap( object ):
         return self._size
         
     
+    def GetStorageData( self ):
+        
+        return ( self._data, self._compressed )
+        
+    
+    def SetDecompressedDataCache( self, data_cache ):
+        
+        self._decompressed_data_cache = data_cache
+        
+    
@@ -6,6 +6,7 @@ from . import ClientNetworkingContexts
 from . import ClientNetworkingJobs
 from . import ClientRatings
 from . import ClientThreading
+import collections
 import hashlib
 from . import HydrusConstants as HC
 from . import HydrusData
@@ -18,12 +19,16 @@ from . import HydrusPaths
 from . import HydrusSerialisable
 import json
 import os
+import queue
 import threading
 import time
 import traceback
 from qtpy import QtWidgets as QW
 from . import QtPorting as QP
 
+# how many update files repository processing reads and parses ahead of the db
+UPDATE_PREFETCH_DEPTH = 2
+
 def GenerateDefaultServiceDictionary( service_type ):
     
     dictionary = HydrusSerialisable.SerialisableDictionary()
@@ -1210,6 +1215,97 @@ class ServiceRepository( ServiceRestricted ):
         return dictionary
         
     
+    def _IterateUpdates( self, update_hashes, mime, job_key ):
+        
+        # the next few updates are read and parsed on other threads while the db works on the current one
+        # a bad update found early is only reported, and its maintenance scheduled, once we get to it, so everything before it still gets processed
+        
+        update_hashes = list( update_hashes )
+        
+        def do_it( update_hash, result_queue ):
+            
+            try:
+                
+                result_queue.put( ( self._LoadUpdate( update_hash, mime ), None ) )
+                
+            except Exception as e:
+                
+                result_queue.put( ( None, e ) )
+                
+            
+        
+        in_flight = collections.deque()
+        
+        num_started = 0
+        
+        while True:
+            
+            # the one we are about to hand over, plus the ones to get ready while the db works on it
+            
+            while num_started < len( update_hashes ) and len( in_flight ) < 1 + UPDATE_PREFETCH_DEPTH:
+                
+                update_hash = update_hashes[ num_started ]
+                
+                num_started += 1
+                
+                result_queue = queue.Queue()
+                
+                HG.client_controller.CallToThread( do_it, update_hash, result_queue )
+                
+                in_flight.append( ( update_hash, result_queue ) )
+                
+            
+            if len( in_flight ) == 0:
+                
+                return
+                
+            
+            ( update_hash, result_queue ) = in_flight.popleft()
+            
+            # a worker queued as we shut down may never run, so we cannot wait on it forever
+            
+            while True:
+                
+                if HG.model_shutdown:
+                    
+                    raise HydrusExceptions.ShutdownException( 'Application is shutting down!' )
+                    
+                
+                if job_key.IsCancelled():
+                    
+                    return
+                    
+                
+                try:
+                    
+                    ( result, e ) = result_queue.get( timeout = 1.0 )
+                    
+                    break
+                    
+                except queue.Empty:
+                    
+                    continue
+                    
+                
+            
+            if e is not None:
+                
+                raise e
+                
+            
+            ( update, maintenance_job_type, error_text ) = result
+            
+            if maintenance_job_type is not None:
+                
+                HG.client_controller.WriteSynchronous( 'schedule_repository_update_file_maintenance', self._service_key, maintenance_job_type )
+                
+                raise Exception( error_text )
+                
+            
+            yield ( update_hash, update )
+            
+        
+    
     def _LoadFromDictionary( self, dictionary ):
         
         ServiceRestricted._LoadFromDictionary( self, dictionary )
@@ -1218,6 +1314,50 @@ class ServiceRepository( ServiceRestricted ):
         self._paused = dictionary[ 'paused' ]
         
     
+    def _LoadUpdate( self, update_hash, mime ):
+        
+        # this runs on a prefetch thread, so we hand back what went wrong and leave the maintenance to whoever gets to this update
+        
+        try:
+            
+            update_path = HG.client_controller.client_files_manager.GetFilePath( update_hash, mime )
+            
+        except HydrusExceptions.FileMissingException:
+            
+            return ( None, ClientFiles.REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_PRESENCE, 'An unusual error has occured during repository processing: an update file was missing. Your repository should be paused, and all update files have been scheduled for a presence check. Please permit file maintenance to check them, or tell it to do so manually, before unpausing your repository.' )
+            
+        
+        with open( update_path, 'rb' ) as f:
+            
+            update_network_bytes = f.read()
+            
+        
+        try:
+            
+            update = HydrusSerialisable.CreateFromNetworkBytes( update_network_bytes )
+            
+        except:
+            
+            return ( None, ClientFiles.REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_DATA, 'An unusual error has occured during repository processing: an update file was invalid. Your repository should be paused, and all update files have been scheduled for an integrity check. Please permit file maintenance to check them, or tell it to do so manually, before unpausing your repository.' )
+            
+        
+        if mime == HC.APPLICATION_HYDRUS_UPDATE_DEFINITIONS:
+            
+            update_class = HydrusNetwork.DefinitionsUpdate
+            
+        else:
+            
+            update_class = HydrusNetwork.ContentUpdate
+            
+        
+        if not isinstance( update, update_class ):
+            
+            return ( None, ClientFiles.REGENERATE_FILE_DATA_JOB_FILE_METADATA, 'An unusual error has occured during repository processing: an update file has incorrect metadata. Your repository should be paused, and all update files have been scheduled for a metadata rescan. Please permit file maintenance to fix them, or tell it to do so manually, before unpausing your repository.' )
+            
+        
+        return ( update, None, None )
+        
+    
     def _LogFinalRowSpeed( self, precise_timestamp, total_rows, row_name ):
         
         if total_rows == 0:
@@ -1268,7 +1408,9 @@ class ServiceRepository( ServiceRestricted ):
             
             try:
                 
-                response = self.Request( HC.GET, 'metadata', { 'since' : next_update_index } )
+                # old servers ignore the encoding and give us json updates, which we can also read
+                
+                response = self.Request( HC.GET, 'metadata', { 'since' : next_update_index, 'update_encoding' : HydrusNetwork.UPDATE_ENCODING_COLUMNAR } )
                 
                 metadata_slice = response[ 'metadata_slice' ]
                 
@@ -1521,7 +1663,7 @@ class ServiceRepository( ServiceRestricted ):
             
             try:
                 
-                for definition_hash in definition_hashes:
+                for ( definition_hash, definition_update ) in self._IterateUpdates( definition_hashes, HC.APPLICATION_HYDRUS_UPDATE_DEFINITIONS, job_key ):
                     
                     progress_string = HydrusData.ConvertValueRangeToPrettyString( num_updates_done + 1, num_updates_to_do )
                     
@@ -1534,40 +1676,6 @@ class ServiceRepository( ServiceRestricted ):
                     job_key.SetVariable( 'popup_text_1', status )
                     job_key.SetVariable( 'popup_gauge_1', ( num_updates_done, num_updates_to_do ) )
                     
-                    try:
-                        
-                        update_path = HG.client_controller.client_files_manager.GetFilePath( definition_hash, HC.APPLICATION_HYDRUS_UPDATE_DEFINITIONS )
-                        
-                    except HydrusExceptions.FileMissingException:
-                        
-                        HG.client_controller.WriteSynchronous( 'schedule_repository_update_file_maintenance', self._service_key, ClientFiles.REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_PRESENCE )
-                        
-                        raise Exception( 'An unusual error has occured during repository processing: an update file was missing. Your repository should be paused, and all update files have been scheduled for a presence check. Please permit file maintenance to check them, or tell it to do so manually, before unpausing your repository.' )
-                        
-                    
-                    with open( update_path, 'rb' ) as f:
-                        
-                        update_network_bytes = f.read()
-                        
-                    
-                    try:
-                        
-                        definition_update = HydrusSerialisable.CreateFromNetworkBytes( update_network_bytes )
-                        
-                    except:
-                        
-                        HG.client_controller.WriteSynchronous( 'schedule_repository_update_file_maintenance', self._service_key, ClientFiles.REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_DATA )
-                        
-                        raise Exception( 'An unusual error has occured during repository processing: an update file was invalid. Your repository should be paused, and all update files have been scheduled for an integrity check. Please permit file maintenance to check them, or tell it to do so manually, before unpausing your repository.' )
-                        
-                    
-                    if not isinstance( definition_update, HydrusNetwork.DefinitionsUpdate ):
-                        
-                        HG.client_controller.WriteSynchronous( 'schedule_repository_update_file_maintenance', self._service_key, ClientFiles.REGENERATE_FILE_DATA_JOB_FILE_METADATA )
-                        
-                        raise Exception( 'An unusual error has occured during repository processing: an update file has incorrect metadata. Your repository should be paused, and all update files have been scheduled for a metadata rescan. Please permit file maintenance to fix them, or tell it to do so manually, before unpausing your repository.' )
-                        
-                    
                     rows_in_this_update = definition_update.GetNumRows()
                     rows_done_in_this_update = 0
                     
@@ -1649,7 +1757,7 @@ class ServiceRepository( ServiceRestricted ):
             
             try:
                 
-                for content_hash in content_hashes:
+                for ( content_hash, content_update ) in self._IterateUpdates( content_hashes, HC.APPLICATION_HYDRUS_UPDATE_CONTENT, job_key ):
                     
                     progress_string = HydrusData.ConvertValueRangeToPrettyString( num_updates_done + 1, num_updates_to_do )
                     
@@ -1662,40 +1770,6 @@ class ServiceRepository( ServiceRestricted ):
                     job_key.SetVariable( 'popup_text_1', status )
                     job_key.SetVariable( 'popup_gauge_1', ( num_updates_done, num_updates_to_do ) )
                     
-                    try:
-                        
-                        update_path = HG.client_controller.client_files_manager.GetFilePath( content_hash, HC.APPLICATION_HYDRUS_UPDATE_CONTENT )
-                        
-                    except HydrusExceptions.FileMissingException:
-                        
-                        HG.client_controller.WriteSynchronous( 'schedule_repository_update_file_maintenance', self._service_key, ClientFiles.REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_PRESENCE )
-                        
-                        raise Exception( 'An unusual error has occured during repository processing: an update file was missing. Your repository should be paused, and all update files have been scheduled for a presence check. Please permit file maintenance to check them, or tell it to do so manually, before unpausing your repository.' )
-                        
-                    
-                    with open( update_path, 'rb' ) as f:
-                        
-                        update_network_bytes = f.read()
-                        
-                    
-                    try:
-                        
-                        content_update = HydrusSerialisable.CreateFromNetworkBytes( update_network_bytes )
-                        
-                    except:
-                        
-                        HG.client_controller.WriteSynchronous( 'schedule_repository_update_file_maintenance', self._service_key, ClientFiles.REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_DATA )
-                        
-                        raise Exception( 'An unusual error has occured during repository processing: an update file was invalid. Your repository should be paused, and all update files have been scheduled for an integrity check. Please permit file maintenance to check them, or tell it to do so manually, before unpausing your repository.' )
-                        
-                    
-                    if not isinstance( content_update, HydrusNetwork.ContentUpdate ):
-                        
-                        HG.client_controller.WriteSynchronous( 'schedule_repository_update_file_maintenance', self._service_key, ClientFiles.REGENERATE_FILE_DATA_JOB_FILE_METADATA )
-                        
-                        raise Exception( 'An unusual error has occured during repository processing: an update file has incorrect metadata. Your repository should be paused, and all update files have been scheduled for a metadata rescan. Please permit file maintenance to fix them, or tell it to do so manually, before unpausing your repository.' )
-                        
-                    
                     rows_in_this_update = content_update.GetNumRows()
                     rows_done_in_this_update = 0
                     
@@ -1705,6 +1779,8 @@ class ServiceRepository( ServiceRestricted ):
                     iterator_dict[ 'deleted_files' ] = iter( content_update.GetDeletedFiles() )
                     iterator_dict[ 'new_mappings' ] = HydrusData.SmoothOutMappingIterator( content_update.GetNewMappings(), 50 )
                     iterator_dict[ 'deleted_mappings' ] = HydrusData.SmoothOutMappingIterator( content_update.GetDeletedMappings(), 50 )
+                    iterator_dict[ 'new_mappings_rows' ] = content_update.GetNewMappingsRows()
+                    iterator_dict[ 'deleted_mappings_rows' ] = content_update.GetDeletedMappingsRows()
                     iterator_dict[ 'new_parents' ] = iter( content_update.GetNewTagParents() )
                     iterator_dict[ 'deleted_parents' ] = iter( content_update.GetDeletedTagParents() )
                     iterator_dict[ 'new_siblings' ] = iter( content_update.GetNewTagSiblings() )
@@ -5,6 +5,11 @@ from . import HydrusData
 from . import HydrusExceptions
 from . import HydrusGlobals as HG
 from . import HydrusImageHandling
+from . import HydrusPaths
+from . import HydrusVideoHandling
+import json
+import os
+import zlib
 
 if cv2.__version__.startswith( '2' ):
     
@@ -24,6 +29,18 @@ else:
     CAP_PROP_CONVERT_RGB = cv2.CAP_PROP_CONVERT_RGB
     CAP_PROP_POS_FRAMES = cv2.CAP_PROP_POS_FRAMES
     
+def DeleteVideoFrameIndices( hashes ):
+    
+    for hash in hashes:
+        
+        path = GetVideoFrameIndexPath( hash )
+        
+        if os.path.exists( path ):
+            
+            HydrusPaths.DeletePath( path )
+            
+        
+    
 def GetCVVideoProperties( path ):
     
     capture = cv2.VideoCapture( path )
@@ -44,6 +61,44 @@ def GetCVVideoProperties( path ):
     
     return ( ( width, height ), duration, num_frames )
     
+def GetVideoFrameIndex( hash, path ):
+    
+    # the index only depends on the file, so we work it out once and keep it in the db dir
+    
+    index_path = GetVideoFrameIndexPath( hash )
+    
+    if os.path.exists( index_path ):
+        
+        try:
+            
+            with open( index_path, 'rb' ) as f:
+                
+                ( frame_timestamps_ms, keyframe_indices ) = json.loads( zlib.decompress( f.read() ).decode( 'utf-8' ) )
+                
+            
+            return ( frame_timestamps_ms, keyframe_indices )
+            
+        except Exception as e:
+            
+            HydrusData.Print( 'The video frame index at {} could not be read, so it will be regenerated.'.format( index_path ) )
+            
+        
+    
+    ( frame_timestamps_ms, keyframe_indices ) = HydrusVideoHandling.GetVideoFrameIndex( path )
+    
+    HydrusPaths.MakeSureDirectoryExists( os.path.dirname( index_path ) )
+    
+    with open( index_path, 'wb' ) as f:
+        
+        f.write( zlib.compress( json.dumps( ( frame_timestamps_ms, keyframe_indices ) ).encode( 'utf-8' ) ) )
+        
+    
+    return ( frame_timestamps_ms, keyframe_indices )
+    
+def GetVideoFrameIndexPath( hash ):
+    
+    return os.path.join( HG.client_controller.db_dir, 'client_video_frame_indices', hash.hex() + '.index' )
+    
 # the cv code was initially written by @fluffy_cub
 class GIFRenderer( object ):
     
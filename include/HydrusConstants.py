@@ -70,8 +70,8 @@ options = {}
 # Misc
 
 NETWORK_VERSION = 18
-SOFTWARE_VERSION = 384
-CLIENT_API_VERSION = 11
+SOFTWARE_VERSION = 385
+CLIENT_API_VERSION = 12
 
 SERVER_THUMBNAIL_DIMENSIONS = ( 200, 200 )
 
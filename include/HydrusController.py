@@ -588,6 +588,11 @@ class HydrusController( object ):
         return self._Read( action, *args, **kwargs )
         
     
+    def ReadSnapshot( self, action, *args, **kwargs ):
+        
+        return self.db.ReadSnapshot( action, *args, **kwargs )
+        
+    
     def ReleaseThreadSlot( self, thread_type ):
         
         with self._thread_slot_lock:
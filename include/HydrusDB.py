@@ -1,3 +1,4 @@
+import collections
 import distutils.version
 from . import HydrusConstants as HC
 from . import HydrusData
@@ -5,14 +6,24 @@ from . import HydrusExceptions
 from . import HydrusGlobals as HG
 from . import HydrusPaths
 from . import HydrusText
+import math
+import numpy
 import os
+import pathlib
 import queue
 import sqlite3
+import threading
 import traceback
 import time
 
 CONNECTION_REFRESH_TIME = 60 * 30
 
+SLOW_JOB_THRESHOLD = 1.0
+SLOW_JOB_LOG_SIZE = 100
+MAX_LOGGED_STATEMENT_LENGTH = 1024
+
+BYTE_POPCOUNTS = numpy.array( [ bin( i ).count( '1' ) for i in range( 256 ) ], dtype = numpy.int64 )
+
 def CanVacuum( db_path, stop_time = None ):
     
     try:
@@ -128,6 +139,7 @@ def VacuumDB( db_path ):
 class HydrusDB( object ):
     
     READ_WRITE_ACTIONS = []
+    PARALLEL_READ_ACTIONS = []
     UPDATE_WAIT = 2
     
     TRANSACTION_COMMIT_TIME = 30
@@ -189,7 +201,25 @@ class HydrusDB( object ):
         self._current_job_name = ''
         
         self._db = None
-        self._c = None
+        self._write_c = None
+        
+        self._write_caches = {}
+        
+        self._read_jobs = queue.Queue()
+        self._num_read_loops_running = 0
+        self._thread_ids_to_read_cursors = {}
+        self._thread_ids_to_read_caches = {}
+        
+        self._read_connections_condition = threading.Condition()
+        self._read_connections_allowed = False
+        self._num_read_connections_open = 0
+        
+        self._job_statistics = JobStatistics()
+        
+        self._write_job_count_lock = threading.Lock()
+        self._num_write_jobs_submitted = 0
+        self._num_write_jobs_done = 0
+        self._num_write_jobs_committed = 0
         
         if os.path.exists( os.path.join( self._db_dir, self._db_filenames[ 'main' ] ) ):
             
@@ -276,6 +306,16 @@ class HydrusDB( object ):
                 
             
         
+        if self._CanUseReadConnections():
+            
+            for i in range( HG.db_read_connections ):
+                
+                self._num_read_loops_running += 1
+                
+                self._controller.CallToThreadLongRunning( self.ReadLoop )
+                
+            
+        
     
     def _AnalyzeTempTable( self, temp_table_name ):
         
@@ -304,6 +344,21 @@ class HydrusDB( object ):
         self._c.execute( 'ATTACH ? AS durable_temp;', ( db_path, ) )
         
     
+    def _AttachExternalDatabasesReadOnly( self, c ):
+        
+        for ( name, filename ) in list(self._db_filenames.items()):
+            
+            if name == 'main':
+                
+                continue
+                
+            
+            db_path = os.path.join( self._db_dir, filename )
+            
+            c.execute( 'ATTACH ? AS ' + name + ';', ( self._GetReadOnlyURI( db_path ), ) )
+            
+        
+    
     def _BeginImmediate( self ):
         
         if not self._in_transaction:
@@ -316,6 +371,23 @@ class HydrusDB( object ):
             
         
     
+    def _CanUseReadConnections( self ):
+        
+        # read connections see the last committed state of the write connection, which needs WAL to happen concurrently
+        
+        if len( self.PARALLEL_READ_ACTIONS ) == 0 or HG.db_read_connections < 1:
+            
+            return False
+            
+        
+        if HG.no_wal or HG.db_memory_journaling:
+            
+            return False
+            
+        
+        return True
+        
+    
     def _CleanUpCaches( self ):
         
         pass
@@ -323,6 +395,8 @@ class HydrusDB( object ):
     
     def _CloseDBCursor( self ):
         
+        self._DisconnectReadConnections()
+        
         if self._db is not None:
             
             if self._in_transaction:
@@ -330,16 +404,34 @@ class HydrusDB( object ):
                 self._Commit()
                 
             
-            self._c.close()
+            self._write_c.close()
             self._db.close()
             
-            del self._c
+            del self._write_c
             del self._db
             
             self._db = None
-            self._c = None
+            self._write_c = None
+            
+        
+    
+    def _CloseReadConnection( self, db, c ):
+        
+        thread_id = threading.get_ident()
+        
+        with self._read_connections_condition:
+            
+            del self._thread_ids_to_read_cursors[ thread_id ]
+            del self._thread_ids_to_read_caches[ thread_id ]
+            
+            self._num_read_connections_open -= 1
+            
+            self._read_connections_condition.notify_all()
             
         
+        c.close()
+        db.close()
+        
     
     def _Commit( self ):
         
@@ -349,6 +441,8 @@ class HydrusDB( object ):
             
             self._in_transaction = False
             
+            self._num_write_jobs_committed = self._num_write_jobs_done
+            
         else:
             
             HydrusData.Print( 'Received a call to commit, but was not in a transaction!' )
@@ -398,6 +492,23 @@ class HydrusDB( object ):
         HydrusData.DebugPrint( message )
         
     
+    def _DisconnectReadConnections( self ):
+        
+        # the read connections have to be closed before the write connection is, or they will keep the WAL alive through a backup or vacuum
+        
+        with self._read_connections_condition:
+            
+            self._read_connections_allowed = False
+            
+            self._read_connections_condition.notify_all()
+            
+            while self._num_read_connections_open > 0:
+                
+                self._read_connections_condition.wait( 1 )
+                
+            
+        
+    
     def _ExecuteManySelectSingleParam( self, query, single_param_iterator ):
         
         select_args_iterator = ( ( param, ) for param in single_param_iterator )
@@ -422,6 +533,72 @@ class HydrusDB( object ):
             
         
     
+    def _ExecuteJob( self, job ):
+        
+        job_type = job.GetType()
+        
+        ( action, args, kwargs ) = job.GetCallableTuple()
+        
+        time_started = HydrusData.GetNowPrecise()
+        
+        # tracing every statement is too expensive to leave on, so we only do it for actions that were slow last time
+        
+        statement_timer = None
+        
+        if self._job_statistics.ShouldTimeStatements( action ):
+            
+            statement_timer = StatementTimer()
+            
+            connection = self._c.connection
+            
+            connection.set_trace_callback( statement_timer )
+            
+        
+        try:
+            
+            if job_type in ( 'read', 'read_write' ):
+                
+                result = self._Read( action, *args, **kwargs )
+                
+            else:
+                
+                result = self._Write( action, *args, **kwargs )
+                
+            
+        finally:
+            
+            if statement_timer is not None:
+                
+                try:
+                    
+                    connection.set_trace_callback( None )
+                    
+                except sqlite3.ProgrammingError:
+                    
+                    pass # the job closed the connection it started on
+                    
+                
+            
+        
+        time_finished = HydrusData.GetNowPrecise()
+        
+        self._job_statistics.AddJob( job_type, action, time_started - job.GetCreationTime(), time_finished - time_started, result, statement_timer )
+        
+        return result
+        
+    
+    def _GetCursor( self ):
+        
+        # read connection threads get their own cursor, everything else talks to the write connection
+        
+        return self._thread_ids_to_read_cursors.get( threading.get_ident(), self._write_c )
+        
+    
+    def _GetReadOnlyURI( self, db_path ):
+        
+        return pathlib.Path( db_path ).absolute().as_uri() + '?mode=ro'
+        
+    
     def _GetRowCount( self ):
         
         row_count = self._c.rowcount
@@ -430,6 +607,20 @@ class HydrusDB( object ):
         else: return row_count
         
     
+    def _GetThreadCache( self, name ):
+        
+        # read connection threads keep their own id lookup caches, so the write thread resetting its caches cannot pull entries out from under a read in progress
+        
+        caches = self._thread_ids_to_read_caches.get( threading.get_ident(), self._write_caches )
+        
+        if name not in caches:
+            
+            caches[ name ] = {}
+            
+        
+        return caches[ name ]
+        
+    
     def _InitCaches( self ):
         
         pass
@@ -492,7 +683,7 @@ class HydrusDB( object ):
         
         self._connection_timestamp = HydrusData.GetNow()
         
-        self._c = self._db.cursor()
+        self._write_c = self._db.cursor()
         
         if HG.no_db_temp_files:
             
@@ -568,6 +759,13 @@ class HydrusDB( object ):
             raise HydrusExceptions.DBAccessException( str( e ) )
             
         
+        with self._read_connections_condition:
+            
+            self._read_connections_allowed = True
+            
+            self._read_connections_condition.notify_all()
+            
+        
     
     def _InitDiskCache( self ):
         
@@ -584,11 +782,48 @@ class HydrusDB( object ):
         raise NotImplementedError()
         
     
+    def _OpenReadConnection( self ):
+        
+        db_path = os.path.join( self._db_dir, self._db_filenames[ 'main' ] )
+        
+        db = sqlite3.connect( self._GetReadOnlyURI( db_path ), uri = True, isolation_level = None, detect_types = sqlite3.PARSE_DECLTYPES )
+        
+        c = db.cursor()
+        
+        if HG.no_db_temp_files:
+            
+            c.execute( 'PRAGMA temp_store = 2;' )
+            
+        
+        c.execute( 'ATTACH ":memory:" AS mem;' )
+        
+        self._AttachExternalDatabasesReadOnly( c )
+        
+        db_names = [ name for ( index, name, path ) in c.execute( 'PRAGMA database_list;' ) if name not in ( 'mem', 'temp' ) ]
+        
+        for db_name in db_names:
+            
+            c.execute( 'PRAGMA {}.cache_size = -10000;'.format( db_name ) )
+            
+        
+        thread_id = threading.get_ident()
+        
+        with self._read_connections_condition:
+            
+            self._thread_ids_to_read_cursors[ thread_id ] = c
+            self._thread_ids_to_read_caches[ thread_id ] = {}
+            
+            self._num_read_connections_open += 1
+            
+        
+        return ( db, c )
+        
+    
     def _ProcessJob( self, job ):
         
         job_type = job.GetType()
         
-        ( action, args, kwargs ) = job.GetCallableTuple()
+        write_job_uncounted = False
         
         try:
             
@@ -598,6 +833,8 @@ class HydrusDB( object ):
                 
                 self._transaction_contains_writes = True
                 
+                write_job_uncounted = True
+                
             else:
                 
                 self._current_status = 'db read locked'
@@ -605,13 +842,15 @@ class HydrusDB( object ):
             
             self.publish_status_update()
             
-            if job_type in ( 'read', 'read_write' ):
+            result = self._ExecuteJob( job )
+            
+            if write_job_uncounted:
                 
-                result = self._Read( action, *args, **kwargs )
+                # counted before any commit below, so read connections know this job's writes are visible once it happens
                 
-            elif job_type in ( 'write' ):
+                self._num_write_jobs_done += 1
                 
-                result = self._Write( action, *args, **kwargs )
+                write_job_uncounted = False
                 
             
             if self._transaction_contains_writes and HydrusData.TimeHasPassed( self._transaction_started + self.TRANSACTION_COMMIT_TIME ):
@@ -664,6 +903,11 @@ class HydrusDB( object ):
             
         finally:
             
+            if write_job_uncounted:
+                
+                self._num_write_jobs_done += 1
+                
+            
             self._pubsubs = []
             
             self._current_status = ''
@@ -672,11 +916,69 @@ class HydrusDB( object ):
             
         
     
+    def _ProcessReadJob( self, job ):
+        
+        try:
+            
+            self._c.execute( 'BEGIN DEFERRED;' ) # one snapshot for the whole job
+            
+            try:
+                
+                result = self._ExecuteJob( job )
+                
+            finally:
+                
+                self._c.execute( 'COMMIT;' )
+                
+            
+            job.PutResult( result )
+            
+        except sqlite3.OperationalError as e:
+            
+            if 'readonly' in str( e ):
+                
+                # this read wanted to write something after all, so the write connection will have to do it
+                
+                self._jobs.put( job )
+                
+            else:
+                
+                self._ManageDBError( job, e )
+                
+            
+        except Exception as e:
+            
+            self._ManageDBError( job, e )
+            
+        
+    
     def _Read( self, action, *args, **kwargs ):
         
         raise NotImplementedError()
         
     
+    def _ReadConnectionsCanServe( self, action, read_your_writes = True ):
+        
+        if self._num_read_loops_running == 0 or action not in self.PARALLEL_READ_ACTIONS:
+            
+            return False
+            
+        
+        if read_your_writes:
+            
+            # submitted first, so a write that sneaks in between only makes us more conservative
+            
+            num_submitted = self._num_write_jobs_submitted
+            
+            if self._num_write_jobs_committed < num_submitted:
+                
+                return False
+                
+            
+        
+        return True
+        
+    
     def _RepairDB( self ):
         
         pass
@@ -742,6 +1044,16 @@ class HydrusDB( object ):
         return { item for ( item, ) in iterable_cursor }
         
     
+    def _SubmitWriteJob( self, job ):
+        
+        with self._write_job_count_lock:
+            
+            self._num_write_jobs_submitted += 1
+            
+            self._jobs.put( job )
+            
+        
+    
     def _TableHasAtLeastRowCount( self, name, row_count ):
         
         cursor = self._c.execute( 'SELECT 1 FROM {};'.format( name ) )
@@ -776,6 +1088,8 @@ class HydrusDB( object ):
         raise NotImplementedError()
         
     
+    _c = property( _GetCursor )
+    
     def pub_after_job( self, topic, *args, **kwargs ):
         
         if len( args ) == 0 and len( kwargs ) == 0:
@@ -813,6 +1127,11 @@ class HydrusDB( object ):
         return total
         
     
+    def GetJobStatistics( self ):
+        
+        return self._job_statistics.GetReport()
+        
+    
     def GetStatus( self ):
         
         return ( self._current_status, self._current_job_name )
@@ -835,7 +1154,7 @@ class HydrusDB( object ):
     
     def JobsQueueEmpty( self ):
         
-        return self._jobs.empty()
+        return self._jobs.empty() and self._read_jobs.empty()
         
     
     def MainLoop( self ):
@@ -968,6 +1287,8 @@ class HydrusDB( object ):
     
     def Read( self, action, *args, **kwargs ):
         
+        # the job sees every write submitted before it. it only goes to the read connections if they have all been committed
+        
         if action in self.READ_WRITE_ACTIONS:
             
             job_type = 'read_write'
@@ -986,35 +1307,745 @@ class HydrusDB( object ):
             raise HydrusExceptions.ShutdownException( 'Application has shut down!' )
             
         
-        self._jobs.put( job )
+        if job_type == 'read_write':
+            
+            self._SubmitWriteJob( job )
+            
+        elif self._ReadConnectionsCanServe( action, read_your_writes = True ):
+            
+            self._read_jobs.put( job )
+            
+        else:
+            
+            self._jobs.put( job )
+            
         
         return job.GetResult()
         
     
-    def ReadyToServeRequests( self ):
-        
-        return self._ready_to_serve_requests
-        
-    
-    def Shutdown( self ):
-        
-        self._local_shutdown = True
-        
-    
-    def Write( self, action, synchronous, *args, **kwargs ):
-        
-        job_type = 'write'
+    def ReadLoop( self ):
         
-        job = HydrusData.JobDatabase( job_type, synchronous, action, *args, **kwargs )
+        db = None
+        c = None
         
-        if HG.model_shutdown:
+        try:
             
-            raise HydrusExceptions.ShutdownException( 'Application has shut down!' )
+            while not ( ( self._local_shutdown or HG.model_shutdown ) and self._read_jobs.empty() ):
+                
+                with self._read_connections_condition:
+                    
+                    if not self._read_connections_allowed and db is not None:
+                        
+                        self._CloseReadConnection( db, c )
+                        
+                        db = None
+                        c = None
+                        
+                    
+                    while not self._read_connections_allowed:
+                        
+                        if self._local_shutdown or HG.model_shutdown:
+                            
+                            return
+                            
+                        
+                        self._read_connections_condition.wait( 1 )
+                        
+                    
+                    if db is None:
+                        
+                        ( db, c ) = self._OpenReadConnection()
+                        
+                    
+                
+                try:
+                    
+                    job = self._read_jobs.get( timeout = 1 )
+                    
+                except queue.Empty:
+                    
+                    continue
+                    
+                
+                if HG.db_report_mode:
+                    
+                    HydrusData.ShowText( 'Running ' + job.ToString() + ' on a read connection' )
+                    
+                
+                self._ProcessReadJob( job )
+                
             
-        
-        self._jobs.put( job )
-        
-        if synchronous: return job.GetResult()
+        except:
+            
+            self._DisplayCatastrophicError( traceback.format_exc() )
+            
+        finally:
+            
+            if db is not None:
+                
+                self._CloseReadConnection( db, c )
+                
+            
+            with self._read_connections_condition:
+                
+                self._num_read_loops_running -= 1
+                
+            
+            # anything that was waiting on us can go to the write connection instead
+            
+            if self._num_read_loops_running == 0:
+                
+                while not self._read_jobs.empty():
+                    
+                    self._jobs.put( self._read_jobs.get() )
+                    
+                
+            
+        
+    
+    def ReadSnapshot( self, action, *args, **kwargs ):
+        
+        # for reads that are happy to see the last committed state rather than wait on writes still in the queue
+        
+        if action in self.READ_WRITE_ACTIONS or not self._ReadConnectionsCanServe( action, read_your_writes = False ):
+            
+            return self.Read( action, *args, **kwargs )
+            
+        
+        job = HydrusData.JobDatabase( 'read', True, action, *args, **kwargs )
+        
+        if HG.model_shutdown:
+            
+            raise HydrusExceptions.ShutdownException( 'Application has shut down!' )
+            
+        
+        self._read_jobs.put( job )
+        
+        return job.GetResult()
+        
+    
+    def ReadyToServeRequests( self ):
+        
+        return self._ready_to_serve_requests
+        
+    
+    def ResetJobStatistics( self ):
+        
+        self._job_statistics = JobStatistics()
+        
+    
+    def Shutdown( self ):
+        
+        self._local_shutdown = True
+        
+    
+    def Write( self, action, synchronous, *args, **kwargs ):
+        
+        job_type = 'write'
+        
+        job = HydrusData.JobDatabase( job_type, synchronous, action, *args, **kwargs )
+        
+        if HG.model_shutdown:
+            
+            raise HydrusExceptions.ShutdownException( 'Application has shut down!' )
+            
+        
+        self._SubmitWriteJob( job )
+        
+        if synchronous: return job.GetResult()
+        
+    
+class HashIdSet( object ):
+    
+    # a compact, roaring-style set of non-negative integer ids
+    # ids are bucketed by their high bits, and each bucket keeps its low 16 bits as a sorted uint16 array while it is sparse, or as a packed 65536-bit bitmap once it has more than 4096 members
+    # a python set of a million ids is ~60MB, whereas this is ~2MB at worst and 128KB if the ids are dense
+    
+    MAX_ARRAY_CONTAINER_SIZE = 4096
+    
+    def __init__( self, iterable = None ):
+        
+        self._highs_to_containers = {}
+        self._num_ids = 0
+        
+        if iterable is not None:
+            
+            self._highs_to_containers = self._ConvertToContainers( iterable )
+            
+            self._RecountIds()
+            
+        
+    
+    def __contains__( self, hash_id ):
+        
+        ( high, low ) = divmod( hash_id, 65536 )
+        
+        if high not in self._highs_to_containers:
+            
+            return False
+            
+        
+        container = self._highs_to_containers[ high ]
+        
+        if container.dtype == numpy.uint16:
+            
+            i = numpy.searchsorted( container, low )
+            
+            return i < len( container ) and container[ i ] == low
+            
+        else:
+            
+            return bool( ( container[ low >> 3 ] >> ( low & 7 ) ) & 1 )
+            
+        
+    
+    def __iter__( self ):
+        
+        for high in sorted( self._highs_to_containers.keys() ):
+            
+            lows = self._GetArray( self._highs_to_containers[ high ] )
+            
+            yield from ( lows.astype( numpy.int64 ) + ( high << 16 ) ).tolist()
+            
+        
+    
+    def __len__( self ):
+        
+        return self._num_ids
+        
+    
+    def _BitmapContains( self, bitmap, lows ):
+        
+        return ( ( bitmap[ lows >> 3 ] >> ( lows & 7 ) ) & 1 ).astype( bool )
+        
+    
+    def _ConvertToContainers( self, iterable ):
+        
+        if isinstance( iterable, HashIdSet ):
+            
+            # containers are never changed in place, so we can share them
+            
+            return dict( iterable._highs_to_containers )
+            
+        
+        # sorting in place and splitting on bucket boundaries keeps the temporary arrays to about one copy of the ids
+        
+        hash_ids = numpy.fromiter( iterable, dtype = numpy.int64 )
+        
+        hash_ids.sort()
+        
+        highs_to_containers = {}
+        
+        if len( hash_ids ) == 0:
+            
+            return highs_to_containers
+            
+        
+        first_high = int( hash_ids[ 0 ] ) >> 16
+        last_high = int( hash_ids[ -1 ] ) >> 16
+        
+        boundaries = numpy.searchsorted( hash_ids, numpy.arange( first_high, last_high + 2, dtype = numpy.int64 ) << 16 ).tolist()
+        
+        for ( high, start, end ) in zip( range( first_high, last_high + 1 ), boundaries, boundaries[ 1 : ] ):
+            
+            if start == end:
+                
+                continue
+                
+            
+            lows = numpy.unique( ( hash_ids[ start : end ] & 0xFFFF ).astype( numpy.uint16 ) )
+            
+            highs_to_containers[ high ] = self._Normalise( lows )
+            
+        
+        return highs_to_containers
+        
+    
+    def _Difference( self, container_a, container_b ):
+        
+        if container_a.dtype == numpy.uint16:
+            
+            if container_b.dtype == numpy.uint16:
+                
+                result = numpy.setdiff1d( container_a, container_b, assume_unique = True )
+                
+            else:
+                
+                result = container_a[ ~ self._BitmapContains( container_b, container_a ) ]
+                
+            
+        else:
+            
+            result = numpy.bitwise_and( container_a, numpy.bitwise_not( self._GetBitmap( container_b ) ) )
+            
+        
+        return self._Normalise( result )
+        
+    
+    def _FilterBySet( self, hash_ids, keep_members ):
+        
+        # when we are much smaller than a python set, checking our members against it is cheaper than converting it
+        
+        if keep_members:
+            
+            filtered_hash_ids = [ hash_id for hash_id in self if hash_id in hash_ids ]
+            
+        else:
+            
+            filtered_hash_ids = [ hash_id for hash_id in self if hash_id not in hash_ids ]
+            
+        
+        self._highs_to_containers = self._ConvertToContainers( filtered_hash_ids )
+        
+        self._RecountIds()
+        
+    
+    def _GetArray( self, container ):
+        
+        if container.dtype == numpy.uint16:
+            
+            return container
+            
+        
+        return numpy.flatnonzero( numpy.unpackbits( container, bitorder = 'little' ) ).astype( numpy.uint16 )
+        
+    
+    def _GetBitmap( self, container ):
+        
+        if container.dtype == numpy.uint8:
+            
+            return container
+            
+        
+        bits = numpy.zeros( 65536, dtype = bool )
+        
+        bits[ container ] = True
+        
+        return numpy.packbits( bits, bitorder = 'little' )
+        
+    
+    def _GetContainerSize( self, container ):
+        
+        if container.dtype == numpy.uint16:
+            
+            return len( container )
+            
+        
+        return int( BYTE_POPCOUNTS[ container ].sum() )
+        
+    
+    def _Intersect( self, container_a, container_b ):
+        
+        if container_a.dtype == numpy.uint16:
+            
+            if container_b.dtype == numpy.uint16:
+                
+                result = numpy.intersect1d( container_a, container_b, assume_unique = True )
+                
+            else:
+                
+                result = container_a[ self._BitmapContains( container_b, container_a ) ]
+                
+            
+        elif container_b.dtype == numpy.uint16:
+            
+            result = container_b[ self._BitmapContains( container_a, container_b ) ]
+            
+        else:
+            
+            result = numpy.bitwise_and( container_a, container_b )
+            
+        
+        return self._Normalise( result )
+        
+    
+    def _Normalise( self, container ):
+        
+        size = self._GetContainerSize( container )
+        
+        if size == 0:
+            
+            return None
+            
+        
+        if container.dtype == numpy.uint16 and size > self.MAX_ARRAY_CONTAINER_SIZE:
+            
+            return self._GetBitmap( container )
+            
+        elif container.dtype == numpy.uint8 and size <= self.MAX_ARRAY_CONTAINER_SIZE:
+            
+            return self._GetArray( container )
+            
+        
+        return container
+        
+    
+    def _RecountIds( self ):
+        
+        self._num_ids = sum( ( self._GetContainerSize( container ) for container in self._highs_to_containers.values() ) )
+        
+    
+    def _Union( self, container_a, container_b ):
+        
+        if container_a.dtype == numpy.uint16 and container_b.dtype == numpy.uint16:
+            
+            result = numpy.union1d( container_a, container_b )
+            
+        else:
+            
+            result = numpy.bitwise_or( self._GetBitmap( container_a ), self._GetBitmap( container_b ) )
+            
+        
+        return self._Normalise( result )
+        
+    
+    def copy( self ):
+        
+        return HashIdSet( self )
+        
+    
+    def difference( self, iterable ):
+        
+        hash_id_set = self.copy()
+        
+        hash_id_set.difference_update( iterable )
+        
+        return hash_id_set
+        
+    
+    def difference_update( self, iterable ):
+        
+        if isinstance( iterable, ( set, frozenset ) ) and len( self ) * 4 < len( iterable ):
+            
+            self._FilterBySet( iterable, False )
+            
+            return
+            
+        
+        other_highs_to_containers = self._ConvertToContainers( iterable )
+        
+        for ( high, other_container ) in other_highs_to_containers.items():
+            
+            if high in self._highs_to_containers:
+                
+                container = self._Difference( self._highs_to_containers[ high ], other_container )
+                
+                if container is None:
+                    
+                    del self._highs_to_containers[ high ]
+                    
+                else:
+                    
+                    self._highs_to_containers[ high ] = container
+                    
+                
+            
+        
+        self._RecountIds()
+        
+    
+    def intersection( self, iterable ):
+        
+        hash_id_set = self.copy()
+        
+        hash_id_set.intersection_update( iterable )
+        
+        return hash_id_set
+        
+    
+    def intersection_update( self, iterable ):
+        
+        if isinstance( iterable, ( set, frozenset ) ) and len( self ) * 4 < len( iterable ):
+            
+            self._FilterBySet( iterable, True )
+            
+            return
+            
+        
+        other_highs_to_containers = self._ConvertToContainers( iterable )
+        
+        highs_to_containers = {}
+        
+        for ( high, container ) in self._highs_to_containers.items():
+            
+            if high in other_highs_to_containers:
+                
+                container = self._Intersect( container, other_highs_to_containers[ high ] )
+                
+                if container is not None:
+                    
+                    highs_to_containers[ high ] = container
+                    
+                
+            
+        
+        self._highs_to_containers = highs_to_containers
+        
+        self._RecountIds()
+        
+    
+    def union( self, iterable ):
+        
+        hash_id_set = self.copy()
+        
+        hash_id_set.update( iterable )
+        
+        return hash_id_set
+        
+    
+    def update( self, iterable ):
+        
+        other_highs_to_containers = self._ConvertToContainers( iterable )
+        
+        for ( high, other_container ) in other_highs_to_containers.items():
+            
+            if high in self._highs_to_containers:
+                
+                self._highs_to_containers[ high ] = self._Union( self._highs_to_containers[ high ], other_container )
+                
+            else:
+                
+                self._highs_to_containers[ high ] = other_container
+                
+            
+        
+        self._RecountIds()
+        
+    
+class JobStatistics( object ):
+    
+    def __init__( self ):
+        
+        self._lock = threading.Lock()
+        
+        self._time_started = HydrusData.GetNow()
+        
+        self._actions_to_job_types = {}
+        self._actions_to_num_rows = collections.Counter()
+        self._actions_to_execution_histograms = collections.defaultdict( LatencyHistogram )
+        self._actions_to_queue_histograms = collections.defaultdict( LatencyHistogram )
+        
+        self._actions_last_slow = set()
+        
+        self._slow_jobs = collections.deque( maxlen = SLOW_JOB_LOG_SIZE )
+        
+    
+    def AddJob( self, job_type, action, queue_time, execution_time, result, statement_timer = None ):
+        
+        if isinstance( result, ( list, tuple, set, frozenset, dict ) ):
+            
+            num_rows = len( result )
+            
+        elif result is None:
+            
+            num_rows = 0
+            
+        else:
+            
+            num_rows = 1
+            
+        
+        with self._lock:
+            
+            self._actions_to_job_types[ action ] = job_type
+            self._actions_to_num_rows[ action ] += num_rows
+            self._actions_to_execution_histograms[ action ].Add( execution_time )
+            self._actions_to_queue_histograms[ action ].Add( queue_time )
+            
+            if execution_time >= SLOW_JOB_THRESHOLD:
+                
+                self._actions_last_slow.add( action )
+                
+                if statement_timer is None:
+                    
+                    ( slowest_statement, slowest_statement_time ) = ( None, None )
+                    
+                else:
+                    
+                    ( slowest_statement, slowest_statement_time ) = statement_timer.GetSlowestStatement()
+                    
+                
+                slow_job = {
+                    'timestamp' : HydrusData.GetNow(),
+                    'action' : action,
+                    'job_type' : job_type,
+                    'queue_time' : queue_time,
+                    'execution_time' : execution_time,
+                    'rows' : num_rows,
+                    'slowest_statement' : slowest_statement,
+                    'slowest_statement_time' : slowest_statement_time
+                }
+                
+                self._slow_jobs.append( slow_job )
+                
+            else:
+                
+                self._actions_last_slow.discard( action )
+                
+            
+        
+    
+    def GetReport( self ):
+        
+        with self._lock:
+            
+            actions = {}
+            
+            for ( action, execution_histogram ) in self._actions_to_execution_histograms.items():
+                
+                actions[ action ] = {
+                    'job_type' : self._actions_to_job_types[ action ],
+                    'count' : execution_histogram.GetCount(),
+                    'rows' : self._actions_to_num_rows[ action ],
+                    'execution_time' : execution_histogram.GetSummary(),
+                    'queue_time' : self._actions_to_queue_histograms[ action ].GetSummary()
+                }
+                
+            
+            report = {
+                'since' : self._time_started,
+                'slow_job_threshold' : SLOW_JOB_THRESHOLD,
+                'actions' : actions,
+                'slow_jobs' : list( self._slow_jobs )
+            }
+            
+            return report
+            
+        
+    
+    def ShouldTimeStatements( self, action ):
+        
+        return action in self._actions_last_slow
+        
+    
+class LatencyHistogram( object ):
+    
+    # four log-spaced buckets per doubling from 0.1ms to ~100s, so percentiles are good to within about 20%
+    
+    MIN_LATENCY = 0.0001
+    NUM_BUCKETS = 81
+    
+    def __init__( self ):
+        
+        self._bucket_counts = [ 0 ] * self.NUM_BUCKETS
+        
+        self._count = 0
+        self._total = 0.0
+        self._max = 0.0
+        
+    
+    def Add( self, latency ):
+        
+        if latency <= self.MIN_LATENCY:
+            
+            bucket_index = 0
+            
+        else:
+            
+            bucket_index = min( int( math.ceil( 4 * math.log2( latency / self.MIN_LATENCY ) ) ), self.NUM_BUCKETS - 1 )
+            
+        
+        self._bucket_counts[ bucket_index ] += 1
+        
+        self._count += 1
+        self._total += latency
+        self._max = max( self._max, latency )
+        
+    
+    def GetCount( self ):
+        
+        return self._count
+        
+    
+    def GetPercentile( self, percentile ):
+        
+        if self._count == 0:
+            
+            return 0.0
+            
+        
+        target = percentile * self._count
+        
+        cumulative_count = 0
+        
+        for ( bucket_index, bucket_count ) in enumerate( self._bucket_counts ):
+            
+            cumulative_count += bucket_count
+            
+            if cumulative_count >= target:
+                
+                bucket_upper_bound = self.MIN_LATENCY * 2 ** ( bucket_index / 4 )
+                
+                return min( bucket_upper_bound, self._max )
+                
+            
+        
+        return self._max
+        
+    
+    def GetSummary( self ):
+        
+        if self._count == 0:
+            
+            mean = 0.0
+            
+        else:
+            
+            mean = self._total / self._count
+            
+        
+        return { 'mean' : mean, 'p50' : self.GetPercentile( 0.5 ), 'p95' : self.GetPercentile( 0.95 ), 'p99' : self.GetPercentile( 0.99 ), 'max' : self._max }
+        
+    
+class StatementTimer( object ):
+    
+    # a trace callback gets called as each statement starts, so a statement's time is the gap until the next one
+    
+    def __init__( self ):
+        
+        self._current_statement = None
+        self._current_statement_started = 0.0
+        
+        self._slowest_statement = None
+        self._slowest_statement_time = 0.0
+        
+    
+    def __call__( self, statement ):
+        
+        now = HydrusData.GetNowPrecise()
+        
+        self._Lap( now )
+        
+        self._current_statement = statement
+        self._current_statement_started = now
+        
+    
+    def _Lap( self, now ):
+        
+        if self._current_statement is not None:
+            
+            statement_time = now - self._current_statement_started
+            
+            if statement_time > self._slowest_statement_time:
+                
+                self._slowest_statement = self._current_statement
+                self._slowest_statement_time = statement_time
+                
+            
+        
+    
+    def GetSlowestStatement( self ):
+        
+        self._Lap( HydrusData.GetNowPrecise() )
+        
+        self._current_statement = None
+        
+        if self._slowest_statement is None:
+            
+            return ( None, None )
+            
+        
+        return ( self._slowest_statement[ : MAX_LOGGED_STATEMENT_LENGTH ], self._slowest_statement_time )
         
     
 class TemporaryIntegerTable( object ):
@@ -1688,6 +1688,8 @@ class JobDatabase( object ):
         self._args = args
         self._kwargs = kwargs
         
+        self._creation_time = GetNowPrecise()
+        
         self._result_ready = threading.Event()
         
     
@@ -1696,6 +1698,11 @@ class JobDatabase( object ):
         return ( self._action, self._args, self._kwargs )
         
     
+    def GetCreationTime( self ):
+        
+        return self._creation_time
+        
+    
     def GetResult( self ):
         
         time.sleep( 0.00001 ) # this one neat trick can save hassle on superquick jobs as event.wait can be laggy
@@ -14,6 +14,7 @@ no_wal = False
 no_db_temp_files = False
 db_memory_journaling = False
 db_synchronous_override = None
+db_read_connections = 2
 
 import_folders_running = False
 export_folders_running = False
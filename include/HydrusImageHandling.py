@@ -80,6 +80,8 @@ try:
         CV_JPEG_THUMBNAIL_ENCODE_PARAMS = []
         CV_PNG_THUMBNAIL_ENCODE_PARAMS = []
         
+        CV_IMREAD_REDUCED_COLOR_FLAGS = {}
+        
     else:
         
         CV_IMREAD_FLAGS_SUPPORTS_ALPHA = cv2.IMREAD_UNCHANGED
@@ -88,6 +90,8 @@ try:
         CV_JPEG_THUMBNAIL_ENCODE_PARAMS = [ cv2.IMWRITE_JPEG_QUALITY, 92 ]
         CV_PNG_THUMBNAIL_ENCODE_PARAMS = [ cv2.IMWRITE_PNG_COMPRESSION, 9 ]
         
+        CV_IMREAD_REDUCED_COLOR_FLAGS = { 2 : cv2.IMREAD_REDUCED_COLOR_2, 4 : cv2.IMREAD_REDUCED_COLOR_4, 8 : cv2.IMREAD_REDUCED_COLOR_8 }
+        
     
     OPENCV_OK = True
     
@@ -143,7 +147,7 @@ def Dequantize( pil_image ):
     
     return pil_image
     
-def GenerateNumPyImage( path, mime, force_pil = False ):
+def GenerateNumPyImage( path, mime, force_pil = False, minimum_resolution = None ):
     
     if HG.media_load_report_mode:
         
@@ -162,7 +166,7 @@ def GenerateNumPyImage( path, mime, force_pil = False ):
             HydrusData.ShowText( 'Loading with PIL' )
             
         
-        pil_image = GeneratePILImage( path )
+        pil_image = GeneratePILImage( path, minimum_resolution = minimum_resolution )
         
         numpy_image = GenerateNumPyImageFromPILImage( pil_image )
         
@@ -177,6 +181,16 @@ def GenerateNumPyImage( path, mime, force_pil = False ):
             
             flags = CV_IMREAD_FLAGS_SUPPORTS_EXIF_REORIENTATION
             
+            if minimum_resolution is not None:
+                
+                reduced_decode_factor = GetReducedDecodeFactor( GetJPEGResolution( path ), minimum_resolution )
+                
+                if reduced_decode_factor in CV_IMREAD_REDUCED_COLOR_FLAGS:
+                    
+                    flags = CV_IMREAD_REDUCED_COLOR_FLAGS[ reduced_decode_factor ]
+                    
+                
+            
         else:
             
             flags = CV_IMREAD_FLAGS_SUPPORTS_ALPHA
@@ -191,7 +205,7 @@ def GenerateNumPyImage( path, mime, force_pil = False ):
                 HydrusData.ShowText( 'OpenCV Failed, loading with PIL' )
                 
             
-            pil_image = GeneratePILImage( path )
+            pil_image = GeneratePILImage( path, minimum_resolution = minimum_resolution )
             
             numpy_image = GenerateNumPyImageFromPILImage( pil_image )
             
@@ -242,7 +256,7 @@ def GenerateNumPyImageFromPILImage( pil_image ):
     
     return numpy.fromstring( s, dtype = 'uint8' ).reshape( ( h, w, len( s ) // ( w * h ) ) )
     
-def GeneratePILImage( path ):
+def GeneratePILImage( path, minimum_resolution = None ):
     
     try:
         
@@ -253,6 +267,18 @@ def GeneratePILImage( path ):
         raise HydrusExceptions.MimeException( 'Could not load the image--it was likely malformed!' )
         
     
+    if minimum_resolution is not None and pil_image.format == 'JPEG':
+        
+        reduced_decode_factor = GetReducedDecodeFactor( pil_image.size, minimum_resolution )
+        
+        if reduced_decode_factor > 1:
+            
+            ( width, height ) = pil_image.size
+            
+            pil_image.draft( pil_image.mode, ( width // reduced_decode_factor, height // reduced_decode_factor ) )
+            
+        
+    
     if pil_image.format == 'JPEG' and hasattr( pil_image, '_getexif' ):
         
         try:
@@ -352,7 +378,7 @@ def GenerateThumbnailBytesFromStaticImagePath( path, target_resolution, mime ):
     
     if OPENCV_OK:
         
-        numpy_image = GenerateNumPyImage( path, mime )
+        numpy_image = GenerateNumPyImage( path, mime, minimum_resolution = target_resolution )
         
         thumbnail_numpy_image = ResizeNumPyImage( numpy_image, target_resolution )
         
@@ -368,13 +394,13 @@ def GenerateThumbnailBytesFromStaticImagePath( path, target_resolution, mime ):
             
         
     
-    pil_image = GeneratePILImage( path )
+    pil_image = GeneratePILImage( path, minimum_resolution = target_resolution )
     
     pil_image = Dequantize( pil_image )
     
     thumbnail_pil_image = pil_image.resize( target_resolution, PILImage.ANTIALIAS )
     
-    thumbnail_bytes = GenerateThumbnailBytesPIL( pil_image, mime )
+    thumbnail_bytes = GenerateThumbnailBytesPIL( thumbnail_pil_image, mime )
     
     return thumbnail_bytes
     
@@ -500,9 +526,16 @@ def GetImageProperties( path, mime ):
     
     if OPENCV_OK and mime not in PIL_ONLY_MIMETYPES: # webp here too maybe eventually, or offload it all to ffmpeg
         
-        numpy_image = GenerateNumPyImage( path, mime )
-        
-        ( width, height ) = GetResolutionNumPy( numpy_image )
+        if mime == HC.IMAGE_JPEG:
+            
+            ( width, height ) = GetJPEGOrientedResolution( path )
+            
+        else:
+            
+            numpy_image = GenerateNumPyImage( path, mime )
+            
+            ( width, height ) = GetResolutionNumPy( numpy_image )
+            
         
         duration = None
         num_frames = None
@@ -526,6 +559,58 @@ def GetImageProperties( path, mime ):
     
     return ( ( width, height ), duration, num_frames )
     
+def GetJPEGOrientedResolution( path ):
+    
+    # opencv applies exif rotation as it decodes, so we see which way round a cheap reduced decode comes out rather than trust our own exif parsing
+    
+    ( width, height ) = GetJPEGResolution( path )
+    
+    if width == height:
+        
+        return ( width, height )
+        
+    
+    for reduced_decode_factor in ( 8, 4, 2 ):
+        
+        if reduced_decode_factor not in CV_IMREAD_REDUCED_COLOR_FLAGS:
+            
+            continue
+            
+        
+        # libjpeg rounds scaled sizes up
+        reduced_width = ( width + reduced_decode_factor - 1 ) // reduced_decode_factor
+        reduced_height = ( height + reduced_decode_factor - 1 ) // reduced_decode_factor
+        
+        if reduced_width == reduced_height:
+            
+            continue
+            
+        
+        numpy_image = cv2.imread( path, flags = CV_IMREAD_REDUCED_COLOR_FLAGS[ reduced_decode_factor ] )
+        
+        if numpy_image is None:
+            
+            break
+            
+        
+        reduced_resolution = GetResolutionNumPy( numpy_image )
+        
+        if reduced_resolution == ( reduced_width, reduced_height ):
+            
+            return ( width, height )
+            
+        elif reduced_resolution == ( reduced_height, reduced_width ):
+            
+            return ( height, width )
+            
+        
+        break
+        
+    
+    numpy_image = GenerateNumPyImage( path, HC.IMAGE_JPEG )
+    
+    return GetResolutionNumPy( numpy_image )
+    
 # bigger number is worse quality
 # this is very rough and misses some finesse
 def GetJPEGQuantizationQualityEstimate( path ):
@@ -583,6 +668,20 @@ def GetJPEGQuantizationQualityEstimate( path ):
     
     return ( 'unknown', None )
     
+def GetJPEGResolution( path ):
+    
+    try:
+        
+        with PILImage.open( path ) as pil_image:
+            
+            return pil_image.size
+            
+        
+    except Exception as e:
+        
+        raise HydrusExceptions.MimeException( 'Could not load the image--it was likely malformed!' )
+        
+    
 def GetPSDResolution( path ):
     
     with open( path, 'rb' ) as f:
@@ -598,6 +697,27 @@ def GetPSDResolution( path ):
     
     return ( width, height )
     
+def GetReducedDecodeFactor( image_resolution, minimum_resolution ):
+    
+    # a jpeg can be decoded straight to 1/2, 1/4 or 1/8 size for a fraction of the work, so if we only want a small image, we pick the smallest of those that is still big enough
+    # we do not know yet if exif will rotate the image, so the result has to be big enough either way round
+    
+    ( image_width, image_height ) = image_resolution
+    ( minimum_width, minimum_height ) = minimum_resolution
+    
+    smallest_image_side = min( image_width, image_height )
+    largest_minimum_side = max( minimum_width, minimum_height )
+    
+    for reduced_decode_factor in ( 8, 4, 2 ):
+        
+        if smallest_image_side // reduced_decode_factor >= largest_minimum_side:
+            
+            return reduced_decode_factor
+            
+        
+    
+    return 1
+    
 def GetResolutionNumPy( numpy_image ):
     
     ( image_height, image_width, depth ) = numpy_image.shape
@@ -1,3 +1,4 @@
+import array
 import collections
 from . import HydrusConstants as HC
 from . import HydrusData
@@ -5,15 +6,78 @@ from . import HydrusExceptions
 from . import HydrusGlobals as HG
 from . import HydrusNetworking
 from . import HydrusSerialisable
+import itertools
+import operator
+import sys
 import threading
 import urllib
+import zlib
 
-INT_PARAMS = { 'expires', 'num', 'since', 'content_type', 'action', 'status' }
+INT_PARAMS = { 'expires', 'num', 'since', 'content_type', 'action', 'status', 'update_encoding' }
 BYTE_PARAMS = { 'access_key', 'account_type_key', 'subject_account_key', 'hash', 'registration_key', 'subject_hash', 'update_hash' }
 STRING_PARAMS = { 'subject_tag' }
 JSON_PARAMS = set()
 JSON_BYTE_LIST_PARAMS = set()
 
+# a columnar update is a binary dump that keeps its ids in blobs, as zlib'd arrays of deltas in the smallest int type that fits
+# the server writes every update both ways, and only clients that ask for columnar updates get those hashes in their metadata
+
+UPDATE_ENCODING_JSON = 0
+UPDATE_ENCODING_COLUMNAR = 1
+
+INTEGER_COLUMN_TYPECODES = ( 'b', 'h', 'i', 'q' )
+
+def DecodeIntegerColumn( column_info, blobs ):
+    
+    ( blob_index, typecode ) = column_info
+    
+    deltas = array.array( typecode )
+    
+    deltas.frombytes( zlib.decompress( blobs[ blob_index ] ) )
+    
+    if sys.byteorder == 'big':
+        
+        deltas.byteswap()
+        
+    
+    return array.array( 'q', itertools.accumulate( deltas ) )
+    
+def EncodeIntegerColumn( ints, blobs ):
+    
+    ints = array.array( 'q', ints )
+    
+    deltas = array.array( 'q', map( operator.sub, ints, itertools.chain( ( 0, ), ints ) ) )
+    
+    if len( deltas ) == 0:
+        
+        ( smallest, largest ) = ( 0, 0 )
+        
+    else:
+        
+        ( smallest, largest ) = ( min( deltas ), max( deltas ) )
+        
+    
+    for typecode in INTEGER_COLUMN_TYPECODES:
+        
+        limit = 2 ** ( 8 * array.array( typecode ).itemsize - 1 )
+        
+        if -limit <= smallest and largest < limit:
+            
+            break
+            
+        
+    
+    deltas = array.array( typecode, deltas )
+    
+    if sys.byteorder == 'big':
+        
+        deltas.byteswap()
+        
+    
+    blobs.append( zlib.compress( deltas.tobytes(), 9 ) )
+    
+    return ( len( blobs ) - 1, typecode )
+    
 def GenerateDefaultServiceDictionary( service_type ):
     
     dictionary = HydrusSerialisable.SerialisableDictionary()
@@ -1244,6 +1308,58 @@ class ContentUpdate( HydrusSerialisable.SerialisableBase ):
         
         self._content_data = {}
         
+        # columnar mappings stay as ( tag_ids, counts, hash_ids ) arrays until someone asks for them
+        
+        self._mappings_columns = {}
+        
+    
+    def _DecodeColumns( self, content_type, encoded_datas, blobs ):
+        
+        columns = [ DecodeIntegerColumn( column_info, blobs ) for column_info in encoded_datas[ 'columns' ] ]
+        
+        if content_type == HC.CONTENT_TYPE_MAPPINGS:
+            
+            return tuple( columns )
+            
+        elif len( columns ) == 2:
+            
+            return list( zip( *columns ) )
+            
+        else:
+            
+            ( column, ) = columns
+            
+            return column
+            
+        
+    
+    def _EncodeColumns( self, content_type, action, datas, blobs ):
+        
+        if content_type == HC.CONTENT_TYPE_MAPPINGS:
+            
+            tag_ids = EncodeIntegerColumn( ( tag_id for ( tag_id, hash_ids ) in datas ), blobs )
+            counts = EncodeIntegerColumn( ( len( hash_ids ) for ( tag_id, hash_ids ) in datas ), blobs )
+            hash_ids = EncodeIntegerColumn( itertools.chain.from_iterable( ( hash_ids for ( tag_id, hash_ids ) in datas ) ), blobs )
+            
+            columns = [ tag_ids, counts, hash_ids ]
+            
+        elif content_type in ( HC.CONTENT_TYPE_TAG_PARENTS, HC.CONTENT_TYPE_TAG_SIBLINGS ):
+            
+            columns = [ EncodeIntegerColumn( ( pair[0] for pair in datas ), blobs ), EncodeIntegerColumn( ( pair[1] for pair in datas ), blobs ) ]
+            
+        elif content_type == HC.CONTENT_TYPE_FILES and action == HC.CONTENT_UPDATE_DELETE:
+            
+            columns = [ EncodeIntegerColumn( datas, blobs ) ]
+            
+        else:
+            
+            # new file rows have sizes, mimes and nulls, so they stay as json
+            
+            return datas
+            
+        
+        return { 'columns' : columns }
+        
     
     def _GetContent( self, content_type, action ):
         
@@ -1258,13 +1374,64 @@ class ContentUpdate( HydrusSerialisable.SerialisableBase ):
         return []
         
     
+    def _GetMappings( self, action ):
+        
+        if action in self._mappings_columns:
+            
+            ( tag_ids, counts, hash_ids ) = self._mappings_columns[ action ]
+            
+            ends = list( itertools.accumulate( counts ) )
+            
+            return ( ( tag_id, hash_ids[ start : end ] ) for ( tag_id, start, end ) in zip( tag_ids, itertools.chain( ( 0, ), ends ), ends ) )
+            
+        else:
+            
+            return self._GetContent( HC.CONTENT_TYPE_MAPPINGS, action )
+            
+        
+    
+    def _GetMappingsRows( self, action ):
+        
+        if action in self._mappings_columns:
+            
+            ( tag_ids, counts, hash_ids ) = self._mappings_columns[ action ]
+            
+            return zip( itertools.chain.from_iterable( map( itertools.repeat, tag_ids, counts ) ), hash_ids )
+            
+        else:
+            
+            return ( ( tag_id, hash_id ) for ( tag_id, hash_ids ) in self._GetContent( HC.CONTENT_TYPE_MAPPINGS, action ) for hash_id in hash_ids )
+            
+        
+    
     def _GetSerialisableInfo( self ):
         
+        blobs = HydrusSerialisable.GetBinaryDumpBlobs()
+        
         serialisable_info = []
         
-        for ( content_type, actions_to_datas ) in list(self._content_data.items()):
+        content_data = { content_type : dict( actions_to_datas ) for ( content_type, actions_to_datas ) in self._content_data.items() }
+        
+        for action in self._mappings_columns:
+            
+            if HC.CONTENT_TYPE_MAPPINGS not in content_data:
+                
+                content_data[ HC.CONTENT_TYPE_MAPPINGS ] = {}
+                
+            
+            content_data[ HC.CONTENT_TYPE_MAPPINGS ][ action ] = [ ( tag_id, list( hash_ids ) ) for ( tag_id, hash_ids ) in self._GetMappings( action ) ]
+            
+        
+        for ( content_type, actions_to_datas ) in list(content_data.items()):
             
-            serialisable_actions_to_datas = list(actions_to_datas.items())
+            if blobs is None:
+                
+                serialisable_actions_to_datas = list(actions_to_datas.items())
+                
+            else:
+                
+                serialisable_actions_to_datas = [ ( action, self._EncodeColumns( content_type, action, datas, blobs ) ) for ( action, datas ) in actions_to_datas.items() ]
+                
             
             serialisable_info.append( ( content_type, serialisable_actions_to_datas ) )
             
@@ -1276,7 +1443,24 @@ class ContentUpdate( HydrusSerialisable.SerialisableBase ):
         
         for ( content_type, serialisable_actions_to_datas ) in serialisable_info:
             
-            actions_to_datas = dict( serialisable_actions_to_datas )
+            actions_to_datas = {}
+            
+            for ( action, datas ) in serialisable_actions_to_datas:
+                
+                if isinstance( datas, dict ):
+                    
+                    datas = self._DecodeColumns( content_type, datas, HydrusSerialisable.GetBinaryLoadBlobs() )
+                    
+                    if content_type == HC.CONTENT_TYPE_MAPPINGS:
+                        
+                        self._mappings_columns[ action ] = datas
+                        
+                        continue
+                        
+                    
+                
+                actions_to_datas[ action ] = datas
+                
             
             self._content_data[ content_type ] = actions_to_datas
             
@@ -1306,7 +1490,12 @@ class ContentUpdate( HydrusSerialisable.SerialisableBase ):
     
     def GetDeletedMappings( self ):
         
-        return self._GetContent( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_DELETE )
+        return self._GetMappings( HC.CONTENT_UPDATE_DELETE )
+        
+    
+    def GetDeletedMappingsRows( self ):
+        
+        return self._GetMappingsRows( HC.CONTENT_UPDATE_DELETE )
         
     
     def GetDeletedTagParents( self ):
@@ -1326,7 +1515,14 @@ class ContentUpdate( HydrusSerialisable.SerialisableBase ):
     
     def GetNewMappings( self ):
         
-        return self._GetContent( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_ADD )
+        return self._GetMappings( HC.CONTENT_UPDATE_ADD )
+        
+    
+    def GetNewMappingsRows( self ):
+        
+        # flat ( service_tag_id, service_hash_id ) rows. for a columnar update, these come straight off the arrays without a python loop
+        
+        return self._GetMappingsRows( HC.CONTENT_UPDATE_ADD )
         
     
     def GetNewTagParents( self ):
@@ -1362,6 +1558,11 @@ class ContentUpdate( HydrusSerialisable.SerialisableBase ):
                 
             
         
+        for ( tag_ids, counts, hash_ids ) in self._mappings_columns.values():
+            
+            num += len( hash_ids )
+            
+        
         return num
         
     
@@ -1568,16 +1769,45 @@ class DefinitionsUpdate( HydrusSerialisable.SerialisableBase ):
     
     def _GetSerialisableInfo( self ):
         
+        blobs = HydrusSerialisable.GetBinaryDumpBlobs()
+        
         serialisable_info = []
         
         if len( self._hash_ids_to_hashes ) > 0:
             
-            serialisable_info.append( ( HC.DEFINITIONS_TYPE_HASHES, [ ( hash_id, hash.hex() ) for ( hash_id, hash ) in list(self._hash_ids_to_hashes.items()) ] ) )
+            hash_lengths = { len( hash ) for hash in self._hash_ids_to_hashes.values() }
+            
+            if blobs is None or len( hash_lengths ) > 1:
+                
+                serialisable_info.append( ( HC.DEFINITIONS_TYPE_HASHES, [ ( hash_id, hash.hex() ) for ( hash_id, hash ) in list(self._hash_ids_to_hashes.items()) ] ) )
+                
+            else:
+                
+                ( hash_length, ) = hash_lengths
+                
+                ids = EncodeIntegerColumn( self._hash_ids_to_hashes.keys(), blobs )
+                
+                blobs.append( b''.join( self._hash_ids_to_hashes.values() ) )
+                
+                serialisable_info.append( ( HC.DEFINITIONS_TYPE_HASHES, { 'ids' : ids, 'hashes' : ( len( blobs ) - 1, hash_length ) } ) )
+                
             
         
         if len( self._tag_ids_to_tags ) > 0:
             
-            serialisable_info.append( ( HC.DEFINITIONS_TYPE_TAGS, list(self._tag_ids_to_tags.items()) ) )
+            if blobs is None:
+                
+                serialisable_info.append( ( HC.DEFINITIONS_TYPE_TAGS, list(self._tag_ids_to_tags.items()) ) )
+                
+            else:
+                
+                ids = EncodeIntegerColumn( self._tag_ids_to_tags.keys(), blobs )
+                lengths = EncodeIntegerColumn( ( len( tag ) for tag in self._tag_ids_to_tags.values() ), blobs )
+                
+                blobs.append( zlib.compress( bytes( ''.join( self._tag_ids_to_tags.values() ), 'utf-8' ), 9 ) )
+                
+                serialisable_info.append( ( HC.DEFINITIONS_TYPE_TAGS, { 'ids' : ids, 'lengths' : lengths, 'text' : len( blobs ) - 1 } ) )
+                
             
         
         return serialisable_info
@@ -1587,7 +1817,34 @@ class DefinitionsUpdate( HydrusSerialisable.SerialisableBase ):
         
         for ( definition_type, definitions ) in serialisable_info:
             
-            if definition_type == HC.DEFINITIONS_TYPE_HASHES:
+            if isinstance( definitions, dict ):
+                
+                blobs = HydrusSerialisable.GetBinaryLoadBlobs()
+                
+                ids = DecodeIntegerColumn( definitions[ 'ids' ], blobs )
+                
+                if definition_type == HC.DEFINITIONS_TYPE_HASHES:
+                    
+                    ( blob_index, hash_length ) = definitions[ 'hashes' ]
+                    
+                    blob = blobs[ blob_index ]
+                    
+                    hashes = [ blob[ i : i + hash_length ] for i in range( 0, len( blob ), hash_length ) ]
+                    
+                    self._hash_ids_to_hashes = dict( zip( ids, hashes ) )
+                    
+                elif definition_type == HC.DEFINITIONS_TYPE_TAGS:
+                    
+                    text = str( zlib.decompress( blobs[ definitions[ 'text' ] ] ), 'utf-8' )
+                    
+                    ends = list( itertools.accumulate( DecodeIntegerColumn( definitions[ 'lengths' ], blobs ) ) )
+                    
+                    tags = [ text[ start : end ] for ( start, end ) in zip( itertools.chain( ( 0, ), ends ), ends ) ]
+                    
+                    self._tag_ids_to_tags = dict( zip( ids, tags ) )
+                    
+                
+            elif definition_type == HC.DEFINITIONS_TYPE_HASHES:
                 
                 self._hash_ids_to_hashes = { hash_id : bytes.fromhex( encoded_hash ) for ( hash_id, encoded_hash ) in definitions }
                 
@@ -1814,11 +2071,16 @@ class Metadata( HydrusSerialisable.SerialisableBase ):
             
         
     
-    def GetSlice( self, from_update_index ):
+    def GetSlice( self, from_update_index, update_hash_substitutions = None ):
+        
+        if update_hash_substitutions is None:
+            
+            update_hash_substitutions = {}
+            
         
         with self._lock:
             
-            metadata = { update_index : row for ( update_index, row ) in list(self._metadata.items()) if update_index >= from_update_index }
+            metadata = { update_index : ( [ update_hash_substitutions.get( update_hash, update_hash ) for update_hash in update_hashes ], begin, end ) for ( update_index, ( update_hashes, begin, end ) ) in list(self._metadata.items()) if update_index >= from_update_index }
             
             return Metadata( metadata, self._next_update_due )
             
@@ -2305,6 +2567,36 @@ class ServerServiceRepository( ServerServiceRestricted ):
         
         self._metadata = dictionary[ 'metadata' ]
         
+        self._update_hashes_to_columnar_update_hashes = None
+        self._columnar_update_hashes = None
+        
+    
+    def _LoadColumnarUpdateHashes( self ):
+        
+        with self._lock:
+            
+            if self._update_hashes_to_columnar_update_hashes is not None:
+                
+                return
+                
+            
+            service_key = self._service_key
+            
+        
+        # the pairing only grows, and in memory, so we only ever read it once
+        # the read happens outside the lock, and if someone beat us to it, theirs is as good as ours
+        
+        update_hashes_to_columnar_update_hashes = HG.server_controller.Read( 'columnar_update_hashes', service_key )
+        
+        with self._lock:
+            
+            if self._update_hashes_to_columnar_update_hashes is None:
+                
+                self._update_hashes_to_columnar_update_hashes = update_hashes_to_columnar_update_hashes
+                self._columnar_update_hashes = set( update_hashes_to_columnar_update_hashes.values() )
+                
+            
+        
     
     def GetMetadata( self ):
         
@@ -2314,11 +2606,25 @@ class ServerServiceRepository( ServerServiceRestricted ):
             
         
     
-    def GetMetadataSlice( self, from_update_index ):
+    def GetMetadataSlice( self, from_update_index, update_encoding = UPDATE_ENCODING_JSON ):
+        
+        if update_encoding == UPDATE_ENCODING_COLUMNAR:
+            
+            self._LoadColumnarUpdateHashes()
+            
         
         with self._lock:
             
-            return self._metadata.GetSlice( from_update_index )
+            update_hash_substitutions = None
+            
+            if update_encoding == UPDATE_ENCODING_COLUMNAR:
+                
+                # updates from before columnar updates do not have a twin, so they stay as they are
+                
+                update_hash_substitutions = self._update_hashes_to_columnar_update_hashes
+                
+            
+            return self._metadata.GetSlice( from_update_index, update_hash_substitutions = update_hash_substitutions )
             
         
     
@@ -2326,7 +2632,19 @@ class ServerServiceRepository( ServerServiceRestricted ):
         
         with self._lock:
             
-            return self._metadata.HasUpdateHash( update_hash )
+            if self._metadata.HasUpdateHash( update_hash ):
+                
+                return True
+                
+            
+        
+        # columnar twins are not in the metadata
+        
+        self._LoadColumnarUpdateHashes()
+        
+        with self._lock:
+            
+            return update_hash in self._columnar_update_hashes
             
         
     
@@ -2348,6 +2666,10 @@ class ServerServiceRepository( ServerServiceRestricted ):
             
             try:
                 
+                # we extend the pairing below, so it has to be there before the new pairs hit the db
+                
+                self._LoadColumnarUpdateHashes()
+                
                 while update_due:
                     
                     with self._lock:
@@ -2359,7 +2681,14 @@ class ServerServiceRepository( ServerServiceRestricted ):
                     
                     end = begin + HC.UPDATE_DURATION
                     
-                    update_hashes = HG.server_controller.WriteSynchronous( 'create_update', service_key, begin, end )
+                    # the files are generated off a read connection, so only recording them needs the write lock
+                    # committing first means that connection's snapshot has everything up to the end of the period
+                    
+                    HG.server_controller.WriteSynchronous( 'commit' )
+                    
+                    ( update_hashes, columnar_update_hashes ) = HG.server_controller.ReadSnapshot( 'update_files', service_key, begin, end )
+                    
+                    HG.server_controller.WriteSynchronous( 'create_update', service_key, update_hashes, columnar_update_hashes )
                     
                     next_update_due = end + HC.UPDATE_DURATION + 1
                     
@@ -2367,6 +2696,9 @@ class ServerServiceRepository( ServerServiceRestricted ):
                         
                         self._metadata.AppendUpdate( update_hashes, begin, end, next_update_due )
                         
+                        self._update_hashes_to_columnar_update_hashes.update( zip( update_hashes, columnar_update_hashes ) )
+                        self._columnar_update_hashes.update( columnar_update_hashes )
+                        
                         update_due = self._metadata.UpdateDue()
                         
                     
@@ -2474,13 +2806,22 @@ class ServerServiceAdmin( ServerServiceRestricted ):
     
 class UpdateBuilder( object ):
     
-    def __init__( self, update_class, max_rows ):
+    def __init__( self, update_class, max_rows, update_callable = None ):
         
         self._update_class = update_class
         self._max_rows = max_rows
         
         self._updates = []
         
+        # with a callable, each update is handed over as soon as it fills rather than all of them being held to the end
+        
+        if update_callable is None:
+            
+            update_callable = self._updates.append
+            
+        
+        self._update_callable = update_callable
+        
         self._current_update = self._update_class()
         self._current_num_rows = 0
         
@@ -2492,7 +2833,7 @@ class UpdateBuilder( object ):
         
         if self._current_num_rows > self._max_rows:
             
-            self._updates.append( self._current_update )
+            self._update_callable( self._current_update )
             
             self._current_update = self._update_class()
             self._current_num_rows = 0
@@ -2503,7 +2844,7 @@ class UpdateBuilder( object ):
         
         if self._current_update.GetNumRows() > 0:
             
-            self._updates.append( self._current_update )
+            self._update_callable( self._current_update )
             
         
         self._current_update = None
@@ -1,4 +1,7 @@
+from . import HydrusExceptions
 import json
+import struct
+import threading
 import zlib
 
 LZ4_OK = False
@@ -94,11 +97,62 @@ SERIALISABLE_TYPE_CLIENT_API_PERMISSIONS = 76
 SERIALISABLE_TYPE_SERVICE_KEYS_TO_TAGS = 77
 SERIALISABLE_TYPE_MEDIA_COLLECT = 78
 SERIALISABLE_TYPE_TAG_DISPLAY_MANAGER = 79
+SERIALISABLE_TYPE_BINARY_CHILD = 80
 
 SERIALISABLE_TYPES_TO_OBJECT_TYPES = {}
 
+# binary dumps are: magic, compression type, blob count, length-prefixed blobs, then the compressed json tuple
+# lazy children are stored as blobs, so loading the parent does not have to decompress or parse them
+
+BINARY_MAGIC = b'\x00HS1'
+
+BINARY_COMPRESSION_NONE = 0
+BINARY_COMPRESSION_LZ4 = 1
+BINARY_COMPRESSION_ZLIB = 2
+
+binary_context = threading.local()
+
+def CreateFromBinary( binary ):
+    
+    ( obj_tuple, blobs ) = UnpackBinary( binary )
+    
+    return CreateFromSerialisableTuple( obj_tuple, blobs = blobs )
+    
+def CreateFromBinaryChild( serialisable_info ):
+    
+    ( serialisable_type, version, blob_index, summary ) = serialisable_info
+    
+    load_stack = GetBinaryLoadStack()
+    
+    if len( load_stack ) == 0:
+        
+        raise HydrusExceptions.SerialisationException( 'Found a binary child outside of a binary dump!' )
+        
+    
+    binary = load_stack[-1][ blob_index ]
+    
+    obj = SERIALISABLE_TYPES_TO_OBJECT_TYPES[ serialisable_type ]()
+    
+    if version == obj.SERIALISABLE_VERSION and summary is not None:
+        
+        obj.InitialiseLazily( binary, summary )
+        
+    else:
+        
+        # an old version needs to go through the update code, so it has to load now
+        
+        obj.InitialiseFromBinary( binary )
+        
+    
+    return obj
+    
 def CreateFromNetworkBytes( network_string ):
     
+    if IsBinary( network_string ):
+        
+        return CreateFromBinary( network_string )
+        
+    
     try:
         
         obj_bytes = zlib.decompress( network_string )
@@ -125,12 +179,33 @@ def CreateFromString( obj_string ):
     
     return CreateFromSerialisableTuple( obj_tuple )
     
-def CreateFromSerialisableTuple( obj_tuple ):
+def CreateFromSerialisableTuple( obj_tuple, blobs = None ):
+    
+    if blobs is not None:
+        
+        load_stack = GetBinaryLoadStack()
+        
+        load_stack.append( blobs )
+        
+        try:
+            
+            return CreateFromSerialisableTuple( obj_tuple )
+            
+        finally:
+            
+            load_stack.pop()
+            
+        
     
     if len( obj_tuple ) == 3:
         
         ( serialisable_type, version, serialisable_info ) = obj_tuple
         
+        if serialisable_type == SERIALISABLE_TYPE_BINARY_CHILD:
+            
+            return CreateFromBinaryChild( serialisable_info )
+            
+        
         obj = SERIALISABLE_TYPES_TO_OBJECT_TYPES[ serialisable_type ]()
         
     else:
@@ -144,6 +219,50 @@ def CreateFromSerialisableTuple( obj_tuple ):
     
     return obj
     
+def GetBinaryDumpBlobs():
+    
+    # the blobs of the binary dump in progress, or None if this is a json dump
+    
+    dump_stack = GetBinaryDumpStack()
+    
+    if len( dump_stack ) == 0:
+        
+        return None
+        
+    
+    ( dump_root, blobs ) = dump_stack[-1]
+    
+    return blobs
+    
+def GetBinaryDumpStack():
+    
+    if not hasattr( binary_context, 'dump_stack' ):
+        
+        binary_context.dump_stack = []
+        
+    
+    return binary_context.dump_stack
+    
+def GetBinaryLoadBlobs():
+    
+    load_stack = GetBinaryLoadStack()
+    
+    if len( load_stack ) == 0:
+        
+        raise HydrusExceptions.SerialisationException( 'Looked for binary blobs outside of a binary dump!' )
+        
+    
+    return load_stack[-1]
+    
+def GetBinaryLoadStack():
+    
+    if not hasattr( binary_context, 'load_stack' ):
+        
+        binary_context.load_stack = []
+        
+    
+    return binary_context.load_stack
+    
 def GetNonDupeName( original_name, disallowed_names ):
     
     i = 1
@@ -159,11 +278,91 @@ def GetNonDupeName( original_name, disallowed_names ):
     
     return non_dupe_name
     
+def IsBinary( dump ):
+    
+    return isinstance( dump, bytes ) and dump.startswith( BINARY_MAGIC )
+    
+def PackBinary( obj_tuple, blobs, compression = None ):
+    
+    obj_bytes = bytes( json.dumps( obj_tuple ), 'utf-8' )
+    
+    if compression is None:
+        
+        compression = BINARY_COMPRESSION_LZ4 if LZ4_OK else BINARY_COMPRESSION_ZLIB
+        
+    
+    if compression == BINARY_COMPRESSION_LZ4:
+        
+        obj_bytes = lz4.block.compress( obj_bytes )
+        
+    elif compression == BINARY_COMPRESSION_ZLIB:
+        
+        obj_bytes = zlib.compress( obj_bytes, 1 )
+        
+    
+    chunks = [ BINARY_MAGIC, struct.pack( '<BI', compression, len( blobs ) ) ]
+    
+    for blob in blobs:
+        
+        chunks.append( struct.pack( '<I', len( blob ) ) )
+        chunks.append( blob )
+        
+    
+    chunks.append( obj_bytes )
+    
+    return b''.join( chunks )
+    
 def SetNonDupeName( obj, disallowed_names ):
     
     non_dupe_name = GetNonDupeName( obj.GetName(), disallowed_names )
     
     obj.SetName( non_dupe_name )
+    
+def UnpackBinary( binary ):
+    
+    if not IsBinary( binary ):
+        
+        raise HydrusExceptions.SerialisationException( 'That was not a binary dump!' )
+        
+    
+    offset = len( BINARY_MAGIC )
+    
+    ( compression, num_blobs ) = struct.unpack_from( '<BI', binary, offset )
+    
+    offset += 5
+    
+    blobs = []
+    
+    for i in range( num_blobs ):
+        
+        ( blob_length, ) = struct.unpack_from( '<I', binary, offset )
+        
+        offset += 4
+        
+        blobs.append( binary[ offset : offset + blob_length ] )
+        
+        offset += blob_length
+        
+    
+    obj_bytes = binary[ offset : ]
+    
+    if compression == BINARY_COMPRESSION_LZ4:
+        
+        if not LZ4_OK:
+            
+            raise HydrusExceptions.SerialisationException( 'That binary dump needs lz4 to load, but lz4 is not available!' )
+            
+        
+        obj_bytes = lz4.block.decompress( obj_bytes )
+        
+    elif compression == BINARY_COMPRESSION_ZLIB:
+        
+        obj_bytes = zlib.decompress( obj_bytes )
+        
+    
+    obj_tuple = json.loads( obj_bytes )
+    
+    return ( obj_tuple, blobs )
 
 class SerialisableBase( object ):
     
@@ -171,6 +370,39 @@ class SerialisableBase( object ):
     SERIALISABLE_NAME = 'Base Serialisable Object'
     SERIALISABLE_VERSION = 1
     
+    # the db stores these as binary dumps
+    SERIALISABLE_BINARY_DUMP = False
+    # these go in their own blob in a binary dump and are not parsed until they are needed
+    SERIALISABLE_LAZY_LOAD = False
+    
+    def _GetBinaryChildSerialisableTuple( self, blobs ):
+        
+        with self._lock:
+            
+            binary = self._GetLazyBinary()
+            summary = self._GetLazySummary()
+            
+        
+        if binary is None:
+            
+            binary = self.DumpToBinary()
+            
+        
+        blobs.append( binary )
+        
+        return ( SERIALISABLE_TYPE_BINARY_CHILD, 1, ( self.SERIALISABLE_TYPE, self.SERIALISABLE_VERSION, len( blobs ) - 1, summary ) )
+        
+    
+    def _GetLazyBinary( self ):
+        
+        return None
+        
+    
+    def _GetLazySummary( self ):
+        
+        return None
+        
+    
     def _GetSerialisableInfo( self ):
         
         raise NotImplementedError()
@@ -181,11 +413,36 @@ class SerialisableBase( object ):
         raise NotImplementedError()
         
     
+    def _InitialiseLazily( self, binary, summary ):
+        
+        raise NotImplementedError()
+        
+    
     def _UpdateSerialisableInfo( self, version, old_serialisable_info ):
         
         return old_serialisable_info
         
     
+    def DumpToBinary( self, compression = None ):
+        
+        blobs = []
+        
+        dump_stack = GetBinaryDumpStack()
+        
+        dump_stack.append( ( self, blobs ) )
+        
+        try:
+            
+            obj_tuple = self.GetSerialisableTuple()
+            
+        finally:
+            
+            dump_stack.pop()
+            
+        
+        return PackBinary( obj_tuple, blobs, compression = compression )
+        
+    
     def DumpToNetworkBytes( self ):
         
         obj_string = self.DumpToString()
@@ -197,7 +454,20 @@ class SerialisableBase( object ):
     
     def DumpToString( self ):
         
-        obj_tuple = self.GetSerialisableTuple()
+        # a json dump has nowhere to put binary children, even if it happens inside a binary dump
+        
+        dump_stack = GetBinaryDumpStack()
+        
+        dump_stack.append( ( self, None ) )
+        
+        try:
+            
+            obj_tuple = self.GetSerialisableTuple()
+            
+        finally:
+            
+            dump_stack.pop()
+            
         
         return json.dumps( obj_tuple )
         
@@ -209,6 +479,23 @@ class SerialisableBase( object ):
     
     def GetSerialisableTuple( self ):
         
+        if self.SERIALISABLE_LAZY_LOAD:
+            
+            dump_stack = GetBinaryDumpStack()
+            
+            if len( dump_stack ) > 0:
+                
+                ( dump_root, blobs ) = dump_stack[-1]
+                
+                # lazy children of lazy children are stored inline, so a lazy child never needs a blob context to load
+                
+                if blobs is not None and dump_root is not self and not dump_root.SERIALISABLE_LAZY_LOAD:
+                    
+                    return self._GetBinaryChildSerialisableTuple( blobs )
+                    
+                
+            
+        
         if hasattr( self, '_lock' ):
             
             with getattr( self, '_lock' ):
@@ -224,6 +511,26 @@ class SerialisableBase( object ):
         return ( self.SERIALISABLE_TYPE, self.SERIALISABLE_VERSION, serialisable_info )
         
     
+    def InitialiseFromBinary( self, binary ):
+        
+        ( obj_tuple, blobs ) = UnpackBinary( binary )
+        
+        ( serialisable_type, version, serialisable_info ) = obj_tuple
+        
+        load_stack = GetBinaryLoadStack()
+        
+        load_stack.append( blobs )
+        
+        try:
+            
+            self.InitialiseFromSerialisableInfo( version, serialisable_info )
+            
+        finally:
+            
+            load_stack.pop()
+            
+        
+    
     def InitialiseFromSerialisableInfo( self, version, serialisable_info ):
         
         while version < self.SERIALISABLE_VERSION:
@@ -234,6 +541,18 @@ class SerialisableBase( object ):
         self._InitialiseFromSerialisableInfo( serialisable_info )
         
     
+    def InitialiseLazily( self, binary, summary ):
+        
+        if self.SERIALISABLE_LAZY_LOAD:
+            
+            self._InitialiseLazily( binary, summary )
+            
+        else:
+            
+            self.InitialiseFromBinary( binary )
+            
+        
+    
 class SerialisableBaseNamed( SerialisableBase ):
     
     SERIALISABLE_TYPE = SERIALISABLE_TYPE_BASE_NAMED
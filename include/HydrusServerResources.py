@@ -12,7 +12,8 @@ from twisted.internet import reactor, defer
 from twisted.internet.threads import deferToThread
 from twisted.web.server import NOT_DONE_YET
 from twisted.web.resource import Resource
-from twisted.web.static import File as FileResource, NoRangeStaticProducer
+from twisted.web import http
+from twisted.web.static import File as FileResource
 from . import HydrusData
 from . import HydrusGlobals as HG
 
@@ -208,6 +209,60 @@ def GenerateEris( service ):
                                      <font color="gray">MMMM</font>
 </pre></body></html>'''
     
+def IfRangeMatches( request, etag, last_modified_timestamp ):
+    
+    # a resumed download only gets the rest of the file if the file is still the one it started with
+    
+    if_range = request.getHeader( 'If-Range' )
+    
+    if if_range is None:
+        
+        return True
+        
+    
+    if if_range.startswith( '"' ):
+        
+        return if_range == etag
+        
+    
+    try:
+        
+        return http.stringToDatetime( if_range ) == last_modified_timestamp
+        
+    except:
+        
+        return False
+        
+    
+def IsNotModified( request, etag, last_modified_timestamp ):
+    
+    if_none_match = request.getHeader( 'If-None-Match' )
+    
+    if if_none_match is not None:
+        
+        # when there are etags, If-Modified-Since is ignored
+        
+        etags = ParseETags( if_none_match )
+        
+        return etag in etags or '*' in etags
+        
+    
+    if_modified_since = request.getHeader( 'If-Modified-Since' )
+    
+    if if_modified_since is not None:
+        
+        try:
+            
+            return last_modified_timestamp <= http.stringToDatetime( if_modified_since )
+            
+        except:
+            
+            return False
+            
+        
+    
+    return False
+    
 def ParseFileArguments( path, decompression_bombs_ok = False ):
     
     HydrusImageHandling.ConvertToPngIfBmp( path )
@@ -269,6 +324,26 @@ def ParseFileArguments( path, decompression_bombs_ok = False ):
     
     return args
     
+def ParseETags( etags_string ):
+    
+    etags = set()
+    
+    for etag in etags_string.split( ',' ):
+        
+        etag = etag.strip()
+        
+        # conditional GET compares weakly, so W/"abc" matches "abc"
+        
+        if etag.startswith( 'W/' ):
+            
+            etag = etag[2:]
+            
+        
+        etags.add( etag )
+        
+    
+    return etags
+    
 hydrus_favicon = FileResource( os.path.join( HC.STATIC_DIR, 'hydrus.ico' ), defaultType = 'image/x-icon' )
 
 class HydrusDomain( object ):
@@ -432,32 +507,76 @@ class HydrusResource( Resource ):
             
             path = response_context.GetPath()
             
-            size = os.path.getsize( path )
+            file_resource = FileResource( path )
+            
+            last_modified_timestamp = int( file_resource.getModificationTime() )
             
             mime = response_context.GetMime()
             
             content_type = HC.mime_mimetype_string_lookup[ mime ]
             
-            content_length = size
-            
             ( base, filename ) = os.path.split( path )
             
             content_disposition = 'inline; filename="' + filename + '"'
             
-            request.setHeader( 'Content-Type', str( content_type ) )
-            request.setHeader( 'Content-Length', str( content_length ) )
+            if response_context.HasHash():
+                
+                # the hash is of the content itself, so this exact response is good forever
+                
+                etag = '"' + response_context.GetHash().hex() + '"'
+                
+                cache_control = 'max-age={}, immutable'.format( 86400 * 365 )
+                
+            else:
+                
+                etag = '"{:x}-{:x}"'.format( last_modified_timestamp, file_resource.getFileSize() )
+                
+                cache_control = 'max-age={}'.format( 86400 * 365 )
+                
+            
             request.setHeader( 'Content-Disposition', str( content_disposition ) )
+            request.setHeader( 'Accept-Ranges', 'bytes' )
+            request.setHeader( 'ETag', etag )
+            request.setHeader( 'Last-Modified', http.datetimeToString( last_modified_timestamp ) )
             
             request.setHeader( 'Expires', time.strftime( '%a, %d %b %Y %H:%M:%S GMT', time.gmtime( time.time() + 86400 * 365 ) ) )
-            request.setHeader( 'Cache-Control', 'max-age={}'.format( 86400 * 365 ) )
-            
-            fileObject = open( path, 'rb' )
-            
-            producer = NoRangeStaticProducer( request, fileObject )
+            request.setHeader( 'Cache-Control', cache_control )
             
-            producer.start()
-            
-            do_finish = False
+            if status_code == 200 and IsNotModified( request, etag, last_modified_timestamp ):
+                
+                request.setResponseCode( 304 )
+                
+                content_length = 0
+                
+            else:
+                
+                if not IfRangeMatches( request, etag, last_modified_timestamp ):
+                    
+                    request.requestHeaders.removeHeader( 'Range' )
+                    
+                
+                file_resource.type = str( content_type )
+                file_resource.encoding = None
+                
+                fileObject = open( path, 'rb' )
+                
+                # this sets the 200, 206 or 416 and the content headers for the whole file, a single range or multipart ranges
+                
+                producer = file_resource.makeProducer( request, fileObject )
+                
+                content_length = int( request.responseHeaders.getRawHeaders( 'Content-Length' )[0] )
+                
+                if request.code == 416:
+                    
+                    fileObject.close()
+                    
+                else:
+                    
+                    producer.start()
+                    
+                    do_finish = False
+                    
+                
             
         elif response_context.HasBody():
             
@@ -854,7 +973,7 @@ class HydrusResourceWelcome( HydrusResource ):
     
 class ResponseContext( object ):
     
-    def __init__( self, status_code, mime = HC.APPLICATION_JSON, body = None, path = None, cookies = None ):
+    def __init__( self, status_code, mime = HC.APPLICATION_JSON, body = None, path = None, hash = None, cookies = None ):
         
         if body is None:
             
@@ -887,6 +1006,7 @@ class ResponseContext( object ):
         self._mime = mime
         self._body_bytes = body_bytes
         self._path = path
+        self._hash = hash
         self._cookies = cookies
         
     
@@ -897,6 +1017,8 @@ class ResponseContext( object ):
     
     def GetCookies( self ): return self._cookies
     
+    def GetHash( self ): return self._hash
+    
     def GetMime( self ): return self._mime
     
     def GetPath( self ): return self._path
@@ -905,5 +1027,7 @@ class ResponseContext( object ):
     
     def HasBody( self ): return self._body_bytes is not None
     
+    def HasHash( self ): return self._hash is not None
+    
     def HasPath( self ): return self._path is not None
     
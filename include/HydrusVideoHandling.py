@@ -6,6 +6,7 @@ from . import HydrusImageHandling
 from . import HydrusPaths
 from . import HydrusText
 from . import HydrusThreading
+import bisect
 import numpy
 import os
 import re
@@ -400,6 +401,26 @@ def GetMime( path ):
     
     return HC.APPLICATION_UNKNOWN
     
+def GetVideoFrameIndex( path ):
+    
+    # copying the packets out is cheap, so this is about as fast as reading the file
+    
+    cmd = [ FFMPEG_PATH, '-i', path, '-loglevel', 'quiet', '-map', '0:v:0', '-c', 'copy', '-f', 'framecrc', '-' ]
+    
+    sbp_kwargs = HydrusData.GetSubprocessKWArgs()
+    
+    process = subprocess.Popen( cmd, bufsize = 10**5, stdin = subprocess.PIPE, stdout = subprocess.PIPE, stderr = subprocess.PIPE, **sbp_kwargs )
+    
+    ( stdout, stderr ) = process.communicate()
+    
+    del process
+    
+    ( text, encoding ) = HydrusText.NonFailingUnicodeDecode( stdout, 'utf-8' )
+    
+    lines = text.splitlines()
+    
+    return ParseFFMPEGFrameIndex( lines )
+    
 def HasVideoStream( path ):
     
     lines = GetFFMPEGInfoLines( path )
@@ -548,6 +569,90 @@ def ParseFFMPEGFPS( first_second_lines ):
         raise HydrusExceptions.MimeException( 'Error estimating framerate!' )
         
     
+def ParseFFMPEGFrameIndex( lines ):
+    
+    # framecrc gives one line per packet in decode order, like:
+    # #tb 0: 1/12288
+    # 0,      -1024,          0,      512,    13818, 0xaf189d38
+    # 0,       -512,       2048,      512,     1311, 0x194b9e0d, F=0x0
+    # the flags are only listed when they are not just 'keyframe'
+    
+    time_base = None
+    
+    timestamps = set()
+    keyframe_timestamps = set()
+    
+    for line in lines:
+        
+        if line.startswith( '#tb 0:' ):
+            
+            ( numerator, denominator ) = line.split( ':' )[1].strip().split( '/' )
+            
+            time_base = int( numerator ) / int( denominator )
+            
+            continue
+            
+        
+        if line.startswith( '#' ):
+            
+            continue
+            
+        
+        components = [ component.strip() for component in line.split( ',' ) ]
+        
+        if len( components ) < 6:
+            
+            continue
+            
+        
+        try:
+            
+            pts = int( components[2] )
+            
+            flags = 1
+            
+            for component in components[6:]:
+                
+                if component.startswith( 'F=' ):
+                    
+                    flags = int( component[2:], 16 )
+                    
+                
+            
+        except ValueError:
+            
+            raise HydrusExceptions.MimeException( 'Could not parse the frame index line "{}"!'.format( line ) )
+            
+        
+        # discarded packets are never shown
+        
+        if flags & 4:
+            
+            continue
+            
+        
+        # invisible frames, like vp8 alt-refs, share a timestamp with the frame they help draw, so we count timestamps, not packets
+        
+        timestamps.add( pts )
+        
+        if flags & 1:
+            
+            keyframe_timestamps.add( pts )
+            
+        
+    
+    if time_base is None or len( timestamps ) == 0:
+        
+        raise HydrusExceptions.MimeException( 'Could not find any frames for the frame index!' )
+        
+    
+    sorted_timestamps = sorted( timestamps )
+    
+    timestamps_ms = [ int( round( pts * time_base * 1000 ) ) for pts in sorted_timestamps ]
+    keyframe_indices = [ i for ( i, pts ) in enumerate( sorted_timestamps ) if pts in keyframe_timestamps ]
+    
+    return ( timestamps_ms, keyframe_indices )
+    
 def ParseFFMPEGHasVideo( lines ):
     
     try:
@@ -704,6 +809,7 @@ class VideoRendererFFMPEG( object ):
         self._target_resolution = target_resolution
         
         self.lastread = None
+        self._last_good_index = None
         
         self.fps = self._num_frames / self._duration
         
@@ -725,9 +831,78 @@ class VideoRendererFFMPEG( object ):
         
         self.bufsize = bufsize
         
+        self._skip_buffer = None
+        
+        self._frame_timestamps_ms = None
+        self._keyframe_indices = None
+        
         self.initialize()
         
     
+    def _GetLastGoodFrame( self ):
+        
+        # we do not copy every frame aside just in case, so once the stream dies we go back and decode the last good one again, once
+        
+        if self.lastread is None and self._last_good_index is not None:
+            
+            ( w, h ) = self._target_resolution
+            
+            pos = self.pos
+            
+            self.initialize( self._last_good_index )
+            
+            lastread = numpy.empty( ( h, w, self.depth ), dtype = 'uint8' )
+            
+            num_read = self._ReadInto( lastread )
+            
+            self.close()
+            
+            self.pos = pos
+            
+            if num_read != self.depth * w * h:
+                
+                raise Exception( 'Unable to render that video! Please send it to hydrus dev so he can look at it!' )
+                
+            
+            self.lastread = lastread
+            
+        
+        return self.lastread
+        
+    
+    def _GetSeekTime( self, index ):
+        
+        if self._frame_timestamps_ms is not None and 0 < index < len( self._frame_timestamps_ms ):
+            
+            # halfway to the previous frame, so rounding can never drop us a frame too far
+            
+            return ( self._frame_timestamps_ms[ index - 1 ] + self._frame_timestamps_ms[ index ] ) / 2000.0
+            
+        
+        return index / self.fps
+        
+    
+    def _ReadInto( self, buffer ):
+        
+        view = memoryview( buffer ).cast( 'B' )
+        
+        num_read = 0
+        
+        while num_read < len( view ):
+            
+            num_read_this_time = self.process.stdout.readinto( view[ num_read : ] )
+            
+            if num_read_this_time is None or num_read_this_time == 0:
+                
+                break
+                
+            
+            num_read += num_read_this_time
+            
+        
+        return num_read
+        
+    
     def close( self ):
         
         if self.process is not None:
@@ -763,7 +938,7 @@ class VideoRendererFFMPEG( object ):
                 do_ss = True
                 
             
-            ss = start_index / self.fps
+            ss = self._GetSeekTime( start_index )
             self.pos = start_index
             skip_frames = 0
             
@@ -810,43 +985,51 @@ class VideoRendererFFMPEG( object ):
         
         n = int( n )
         
-        ( w, h ) = self._target_resolution
+        if self._skip_buffer is None:
+            
+            self._skip_buffer = bytearray( self.bufsize )
+            
         
         for i in range( n ):
             
             if self.process is not None:
                 
-                self.process.stdout.read( self.depth * w * h )
-                
-                self.process.stdout.flush()
+                self._ReadInto( self._skip_buffer )
                 
             
             self.pos += 1
             
         
     
-    def read_frame( self ):
+    def read_frame( self, numpy_image = None ):
+        
+        # pass a buffer from an earlier frame you are done with, and we'll read straight into it rather than making a new one
         
         if self.pos == self._num_frames:
             
             self.initialize()
             
         
+        ( w, h ) = self._target_resolution
+        
+        if numpy_image is None:
+            
+            numpy_image = numpy.empty( ( h, w, self.depth ), dtype = 'uint8' )
+            
+        
         if self.process is None:
             
-            result = self.lastread
+            result = self._GetLastGoodFrame()
             
         else:
             
-            ( w, h ) = self._target_resolution
-            
             nbytes = self.depth * w * h
             
-            s = self.process.stdout.read( nbytes )
+            num_read = self._ReadInto( numpy_image )
             
-            if len(s) != nbytes:
+            if num_read != nbytes:
                 
-                if self.lastread is None:
+                if self._last_good_index is None:
                     
                     if self.pos != 0:
                         
@@ -859,22 +1042,32 @@ class VideoRendererFFMPEG( object ):
                         
                         self.set_position( 0 )
                         
-                        return self.read_frame()
+                        return self.read_frame( numpy_image )
                         
                     
                     raise Exception( 'Unable to render that video! Please send it to hydrus dev so he can look at it!' )
                     
                 
-                result = self.lastread
-                
                 self.close()
                 
+                result = self._GetLastGoodFrame()
+                
             else:
                 
-                result = numpy.fromstring( s, dtype = 'uint8' ).reshape( ( h, w, len( s ) // ( w * h ) ) )
+                result = numpy_image
                 
-                self.lastread = result
+                # the caller reuses the buffers we hand back, so we only remember where the last good frame was
                 
+                self.lastread = None
+                self._last_good_index = self.pos
+                
+            
+        
+        if result is not None and result is not numpy_image:
+            
+            numpy_image[:] = result
+            
+            result = numpy_image
             
         
         self.pos += 1
@@ -887,6 +1080,18 @@ class VideoRendererFFMPEG( object ):
         rewind = pos < self.pos
         jump_a_long_way_ahead = pos > self.pos + 60
         
+        if self._keyframe_indices is not None and self._mime not in ( HC.IMAGE_APNG, HC.IMAGE_GIF ):
+            
+            # a seek decodes from the keyframe before pos, so if that is ahead of us, seeking is cheaper than piping over everything in between
+            
+            i = bisect.bisect_right( self._keyframe_indices, pos ) - 1
+            
+            if i >= 0 and self._keyframe_indices[ i ] > self.pos + 1:
+                
+                jump_a_long_way_ahead = True
+                
+            
+        
         if rewind or jump_a_long_way_ahead:
             
             self.initialize( pos )
@@ -897,6 +1102,12 @@ class VideoRendererFFMPEG( object ):
             
         
     
+    def SetFrameIndex( self, frame_timestamps_ms, keyframe_indices ):
+        
+        self._frame_timestamps_ms = frame_timestamps_ms
+        self._keyframe_indices = keyframe_indices
+        
+    
     def Stop( self ):
         
         self.close()
@@ -7,7 +7,9 @@ from . import HydrusExceptions
 from . import HydrusNetwork
 from . import HydrusPaths
 from . import HydrusSerialisable
+import itertools
 import os
+import psutil
 import random
 from . import ServerFiles
 import sqlite3
@@ -72,13 +74,19 @@ def GenerateRepositoryTagSiblingsTableNames( service_id ):
     
     return ( current_tag_siblings_table_name, deleted_tag_siblings_table_name, pending_tag_siblings_table_name, petitioned_tag_siblings_table_name )
     
-def GenerateRepositoryUpdateTableName( service_id ):
+def GenerateRepositoryUpdateTableNames( service_id ):
     
-    return 'updates_' + str( service_id )
+    suffix = str( service_id )
+    
+    update_table_name = 'updates_' + suffix
+    columnar_update_table_name = 'columnar_updates_' + suffix
+    
+    return ( update_table_name, columnar_update_table_name )
     
 class DB( HydrusDB.HydrusDB ):
     
     READ_WRITE_ACTIONS = [ 'access_key', 'immediate_content_update', 'registration_keys' ]
+    PARALLEL_READ_ACTIONS = [ 'update_files' ]
     
     TRANSACTION_COMMIT_TIME = 120
     
@@ -338,6 +346,15 @@ class DB( HydrusDB.HydrusDB ):
             
         
     
+    def _CommitNow( self ):
+        
+        # so the read connections see everything written so far
+        
+        self._Commit()
+        
+        self._BeginImmediate()
+        
+    
     def _CreateDB( self ):
         
         HydrusPaths.MakeSureDirectoryExists( self._files_dir )
@@ -1246,6 +1263,7 @@ class DB( HydrusDB.HydrusDB ):
         elif action == 'account_info': result = self._GetAccountInfo( *args, **kwargs )
         elif action == 'account_key_from_access_key': result = self._GetAccountKeyFromAccessKey( *args, **kwargs )
         elif action == 'account_types': result = self._GetAccountTypes( *args, **kwargs )
+        elif action == 'columnar_update_hashes': result = self._RepositoryGetColumnarUpdateHashes( *args, **kwargs )
         elif action == 'immediate_update': result = self._RepositoryGenerateImmediateUpdate( *args, **kwargs )
         elif action == 'ip': result = self._RepositoryGetIPTimestamp( *args, **kwargs )
         elif action == 'num_petitions': result = self._RepositoryGetNumPetitions( *args, **kwargs )
@@ -1256,6 +1274,7 @@ class DB( HydrusDB.HydrusDB ):
         elif action == 'services': result = self._GetServices( *args, **kwargs )
         elif action == 'services_from_account': result = self._GetServicesFromAccount( *args, **kwargs )
         elif action == 'sessions': result = self._GetSessions( *args, **kwargs )
+        elif action == 'update_files': result = self._RepositoryGenerateUpdateFiles( *args, **kwargs )
         elif action == 'verify_access_key': result = self._VerifyAccessKey( *args, **kwargs )
         else: raise Exception( 'db received an unknown read command: ' + action )
         
@@ -1518,65 +1537,32 @@ class DB( HydrusDB.HydrusDB ):
         
         #
         
-        ( update_table_name ) = GenerateRepositoryUpdateTableName( service_id )
+        ( update_table_name, columnar_update_table_name ) = GenerateRepositoryUpdateTableNames( service_id )
         
         self._c.execute( 'CREATE TABLE ' + update_table_name + ' ( master_hash_id INTEGER PRIMARY KEY );' )
+        self._c.execute( 'CREATE TABLE ' + columnar_update_table_name + ' ( master_hash_id INTEGER PRIMARY KEY, columnar_master_hash_id INTEGER );' )
         
     
-    def _RepositoryCreateUpdate( self, service_key, begin, end ):
-        
-        service_id = self._GetServiceId( service_key )
-        
-        ( name, ) = self._c.execute( 'SELECT name FROM services WHERE service_id = ?;', ( service_id, ) ).fetchone()
-        
-        HydrusData.Print( 'Creating update for ' + repr( name ) + ' from ' + HydrusData.ConvertTimestampToPrettyTime( begin, in_gmt = True ) + ' to ' + HydrusData.ConvertTimestampToPrettyTime( end, in_gmt = True ) )
-        
-        updates = self._RepositoryGenerateUpdates( service_id, begin, end )
-        
-        update_hashes = []
-        
-        total_definition_rows = 0
-        total_content_rows = 0
+    def _RepositoryCreateUpdate( self, service_key, update_hashes, columnar_update_hashes ):
         
-        if len( updates ) > 0:
+        if len( update_hashes ) > 0:
             
-            for update in updates:
-                
-                num_rows = update.GetNumRows()
-                
-                if isinstance( update, HydrusNetwork.DefinitionsUpdate ):
-                    
-                    total_definition_rows += num_rows
-                    
-                elif isinstance( update, HydrusNetwork.ContentUpdate ):
-                    
-                    total_content_rows += num_rows
-                    
-                
-                update_bytes = update.DumpToNetworkBytes()
-                
-                update_hash = hashlib.sha256( update_bytes ).digest()
-                
-                dest_path = ServerFiles.GetExpectedFilePath( update_hash )
-                
-                with open( dest_path, 'wb' ) as f:
-                    
-                    f.write( update_bytes )
-                    
-                
-                update_hashes.append( update_hash )
-                
+            service_id = self._GetServiceId( service_key )
             
-            ( update_table_name ) = GenerateRepositoryUpdateTableName( service_id )
+            ( update_table_name, columnar_update_table_name ) = GenerateRepositoryUpdateTableNames( service_id )
             
-            master_hash_ids = self._GetMasterHashIds( update_hashes )
+            master_hash_ids = self._GetMasterHashIds( update_hashes + columnar_update_hashes )
             
             self._c.executemany( 'INSERT OR IGNORE INTO ' + update_table_name + ' ( master_hash_id ) VALUES ( ? );', ( ( master_hash_id, ) for master_hash_id in master_hash_ids ) )
             
-        
-        HydrusData.Print( 'Update OK. ' + HydrusData.ToHumanInt( total_definition_rows ) + ' definition rows and ' + HydrusData.ToHumanInt( total_content_rows ) + ' content rows in ' + HydrusData.ToHumanInt( len( updates ) ) + ' update files.' )
-        
-        return update_hashes
+            # services from before columnar updates do not have this table yet
+            
+            self._c.execute( 'CREATE TABLE IF NOT EXISTS ' + columnar_update_table_name + ' ( master_hash_id INTEGER PRIMARY KEY, columnar_master_hash_id INTEGER );' )
+            
+            pairs = [ ( self._GetMasterHashId( update_hash ), self._GetMasterHashId( columnar_update_hash ) ) for ( update_hash, columnar_update_hash ) in zip( update_hashes, columnar_update_hashes ) ]
+            
+            self._c.executemany( 'INSERT OR IGNORE INTO ' + columnar_update_table_name + ' ( master_hash_id, columnar_master_hash_id ) VALUES ( ?, ? );', pairs )
+            
         
     
     def _RepositoryDeleteFiles( self, service_id, account_id, service_hash_ids, timestamp ):
@@ -1703,13 +1689,18 @@ class DB( HydrusDB.HydrusDB ):
         
         table_names.extend( GenerateRepositoryTagSiblingsTableNames( service_id ) )
         
-        table_names.append( GenerateRepositoryUpdateTableName( service_id ) )
+        ( update_table_name, columnar_update_table_name ) = GenerateRepositoryUpdateTableNames( service_id )
+        
+        table_names.append( update_table_name )
         
         for table_name in table_names:
             
             self._c.execute( 'DROP TABLE ' + table_name + ';' )
             
         
+        self._c.execute( 'DROP TABLE IF EXISTS ' + columnar_update_table_name + ';' )
+            
+        
     
     def _RepositoryGenerateImmediateUpdate( self, service_key, account, begin, end ):
         
@@ -1720,22 +1711,93 @@ class DB( HydrusDB.HydrusDB ):
         
         service_id = self._GetServiceId( service_key )
         
-        updates = self._RepositoryGenerateUpdates( service_id, begin, end )
+        updates = []
+        
+        self._RepositoryGenerateUpdates( service_id, begin, end, updates.append )
         
         return updates
         
     
-    def _RepositoryGenerateUpdates( self, service_id, begin, end ):
+    def _RepositoryGenerateUpdateFiles( self, service_key, begin, end ):
+        
+        service_id = self._GetServiceId( service_key )
+        
+        ( name, ) = self._c.execute( 'SELECT name FROM services WHERE service_id = ?;', ( service_id, ) ).fetchone()
+        
+        HydrusData.Print( 'Creating update for ' + repr( name ) + ' from ' + HydrusData.ConvertTimestampToPrettyTime( begin, in_gmt = True ) + ' to ' + HydrusData.ConvertTimestampToPrettyTime( end, in_gmt = True ) )
+        
+        process = psutil.Process()
+        
+        start_rss = process.memory_info().rss
+        
+        update_hashes = []
+        columnar_update_hashes = []
+        
+        stats = collections.Counter()
+        
+        stats[ 'peak_rss' ] = start_rss
+        
+        def write_file( update_bytes ):
+            
+            update_hash = hashlib.sha256( update_bytes ).digest()
+            
+            dest_path = ServerFiles.GetExpectedFilePath( update_hash )
+            
+            with open( dest_path, 'wb' ) as f:
+                
+                f.write( update_bytes )
+                
+            
+            return update_hash
+            
+        
+        def write_update_files( update ):
+            
+            num_rows = update.GetNumRows()
+            
+            if isinstance( update, HydrusNetwork.DefinitionsUpdate ):
+                
+                stats[ 'definition_rows' ] += num_rows
+                
+            elif isinstance( update, HydrusNetwork.ContentUpdate ):
+                
+                stats[ 'content_rows' ] += num_rows
+                
+            
+            # every update is written as json for old clients and as a columnar twin for clients that ask for it
+            # lz4 is optional, so the twin is zlib'd to make sure every client can read it
+            
+            update_bytes = update.DumpToNetworkBytes()
+            columnar_update_bytes = update.DumpToBinary( compression = HydrusSerialisable.BINARY_COMPRESSION_ZLIB )
+            
+            # this is the high point, with the update and both of its dumps alive
+            
+            stats[ 'peak_rss' ] = max( stats[ 'peak_rss' ], process.memory_info().rss )
+            
+            update_hashes.append( write_file( update_bytes ) )
+            columnar_update_hashes.append( write_file( columnar_update_bytes ) )
+            
+        
+        self._RepositoryGenerateUpdates( service_id, begin, end, write_update_files )
+        
+        peak_rss = max( stats[ 'peak_rss' ], process.memory_info().rss )
+        
+        HydrusData.Print( 'Update OK. ' + HydrusData.ToHumanInt( stats[ 'definition_rows' ] ) + ' definition rows and ' + HydrusData.ToHumanInt( stats[ 'content_rows' ] ) + ' content rows in ' + HydrusData.ToHumanInt( len( update_hashes ) ) + ' update files. Peak memory use was ' + HydrusData.ToHumanBytes( peak_rss ) + ', ' + HydrusData.ToHumanBytes( max( 0, peak_rss - start_rss ) ) + ' over the start.' )
+        
+        return ( update_hashes, columnar_update_hashes )
+        
+    
+    def _RepositoryGenerateUpdates( self, service_id, begin, end, update_callable ):
+        
+        # each update goes to the callable as soon as it fills, so only one of each type is ever held in memory
         
         MAX_DEFINITIONS_ROWS = 50000
         MAX_CONTENT_ROWS = 250000
         
         MAX_CONTENT_CHUNK = 25000
         
-        updates = []
-        
-        definitions_update_builder = HydrusNetwork.UpdateBuilder( HydrusNetwork.DefinitionsUpdate, MAX_DEFINITIONS_ROWS )
-        content_update_builder = HydrusNetwork.UpdateBuilder( HydrusNetwork.ContentUpdate, MAX_CONTENT_ROWS )
+        definitions_update_builder = HydrusNetwork.UpdateBuilder( HydrusNetwork.DefinitionsUpdate, MAX_DEFINITIONS_ROWS, update_callable = update_callable )
+        content_update_builder = HydrusNetwork.UpdateBuilder( HydrusNetwork.ContentUpdate, MAX_CONTENT_ROWS, update_callable = update_callable )
         
         ( service_hash_ids_table_name, service_tag_ids_table_name ) = GenerateRepositoryMasterMapTableNames( service_id )
         
@@ -1755,8 +1817,6 @@ class DB( HydrusDB.HydrusDB ):
         
         definitions_update_builder.Finish()
         
-        updates.extend( definitions_update_builder.GetUpdates() )
-        
         #
         
         ( current_files_table_name, deleted_files_table_name, pending_files_table_name, petitioned_files_table_name, ip_addresses_table_name ) = GenerateRepositoryFilesTableNames( service_id )
@@ -1781,11 +1841,15 @@ class DB( HydrusDB.HydrusDB ):
         
         ( current_mappings_table_name, deleted_mappings_table_name, pending_mappings_table_name, petitioned_mappings_table_name ) = GenerateRepositoryMappingsTableNames( service_id )
         
-        service_tag_ids_to_service_hash_ids = HydrusData.BuildKeyToListDict( self._c.execute( 'SELECT service_tag_id, service_hash_id FROM ' + current_mappings_table_name + ' WHERE mapping_timestamp BETWEEN ? AND ?;', ( begin, end ) ) )
+        # sqlite sorts these in a temp b-tree that spills to disk, rather than us building every tag's list in memory. sorted hash ids also make small deltas for columnar updates
+        
+        cursor = self._c.execute( 'SELECT service_tag_id, service_hash_id FROM ' + current_mappings_table_name + ' WHERE mapping_timestamp BETWEEN ? AND ? ORDER BY service_tag_id, service_hash_id;', ( begin, end ) )
         
-        for ( service_tag_id, service_hash_ids ) in list(service_tag_ids_to_service_hash_ids.items()):
+        for ( service_tag_id, group ) in itertools.groupby( cursor, key = lambda row: row[0] ):
+            
+            service_hash_ids = ( service_hash_id for ( gumpf, service_hash_id ) in group )
             
-            for block_of_service_hash_ids in HydrusData.SplitListIntoChunks( service_hash_ids, MAX_CONTENT_CHUNK ):
+            for block_of_service_hash_ids in HydrusData.SplitIteratorIntoChunks( service_hash_ids, MAX_CONTENT_CHUNK ):
                 
                 row_weight = len( block_of_service_hash_ids )
                 
@@ -1793,11 +1857,13 @@ class DB( HydrusDB.HydrusDB ):
                 
             
         
-        service_tag_ids_to_service_hash_ids = HydrusData.BuildKeyToListDict( self._c.execute( 'SELECT service_tag_id, service_hash_id FROM ' + deleted_mappings_table_name + ' WHERE mapping_timestamp BETWEEN ? AND ?;', ( begin, end ) ) )
+        cursor = self._c.execute( 'SELECT service_tag_id, service_hash_id FROM ' + deleted_mappings_table_name + ' WHERE mapping_timestamp BETWEEN ? AND ? ORDER BY service_tag_id, service_hash_id;', ( begin, end ) )
         
-        for ( service_tag_id, service_hash_ids ) in list(service_tag_ids_to_service_hash_ids.items()):
+        for ( service_tag_id, group ) in itertools.groupby( cursor, key = lambda row: row[0] ):
             
-            for block_of_service_hash_ids in HydrusData.SplitListIntoChunks( service_hash_ids, MAX_CONTENT_CHUNK ):
+            service_hash_ids = ( service_hash_id for ( gumpf, service_hash_id ) in group )
+            
+            for block_of_service_hash_ids in HydrusData.SplitIteratorIntoChunks( service_hash_ids, MAX_CONTENT_CHUNK ):
                 
                 row_weight = len( block_of_service_hash_ids )
                 
@@ -1845,10 +1911,6 @@ class DB( HydrusDB.HydrusDB ):
         
         content_update_builder.Finish()
         
-        updates.extend( content_update_builder.GetUpdates() )
-        
-        return updates
-        
     
     def _RepositoryGetAccountInfo( self, service_id, account_id ):
         
@@ -2539,6 +2601,20 @@ class DB( HydrusDB.HydrusDB ):
         return HydrusNetwork.Petition( action, petitioner_account, reason, contents )
         
     
+    def _RepositoryGetColumnarUpdateHashes( self, service_key ):
+        
+        service_id = self._GetServiceId( service_key )
+        
+        ( update_table_name, columnar_update_table_name ) = GenerateRepositoryUpdateTableNames( service_id )
+        
+        if self._c.execute( 'SELECT 1 FROM sqlite_master WHERE name = ?;', ( columnar_update_table_name, ) ).fetchone() is None:
+            
+            return {}
+            
+        
+        return dict( self._c.execute( 'SELECT update_hashes.hash, columnar_update_hashes.hash FROM ' + columnar_update_table_name + ' AS pairs, hashes AS update_hashes, hashes AS columnar_update_hashes WHERE update_hashes.master_hash_id = pairs.master_hash_id AND columnar_update_hashes.master_hash_id = pairs.columnar_master_hash_id;' ) )
+        
+    
     def _RepositoryHasFile( self, service_key, hash ):
         
         if not self._MasterHashExists( hash ):
@@ -3400,7 +3476,8 @@ class DB( HydrusDB.HydrusDB ):
         elif action == 'account_types': self._ModifyAccountTypes( *args, **kwargs )
         elif action == 'analyze': self._Analyze( *args, **kwargs )
         elif action == 'backup': self._Backup( *args, **kwargs )
-        elif action == 'create_update': result = self._RepositoryCreateUpdate( *args, **kwargs )
+        elif action == 'commit': self._CommitNow( *args, **kwargs )
+        elif action == 'create_update': self._RepositoryCreateUpdate( *args, **kwargs )
         elif action == 'delete_orphans': self._DeleteOrphans( *args, **kwargs )
         elif action == 'dirty_accounts': self._SaveDirtyAccounts( *args, **kwargs )
         elif action == 'dirty_services': self._SaveDirtyServices( *args, **kwargs )
@@ -546,7 +546,7 @@ class HydrusResourceRestrictedRepositoryFile( HydrusResourceRestricted ):
         
         path = ServerFiles.GetFilePath( hash )
         
-        response_context = HydrusServerResources.ResponseContext( 200, mime = mime, path = path )
+        response_context = HydrusServerResources.ResponseContext( 200, mime = mime, path = path, hash = hash )
         
         return response_context
         
@@ -653,7 +653,7 @@ class HydrusResourceRestrictedUpdate( HydrusResourceRestricted ):
         
         path = ServerFiles.GetFilePath( update_hash )
         
-        response_context = HydrusServerResources.ResponseContext( 200, mime = HC.APPLICATION_OCTET_STREAM, path = path )
+        response_context = HydrusServerResources.ResponseContext( 200, mime = HC.APPLICATION_OCTET_STREAM, path = path, hash = update_hash )
         
         return response_context
         
@@ -694,7 +694,18 @@ class HydrusResourceRestrictedMetadataUpdate( HydrusResourceRestricted ):
         
         since = request.parsed_request_args[ 'since' ]
         
-        metadata_slice = self._service.GetMetadataSlice( since )
+        # old clients do not say, and they get the json updates they have always had
+        
+        if 'update_encoding' in request.parsed_request_args:
+            
+            update_encoding = request.parsed_request_args[ 'update_encoding' ]
+            
+        else:
+            
+            update_encoding = HydrusNetwork.UPDATE_ENCODING_JSON
+            
+        
+        metadata_slice = self._service.GetMetadataSlice( since, update_encoding = update_encoding )
         
         body = HydrusNetwork.DumpHydrusArgsToNetworkBytes( { 'metadata_slice' : metadata_slice } )
         
@@ -125,6 +125,7 @@ class TestClientAPI( unittest.TestCase ):
         permissions_to_set_up.append( ( 'add_urls', [ ClientAPI.CLIENT_API_PERMISSION_ADD_URLS ] ) )
         permissions_to_set_up.append( ( 'manage_pages', [ ClientAPI.CLIENT_API_PERMISSION_MANAGE_PAGES ] ) )
         permissions_to_set_up.append( ( 'manage_cookies', [ ClientAPI.CLIENT_API_PERMISSION_MANAGE_COOKIES ] ) )
+        permissions_to_set_up.append( ( 'manage_database', [ ClientAPI.CLIENT_API_PERMISSION_MANAGE_DATABASE ] ) )
         permissions_to_set_up.append( ( 'search_all_files', [ ClientAPI.CLIENT_API_PERMISSION_SEARCH_FILES ] ) )
         permissions_to_set_up.append( ( 'search_green_files', [ ClientAPI.CLIENT_API_PERMISSION_SEARCH_FILES ] ) )
         
@@ -1349,6 +1350,45 @@ class TestClientAPI( unittest.TestCase ):
         self.assertEqual( frozen_result_cookies, frozen_expected_cookies )
         
     
+    def _test_manage_database( self, connection, set_up_permissions ):
+        
+        api_permissions = set_up_permissions[ 'manage_database' ]
+        
+        access_key_hex = api_permissions.GetAccessKey().hex()
+        
+        headers = { 'Hydrus-Client-API-Access-Key' : access_key_hex }
+        
+        #
+        
+        path = '/manage_database/get_job_statistics'
+        
+        connection.request( 'GET', path, headers = headers )
+        
+        response = connection.getresponse()
+        
+        data = response.read()
+        
+        text = str( data, 'utf-8' )
+        
+        self.assertEqual( response.status, 200 )
+        
+        d = json.loads( text )
+        
+        self.assertEqual( d, HG.test_controller.GetJobStatistics() )
+        
+        # wrong permission
+        
+        headers = { 'Hydrus-Client-API-Access-Key' : set_up_permissions[ 'manage_cookies' ].GetAccessKey().hex() }
+        
+        connection.request( 'GET', path, headers = headers )
+        
+        response = connection.getresponse()
+        
+        data = response.read()
+        
+        self.assertEqual( response.status, 403 )
+        
+    
     def _test_manage_pages( self, connection, set_up_permissions ):
         
         api_permissions = set_up_permissions[ 'manage_pages' ]
@@ -1468,6 +1508,72 @@ class TestClientAPI( unittest.TestCase ):
         
         self.assertEqual( d, expected_answer )
         
+        # search files a page at a time
+        
+        path = '/get_files/search_files?tags={}&limit=4'.format( urllib.parse.quote( json.dumps( tags ) ) )
+        
+        connection.request( 'GET', path, headers = headers )
+        
+        response = connection.getresponse()
+        
+        data = response.read()
+        
+        text = str( data, 'utf-8' )
+        
+        self.assertEqual( response.status, 200 )
+        
+        d = json.loads( text )
+        
+        self.assertEqual( d[ 'file_ids' ], hash_ids[ : 4 ] )
+        
+        next_cursor = d[ 'next_cursor' ]
+        
+        self.assertIsNotNone( next_cursor )
+        
+        path = '/get_files/search_files?cursor={}'.format( urllib.parse.quote( next_cursor ) )
+        
+        connection.request( 'GET', path, headers = headers )
+        
+        response = connection.getresponse()
+        
+        data = response.read()
+        
+        text = str( data, 'utf-8' )
+        
+        self.assertEqual( response.status, 200 )
+        
+        d = json.loads( text )
+        
+        expected_answer = { 'file_ids' : hash_ids[ 4 : ], 'next_cursor' : None }
+        
+        self.assertEqual( d, expected_answer )
+        
+        # a negative offset on a cursor we did give out
+        
+        ( search_key_hex, offset ) = next_cursor.split( '_' )
+        
+        path = '/get_files/search_files?cursor={}'.format( urllib.parse.quote( search_key_hex + '_-1' ) )
+        
+        connection.request( 'GET', path, headers = headers )
+        
+        response = connection.getresponse()
+        
+        data = response.read()
+        
+        self.assertEqual( response.status, 400 )
+        
+        # a cursor we never gave out
+        
+        path = '/get_files/search_files?cursor={}'.format( HydrusData.GenerateKey().hex() + '_0' )
+        
+        connection.request( 'GET', path, headers = headers )
+        
+        response = connection.getresponse()
+        
+        data = response.read()
+        
+        self.assertEqual( response.status, 400 )
+        
         # some file search param parsing
         
         class PretendRequest( object ):
@@ -1912,6 +2018,134 @@ class TestClientAPI( unittest.TestCase ):
         
         self.assertEqual( hashlib.sha256( data ).digest(), hash )
         
+        self.assertEqual( response.getheader( 'ETag' ), '"' + hash_hex + '"' )
+        self.assertEqual( response.getheader( 'Accept-Ranges' ), 'bytes' )
+        self.assertIn( 'immutable', response.getheader( 'Cache-Control' ) )
+        
+        file_data = data
+        last_modified = response.getheader( 'Last-Modified' )
+        
+        # ranges
+        
+        range_headers = dict( headers )
+        
+        range_headers[ 'Range' ] = 'bytes=100-199'
+        
+        connection.request( 'GET', path, headers = range_headers )
+        
+        response = connection.getresponse()
+        
+        data = response.read()
+        
+        self.assertEqual( response.status, 206 )
+        
+        self.assertEqual( response.getheader( 'Content-Range' ), 'bytes 100-199/{}'.format( len( file_data ) ) )
+        self.assertEqual( data, file_data[100:200] )
+        
+        range_headers[ 'Range' ] = 'bytes=-50'
+        
+        connection.request( 'GET', path, headers = range_headers )
+        
+        response = connection.getresponse()
+        
+        data = response.read()
+        
+        self.assertEqual( response.status, 206 )
+        
+        self.assertEqual( data, file_data[-50:] )
+        
+        range_headers[ 'Range' ] = 'bytes=0-9,20-29'
+        
+        connection.request( 'GET', path, headers = range_headers )
+        
+        response = connection.getresponse()
+        
+        data = response.read()
+        
+        self.assertEqual( response.status, 206 )
+        
+        self.assertTrue( response.getheader( 'Content-Type' ).startswith( 'multipart/byteranges' ) )
+        self.assertIn( file_data[0:10], data )
+        self.assertIn( file_data[20:30], data )
+        
+        range_headers[ 'Range' ] = 'bytes={}-'.format( len( file_data ) )
+        
+        connection.request( 'GET', path, headers = range_headers )
+        
+        response = connection.getresponse()
+        
+        data = response.read()
+        
+        self.assertEqual( response.status, 416 )
+        
+        self.assertEqual( response.getheader( 'Content-Range' ), 'bytes */{}'.format( len( file_data ) ) )
+        
+        # a resume against a different version of the file gets the whole thing
+        
+        range_headers[ 'Range' ] = 'bytes=100-199'
+        range_headers[ 'If-Range' ] = '"' + os.urandom( 32 ).hex() + '"'
+        
+        connection.request( 'GET', path, headers = range_headers )
+        
+        response = connection.getresponse()
+        
+        data = response.read()
+        
+        self.assertEqual( response.status, 200 )
+        
+        self.assertEqual( data, file_data )
+        
+        range_headers[ 'If-Range' ] = '"' + hash_hex + '"'
+        
+        connection.request( 'GET', path, headers = range_headers )
+        
+        response = connection.getresponse()
+        
+        data = response.read()
+        
+        self.assertEqual( response.status, 206 )
+        
+        self.assertEqual( data, file_data[100:200] )
+        
+        # conditional
+        
+        conditional_headers = dict( headers )
+        
+        conditional_headers[ 'If-None-Match' ] = '"abcd", W/"' + hash_hex + '"'
+        
+        connection.request( 'GET', path, headers = conditional_headers )
+        
+        response = connection.getresponse()
+        
+        data = response.read()
+        
+        self.assertEqual( response.status, 304 )
+        
+        self.assertEqual( data, b'' )
+        
+        conditional_headers[ 'If-None-Match' ] = '"abcd"'
+        conditional_headers[ 'If-Modified-Since' ] = last_modified
+        
+        connection.request( 'GET', path, headers = conditional_headers )
+        
+        response = connection.getresponse()
+        
+        data = response.read()
+        
+        self.assertEqual( response.status, 200 )
+        
+        self.assertEqual( data, file_data )
+        
+        del conditional_headers[ 'If-None-Match' ]
+        
+        connection.request( 'GET', path, headers = conditional_headers )
+        
+        response = connection.getresponse()
+        
+        data = response.read()
+        
+        self.assertEqual( response.status, 304 )
+        
         #
         
         path = '/get_files/thumbnail?hash={}'.format( hash_hex )
@@ -1926,6 +2160,24 @@ class TestClientAPI( unittest.TestCase ):
         
         self.assertEqual( hashlib.sha256( data ).digest(), thumb_hash )
         
+        # thumbnails can be regenerated, so they get a validator from the file on disk
+        
+        etag = response.getheader( 'ETag' )
+        
+        self.assertNotEqual( etag, '"' + hash_hex + '"' )
+        
+        conditional_headers = dict( headers )
+        
+        conditional_headers[ 'If-None-Match' ] = etag
+        
+        connection.request( 'GET', path, headers = conditional_headers )
+        
+        response = connection.getresponse()
+        
+        data = response.read()
+        
+        self.assertEqual( response.status, 304 )
+        
         # now 404
         
         hash_404 = os.urandom( 32 )
@@ -1987,6 +2239,7 @@ class TestClientAPI( unittest.TestCase ):
         self._test_add_tags( connection, set_up_permissions )
         self._test_add_urls( connection, set_up_permissions )
         self._test_manage_cookies( connection, set_up_permissions )
+        self._test_manage_database( connection, set_up_permissions )
         self._test_manage_pages( connection, set_up_permissions )
         self._test_search_files( connection, set_up_permissions )
         self._test_permission_failures( connection, set_up_permissions )
@@ -3,13 +3,17 @@ from . import ClientGUIManagement
 from . import ClientManagers
 from . import ClientNetworking
 from . import ClientCaches
+from . import ClientFiles
 from . import ClientServices
+from . import ClientThreading
 import collections
 from . import HydrusConstants as HC
 import os
+import time
 import unittest
 from . import HydrusData
 from . import HydrusGlobals as HG
+from mock import patch
 
 class TestManagers( unittest.TestCase ):
     
@@ -70,6 +74,68 @@ class TestManagers( unittest.TestCase ):
         self.assertRaises( Exception, services_manager.GetService, other_key )
         
     
+    def test_repository_update_iteration( self ):
+        
+        repo = ClientServices.GenerateService( HydrusData.GenerateKey(), HC.TAG_REPOSITORY, 'test tag repo' )
+        
+        update_hashes = [ HydrusData.GenerateKey() for i in range( 6 ) ]
+        
+        bad_update_hash = update_hashes[3]
+        
+        def load_update( update_hash, mime ):
+            
+            # the later ones finish first, so the prefetch has to put them back in order
+            
+            time.sleep( 0.05 * ( len( update_hashes ) - update_hashes.index( update_hash ) ) )
+            
+            if update_hash == bad_update_hash:
+                
+                return ( None, ClientFiles.REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_DATA, 'bad update' )
+                
+            
+            return ( update_hash.hex(), None, None )
+            
+        
+        with patch.object( repo, '_LoadUpdate', load_update ):
+            
+            job_key = ClientThreading.JobKey()
+            
+            results = [ update for ( update_hash, update ) in repo._IterateUpdates( update_hashes[:3], HC.APPLICATION_HYDRUS_UPDATE_CONTENT, job_key ) ]
+            
+            self.assertEqual( results, [ update_hash.hex() for update_hash in update_hashes[:3] ] )
+            
+            # the bad update is found while we are still on the first, but we should get everything before it, and only then hear about it
+            
+            iterator = repo._IterateUpdates( update_hashes, HC.APPLICATION_HYDRUS_UPDATE_CONTENT, job_key )
+            
+            for update_hash in update_hashes[:3]:
+                
+                self.assertEqual( next( iterator ), ( update_hash, update_hash.hex() ) )
+                
+                self.assertEqual( HG.test_controller.GetWrite( 'schedule_repository_update_file_maintenance' ), [] )
+                
+            
+            with self.assertRaises( Exception ) as context:
+                
+                next( iterator )
+                
+            
+            self.assertEqual( str( context.exception ), 'bad update' )
+            
+            [ ( args, kwargs ) ] = HG.test_controller.GetWrite( 'schedule_repository_update_file_maintenance' )
+            
+            self.assertEqual( args, ( repo.GetServiceKey(), ClientFiles.REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_DATA ) )
+            
+            # and a cancel stops us waiting
+            
+            job_key = ClientThreading.JobKey( cancellable = True )
+            
+            job_key.Cancel()
+            
+            self.assertEqual( list( repo._IterateUpdates( update_hashes, HC.APPLICATION_HYDRUS_UPDATE_CONTENT, job_key ) ), [] )
+            
+        
+    
     def test_undo( self ):
         
         hash_1 = HydrusData.GenerateKey()
@@ -1,4 +1,5 @@
 from . import ClientConstants as CC
+from . import ClientController
 from . import ClientData
 from . import ClientDB
 from . import ClientDefaults
@@ -15,9 +16,11 @@ from . import ClientRatings
 from . import ClientSearch
 from . import ClientServices
 from . import ClientTags
+from . import ClientThreading
 import collections
 from . import HydrusConstants as HC
 from . import HydrusData
+from . import HydrusDB
 from . import HydrusExceptions
 from . import HydrusVideoHandling
 from . import HydrusGlobals as HG
@@ -33,6 +36,7 @@ from . import TestController
 import time
 import threading
 import unittest
+from mock import patch
 
 class TestClientDB( unittest.TestCase ):
     
@@ -186,6 +190,71 @@ class TestClientDB( unittest.TestCase ):
         
         self.assertEqual( result, [] )
         
+        # complex wildcards
+        
+        result = self._read( 'autocomplete_predicates', tag_service_key = CC.DEFAULT_LOCAL_TAG_SERVICE_KEY, search_text = '*ars' )
+        
+        self.assertEqual( set( result ), { ClientSearch.Predicate( HC.PREDICATE_TYPE_TAG, 'series:cars', min_current_count = 1 ) } )
+        
+        result = self._read( 'autocomplete_predicates', tag_service_key = CC.DEFAULT_LOCAL_TAG_SERVICE_KEY, search_text = '*or*' )
+        
+        self.assertEqual( set( result ), { ClientSearch.Predicate( HC.PREDICATE_TYPE_TAG, 'maker:ford', min_current_count = 1 ) } )
+        
+        result = self._read( 'autocomplete_predicates', tag_service_key = CC.DEFAULT_LOCAL_TAG_SERVICE_KEY, search_text = '*arz*' )
+        
+        self.assertEqual( result, [] )
+        
+    
+    def test_backup( self ):
+        
+        backup_dir = os.path.join( TestController.DB_DIR, 'backup' )
+        
+        def do_backup():
+            
+            job_key = self._write( 'backup', backup_dir )
+            
+            while not job_key.IsDone():
+                
+                time.sleep( 0.05 )
+                
+            
+            self.assertEqual( job_key.GetIfHasVariable( 'popup_text_1' ), 'backup complete!' )
+            
+        
+        try:
+            
+            do_backup()
+            
+            for filename in TestClientDB._db._db_filenames.values():
+                
+                db = sqlite3.connect( os.path.join( backup_dir, filename ) )
+                
+                self.assertEqual( db.execute( 'PRAGMA integrity_check;' ).fetchone(), ( 'ok', ) )
+                
+                db.close()
+                
+            
+            db = sqlite3.connect( os.path.join( backup_dir, 'client.db' ) )
+            
+            ( num_services, ) = db.execute( 'SELECT COUNT( * ) FROM services;' ).fetchone()
+            
+            db.close()
+            
+            self.assertEqual( num_services, len( self._read( 'services' ) ) )
+            
+            # nothing has changed, so the update should not copy anything
+            
+            filenames_to_mtimes = { filename : os.stat( os.path.join( backup_dir, filename ) ).st_mtime_ns for filename in TestClientDB._db._db_filenames.values() }
+            
+            do_backup()
+            
+            self.assertEqual( filenames_to_mtimes, { filename : os.stat( os.path.join( backup_dir, filename ) ).st_mtime_ns for filename in TestClientDB._db._db_filenames.values() } )
+            
+        finally:
+            
+            shutil.rmtree( backup_dir )
+            
+        
     
     def test_export_folders( self ):
         
@@ -371,7 +440,10 @@ class TestClientDB( unittest.TestCase ):
         tests.append( ( HC.PREDICATE_TYPE_SYSTEM_RATIO, ( '\u2248', 200, 201 ), 1 ) )
         tests.append( ( HC.PREDICATE_TYPE_SYSTEM_RATIO, ( '\u2248', 4, 1 ), 0 ) )
         
+        tests.append( ( HC.PREDICATE_TYPE_SYSTEM_SIMILAR_TO, ( ( hash, ), 0 ), 1 ) )
         tests.append( ( HC.PREDICATE_TYPE_SYSTEM_SIMILAR_TO, ( ( hash, ), 5 ), 1 ) )
+        tests.append( ( HC.PREDICATE_TYPE_SYSTEM_SIMILAR_TO, ( ( hash, ), 10 ), 1 ) )
+        tests.append( ( HC.PREDICATE_TYPE_SYSTEM_SIMILAR_TO, ( ( hash, ), 16 ), 1 ) )
         tests.append( ( HC.PREDICATE_TYPE_SYSTEM_SIMILAR_TO, ( ( bytes.fromhex( '0123456789abcdef' * 4 ), ), 5 ), 0 ) )
         
         tests.append( ( HC.PREDICATE_TYPE_SYSTEM_SIZE, ( '<', 0, HydrusData.ConvertUnitToInt( 'B' ) ), 0 ) )
@@ -782,6 +854,60 @@ class TestClientDB( unittest.TestCase ):
         HG.test_controller.CallBlockingToQt( HG.test_controller.win, qt_code )
         
     
+    def test_gui_session_autosave( self ):
+        
+        class FakeController( object ):
+            
+            def __init__( self ):
+                
+                self._last_last_session_hash = None
+                
+                self.num_writes = 0
+                
+            
+            def WriteSynchronous( self, name, *args, **kwargs ):
+                
+                self.num_writes += 1
+                
+            
+            def pub( self, *args, **kwargs ):
+                
+                pass
+                
+            
+        
+        management_controller = ClientGUIManagement.CreateManagementControllerImportHDD( [ 'path {}'.format( i ) for i in range( 100 ) ], ClientImportOptions.FileImportOptions(), {}, True )
+        
+        session = ClientGUIPages.GUISession( 'last session' )
+        
+        session._page_tuples = [ ( 'page', ( management_controller, [] ) ) ]
+        
+        session = HydrusSerialisable.CreateFromBinary( session.DumpToBinary() )
+        
+        ( page_type, ( loaded_management_controller, hashes ) ) = session._page_tuples[0]
+        
+        file_seed_cache = loaded_management_controller.GetVariable( 'hdd_import' ).GetFileSeedCache()
+        
+        self.assertIsNotNone( file_seed_cache._lazy_binary )
+        
+        # the autosave of a session nobody touched should not unpack its seeds, only to find nothing changed
+        
+        fake_controller = FakeController()
+        
+        with patch.object( ClientImportFileSeeds.FileSeedCache, '_LoadFileSeeds' ) as load_file_seeds, patch.object( HydrusSerialisable, 'UnpackBinary' ) as unpack_binary:
+            
+            ClientController.Controller.SaveGUISession( fake_controller, session )
+            ClientController.Controller.SaveGUISession( fake_controller, session )
+            
+            load_file_seeds.assert_not_called()
+            unpack_binary.assert_not_called()
+            
+        
+        self.assertEqual( fake_controller.num_writes, 1 )
+        
+        self.assertIsNotNone( file_seed_cache._lazy_binary )
+        
+    
     def test_import( self ):
         
         TestClientDB._clear_db()
@@ -908,6 +1034,41 @@ class TestClientDB( unittest.TestCase ):
             
         
     
+    def test_hash_id_set( self ):
+        
+        # sparse and dense buckets, and the boundaries between them
+        
+        sparse_ids = set( range( 0, 65536 * 3, 97 ) )
+        dense_ids = set( range( 65536 * 2, 65536 * 2 + 20000 ) )
+        other_ids = set( range( 65536 * 2 - 50, 65536 * 2 + 50 ) ).union( { 0, 65535, 65536, 10 ** 9 } )
+        
+        for ( a, b ) in itertools.permutations( ( sparse_ids, dense_ids, other_ids, set() ), 2 ):
+            
+            hash_id_set = HydrusDB.HashIdSet( a )
+            
+            self.assertEqual( len( hash_id_set ), len( a ) )
+            self.assertEqual( list( hash_id_set ), sorted( a ) )
+            
+            self.assertEqual( set( hash_id_set.intersection( b ) ), a.intersection( b ) )
+            self.assertEqual( set( hash_id_set.intersection( HydrusDB.HashIdSet( b ) ) ), a.intersection( b ) )
+            self.assertEqual( set( hash_id_set.difference( b ) ), a.difference( b ) )
+            self.assertEqual( set( hash_id_set.union( b ) ), a.union( b ) )
+            
+            copy = hash_id_set.copy()
+            
+            copy.difference_update( b )
+            copy.update( b )
+            
+            self.assertEqual( len( copy ), len( a.union( b ) ) )
+            self.assertEqual( len( hash_id_set ), len( a ) )
+            
+            for hash_id in ( 0, 97, 65535, 65536 * 2 + 10000, 10 ** 9, 10 ** 12 ):
+                
+                self.assertEqual( hash_id in hash_id_set, hash_id in a )
+                
+            
+        
+    
     def test_hash_status( self ):
         
         TestClientDB._clear_db()
@@ -924,6 +1085,8 @@ class TestClientDB( unittest.TestCase ):
         
         self.assertEqual( result, ( CC.STATUS_UNKNOWN, None, '' ) )
         
+        self.assertFalse( self._read( 'is_known_file_size', os.path.getsize( path ) ) )
+        
         #
         
         file_import_job = ClientImportFileSeeds.FileImportJob( path )
@@ -934,6 +1097,8 @@ class TestClientDB( unittest.TestCase ):
         
         self._write( 'import_file', file_import_job )
         
+        self.assertTrue( self._read( 'is_known_file_size', os.path.getsize( path ) ) )
+        
         #
         
         ( status, written_hash, note ) = self._read( 'hash_status', 'md5', md5 )
@@ -961,6 +1126,31 @@ class TestClientDB( unittest.TestCase ):
         self.assertEqual( ( status, hash ), ( CC.STATUS_DELETED, hash ) )
         
     
+    def test_job_statistics( self ):
+        
+        TestClientDB._db.ResetJobStatistics()
+        
+        for i in range( 10 ):
+            
+            self._read( 'services' )
+            
+        
+        report = TestClientDB._db.GetJobStatistics()
+        
+        services_report = report[ 'actions' ][ 'services' ]
+        
+        self.assertEqual( services_report[ 'job_type' ], 'read' )
+        self.assertEqual( services_report[ 'count' ], 10 )
+        self.assertEqual( services_report[ 'rows' ], 10 * len( self._read( 'services' ) ) )
+        
+        execution_time = services_report[ 'execution_time' ]
+        
+        self.assertTrue( 0 < execution_time[ 'p50' ] <= execution_time[ 'p95' ] <= execution_time[ 'p99' ] <= execution_time[ 'max' ] )
+        self.assertGreaterEqual( services_report[ 'queue_time' ][ 'mean' ], 0 )
+        
+        self.assertEqual( report[ 'slow_jobs' ], [] )
+        
+    
     def test_media_results( self ):
         
         TestClientDB._clear_db()
@@ -1086,6 +1276,283 @@ class TestClientDB( unittest.TestCase ):
         self.assertTrue( result, ( pixiv_id, password ) )
         
     
+    def test_read_connections( self ):
+        
+        TestClientDB._clear_db()
+        
+        search_context = ClientSearch.FileSearchContext( file_service_key = CC.LOCAL_FILE_SERVICE_KEY )
+        
+        self.assertEqual( len( self._read( 'file_query_ids', search_context ) ), 0 )
+        
+        path = os.path.join( HC.STATIC_DIR, 'hydrus.png' )
+        
+        file_import_job = ClientImportFileSeeds.FileImportJob( path )
+        
+        file_import_job.GenerateHashAndStatus()
+        
+        file_import_job.GenerateInfo()
+        
+        self._write( 'import_file', file_import_job )
+        
+        # the import is not committed yet, so only the write connection can see it
+        
+        self.assertEqual( len( TestClientDB._db.ReadSnapshot( 'file_query_ids', search_context ) ), 0 )
+        
+        self.assertEqual( len( self._read( 'file_query_ids', search_context ) ), 1 )
+        
+    
+    def test_repository_bulk_mappings( self ):
+        
+        TestClientDB._clear_db()
+        
+        path = os.path.join( HC.STATIC_DIR, 'hydrus.png' )
+        
+        file_import_job = ClientImportFileSeeds.FileImportJob( path )
+        
+        file_import_job.GenerateHashAndStatus()
+        
+        file_import_job.GenerateInfo()
+        
+        self._write( 'import_file', file_import_job )
+        
+        local_hash = file_import_job.GetHash()
+        
+        ( local_hash_id, ) = self._read( 'file_query_ids', ClientSearch.FileSearchContext( file_service_key = CC.LOCAL_FILE_SERVICE_KEY ) )
+        
+        hashes = [ local_hash ] + [ os.urandom( 32 ) for i in range( 9 ) ]
+        tags = [ 'blue eyes', 'character:samus aran', 'series:metroid', 'eye colour:blue' ]
+        
+        # each update is new mappings, deleted mappings, new siblings and new parents, and later rows take back earlier ones
+        # the first update's parent fills in 'series:metroid' on files 1 and 2, so it has to see that update's mappings
+        
+        content_updates = []
+        
+        content_updates.append( ( [ ( 0, list( range( 10 ) ) ), ( 1, [ 0, 1, 2 ] ), ( 2, [ 0, 5 ] ) ], [ ( 2, [ 5 ] ) ], [ ( 0, 3 ) ], [ ( 1, 2 ) ] ) )
+        content_updates.append( ( [ ( 2, [ 5, 6 ] ) ], [ ( 0, [ 0, 3 ] ), ( 1, [ 1 ] ) ], [], [] ) )
+        content_updates.append( ( [ ( 1, [ 1 ] ), ( 0, [ 0 ] ) ], [ ( 1, [ 0 ] ) ], [], [] ) )
+        
+        normal_service_key = HydrusData.GenerateKey()
+        bulk_service_key = HydrusData.GenerateKey()
+        
+        services = self._read( 'services' )
+        
+        old_services = list( services )
+        
+        services.append( ClientServices.GenerateService( normal_service_key, HC.TAG_REPOSITORY, 'normal tag repo' ) )
+        services.append( ClientServices.GenerateService( bulk_service_key, HC.TAG_REPOSITORY, 'bulk tag repo' ) )
+        
+        self._write( 'update_services', services )
+        
+        original_min_unprocessed_updates = ClientDB.REPOSITORY_BULK_MAPPINGS_MIN_UNPROCESSED_UPDATES
+        
+        try:
+            
+            for service_key in ( normal_service_key, bulk_service_key ):
+                
+                ClientDB.REPOSITORY_BULK_MAPPINGS_MIN_UNPROCESSED_UPDATES = 0 if service_key == bulk_service_key else original_min_unprocessed_updates
+                
+                definition_iterator_dict = {}
+                
+                definition_iterator_dict[ 'service_hash_ids_to_hashes' ] = iter( enumerate( hashes ) )
+                definition_iterator_dict[ 'service_tag_ids_to_tags' ] = iter( enumerate( tags ) )
+                
+                self._write( 'process_repository_definitions', service_key, HydrusData.GenerateKey(), definition_iterator_dict, ClientThreading.JobKey(), 60 )
+                
+                for ( new_mappings, deleted_mappings, new_siblings, new_parents ) in content_updates:
+                    
+                    content_iterator_dict = {}
+                    
+                    content_iterator_dict[ 'new_mappings' ] = iter( new_mappings )
+                    content_iterator_dict[ 'deleted_mappings' ] = iter( deleted_mappings )
+                    content_iterator_dict[ 'new_mappings_rows' ] = ( ( tag_id, hash_id ) for ( tag_id, hash_ids ) in new_mappings for hash_id in hash_ids )
+                    content_iterator_dict[ 'deleted_mappings_rows' ] = ( ( tag_id, hash_id ) for ( tag_id, hash_ids ) in deleted_mappings for hash_id in hash_ids )
+                    content_iterator_dict[ 'new_siblings' ] = iter( new_siblings )
+                    content_iterator_dict[ 'new_parents' ] = iter( new_parents )
+                    
+                    self._write( 'process_repository_content', service_key, HydrusData.GenerateKey(), content_iterator_dict, ClientThreading.JobKey(), 60 )
+                    
+                
+            
+        finally:
+            
+            ClientDB.REPOSITORY_BULK_MAPPINGS_MIN_UNPROCESSED_UPDATES = original_min_unprocessed_updates
+            
+        
+        # the first update is built in one go, the rest are played back over it, and both should land where the normal path does
+        # the bulk service stages from the flat rows, the normal one ignores them
+        
+        def get_results( service_key ):
+            
+            hash_ids_to_tags_managers = self._read( 'force_refresh_tags_managers', ( local_hash_id, ) )
+            
+            tags_manager = hash_ids_to_tags_managers[ local_hash_id ]
+            
+            current = tags_manager.GetCurrent( service_key, ClientTags.TAG_DISPLAY_STORAGE )
+            deleted = tags_manager.GetDeleted( service_key, ClientTags.TAG_DISPLAY_STORAGE )
+            display_current = tags_manager.GetCurrent( service_key, ClientTags.TAG_DISPLAY_SIBLINGS_AND_PARENTS )
+            
+            counts = set()
+            
+            for file_service_key in ( CC.COMBINED_FILE_SERVICE_KEY, CC.LOCAL_FILE_SERVICE_KEY ):
+                
+                for search_text in ( 'b*', 'character:*', 'series:*', 'eye colour:*' ):
+                    
+                    result = self._read( 'autocomplete_predicates', tag_service_key = service_key, file_service_key = file_service_key, search_text = search_text )
+                    
+                    counts.update( ( file_service_key, predicate.GetValue(), predicate.GetCount( HC.CONTENT_STATUS_CURRENT ) ) for predicate in result )
+                    
+                
+            
+            service_info = self._read( 'service_info', service_key )
+            
+            info = { info_type : service_info[ info_type ] for info_type in ( HC.SERVICE_INFO_NUM_FILES, HC.SERVICE_INFO_NUM_TAGS, HC.SERVICE_INFO_NUM_MAPPINGS, HC.SERVICE_INFO_NUM_DELETED_MAPPINGS ) }
+            
+            return ( current, deleted, display_current, counts, info )
+            
+        
+        ( current, deleted, display_current, counts, info ) = get_results( normal_service_key )
+        
+        self.assertEqual( current, { 'blue eyes', 'series:metroid' } )
+        self.assertEqual( deleted, { 'character:samus aran' } )
+        self.assertEqual( display_current, { 'eye colour:blue', 'series:metroid' } )
+        self.assertIn( ( CC.COMBINED_FILE_SERVICE_KEY, 'series:metroid', 5 ), counts )
+        self.assertIn( ( CC.LOCAL_FILE_SERVICE_KEY, 'blue eyes', 1 ), counts )
+        self.assertEqual( info[ HC.SERVICE_INFO_NUM_MAPPINGS ], 16 )
+        
+        self.assertEqual( get_results( bulk_service_key ), ( current, deleted, display_current, counts, info ) )
+        
+        #
+        
+        self._write( 'update_services', old_services )
+        
+    
+    def test_repository_bulk_pairs_order( self ):
+        
+        TestClientDB._clear_db()
+        
+        path = os.path.join( HC.STATIC_DIR, 'hydrus.png' )
+        
+        file_import_job = ClientImportFileSeeds.FileImportJob( path )
+        
+        file_import_job.GenerateHashAndStatus()
+        
+        file_import_job.GenerateInfo()
+        
+        self._write( 'import_file', file_import_job )
+        
+        local_hash = file_import_job.GetHash()
+        
+        ( local_hash_id, ) = self._read( 'file_query_ids', ClientSearch.FileSearchContext( file_service_key = CC.LOCAL_FILE_SERVICE_KEY ) )
+        
+        hashes = [ local_hash, os.urandom( 32 ), os.urandom( 32 ) ]
+        tags = [ 'character:samus aran', 'series:metroid' ]
+        
+        # the first update adds the parent, which fills in 'series:metroid' on files 0 and 1
+        # the second deletes the child from file 0 and the filled in parent from file 1, and only then maps the child to file 2, which should not get the parent
+        
+        content_updates = []
+        
+        content_updates.append( ( [ ( 0, [ 0, 1 ] ) ], [], [ ( 0, 1 ) ] ) )
+        content_updates.append( ( [ ( 0, [ 2 ] ) ], [ ( 0, [ 0 ] ), ( 1, [ 1 ] ) ], [] ) )
+        
+        normal_service_key = HydrusData.GenerateKey()
+        bulk_service_key = HydrusData.GenerateKey()
+        
+        services = self._read( 'services' )
+        
+        old_services = list( services )
+        
+        services.append( ClientServices.GenerateService( normal_service_key, HC.TAG_REPOSITORY, 'normal tag repo' ) )
+        services.append( ClientServices.GenerateService( bulk_service_key, HC.TAG_REPOSITORY, 'bulk tag repo' ) )
+        
+        self._write( 'update_services', services )
+        
+        # the updates are registered up front, so the bulk service stages both before it flushes
+        
+        update_network_bytes = HydrusNetwork.ContentUpdate().DumpToNetworkBytes()
+        
+        original_min_unprocessed_updates = ClientDB.REPOSITORY_BULK_MAPPINGS_MIN_UNPROCESSED_UPDATES
+        
+        try:
+            
+            for service_key in ( normal_service_key, bulk_service_key ):
+                
+                ClientDB.REPOSITORY_BULK_MAPPINGS_MIN_UNPROCESSED_UPDATES = 0 if service_key == bulk_service_key else original_min_unprocessed_updates
+                
+                metadata = HydrusNetwork.Metadata()
+                
+                update_hashes = [ os.urandom( 32 ) for content_update in content_updates ]
+                
+                for ( i, update_hash ) in enumerate( update_hashes ):
+                    
+                    self._write( 'import_update', update_network_bytes, update_hash, HC.APPLICATION_HYDRUS_UPDATE_CONTENT )
+                    
+                    metadata.AppendUpdate( [ update_hash ], i * 100, ( i + 1 ) * 100 - 1, ( i + 2 ) * 100 )
+                    
+                
+                self._write( 'associate_repository_update_hashes', service_key, metadata )
+                
+                definition_iterator_dict = {}
+                
+                definition_iterator_dict[ 'service_hash_ids_to_hashes' ] = iter( enumerate( hashes ) )
+                definition_iterator_dict[ 'service_tag_ids_to_tags' ] = iter( enumerate( tags ) )
+                
+                self._write( 'process_repository_definitions', service_key, HydrusData.GenerateKey(), definition_iterator_dict, ClientThreading.JobKey(), 60 )
+                
+                for ( update_hash, ( new_mappings, deleted_mappings, new_parents ) ) in zip( update_hashes, content_updates ):
+                    
+                    content_iterator_dict = {}
+                    
+                    content_iterator_dict[ 'new_mappings' ] = iter( new_mappings )
+                    content_iterator_dict[ 'deleted_mappings' ] = iter( deleted_mappings )
+                    content_iterator_dict[ 'new_mappings_rows' ] = ( ( tag_id, hash_id ) for ( tag_id, hash_ids ) in new_mappings for hash_id in hash_ids )
+                    content_iterator_dict[ 'deleted_mappings_rows' ] = ( ( tag_id, hash_id ) for ( tag_id, hash_ids ) in deleted_mappings for hash_id in hash_ids )
+                    content_iterator_dict[ 'new_parents' ] = iter( new_parents )
+                    
+                    self._write( 'process_repository_content', service_key, update_hash, content_iterator_dict, ClientThreading.JobKey(), 60 )
+                    
+                
+            
+        finally:
+            
+            ClientDB.REPOSITORY_BULK_MAPPINGS_MIN_UNPROCESSED_UPDATES = original_min_unprocessed_updates
+            
+        
+        def get_results( service_key ):
+            
+            hash_ids_to_tags_managers = self._read( 'force_refresh_tags_managers', ( local_hash_id, ) )
+            
+            tags_manager = hash_ids_to_tags_managers[ local_hash_id ]
+            
+            current = tags_manager.GetCurrent( service_key, ClientTags.TAG_DISPLAY_STORAGE )
+            deleted = tags_manager.GetDeleted( service_key, ClientTags.TAG_DISPLAY_STORAGE )
+            
+            counts = {}
+            
+            for search_text in ( 'character:*', 'series:*' ):
+                
+                result = self._read( 'autocomplete_predicates', tag_service_key = service_key, file_service_key = CC.COMBINED_FILE_SERVICE_KEY, search_text = search_text )
+                
+                counts.update( { predicate.GetValue() : predicate.GetCount( HC.CONTENT_STATUS_CURRENT ) for predicate in result if predicate.GetValue() in tags } )
+                
+            
+            
+            return ( current, deleted, counts )
+            
+        
+        ( current, deleted, counts ) = get_results( normal_service_key )
+        
+        self.assertEqual( current, { 'series:metroid' } )
+        self.assertEqual( deleted, { 'character:samus aran' } )
+        self.assertEqual( counts, { 'character:samus aran' : 2, 'series:metroid' : 1 } )
+        
+        self.assertEqual( get_results( bulk_service_key ), ( current, deleted, counts ) )
+        
+        #
+        
+        self._write( 'update_services', old_services )
+        
+    
     def test_services( self ):
         
         result = self._read( 'services', ( HC.LOCAL_FILE_DOMAIN, HC.LOCAL_FILE_TRASH_DOMAIN, HC.COMBINED_LOCAL_FILE, HC.LOCAL_TAG ) )
@@ -1170,3 +1637,78 @@ class TestClientDB( unittest.TestCase ):
             
         
     
+    def test_tag_display_cache( self ):
+        
+        TestClientDB._clear_db()
+        
+        path = os.path.join( HC.STATIC_DIR, 'hydrus.png' )
+        
+        file_import_job = ClientImportFileSeeds.FileImportJob( path )
+        
+        file_import_job.GenerateHashAndStatus()
+        
+        file_import_job.GenerateInfo()
+        
+        self._write( 'import_file', file_import_job )
+        
+        hash = file_import_job.GetHash()
+        
+        ( hash_id, ) = self._read( 'file_query_ids', ClientSearch.FileSearchContext( file_service_key = CC.LOCAL_FILE_SERVICE_KEY ) )
+        
+        def get_display_tags():
+            
+            hash_ids_to_tags_managers = self._read( 'force_refresh_tags_managers', ( hash_id, ) )
+            
+            tags_manager = hash_ids_to_tags_managers[ hash_id ]
+            
+            current = tags_manager.GetCurrent( CC.DEFAULT_LOCAL_TAG_SERVICE_KEY, ClientTags.TAG_DISPLAY_SIBLINGS_AND_PARENTS )
+            pending = tags_manager.GetPending( CC.DEFAULT_LOCAL_TAG_SERVICE_KEY, ClientTags.TAG_DISPLAY_SIBLINGS_AND_PARENTS )
+            
+            return ( current, pending )
+            
+        
+        def do_content_updates( content_updates ):
+            
+            self._write( 'content_updates', { CC.DEFAULT_LOCAL_TAG_SERVICE_KEY : content_updates } )
+            
+        
+        do_content_updates( [ HydrusData.ContentUpdate( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_ADD, ( tag, ( hash, ) ) ) for tag in ( 'lotr', 'character:frodo' ) ] )
+        
+        self.assertEqual( get_display_tags(), ( { 'lotr', 'character:frodo' }, set() ) )
+        
+        # siblings apply to existing mappings
+        
+        do_content_updates( [ HydrusData.ContentUpdate( HC.CONTENT_TYPE_TAG_SIBLINGS, HC.CONTENT_UPDATE_ADD, ( bad_tag, 'series:lord of the rings' ) ) for bad_tag in ( 'lotr', 'the lord of the rings' ) ] )
+        
+        self.assertEqual( get_display_tags(), ( { 'series:lord of the rings', 'character:frodo' }, set() ) )
+        
+        # and to new ones
+        
+        do_content_updates( [ HydrusData.ContentUpdate( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_ADD, ( 'the lord of the rings', ( hash, ) ) ) ] )
+        
+        self.assertEqual( get_display_tags(), ( { 'series:lord of the rings', 'character:frodo' }, set() ) )
+        
+        # the ideal tag stays while any of its chain is still there
+        
+        do_content_updates( [ HydrusData.ContentUpdate( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_DELETE, ( 'lotr', ( hash, ) ) ) ] )
+        
+        self.assertEqual( get_display_tags(), ( { 'series:lord of the rings', 'character:frodo' }, set() ) )
+        
+        do_content_updates( [ HydrusData.ContentUpdate( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_DELETE, ( 'the lord of the rings', ( hash, ) ) ) ] )
+        
+        self.assertEqual( get_display_tags(), ( { 'character:frodo' }, set() ) )
+        
+        # removing a sibling splits the chain back up
+        
+        do_content_updates( [ HydrusData.ContentUpdate( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_ADD, ( tag, ( hash, ) ) ) for tag in ( 'lotr', 'the lord of the rings' ) ] )
+        do_content_updates( [ HydrusData.ContentUpdate( HC.CONTENT_TYPE_TAG_SIBLINGS, HC.CONTENT_UPDATE_DELETE, ( 'lotr', 'series:lord of the rings' ) ) ] )
+        
+        self.assertEqual( get_display_tags(), ( { 'lotr', 'series:lord of the rings', 'character:frodo' }, set() ) )
+        
+        # regenerating gives the same answer
+        
+        self._write( 'regenerate_tag_display_cache' )
+        
+        self.assertEqual( get_display_tags(), ( { 'lotr', 'series:lord of the rings', 'character:frodo' }, set() ) )
+        
+    
@@ -3,6 +3,7 @@ from . import ClientData
 from . import ClientDB
 from . import ClientDefaults
 from . import ClientDownloading
+from . import ClientDuplicates
 from . import ClientExporting
 from . import ClientFiles
 from . import ClientGUIManagement
@@ -1059,3 +1060,40 @@ class TestClientDBDuplicates( unittest.TestCase ):
         self._test_dissolve()
         
     
+    def test_phash_index( self ):
+        
+        phash_ids_and_phashes = [ ( phash_id, os.urandom( 8 ) ) for phash_id in range( 1, 2001 ) ]
+        
+        phash_index = ClientDuplicates.PerceptualHashIndex( phash_ids_and_phashes[ : 1000 ] )
+        
+        phash_index.Add( phash_ids_and_phashes[ 1000 : ] )
+        
+        phash_index.Remove( { 5 } )
+        
+        search_phashes = [ phash_ids_and_phashes[4][1], phash_ids_and_phashes[1500][1], os.urandom( 8 ) ]
+        
+        for max_hamming_distance in ( 0, 8, 24 ):
+            
+            results = phash_index.Search( search_phashes, max_hamming_distance )
+            
+            for ( search_phash, similar_phash_ids_to_distances ) in zip( search_phashes, results ):
+                
+                expected = {}
+                
+                for ( phash_id, phash ) in phash_ids_and_phashes:
+                    
+                    distance = HydrusData.Get64BitHammingDistance( search_phash, phash )
+                    
+                    if phash_id != 5 and distance <= max_hamming_distance:
+                        
+                        expected[ phash_id ] = distance
+                        
+                    
+                
+                self.assertEqual( similar_phash_ids_to_distances, expected )
+                
+            
+        
+        self.assertEqual( phash_index.GetNumPHashes(), 1999 )
+        
+    
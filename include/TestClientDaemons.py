@@ -1,10 +1,15 @@
 from . import ClientDaemons
+from . import ClientFiles
 from . import ClientImporting
 from . import ClientImportLocal
+from . import ClientMedia
 from . import ClientPaths
+from . import ClientRatings
 import collections
+import hashlib
 from . import HydrusConstants as HC
 import os
+import random
 import shutil
 import stat
 import unittest
@@ -79,3 +84,58 @@ class TestDaemons( unittest.TestCase ):
             
         
     
+class TestFilesMaintenance( unittest.TestCase ):
+    
+    def test_parallel_jobs( self ):
+        
+        old_file_maintenance_workers = HG.test_controller.new_options.GetInteger( 'file_maintenance_workers' )
+        
+        HG.test_controller.new_options.SetInteger( 'file_maintenance_workers', 4 )
+        
+        try:
+            
+            files_maintenance_manager = ClientFiles.FilesMaintenanceManager( HG.test_controller )
+            
+            expected_cleared_jobs = set()
+            media_results = []
+            
+            for i in range( 20 ):
+                
+                file_bytes = os.urandom( random.randint( 1024, 65536 ) )
+                
+                hash = hashlib.sha256( file_bytes ).digest()
+                
+                HG.test_controller.client_files_manager.LocklessAddFileFromBytes( hash, HC.APPLICATION_OCTET_STREAM, file_bytes )
+                
+                expected_cleared_jobs.add( ( hash, ClientFiles.REGENERATE_FILE_DATA_JOB_OTHER_HASHES, ( hashlib.md5( file_bytes ).digest(), hashlib.sha1( file_bytes ).digest(), hashlib.sha512( file_bytes ).digest() ) ) )
+                
+                file_info_manager = ClientMedia.FileInfoManager( i + 1, hash, size = len( file_bytes ), mime = HC.APPLICATION_OCTET_STREAM )
+                
+                tags_manager = ClientMedia.TagsManager( {} )
+                locations_manager = ClientMedia.LocationsManager( set(), set(), set(), set() )
+                ratings_manager = ClientRatings.RatingsManager( {} )
+                file_viewing_stats_manager = ClientMedia.FileViewingStatsManager( 0, 0, 0, 0 )
+                
+                media_results.append( ClientMedia.MediaResult( file_info_manager, tags_manager, locations_manager, ratings_manager, file_viewing_stats_manager ) )
+                
+            
+            HG.test_controller.ClearWrites( 'file_maintenance_clear_jobs' )
+            
+            files_maintenance_manager.RunJobImmediately( media_results, ClientFiles.REGENERATE_FILE_DATA_JOB_OTHER_HASHES, pub_job_key = False )
+            
+            cleared_jobs = []
+            
+            for ( ( rows, ), kwargs ) in HG.test_controller.GetWrite( 'file_maintenance_clear_jobs' ):
+                
+                cleared_jobs.extend( rows )
+                
+            
+            self.assertEqual( len( cleared_jobs ), 20 )
+            self.assertEqual( set( cleared_jobs ), expected_cleared_jobs )
+            
+        finally:
+            
+            HG.test_controller.new_options.SetInteger( 'file_maintenance_workers', old_file_maintenance_workers )
+            
+        
+    
@@ -1,7 +1,396 @@
+from . import ClientCaches
 from . import ClientConstants as CC
 from . import ClientImportOptions
 from . import ClientImportFileSeeds
+from . import ClientMedia
+from . import ClientRendering
 from . import HydrusConstants as HC
+from . import HydrusData
 from . import HydrusExceptions
+from . import HydrusGlobals as HG
+import numpy
 import os
+import shutil
+import tempfile
+import threading
 import unittest
+
+class GrowingData( object ):
+    
+    def __init__( self, memory_footprint ):
+        
+        self.memory_footprint = memory_footprint
+        
+    
+    def GetEstimatedMemoryFootprint( self ):
+        
+        return self.memory_footprint
+        
+    
+class TestDataCache( unittest.TestCase ):
+    
+    def _GetData( self, memory_footprint ):
+        
+        return ClientCaches.ParsedObject( None, memory_footprint )
+        
+    
+    def test_accounting( self ):
+        
+        data_cache = ClientCaches.DataCache( HG.test_controller, 'test', 1000 )
+        
+        data_cache.AddData( 'a', self._GetData( 100 ) )
+        data_cache.AddData( 'b', self._GetData( 200 ) )
+        data_cache.AddData( 'b', self._GetData( 400 ) )
+        
+        self.assertEqual( data_cache.GetEstimatedMemoryFootprint(), 300 )
+        
+        data_cache.DeleteData( 'a' )
+        
+        self.assertEqual( data_cache.GetEstimatedMemoryFootprint(), 200 )
+        
+        self.assertEqual( data_cache.GetIfHasData( 'a' ), None )
+        self.assertEqual( data_cache.GetIfHasData( 'b' ).GetEstimatedMemoryFootprint(), 200 )
+        
+        ( num_items, memory_footprint, num_hits, num_misses, num_evictions ) = data_cache.GetStats()
+        
+        self.assertEqual( ( num_items, memory_footprint, num_hits, num_misses, num_evictions ), ( 1, 200, 1, 1, 0 ) )
+        
+        data_cache.Clear()
+        
+        self.assertEqual( data_cache.GetEstimatedMemoryFootprint(), 0 )
+        
+    
+    def test_decompressed_data_cache( self ):
+        
+        numpy_image = numpy.random.randint( 0, 255, size = ( 100, 150, 3 ), dtype = numpy.uint8 )
+        
+        hydrus_bitmap = ClientRendering.GenerateHydrusBitmapFromNumPyImage( numpy_image )
+        
+        decompressed_data_cache = ClientCaches.DataCache( HG.test_controller, 'decompressed', 1048576 )
+        
+        hydrus_bitmap.SetDecompressedDataCache( decompressed_data_cache )
+        
+        # the first paint decompresses, the second comes straight from the cache
+        
+        self.assertEqual( bytes( hydrus_bitmap._GetData() ), numpy_image.tobytes() )
+        self.assertEqual( bytes( hydrus_bitmap._GetData() ), numpy_image.tobytes() )
+        
+        self.assertEqual( decompressed_data_cache.GetStats(), ( 1, 100 * 150 * 3, 1, 1, 0 ) )
+        
+        # it keeps to its own size, and does not take from the shared budget
+        
+        cache_memory_budget = ClientCaches.CacheMemoryBudget()
+        
+        cache_memory_budget.AddDataCache( decompressed_data_cache, shares_budget = False )
+        
+        self.assertEqual( cache_memory_budget.GetSize(), 0 )
+        self.assertEqual( cache_memory_budget.GetDataCaches(), [ decompressed_data_cache ] )
+        
+        cache_memory_budget.ShrinkToFit()
+        
+        self.assertEqual( decompressed_data_cache.GetStats()[0], 1 )
+        
+    
+    def test_memory_budget( self ):
+        
+        cache_memory_budget = ClientCaches.CacheMemoryBudget()
+        
+        big_cache = ClientCaches.DataCache( HG.test_controller, 'big', 1000, memory_budget = cache_memory_budget )
+        small_cache = ClientCaches.DataCache( HG.test_controller, 'small', 500, memory_budget = cache_memory_budget )
+        
+        self.assertEqual( cache_memory_budget.GetSize(), 1500 )
+        
+        # one cache can borrow the other's allowance while it is idle
+        
+        for i in range( 14 ):
+            
+            big_cache.AddData( i, self._GetData( 100 ) )
+            
+        
+        self.assertEqual( big_cache.GetEstimatedMemoryFootprint(), 1400 )
+        
+        for i in range( 3 ):
+            
+            small_cache.AddData( i, self._GetData( 100 ) )
+            
+        
+        self.assertEqual( big_cache.GetEstimatedMemoryFootprint() + small_cache.GetEstimatedMemoryFootprint(), 1500 )
+        
+        self.assertFalse( big_cache.HasData( 0 ) )
+        self.assertFalse( big_cache.HasData( 1 ) )
+        self.assertTrue( big_cache.HasData( 2 ) )
+        
+        self.assertEqual( big_cache.GetStats()[4], 2 )
+        
+    
+    def test_demotion_order( self ):
+        
+        data_cache = ClientCaches.DataCache( HG.test_controller, 'test', 1000 )
+        
+        data_cache.PROMOTION_DELAY = -1.0
+        
+        for key in ( 'a', 'b', 'c', 'd', 'e', 'f', 'g', 'h' ):
+            
+            data_cache.AddData( key, self._GetData( 100 ) )
+            
+            data_cache.GetData( key )
+            
+        
+        data_cache.AddData( 'new', self._GetData( 100 ) )
+        
+        # 'i' pushes 'a' out of protection, and 'a' must now be younger than 'new' on probation
+        
+        data_cache.AddData( 'i', self._GetData( 100 ) )
+        
+        data_cache.GetData( 'i' )
+        
+        self.assertEqual( list( data_cache._probationary_keys.keys() ), [ 'new', 'a' ] )
+        
+        last_access_times = list( data_cache._probationary_keys.values() )
+        
+        self.assertEqual( last_access_times, sorted( last_access_times ) )
+        
+    
+    def test_growth_on_touch( self ):
+        
+        data_cache = ClientCaches.DataCache( HG.test_controller, 'test', 1000 )
+        
+        growing_data = GrowingData( 100 )
+        
+        data_cache.AddData( 'a', self._GetData( 400 ) )
+        data_cache.AddData( 'b', growing_data )
+        
+        growing_data.memory_footprint = 900
+        
+        data_cache.GetData( 'b' )
+        
+        self.assertFalse( data_cache.HasData( 'a' ) )
+        self.assertEqual( data_cache.GetEstimatedMemoryFootprint(), 900 )
+        
+        # and the same through a shared budget
+        
+        cache_memory_budget = ClientCaches.CacheMemoryBudget()
+        
+        budget_cache = ClientCaches.DataCache( HG.test_controller, 'budget', 1000, memory_budget = cache_memory_budget )
+        
+        growing_data = GrowingData( 100 )
+        
+        budget_cache.AddData( 'a', self._GetData( 400 ) )
+        budget_cache.AddData( 'b', growing_data )
+        
+        growing_data.memory_footprint = 900
+        
+        budget_cache.GetIfHasData( 'b' )
+        
+        self.assertFalse( budget_cache.HasData( 'a' ) )
+        self.assertEqual( budget_cache.GetEstimatedMemoryFootprint(), 900 )
+        
+    
+    def test_scan_resistance( self ):
+        
+        data_cache = ClientCaches.DataCache( HG.test_controller, 'test', 1000 )
+        
+        data_cache.PROMOTION_DELAY = -1.0
+        
+        for key in ( 'a', 'b' ):
+            
+            data_cache.AddData( key, self._GetData( 100 ) )
+            
+            data_cache.GetData( key )
+            
+        
+        # a long scroll through new data that is looked at only once
+        
+        for i in range( 100 ):
+            
+            data_cache.AddData( i, self._GetData( 100 ) )
+            
+        
+        self.assertTrue( data_cache.HasData( 'a' ) )
+        self.assertTrue( data_cache.HasData( 'b' ) )
+        self.assertFalse( data_cache.HasData( 0 ) )
+        self.assertTrue( data_cache.HasData( 99 ) )
+        
+    
+class TestLocationsManager( unittest.TestCase ):
+    
+    def test_interning( self ):
+        
+        locations_manager_1 = ClientMedia.LocationsManager( { CC.LOCAL_FILE_SERVICE_KEY, CC.COMBINED_LOCAL_FILE_SERVICE_KEY }, set(), set(), set() )
+        locations_manager_2 = ClientMedia.LocationsManager( [ CC.COMBINED_LOCAL_FILE_SERVICE_KEY, CC.LOCAL_FILE_SERVICE_KEY ], set(), set(), set() )
+        
+        self.assertIs( locations_manager_1.GetCurrent(), locations_manager_2.GetCurrent() )
+        self.assertIs( locations_manager_1.GetDeleted(), locations_manager_2.GetPending() )
+        
+        dupe_locations_manager = locations_manager_1.Duplicate()
+        
+        self.assertIs( dupe_locations_manager.GetCurrent(), locations_manager_1.GetCurrent() )
+        
+    
+    def test_process_content_update( self ):
+        
+        hash = HydrusData.GenerateKey()
+        
+        locations_manager = ClientMedia.LocationsManager( { CC.LOCAL_FILE_SERVICE_KEY, CC.COMBINED_LOCAL_FILE_SERVICE_KEY }, set(), set(), set() )
+        other_locations_manager = ClientMedia.LocationsManager( { CC.LOCAL_FILE_SERVICE_KEY, CC.COMBINED_LOCAL_FILE_SERVICE_KEY }, set(), set(), set() )
+        
+        locations_manager.ProcessContentUpdate( CC.LOCAL_FILE_SERVICE_KEY, HydrusData.ContentUpdate( HC.CONTENT_TYPE_FILES, HC.CONTENT_UPDATE_DELETE, ( hash, ) ) )
+        
+        self.assertEqual( locations_manager.GetCurrent(), { CC.TRASH_SERVICE_KEY, CC.COMBINED_LOCAL_FILE_SERVICE_KEY } )
+        self.assertEqual( locations_manager.GetDeleted(), { CC.LOCAL_FILE_SERVICE_KEY } )
+        self.assertTrue( locations_manager.IsTrashed() )
+        
+        # the other file's shared set must not see the change
+        
+        self.assertEqual( other_locations_manager.GetCurrent(), { CC.LOCAL_FILE_SERVICE_KEY, CC.COMBINED_LOCAL_FILE_SERVICE_KEY } )
+        
+        locations_manager.ProcessContentUpdate( CC.TRASH_SERVICE_KEY, HydrusData.ContentUpdate( HC.CONTENT_TYPE_FILES, HC.CONTENT_UPDATE_UNDELETE, ( hash, ) ) )
+        
+        self.assertIs( locations_manager.GetCurrent(), other_locations_manager.GetCurrent() )
+        
+        locations_manager.ResetService( CC.LOCAL_FILE_SERVICE_KEY )
+        
+        self.assertEqual( locations_manager.GetCurrent(), { CC.COMBINED_LOCAL_FILE_SERVICE_KEY } )
+        self.assertEqual( locations_manager.GetDeleted(), set() )
+        
+    
+class TestThumbnailPixelStore( unittest.TestCase ):
+    
+    @classmethod
+    def setUpClass( cls ):
+        
+        cls._dir = tempfile.mkdtemp()
+        
+    
+    @classmethod
+    def tearDownClass( cls ):
+        
+        shutil.rmtree( cls._dir )
+        
+    
+    def _GetHydrusBitmap( self ):
+        
+        numpy_image = numpy.arange( 40 * 30 * 3, dtype = numpy.uint8 ).reshape( ( 30, 40, 3 ) )
+        
+        return ClientRendering.GenerateHydrusBitmapFromNumPyImage( numpy_image )
+        
+    
+    def test_damaged_store( self ):
+        
+        path = os.path.join( self._dir, 'test_damaged_store.db' )
+        
+        with open( path, 'wb' ) as f:
+            
+            f.write( b'this is not a database' * 100 )
+            
+        
+        hash = HydrusData.GenerateKey()
+        
+        bounding_dimensions = ( 150, 125 )
+        thumbnail_stat = ( 1234567890.5, 4096 )
+        
+        thumbnail_pixel_store = ClientCaches.ThumbnailPixelStore( path )
+        
+        thumbnail_pixel_store.StoreHydrusBitmap( hash, bounding_dimensions, thumbnail_stat, self._GetHydrusBitmap() )
+        
+        thumbnail_pixel_store.Flush()
+        
+        self.assertNotEqual( thumbnail_pixel_store.GetHydrusBitmap( hash, bounding_dimensions, thumbnail_stat ), None )
+        
+        thumbnail_pixel_store.Close()
+        
+    
+    def test_store( self ):
+        
+        path = os.path.join( self._dir, 'test_store.db' )
+        
+        hash = HydrusData.GenerateKey()
+        other_hash = HydrusData.GenerateKey()
+        
+        bounding_dimensions = ( 150, 125 )
+        thumbnail_stat = ( 1234567890.5, 4096 )
+        
+        hydrus_bitmap = self._GetHydrusBitmap()
+        
+        thumbnail_pixel_store = ClientCaches.ThumbnailPixelStore( path )
+        
+        self.assertEqual( thumbnail_pixel_store.GetHydrusBitmap( hash, bounding_dimensions, thumbnail_stat ), None )
+        
+        thumbnail_pixel_store.StoreHydrusBitmap( hash, bounding_dimensions, thumbnail_stat, hydrus_bitmap )
+        thumbnail_pixel_store.StoreHydrusBitmap( other_hash, bounding_dimensions, thumbnail_stat, hydrus_bitmap )
+        
+        # pending rows are readable before they are written
+        
+        self.assertEqual( thumbnail_pixel_store.GetHydrusBitmap( hash, bounding_dimensions, thumbnail_stat ).GetStorageData(), hydrus_bitmap.GetStorageData() )
+        
+        thumbnail_pixel_store.Close()
+        
+        thumbnail_pixel_store = ClientCaches.ThumbnailPixelStore( path )
+        
+        stored_hydrus_bitmap = thumbnail_pixel_store.GetHydrusBitmap( hash, bounding_dimensions, thumbnail_stat )
+        
+        self.assertEqual( stored_hydrus_bitmap.GetSize(), ( 40, 30 ) )
+        self.assertEqual( stored_hydrus_bitmap.GetDepth(), 3 )
+        self.assertEqual( bytes( stored_hydrus_bitmap.GetStorageData()[0] ), bytes( hydrus_bitmap.GetStorageData()[0] ) )
+        
+        # a changed thumbnail file or thumbnail size means the pixels are stale
+        
+        self.assertEqual( thumbnail_pixel_store.GetHydrusBitmap( hash, bounding_dimensions, ( 1234567891.5, 4096 ) ), None )
+        self.assertEqual( thumbnail_pixel_store.GetHydrusBitmap( hash, ( 200, 200 ), thumbnail_stat ), None )
+        
+        thumbnail_pixel_store.DeleteThumbnails( { hash } )
+        
+        self.assertEqual( thumbnail_pixel_store.GetHydrusBitmap( hash, bounding_dimensions, thumbnail_stat ), None )
+        self.assertNotEqual( thumbnail_pixel_store.GetHydrusBitmap( other_hash, bounding_dimensions, thumbnail_stat ), None )
+        
+        thumbnail_pixel_store.Clear( ( 200, 200 ) )
+        
+        self.assertEqual( thumbnail_pixel_store.GetHydrusBitmap( other_hash, bounding_dimensions, thumbnail_stat ), None )
+        
+        thumbnail_pixel_store.Close()
+        
+    
+    def test_threaded_reads( self ):
+        
+        path = os.path.join( self._dir, 'test_threaded_reads.db' )
+        
+        bounding_dimensions = ( 150, 125 )
+        thumbnail_stat = ( 1234567890.5, 4096 )
+        
+        hashes = [ HydrusData.GenerateKey() for i in range( 20 ) ]
+        
+        hydrus_bitmap = self._GetHydrusBitmap()
+        
+        thumbnail_pixel_store = ClientCaches.ThumbnailPixelStore( path )
+        
+        for hash in hashes:
+            
+            thumbnail_pixel_store.StoreHydrusBitmap( hash, bounding_dimensions, thumbnail_stat, hydrus_bitmap )
+            
+        
+        thumbnail_pixel_store.Flush()
+        
+        results = []
+        
+        def do_it():
+            
+            results.extend( ( thumbnail_pixel_store.GetHydrusBitmap( hash, bounding_dimensions, thumbnail_stat ) is not None for hash in hashes ) )
+            
+        
+        threads = [ threading.Thread( target = do_it ) for i in range( 4 ) ]
+        
+        for thread in threads:
+            
+            thread.start()
+            
+        
+        for thread in threads:
+            
+            thread.join()
+            
+        
+        self.assertEqual( results, [ True ] * 80 )
+        
+        thumbnail_pixel_store.Close()
+        
+    
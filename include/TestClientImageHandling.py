@@ -1,12 +1,55 @@
 from . import ClientConstants as CC
 from . import ClientImageHandling
+from . import ClientImportFileSeeds
+from . import ClientRendering
+from . import ClientVideoHandling
 import collections
 from . import HydrusConstants as HC
+from . import HydrusFileHandling
+from . import HydrusGlobals as HG
+from . import HydrusImageHandling
+from . import HydrusVideoHandling
+import numpy
 import os
 import unittest
+from qtpy import QtCore as QC
 
 class TestImageHandling( unittest.TestCase ):
     
+    def test_import_job( self ):
+        
+        # the one-read hashes and the shared decode should give what the separate calls always did, whether or not the size was known
+        
+        HG.test_controller.SetRead( 'hash_status', ( CC.STATUS_UNKNOWN, None, '' ) )
+        
+        try:
+            
+            for is_known_file_size in ( False, True ):
+                
+                HG.test_controller.SetRead( 'is_known_file_size', is_known_file_size )
+                
+                for ( filename, mime ) in ( ( 'muh_jpg.jpg', HC.IMAGE_JPEG ), ( 'muh_png.png', HC.IMAGE_PNG ) ):
+                    
+                    path = os.path.join( HC.STATIC_DIR, 'testing', filename )
+                    
+                    file_import_job = ClientImportFileSeeds.FileImportJob( path )
+                    
+                    file_import_job.GenerateHashAndStatus()
+                    
+                    file_import_job.GenerateInfo()
+                    
+                    self.assertEqual( file_import_job.GetHash(), HydrusFileHandling.GetHashFromPath( path ) )
+                    self.assertEqual( file_import_job.GetExtraHashes(), HydrusFileHandling.GetExtraHashesFromPath( path ) )
+                    self.assertEqual( file_import_job.GetPHashes(), ClientImageHandling.GenerateShapePerceptualHashes( path, mime ) )
+                    
+                
+            
+        finally:
+            
+            HG.test_controller.SetRead( 'is_known_file_size', False )
+            
+        
+    
     def test_phash( self ):
         
         phashes = ClientImageHandling.GenerateShapePerceptualHashes( os.path.join( HC.STATIC_DIR, 'hydrus.png' ), HC.IMAGE_PNG )
@@ -21,3 +64,204 @@ class TestImageHandling( unittest.TestCase ):
         
         self.assertEqual( phashes, set( [ b'\xb4M\xc7\xb2M\xcb8\x1c' ] ) )
         
+    
+    def test_reduced_decode( self ):
+        
+        self.assertEqual( HydrusImageHandling.GetReducedDecodeFactor( ( 6000, 4000 ), ( 150, 100 ) ), 8 )
+        self.assertEqual( HydrusImageHandling.GetReducedDecodeFactor( ( 6000, 4000 ), ( 1024, 1024 ) ), 2 )
+        self.assertEqual( HydrusImageHandling.GetReducedDecodeFactor( ( 6000, 4000 ), ( 3000, 2000 ) ), 1 )
+        
+        # the image might be rotated by exif, so a tall target on a wide image still has to fit
+        
+        self.assertEqual( HydrusImageHandling.GetReducedDecodeFactor( ( 4000, 1000 ), ( 100, 400 ) ), 2 )
+        
+        path = os.path.join( HC.STATIC_DIR, 'lain.jpg' )
+        
+        for force_pil in ( False, True ):
+            
+            numpy_image = HydrusImageHandling.GenerateNumPyImage( path, HC.IMAGE_JPEG, force_pil = force_pil, minimum_resolution = ( 80, 80 ) )
+            
+            self.assertEqual( numpy_image.shape, ( 88, 88, 3 ) )
+            
+            numpy_image = HydrusImageHandling.GenerateNumPyImage( path, HC.IMAGE_JPEG, force_pil = force_pil )
+            
+            self.assertEqual( numpy_image.shape, ( 350, 350, 3 ) )
+            
+        
+        for filename in ( 'boned.jpg', 'lain.jpg' ):
+            
+            path = os.path.join( HC.STATIC_DIR, filename )
+            
+            numpy_image = HydrusImageHandling.GenerateNumPyImage( path, HC.IMAGE_JPEG )
+            
+            self.assertEqual( HydrusImageHandling.GetJPEGOrientedResolution( path ), HydrusImageHandling.GetResolutionNumPy( numpy_image ) )
+            
+        
+    
+class TestImageRenderer( unittest.TestCase ):
+    
+    def _GetImageRenderer( self, numpy_image ):
+        
+        # skip the file lookup and background load
+        
+        image_renderer = ClientRendering.ImageRenderer.__new__( ClientRendering.ImageRenderer )
+        
+        ( height, width, depth ) = numpy_image.shape
+        
+        image_renderer._numpy_image = numpy_image
+        image_renderer._mip_levels = []
+        image_renderer._mip_lock = ClientRendering.threading.Lock()
+        image_renderer._hash = b'0' * 32
+        image_renderer._mime = HC.IMAGE_PNG
+        image_renderer._num_frames = 1
+        image_renderer._resolution = ( width, height )
+        
+        return image_renderer
+        
+    
+    def test_tiles( self ):
+        
+        ( x, y ) = numpy.meshgrid( numpy.arange( 3000 ), numpy.arange( 2000 ) )
+        
+        numpy_image = numpy.dstack( ( x % 256, y % 256, ( x + y ) // 20 % 256 ) ).astype( numpy.uint8 )
+        
+        image_renderer = self._GetImageRenderer( numpy_image )
+        
+        original_memory_footprint = image_renderer.GetEstimatedMemoryFootprint()
+        
+        # at 100%, a tile is a straight crop
+        
+        target_resolution = QC.QSize( 3000, 2000 )
+        
+        tile = image_renderer._GetNumPyImage( target_resolution = target_resolution, clip_rect = QC.QRect( 512, 1024, 512, 512 ) )
+        
+        self.assertTrue( tile.flags[ 'C_CONTIGUOUS' ] )
+        self.assertTrue( numpy.array_equal( tile, numpy_image[ 1024 : 1536, 512 : 1024 ] ) )
+        
+        # zoomed out, the tiles come from a mip level and together match a straight resize
+        
+        target_resolution = QC.QSize( 300, 200 )
+        
+        tiled_image = numpy.zeros( ( 200, 300, 3 ), dtype = numpy.uint8 )
+        
+        for tile_y in range( 0, 200, 128 ):
+            
+            for tile_x in range( 0, 300, 128 ):
+                
+                clip_rect = QC.QRect( tile_x, tile_y, 128, 128 ).intersected( QC.QRect( 0, 0, 300, 200 ) )
+                
+                tile = image_renderer._GetNumPyImage( target_resolution = target_resolution, clip_rect = clip_rect )
+                
+                self.assertEqual( tile.shape, ( clip_rect.height(), clip_rect.width(), 3 ) )
+                
+                tiled_image[ clip_rect.y() : clip_rect.y() + clip_rect.height(), clip_rect.x() : clip_rect.x() + clip_rect.width() ] = tile
+                
+            
+        
+        full_image = image_renderer._GetNumPyImage( target_resolution = target_resolution )
+        
+        self.assertLess( numpy.abs( tiled_image.astype( numpy.int16 ) - full_image.astype( numpy.int16 ) ).mean(), 8 )
+        
+        self.assertEqual( [ mip_level.shape for mip_level in image_renderer._mip_levels ], [ ( 1000, 1500, 3 ), ( 500, 750, 3 ) ] )
+        
+        self.assertGreater( image_renderer.GetEstimatedMemoryFootprint(), original_memory_footprint )
+        
+    
+class TestVideoRenderer( unittest.TestCase ):
+    
+    def test_frame_index( self ):
+        
+        # a vp8 alt-ref shares its timestamp with the next frame, and a discarded packet is never shown
+        
+        lines = []
+        
+        lines.append( '#tb 0: 1/1000' )
+        lines.append( '#media_type 0: video' )
+        lines.append( '0,          0,          0,        1,    37598, 0xc7fb7531' )
+        lines.append( '0,         33,         33,        1,     5399, 0xb7567320, F=0x0' )
+        lines.append( '0,         33,         33,        1,       55, 0xd6211261, F=0x0' )
+        lines.append( '0,         67,         67,        1,       91, 0x50902953, F=0x4' )
+        lines.append( '0,        100,        100,        1,     4000, 0xc85a1dd5' )
+        lines.append( '0,        133,        133,        1,       45, 0x3ebf0ee3, F=0x0' )
+        
+        self.assertEqual( HydrusVideoHandling.ParseFFMPEGFrameIndex( lines ), ( [ 0, 33, 100, 133 ], [ 0, 2 ] ) )
+        
+        path = os.path.join( HC.STATIC_DIR, 'testing', 'muh_mpeg.mpeg' )
+        
+        ( frame_timestamps_ms, keyframe_indices ) = HydrusVideoHandling.GetVideoFrameIndex( path )
+        
+        self.assertEqual( len( frame_timestamps_ms ), 105 )
+        self.assertEqual( keyframe_indices, list( range( 0, 105, 12 ) ) )
+        
+        # the client keeps it in the db dir after the first look
+        
+        hash = b'\x01' * 32
+        
+        self.assertEqual( ClientVideoHandling.GetVideoFrameIndex( hash, path ), ( frame_timestamps_ms, keyframe_indices ) )
+        
+        index_path = ClientVideoHandling.GetVideoFrameIndexPath( hash )
+        
+        self.assertTrue( os.path.exists( index_path ) )
+        
+        # so the second look never touches the file
+        
+        self.assertEqual( ClientVideoHandling.GetVideoFrameIndex( hash, os.path.join( HC.STATIC_DIR, 'testing', 'muh_mp4.mp4' ) ), ( frame_timestamps_ms, keyframe_indices ) )
+        
+        ClientVideoHandling.DeleteVideoFrameIndices( ( hash, ) )
+        
+        self.assertFalse( os.path.exists( index_path ) )
+        
+    
+    def test_read_into( self ):
+        
+        path = os.path.join( HC.STATIC_DIR, 'testing', 'muh_mp4.mp4' )
+        
+        renderer = HydrusVideoHandling.VideoRendererFFMPEG( path, HC.VIDEO_MP4, 6290, 151, ( 64, 64 ) )
+        
+        frames = [ renderer.read_frame() for i in range( 151 ) ]
+        
+        renderer.Stop()
+        
+        # reading into our own buffer gives the same frames, and seeking by the frame index lands on the right one
+        
+        renderer = HydrusVideoHandling.VideoRendererFFMPEG( path, HC.VIDEO_MP4, 6290, 151, ( 64, 64 ) )
+        
+        renderer.SetFrameIndex( *HydrusVideoHandling.GetVideoFrameIndex( path ) )
+        
+        numpy_image = numpy.zeros( ( 64, 64, 3 ), dtype = numpy.uint8 )
+        
+        for i in range( 10 ):
+            
+            self.assertIs( renderer.read_frame( numpy_image ), numpy_image )
+            
+            self.assertTrue( numpy.array_equal( numpy_image, frames[ i ] ) )
+            
+        
+        for index in ( 75, 20, 150 ):
+            
+            renderer.set_position( index )
+            
+            renderer.read_frame( numpy_image )
+            
+            self.assertTrue( numpy.array_equal( numpy_image, frames[ index ] ) )
+            
+        
+        renderer.Stop()
+        
+        # when the stream runs dry, we get the last good frame, even though the caller has since reused its buffer
+        
+        renderer = HydrusVideoHandling.VideoRendererFFMPEG( path, HC.VIDEO_MP4, 6290, 151, ( 64, 64 ) )
+        
+        recycled_numpy_image = renderer.read_frame()
+        
+        recycled_numpy_image[:] = 0
+        
+        renderer.close()
+        
+        numpy_image = numpy.zeros( ( 64, 64, 3 ), dtype = numpy.uint8 )
+        
+        self.assertTrue( numpy.array_equal( renderer.read_frame( numpy_image ), frames[0] ) )
+        
+        renderer.Stop()
+        
+    
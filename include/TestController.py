@@ -248,15 +248,18 @@ class Controller( object ):
         self._reads[ 'tag_parents' ] = {}
         self._reads[ 'tag_siblings' ] = {}
         self._reads[ 'in_inbox' ] = False
+        self._reads[ 'is_known_file_size' ] = False
         
         self._writes = collections.defaultdict( list )
         
+        self._job_statistics = HydrusDB.JobStatistics()
+        
         self._managers = {}
         
         self.services_manager = ClientManagers.ServicesManager( self )
         self.client_files_manager = ClientFiles.ClientFilesManager( self )
         
-        self.parsing_cache = ClientCaches.ParsingCache()
+        self.parsing_cache = ClientCaches.ParsingCache( self )
         
         bandwidth_manager = ClientNetworkingBandwidth.NetworkBandwidthManager()
         session_manager = ClientNetworkingSessions.NetworkSessionManager()
@@ -469,6 +472,11 @@ class Controller( object ):
             
         
     
+    def CurrentlyIdle( self ):
+        
+        return True
+        
+    
     def DBCurrentlyDoingJob( self ):
         
         return False
@@ -538,6 +546,11 @@ class Controller( object ):
         return {}
         
     
+    def GetJobStatistics( self ):
+        
+        return self._job_statistics.GetReport()
+        
+    
     def GetWrite( self, name ):
         
         write = self._writes[ name ]
@@ -608,6 +621,11 @@ class Controller( object ):
         return self._reads[ name ]
         
     
+    def ReadSnapshot( self, name, *args, **kwargs ):
+        
+        return self.Read( name, *args, **kwargs )
+        
+    
     def RegisterUIUpdateWindow( self, window ):
         
         pass
@@ -5,6 +5,7 @@ from . import ClientDefaults
 from . import ClientDownloading
 from . import ClientDuplicates
 from . import ClientGUIShortcuts
+from . import ClientImportFileSeeds
 from . import ClientImporting
 from . import ClientImportOptions
 from . import ClientImportSubscriptions
@@ -72,6 +73,18 @@ class TestSerialisables( unittest.TestCase ):
         
         test_func( obj, dupe_obj )
         
+        #
+        
+        binary = obj.DumpToBinary()
+        
+        self.assertTrue( HydrusSerialisable.IsBinary( binary ) )
+        
+        dupe_obj = HydrusSerialisable.CreateFromBinary( binary )
+        
+        self.assertIsNot( obj, dupe_obj )
+        
+        test_func( obj, dupe_obj )
+        
     
     def test_basics( self ):
         
@@ -152,6 +165,72 @@ class TestSerialisables( unittest.TestCase ):
             
         
     
+    def test_SERIALISABLE_TYPE_CONTENT_UPDATE( self ):
+        
+        def test( obj, dupe_obj ):
+            
+            # the binary dump is columnar, so the hash ids come back as arrays
+            
+            self.assertEqual( [ ( tag_id, list( hash_ids ) ) for ( tag_id, hash_ids ) in dupe_obj.GetNewMappings() ], obj.GetNewMappings() )
+            self.assertEqual( [ ( tag_id, list( hash_ids ) ) for ( tag_id, hash_ids ) in dupe_obj.GetDeletedMappings() ], obj.GetDeletedMappings() )
+            self.assertEqual( list( dupe_obj.GetNewMappingsRows() ), [ ( tag_id, hash_id ) for ( tag_id, hash_ids ) in obj.GetNewMappings() for hash_id in hash_ids ] )
+            self.assertEqual( list( dupe_obj.GetDeletedMappingsRows() ), list( obj.GetDeletedMappingsRows() ) )
+            self.assertEqual( [ tuple( row ) for row in dupe_obj.GetNewFiles() ], [ tuple( row ) for row in obj.GetNewFiles() ] )
+            self.assertEqual( list( dupe_obj.GetDeletedFiles() ), obj.GetDeletedFiles() )
+            self.assertEqual( [ tuple( pair ) for pair in dupe_obj.GetNewTagParents() ], obj.GetNewTagParents() )
+            self.assertEqual( [ tuple( pair ) for pair in dupe_obj.GetDeletedTagSiblings() ], obj.GetDeletedTagSiblings() )
+            self.assertEqual( dupe_obj.GetNumRows(), obj.GetNumRows() )
+            
+        
+        content_update = HydrusNetwork.ContentUpdate()
+        
+        content_update.AddRow( ( HC.CONTENT_TYPE_FILES, HC.CONTENT_UPDATE_ADD, ( 5, 1024, HC.IMAGE_JPEG, 1000, 640, 480, None, None, None ) ) )
+        content_update.AddRow( ( HC.CONTENT_TYPE_FILES, HC.CONTENT_UPDATE_DELETE, 7 ) )
+        content_update.AddRow( ( HC.CONTENT_TYPE_FILES, HC.CONTENT_UPDATE_DELETE, 3 ) )
+        
+        for tag_id in range( 1, 20 ):
+            
+            content_update.AddRow( ( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_ADD, ( tag_id, list( range( tag_id * 1000, tag_id * 1000 + tag_id * 10, 3 ) ) ) ) )
+            
+        
+        content_update.AddRow( ( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_DELETE, ( 9, [ 2 ** 40, 1 ] ) ) )
+        content_update.AddRow( ( HC.CONTENT_TYPE_TAG_PARENTS, HC.CONTENT_UPDATE_ADD, ( 4, 2 ) ) )
+        content_update.AddRow( ( HC.CONTENT_TYPE_TAG_SIBLINGS, HC.CONTENT_UPDATE_DELETE, ( 1, 8 ) ) )
+        
+        self._dump_and_load_and_test( content_update, test )
+        
+        # old clients can only read the json, so the network dump stays as it was
+        
+        self.assertFalse( HydrusSerialisable.IsBinary( content_update.DumpToNetworkBytes() ) )
+        
+        columnar_bytes = content_update.DumpToBinary( compression = HydrusSerialisable.BINARY_COMPRESSION_ZLIB )
+        
+        self.assertLess( len( columnar_bytes ), len( content_update.DumpToNetworkBytes() ) )
+        
+        test( content_update, HydrusSerialisable.CreateFromNetworkBytes( columnar_bytes ) )
+        
+    
+    def test_SERIALISABLE_TYPE_DEFINITIONS_UPDATE( self ):
+        
+        def test( obj, dupe_obj ):
+            
+            self.assertEqual( dupe_obj.GetHashIdsToHashes(), obj.GetHashIdsToHashes() )
+            self.assertEqual( dupe_obj.GetTagIdsToTags(), obj.GetTagIdsToTags() )
+            
+        
+        definitions_update = HydrusNetwork.DefinitionsUpdate()
+        
+        for i in range( 1, 100 ):
+            
+            definitions_update.AddRow( ( HC.DEFINITIONS_TYPE_HASHES, i, HydrusData.GenerateKey() ) )
+            definitions_update.AddRow( ( HC.DEFINITIONS_TYPE_TAGS, i * 3, 'series:tag \u00e9\u3042 ' + str( i ) * ( i % 5 ) ) )
+            
+        
+        definitions_update.AddRow( ( HC.DEFINITIONS_TYPE_TAGS, 1000, '' ) )
+        
+        self._dump_and_load_and_test( definitions_update, test )
+        
+    
     def test_SERIALISABLE_TYPE_DUPLICATE_ACTION_OPTIONS( self ):
         
         def test( obj, dupe_obj ):
@@ -385,6 +464,67 @@ class TestSerialisables( unittest.TestCase ):
         assertSCUEqual( result, scu )
         
     
+    def test_SERIALISABLE_TYPE_FILE_SEED_CACHE( self ):
+        
+        def test( obj, dupe_obj ):
+            
+            self.assertEqual( len( obj ), len( dupe_obj ) )
+            self.assertEqual( obj.GetStatusesToCounts(), dupe_obj.GetStatusesToCounts() )
+            self.assertEqual( [ file_seed.file_seed_data for file_seed in obj.GetFileSeeds() ], [ file_seed.file_seed_data for file_seed in dupe_obj.GetFileSeeds() ] )
+            
+        
+        file_seeds = HydrusSerialisable.SerialisableList( [ ClientImportFileSeeds.FileSeed( ClientImportFileSeeds.FILE_SEED_TYPE_HDD, 'file {}'.format( i ) ) for i in range( 10 ) ] )
+        
+        for file_seed in file_seeds[:3]:
+            
+            file_seed.status = CC.STATUS_SUCCESSFUL_AND_NEW
+            
+        
+        file_seed_cache = HydrusSerialisable.CreateFromSerialisableTuple( ( HydrusSerialisable.SERIALISABLE_TYPE_FILE_SEED_CACHE, ClientImportFileSeeds.FileSeedCache.SERIALISABLE_VERSION, file_seeds.GetSerialisableTuple() ) )
+        
+        self._dump_and_load_and_test( file_seed_cache, test )
+        
+        # as a child in a binary dump, the seeds are not parsed until they are needed
+        
+        binary = HydrusSerialisable.SerialisableList( [ file_seed_cache ] ).DumpToBinary()
+        
+        lazy_file_seed_cache = HydrusSerialisable.CreateFromBinary( binary )[0]
+        
+        self.assertIsNotNone( lazy_file_seed_cache._lazy_binary )
+        
+        self.assertEqual( len( lazy_file_seed_cache ), 10 )
+        self.assertEqual( lazy_file_seed_cache.GetStatusesToCounts(), file_seed_cache.GetStatusesToCounts() )
+        self.assertEqual( lazy_file_seed_cache.GetFileSeedCount( CC.STATUS_UNKNOWN ), 7 )
+        self.assertEqual( lazy_file_seed_cache.GetValueRange(), ( 3, 10 ) )
+        self.assertTrue( lazy_file_seed_cache.WorkToDo() )
+        self.assertIsNone( lazy_file_seed_cache.GetNextFileSeed( CC.STATUS_ERROR ) )
+        
+        self.assertEqual( lazy_file_seed_cache.DumpToString(), file_seed_cache.DumpToString() )
+        self.assertEqual( HydrusSerialisable.SerialisableList( [ lazy_file_seed_cache ] ).DumpToBinary(), binary )
+        
+        self.assertIsNotNone( lazy_file_seed_cache._lazy_binary )
+        
+        self.assertEqual( lazy_file_seed_cache.GetNextFileSeed( CC.STATUS_UNKNOWN ).file_seed_data, 'file 3' )
+        
+        self.assertIsNone( lazy_file_seed_cache._lazy_binary )
+        
+        test( file_seed_cache, lazy_file_seed_cache )
+        
+        # an old version goes through the update code as it loads
+        
+        old_serialisable_info = [ [ 'file 0', { 'status' : CC.STATUS_SUCCESSFUL_AND_NEW, 'added_timestamp' : 0, 'last_modified_timestamp' : 0, 'source_timestamp' : None, 'note' : '' } ] ]
+        
+        old_binary = HydrusSerialisable.PackBinary( ( HydrusSerialisable.SERIALISABLE_TYPE_FILE_SEED_CACHE, 7, old_serialisable_info ), [] )
+        
+        binary = HydrusSerialisable.PackBinary( ( HydrusSerialisable.SERIALISABLE_TYPE_BINARY_CHILD, 1, ( HydrusSerialisable.SERIALISABLE_TYPE_FILE_SEED_CACHE, 7, 0, [ [ CC.STATUS_SUCCESSFUL_AND_NEW, 1 ] ] ) ), [ old_binary ] )
+        
+        updated_file_seed_cache = HydrusSerialisable.CreateFromBinary( binary )
+        
+        self.assertIsNone( updated_file_seed_cache._lazy_binary )
+        
+        self.assertEqual( [ ( file_seed.file_seed_data, file_seed.status ) for file_seed in updated_file_seed_cache.GetFileSeeds() ], [ ( 'file 0', CC.STATUS_SUCCESSFUL_AND_NEW ) ] )
+        
+    
     def test_SERIALISABLE_TYPE_SHORTCUT( self ):
         
         def test( obj, dupe_obj ):
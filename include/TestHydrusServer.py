@@ -618,6 +618,42 @@ class TestServer( unittest.TestCase ):
         #self._test_tag_repo( self._clientside_tag_service )
         
     
+    def test_repository_columnar_update_hashes( self ):
+        
+        service = HydrusNetwork.GenerateService( HydrusData.GenerateKey(), HC.TAG_REPOSITORY, 'tag repo', HC.DEFAULT_SERVICE_PORT )
+        
+        old_update_hash = HydrusData.GenerateKey()
+        update_hash = HydrusData.GenerateKey()
+        columnar_update_hash = HydrusData.GenerateKey()
+        
+        metadata = HydrusNetwork.Metadata()
+        
+        metadata.AppendUpdate( [ old_update_hash ], HydrusData.GetNow() - 201000, HydrusData.GetNow() - 101000, HydrusData.GetNow() - 100000 )
+        metadata.AppendUpdate( [ update_hash ], HydrusData.GetNow() - 101000, HydrusData.GetNow() - 1000, HydrusData.GetNow() + 100000 )
+        
+        service._metadata = metadata
+        
+        HG.test_controller.SetRead( 'columnar_update_hashes', { update_hash : columnar_update_hash } )
+        
+        metadata_slice = service.GetMetadataSlice( 0, update_encoding = HydrusNetwork.UPDATE_ENCODING_COLUMNAR )
+        
+        self.assertEqual( metadata_slice.GetUpdateHashes( 0 ), [ old_update_hash ] )
+        self.assertEqual( metadata_slice.GetUpdateHashes( 1 ), [ columnar_update_hash ] )
+        
+        self.assertEqual( service.GetMetadataSlice( 0 ).GetSerialisableTuple(), metadata.GetSerialisableTuple() )
+        
+        self.assertTrue( service.HasUpdateHash( update_hash ) )
+        self.assertTrue( service.HasUpdateHash( columnar_update_hash ) )
+        self.assertFalse( service.HasUpdateHash( HydrusData.GenerateKey() ) )
+        
+        # the pairing is read once and then kept in memory
+        
+        HG.test_controller.SetRead( 'columnar_update_hashes', {} )
+        
+        self.assertTrue( service.HasUpdateHash( columnar_update_hash ) )
+        self.assertEqual( service.GetMetadataSlice( 1, update_encoding = HydrusNetwork.UPDATE_ENCODING_COLUMNAR ).GetUpdateHashes( 1 ), [ columnar_update_hash ] )
+        
+    
     def test_server_admin( self ):
         
         host = '127.0.0.1'
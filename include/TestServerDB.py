@@ -26,6 +26,7 @@ from . import HydrusSerialisable
 import itertools
 import os
 from . import ServerDB
+from . import ServerFiles
 import shutil
 import sqlite3
 import stat
@@ -193,10 +194,98 @@ class TestServerDB( unittest.TestCase ):
         self.assertEqual( set( result ), { self._tag_service_key, self._file_service_key } )
         
     
+    def _test_update_generation( self ):
+        
+        admin_account = self._read( 'account', HC.SERVER_ADMIN_KEY, self._admin_account_key )
+        
+        services = self._read( 'services' )
+        
+        tag_service_key = HydrusData.GenerateKey()
+        
+        services.append( HydrusNetwork.GenerateService( tag_service_key, HC.TAG_REPOSITORY, 'tag repo', 100 ) )
+        
+        service_keys_to_access_keys = self._write( 'services', admin_account, services )
+        
+        account_key = self._read( 'account_key_from_access_key', tag_service_key, service_keys_to_access_keys[ tag_service_key ] )
+        
+        account = self._read( 'account', tag_service_key, account_key )
+        
+        hashes = [ HydrusData.GenerateKey() for i in range( 50 ) ]
+        
+        client_to_server_update = HydrusNetwork.ClientToServerUpdate()
+        
+        for i in range( 30 ):
+            
+            client_to_server_update.AddContent( HC.CONTENT_UPDATE_PEND, HydrusNetwork.Content( HC.CONTENT_TYPE_MAPPINGS, ( 'tag ' + str( i ), hashes[ i : ] ) ) )
+            
+        
+        now = HydrusData.GetNow()
+        
+        self._write( 'update', tag_service_key, account, client_to_server_update, now )
+        
+        immediate_updates = self._read( 'immediate_update', tag_service_key, account, now - 10, now + 10 )
+        
+        # the files are generated off a read connection, which only sees what has been committed
+        
+        self._write( 'commit' )
+        
+        ( update_hashes, columnar_update_hashes ) = TestServerDB._db.ReadSnapshot( 'update_files', tag_service_key, now - 10, now + 10 )
+        
+        self._write( 'create_update', tag_service_key, update_hashes, columnar_update_hashes )
+        
+        # the db pairs each update with its twin
+        
+        self.assertEqual( self._read( 'columnar_update_hashes', tag_service_key ), dict( zip( update_hashes, columnar_update_hashes ) ) )
+        
+        updates = []
+        columnar_updates = []
+        
+        for ( hashes, loaded_updates ) in ( ( update_hashes, updates ), ( columnar_update_hashes, columnar_updates ) ):
+            
+            for update_hash in hashes:
+                
+                with open( ServerFiles.GetExpectedFilePath( update_hash ), 'rb' ) as f:
+                    
+                    loaded_updates.append( HydrusSerialisable.CreateFromNetworkBytes( f.read() ) )
+                    
+                
+            
+        
+        self.assertEqual( [ update.DumpToString() for update in updates ], [ update.DumpToString() for update in immediate_updates ] )
+        
+        # the columnar twins hold the same rows
+        
+        self.assertEqual( len( columnar_updates ), len( updates ) )
+        
+        for ( update, columnar_update ) in zip( updates, columnar_updates ):
+            
+            self.assertEqual( type( columnar_update ), type( update ) )
+            
+            if isinstance( update, HydrusNetwork.DefinitionsUpdate ):
+                
+                self.assertEqual( columnar_update.GetHashIdsToHashes(), update.GetHashIdsToHashes() )
+                self.assertEqual( columnar_update.GetTagIdsToTags(), update.GetTagIdsToTags() )
+                
+            else:
+                
+                self.assertEqual( [ ( service_tag_id, list( service_hash_ids ) ) for ( service_tag_id, service_hash_ids ) in columnar_update.GetNewMappings() ], [ ( service_tag_id, service_hash_ids ) for ( service_tag_id, service_hash_ids ) in update.GetNewMappings() ] )
+                
+            
+        
+        content_updates = [ update for update in updates if isinstance( update, HydrusNetwork.ContentUpdate ) ]
+        
+        mappings = [ ( service_tag_id, len( service_hash_ids ) ) for update in content_updates for ( service_tag_id, service_hash_ids ) in update.GetNewMappings() ]
+        
+        self.assertEqual( len( mappings ), 30 )
+        self.assertEqual( sorted( count for ( service_tag_id, count ) in mappings ), list( range( 21, 51 ) ) )
+        
+    
     def test_server( self ):
         
         self._test_init_server_admin()
         
+        self._test_update_generation()
+        
         # broke since service rewrite
         #self._test_service_creation()
         